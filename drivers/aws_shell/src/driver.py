@@ -1,5 +1,6 @@
 from cloudshell.shell.core.resource_driver_interface import ResourceDriverInterface
 from cloudshell.cp.aws.aws_shell import AWSShell
+from cloudshell.cp.aws.common.converters import convert_to_bool
 from cloudshell.cp.core import DriverRequestParser
 from cloudshell.cp.core.models import DeployApp, DriverResponse
 from cloudshell.cp.core.utils import single
@@ -37,6 +38,16 @@ class AWSShellDriver(ResourceDriverInterface):
         else:
             raise Exception('Could not find the deployment')
 
+    def DeployBatch(self, context, request=None, cancellation_context=None):
+        actions = self.request_parser.convert_driver_request_to_actions(request)
+        deploy_actions = [a for a in actions if isinstance(a, DeployApp)]
+        if any(a.actionParams.deployment.deploymentPath not in self.deployments for a in deploy_actions):
+            raise Exception('Could not find the deployment')
+        self.parse_vnicename(actions)
+
+        deploy_result = self.aws_shell.deploy_ami_batch(context, actions, cancellation_context)
+        return DriverResponse(deploy_result).to_driver_response_json()
+
     def parse_vnicename(self, actions):
         network_actions = [a for a in actions if isinstance(a, ConnectSubnet)]
         for network_action in network_actions:
@@ -78,6 +89,15 @@ class AWSShellDriver(ResourceDriverInterface):
         actions = self.request_parser.convert_driver_request_to_actions(request)
         return self.aws_shell.cleanup_connectivity(context, actions)
 
+    def GetCleanupStatus(self, context, reservation_id=''):
+        return self.aws_shell.get_cleanup_status(context, reservation_id)
+
+    def SweepOrphanedResources(self, context, dry_run='True', reservation_ids='', min_age_hours='24'):
+        reservation_ids = [reservation_id.strip() for reservation_id in reservation_ids.split(',')
+                           if reservation_id.strip()]
+        return self.aws_shell.sweep_orphaned_resources(context, convert_to_bool(dry_run), reservation_ids,
+                                                       float(min_age_hours) * 60 * 60)
+
     def GetApplicationPorts(self, context, ports):
         return self.aws_shell.get_application_ports(context)
 
@@ -1,4 +1,5 @@
 import json
+from functools import partial
 
 import jsonpickle
 from botocore.exceptions import NoCredentialsError, ClientError
@@ -14,18 +15,25 @@ from cloudshell.cp.aws.domain.ami_management.operations.power_operation import P
 from cloudshell.cp.aws.domain.ami_management.operations.refresh_ip_operation import RefreshIpOperation
 from cloudshell.cp.aws.domain.operations.autoload_operation import AutoloadOperation
 from cloudshell.cp.aws.domain.common.cancellation_service import CommandCancellationService
+from cloudshell.cp.aws.domain.common.cleanup_journal import CleanupJournal
+from cloudshell.cp.aws.domain.common.image_metadata_cache import ImageMetadataCache
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
 from cloudshell.cp.aws.domain.common.vm_details_provider import VmDetailsProvider
+from cloudshell.cp.aws.domain.common.windows_credentials_jobs import WindowsCredentialsJobs
 from cloudshell.cp.aws.domain.conncetivity.operations.cleanup import CleanupSandboxInfraOperation
 from cloudshell.cp.aws.domain.conncetivity.operations.traffic_mirroring_operation import \
     TrafficMirrorOperation
 from cloudshell.cp.aws.domain.conncetivity.operations.prepare import PrepareSandboxInfraOperation
+from cloudshell.cp.aws.domain.conncetivity.operations.sweep import SweepOrphanedResourcesOperation
 from cloudshell.cp.aws.domain.context.aws_shell import AwsShellContext
 from cloudshell.cp.aws.domain.context.client_error import ClientErrorWrapper
 from cloudshell.cp.aws.domain.deployed_app.operations.app_ports_operation import DeployedAppPortsOperation
 from cloudshell.cp.aws.domain.deployed_app.operations.vm_details_operation import VmDetailsOperation
+from cloudshell.cp.aws.domain.services.cloudshell.deployed_app_credentials import DeployedAppCredentialsService
 from cloudshell.cp.aws.domain.services.cloudshell.traffic_mirror_pool_services import SessionNumberService
 from cloudshell.cp.aws.domain.services.ec2.ebs import EC2StorageService
 from cloudshell.cp.aws.domain.services.ec2.elastic_ip import ElasticIpService
+from cloudshell.cp.aws.domain.services.ec2.elastic_ip_pool import ElasticIpPool
 from cloudshell.cp.aws.domain.services.ec2.instance import InstanceService
 from cloudshell.cp.aws.domain.services.ec2.instance_credentials import InstanceCredentialsService
 from cloudshell.cp.aws.domain.services.ec2.keypair import KeyPairService
@@ -36,6 +44,7 @@ from cloudshell.cp.aws.domain.services.ec2.security_group import SecurityGroupSe
 from cloudshell.cp.aws.domain.services.ec2.subnet import SubnetService
 from cloudshell.cp.aws.domain.services.ec2.tags import TagService
 from cloudshell.cp.aws.domain.services.ec2.vpc import VPCService
+from cloudshell.cp.aws.domain.services.ec2.warm_instance_pool import WarmInstancePool
 from cloudshell.cp.aws.domain.services.parsers.aws_model_parser import AWSModelsParser
 from cloudshell.cp.aws.domain.services.parsers.command_results_parser import CommandResultsParser
 from cloudshell.cp.aws.domain.services.parsers.custom_param_extractor import VmCustomParamsExtractor
@@ -44,6 +53,7 @@ from cloudshell.cp.aws.domain.services.session_providers.aws_session_provider im
 from cloudshell.cp.aws.domain.services.strategy.device_index import AllocateMissingValuesDeviceIndexStrategy
 from cloudshell.cp.aws.domain.services.waiters.ami import AMIWaiter
 from cloudshell.cp.aws.domain.services.waiters.instance import InstanceWaiter
+from cloudshell.cp.aws.domain.services.waiters.instance_state_poller import InstanceStatePoller
 from cloudshell.cp.aws.domain.services.waiters.password import PasswordWaiter
 from cloudshell.cp.aws.domain.services.waiters.subnet import SubnetWaiter
 from cloudshell.cp.aws.domain.services.waiters.vpc import VPCWaiter
@@ -51,6 +61,7 @@ from cloudshell.cp.aws.domain.services.waiters.vpc_peering import VpcPeeringConn
 
 from cloudshell.cp.aws.domain.deployed_app.operations.set_app_security_groups import \
     SetAppSecurityGroupsOperation
+from cloudshell.cp.aws.models.app_deployment import AppDeployment
 from cloudshell.cp.aws.models.network_actions_models import SetAppSecurityGroupActionResult
 from cloudshell.cp.aws.models.reservation_model import ReservationModel
 from cloudshell.cp.aws.models.vm_details import VmDetailsRequest
@@ -72,7 +83,9 @@ class AWSShell(object):
         self.cancellation_service = CommandCancellationService()
         self.client_err_wrapper = ClientErrorWrapper()
         self.tag_service = TagService(client_err_wrapper=self.client_err_wrapper)
-        self.ec2_instance_waiter = InstanceWaiter(cancellation_service=self.cancellation_service)
+        self.instance_state_poller = InstanceStatePoller()
+        self.ec2_instance_waiter = InstanceWaiter(cancellation_service=self.cancellation_service,
+                                                  instance_state_poller=self.instance_state_poller)
         self.instance_service = InstanceService(self.tag_service, self.ec2_instance_waiter)
         self.ec2_storage_service = EC2StorageService()
         self.model_parser = AWSModelsParser()
@@ -81,6 +94,8 @@ class AWSShell(object):
         self.password_waiter = PasswordWaiter(self.cancellation_service)
         self.vm_custom_params_extractor = VmCustomParamsExtractor()
         self.ami_credentials_service = InstanceCredentialsService(self.password_waiter)
+        self.windows_credentials_jobs = WindowsCredentialsJobs(self.ami_credentials_service,
+                                                               DeployedAppCredentialsService())
         self.security_group_service = SecurityGroupService(self.tag_service)
         self.subnet_waiter = SubnetWaiter()
         self.subnet_service = SubnetService(self.tag_service, self.subnet_waiter)
@@ -90,11 +105,18 @@ class AWSShell(object):
         self.vpc_waiter = VPCWaiter()
         self.route_tables_service = RouteTablesService(self.tag_service)
         self.network_interface_service = NetworkInterfaceService(subnet_service=self.subnet_service)
-        self.elastic_ip_service = ElasticIpService()
+        self.elastic_ip_pool = ElasticIpPool()
+        self.elastic_ip_service = ElasticIpService(elastic_ip_pool=self.elastic_ip_pool)
         self.vm_details_provider = VmDetailsProvider()
         self.session_number_service = SessionNumberService()
         self.traffic_mirror_service = TrafficMirrorService()
         self.request_parser = DriverRequestParser()
+        self.sandbox_footprint_cache = SandboxFootprintCache()
+        self.image_metadata_cache = ImageMetadataCache()
+        self.warm_instance_pool = WarmInstancePool(tag_service=self.tag_service,
+                                                   key_pair_service=self.key_pair_service,
+                                                   instance_waiter=self.ec2_instance_waiter,
+                                                   password_waiter=self.password_waiter)
 
         self.vpc_service = VPCService(tag_service=self.tag_service,
                                       subnet_service=self.subnet_service,
@@ -112,7 +134,8 @@ class AWSShell(object):
                                          route_table_service=self.route_tables_service,
                                          cancellation_service=self.cancellation_service,
                                          subnet_service=self.subnet_service,
-                                         subnet_waiter=self.subnet_waiter)
+                                         subnet_waiter=self.subnet_waiter,
+                                         sandbox_footprint_cache=self.sandbox_footprint_cache)
 
         self.deploy_ami_operation = DeployAMIOperation(instance_service=self.instance_service,
                                                        ami_credential_service=self.ami_credentials_service,
@@ -125,7 +148,11 @@ class AWSShell(object):
                                                        network_interface_service=self.network_interface_service,
                                                        cancellation_service=self.cancellation_service,
                                                        device_index_strategy=AllocateMissingValuesDeviceIndexStrategy(),
-                                                       vm_details_provider=self.vm_details_provider)
+                                                       vm_details_provider=self.vm_details_provider,
+                                                       sandbox_footprint_cache=self.sandbox_footprint_cache,
+                                                       windows_credentials_jobs=self.windows_credentials_jobs,
+                                                       warm_instance_pool=self.warm_instance_pool,
+                                                       image_metadata_cache=self.image_metadata_cache)
 
         self.refresh_ip_operation = RefreshIpOperation(instance_service=self.instance_service)
 
@@ -141,11 +168,15 @@ class AWSShell(object):
         self.clean_up_operation = CleanupSandboxInfraOperation(vpc_service=self.vpc_service,
                                                                key_pair_service=self.key_pair_service,
                                                                route_table_service=self.route_tables_service,
-                                                               traffic_mirror_service=self.traffic_mirror_service)
+                                                               traffic_mirror_service=self.traffic_mirror_service,
+                                                               sandbox_footprint_cache=self.sandbox_footprint_cache,
+                                                               cleanup_journal=CleanupJournal())
+        self.sweep_operation = SweepOrphanedResourcesOperation(cleanup_operation=self.clean_up_operation)
 
         self.deployed_app_ports_operation = DeployedAppPortsOperation(self.vm_custom_params_extractor,
                                                                       security_group_service=self.security_group_service,
-                                                                      instance_service=self.instance_service)
+                                                                      instance_service=self.instance_service,
+                                                                      sandbox_footprint_cache=self.sandbox_footprint_cache)
 
         self.access_key_operation = GetAccessKeyOperation(key_pair_service=self.key_pair_service)
 
@@ -177,18 +208,117 @@ class AWSShell(object):
 
         with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
             shell_context.logger.info('Cleanup Connectivity')
-
-            result = self.clean_up_operation \
-                .cleanup(ec2_client=shell_context.aws_api.ec2_client,
-                         ec2_session=shell_context.aws_api.ec2_session,
-                         s3_session=shell_context.aws_api.s3_session,
-                         aws_ec2_data_model=shell_context.aws_ec2_resource_model,
-                         reservation_id=command_context.reservation.reservation_id,
-                         actions=actions,
-                         logger=shell_context.logger)
+            self._resume_async_cleanups(command_context, shell_context)
+
+            if shell_context.aws_ec2_resource_model.async_cleanup:
+                result = self.clean_up_operation \
+                    .cleanup_async(create_aws_api=partial(self._create_dedicated_clients, shell_context),
+                                   aws_ec2_data_model=shell_context.aws_ec2_resource_model,
+                                   reservation_id=command_context.reservation.reservation_id,
+                                   cloud_provider=command_context.resource.name,
+                                   actions=actions,
+                                   logger=shell_context.logger)
+            else:
+                result = self.clean_up_operation \
+                    .cleanup(ec2_client=shell_context.aws_api.ec2_client,
+                             ec2_session=shell_context.aws_api.ec2_session,
+                             s3_session=shell_context.aws_api.s3_session,
+                             aws_ec2_data_model=shell_context.aws_ec2_resource_model,
+                             reservation_id=command_context.reservation.reservation_id,
+                             actions=actions,
+                             logger=shell_context.logger)
             return self.command_result_parser.set_command_result(
                 {'driverResponse': {'actionResults': [result]}})
 
+    def get_cleanup_status(self, command_context, reservation_id=None):
+        """
+        Returns the status of the asynchronous cleanup of a reservation
+        :param ResourceCommandContext command_context:
+        :param str reservation_id: the reservation of the cleanup, the reservation of the command if empty
+        :return: json string response
+        :rtype: str
+        """
+        with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
+            shell_context.logger.info('Get Cleanup Status')
+            self._resume_async_cleanups(command_context, shell_context)
+
+            entry = self.clean_up_operation.get_cleanup_status(
+                shell_context.aws_ec2_resource_model, reservation_id or self._get_reservation_id(command_context))
+            return self.command_result_parser.set_command_result(entry)
+
+    def sweep_orphaned_resources(self, command_context, dry_run=True, reservation_ids=None,
+                                 min_age=SweepOrphanedResourcesOperation.MIN_AGE):
+        """
+        Deletes the resources of the region left by the reservations of the cloud provider that are not active anymore
+        :param ResourceCommandContext command_context:
+        :param bool dry_run: whether to only report the orphaned resources
+        :param list[str] reservation_ids: the reservations to delete the orphaned resources of, required unless it is
+        a dry run
+        :param float min_age: the time in seconds since the vpc of a reservation was created before it is swept
+        :return: json string response
+        :rtype: str
+        """
+        with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
+            shell_context.logger.info('Sweep Orphaned Resources')
+
+            active_reservation_ids = [reservation.Id for reservation in
+                                      shell_context.cloudshell_session.GetCurrentReservations().Reservations]
+            report = self.sweep_operation.sweep(ec2_client=shell_context.aws_api.ec2_client,
+                                                ec2_session=shell_context.aws_api.ec2_session,
+                                                s3_session=shell_context.aws_api.s3_session,
+                                                aws_ec2_data_model=shell_context.aws_ec2_resource_model,
+                                                active_reservation_ids=active_reservation_ids,
+                                                cloud_provider=command_context.resource.name,
+                                                cloud_provider_owner=self._get_cloud_provider_owner(command_context),
+                                                dry_run=dry_run,
+                                                logger=shell_context.logger,
+                                                reservation_ids=reservation_ids,
+                                                min_age=min_age)
+            return self.command_result_parser.set_command_result(report)
+
+    def _resume_async_cleanups(self, command_context, shell_context):
+        """
+        The cleanups journaled by a driver process that stopped are resumed by the next cleanup or status command of
+        their cloud provider, which has its credentials. A journal that cannot be read does not fail the command
+        """
+        try:
+            self.clean_up_operation.resume_async_cleanups(
+                create_aws_api=partial(self._create_dedicated_clients, shell_context),
+                aws_ec2_data_model=shell_context.aws_ec2_resource_model,
+                cloud_provider=command_context.resource.name,
+                logger=shell_context.logger)
+        except Exception:
+            shell_context.logger.exception("Failed to resume the asynchronous cleanups")
+
+    @staticmethod
+    def _get_cloud_provider_owner(command_context):
+        """
+        The cloud provider resource is identified by its name and its cloudshell server, the account of the cloud
+        provider may be shared with other cloud providers and servers
+        :rtype: str
+        """
+        return '{0}/{1}'.format(command_context.connectivity.server_address, command_context.resource.name)
+
+    def _create_dedicated_clients(self, shell_context):
+        """
+        The background cleanups and warm pool replenishes keep running after the command returned, they use clients
+        of their own boto3 session rather than the cached clients shared by the commands
+        :rtype: cloudshell.cp.aws.models.aws_api.AwsApiClients
+        """
+        return self.aws_session_manager.create_dedicated_clients(shell_context.cloudshell_session,
+                                                                 shell_context.aws_ec2_resource_model)
+
+    def _create_cloudshell_session(self, command_context):
+        """
+        The background windows credentials jobs keep running after the command returned, they open a CloudShell API
+        session of their own rather than using the session of the command
+        :param ResourceCommandContext command_context:
+        :rtype: cloudshell.api.cloudshell_api.CloudShellAPISession
+        """
+        return self.cloudshell_session_helper.get_session(server_address=command_context.connectivity.server_address,
+                                                          token=command_context.connectivity.admin_auth_token,
+                                                          reservation_domain=command_context.reservation.domain)
+
     def prepare_connectivity(self, command_context, actions, cancellation_context):
         """
         Will create a vpc for the reservation and will peer it with the management vpc
@@ -210,6 +340,7 @@ class AWSShell(object):
                 actions=actions,
                 cancellation_context=cancellation_context,
                 logger=shell_context.logger,
+                cloud_provider_owner=self._get_cloud_provider_owner(command_context),
             )
 
             return results
@@ -281,6 +412,7 @@ class AWSShell(object):
         """
         with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
             shell_context.logger.info('Delete instance')
+            self._configure_elastic_ip_pool(shell_context)
 
             resource = command_context.remote_endpoints[0]
             data_holder = self.model_parser.convert_app_resource_to_deployed_app(resource)
@@ -311,7 +443,9 @@ class AWSShell(object):
                 ec2_session=shell_context.aws_api.ec2_session,
                 instance_id=deployed_instance_id,
                 resource=resource,
-                allow_all_storage_traffic=allow_all_storage_traffic)
+                allow_all_storage_traffic=allow_all_storage_traffic,
+                region=shell_context.aws_ec2_resource_model.region,
+                reservation_id=self._get_reservation_id(command_context))
 
     def deploy_ami(self, command_context, actions, cancellation_context):
         """
@@ -322,6 +456,7 @@ class AWSShell(object):
         """
         with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
             shell_context.logger.info('Deploying AMI')
+            self._configure_elastic_ip_pool(shell_context)
 
             deploy_action = single(actions, lambda x: isinstance(x, DeployApp))
             network_actions = [a for a in actions if isinstance(a, ConnectSubnet)]
@@ -336,10 +471,63 @@ class AWSShell(object):
                         network_actions=network_actions,
                         ec2_client=shell_context.aws_api.ec2_client,
                         cancellation_context=cancellation_context,
-                        logger=shell_context.logger)
+                        logger=shell_context.logger,
+                        create_cloudshell_session=partial(self._create_cloudshell_session, command_context),
+                        create_aws_api=partial(self._create_dedicated_clients, shell_context))
 
             return deploy_data
 
+    def deploy_ami_batch(self, command_context, actions, cancellation_context):
+        """
+        Will deploy many Amazon Images of the same reservation together
+        :param ResourceCommandContext command_context:
+        :param list[RequestActionBase] actions: DeployApp actions and the ConnectSubnet actions targeting the apps
+        :param CancellationContext cancellation_context:
+        """
+        with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
+            shell_context.logger.info('Deploying AMI batch')
+            self._configure_elastic_ip_pool(shell_context)
+
+            deploy_data = self.deploy_ami_operation \
+                .deploy_many(ec2_session=shell_context.aws_api.ec2_session,
+                             s3_session=shell_context.aws_api.s3_session,
+                             reservation=self.model_parser.convert_to_reservation_model(command_context.reservation),
+                             aws_ec2_cp_resource_model=shell_context.aws_ec2_resource_model,
+                             app_deployments=self._get_app_deployments(actions),
+                             ec2_client=shell_context.aws_api.ec2_client,
+                             cancellation_context=cancellation_context,
+                             logger=shell_context.logger,
+                             create_cloudshell_session=partial(self._create_cloudshell_session, command_context))
+
+            return deploy_data
+
+    @staticmethod
+    def _get_app_deployments(actions):
+        """
+        Matches each ConnectSubnet action to the DeployApp action of the app it targets
+        :param list[RequestActionBase] actions:
+        :rtype: list[AppDeployment]
+        """
+        deploy_actions = [a for a in actions if isinstance(a, DeployApp)]
+        if not deploy_actions:
+            raise ValueError('No app to deploy')
+
+        network_actions_by_app = {deploy_action.actionParams.appName: [] for deploy_action in deploy_actions}
+        if len(network_actions_by_app) != len(deploy_actions):
+            raise ValueError('The names of the deployed apps must be unique')
+        for network_action in [a for a in actions if isinstance(a, ConnectSubnet)]:
+            if len(deploy_actions) == 1:
+                app_name = deploy_actions[0].actionParams.appName
+            else:
+                app_name = network_action.actionTarget.fullName if network_action.actionTarget else None
+            if app_name not in network_actions_by_app:
+                raise ValueError('ConnectSubnet action {0} does not target any of the deployed apps'
+                                 .format(network_action.actionId))
+            network_actions_by_app[app_name].append(network_action)
+
+        return [AppDeployment(deploy_action, network_actions_by_app[deploy_action.actionParams.appName])
+                for deploy_action in deploy_actions]
+
     def refresh_ip(self, command_context):
         """
         :param ResourceRemoteCommandContext command_context:
@@ -377,9 +565,16 @@ class AWSShell(object):
         with AwsShellContext(context=command_context, aws_session_manager=self.aws_session_manager) as shell_context:
             shell_context.logger.info('GetAccessKey')
             reservation_id = self._get_reservation_id(command_context)
+            try:
+                instance_id = self.model_parser.try_get_deployed_connected_resource_instance_id(command_context)
+            except ValueError:
+                # the command was not run on a deployed app
+                instance_id = None
             return self.access_key_operation.get_access_key(s3_session=shell_context.aws_api.s3_session,
                                                             aws_ec2_resource_model=shell_context.aws_ec2_resource_model,
-                                                            reservation_id=reservation_id)
+                                                            reservation_id=reservation_id,
+                                                            ec2_session=shell_context.aws_api.ec2_session,
+                                                            instance_id=instance_id)
 
     def set_app_security_groups(self, context, request):
         """
@@ -561,6 +756,14 @@ class AWSShell(object):
             raise e
         return actions
 
+    def _configure_elastic_ip_pool(self, shell_context):
+        """
+        :param cloudshell.cp.aws.domain.context.aws_shell.AwsShellContextModel shell_context:
+        """
+        self.elastic_ip_pool.configure(ec2_client=shell_context.aws_api.ec2_client,
+                                       min_size=shell_context.aws_ec2_resource_model.elastic_ip_pool_size,
+                                       max_size=shell_context.aws_ec2_resource_model.elastic_ip_pool_max_size)
+
     @staticmethod
     def _get_reservation_id(context):
         reservation_id = None
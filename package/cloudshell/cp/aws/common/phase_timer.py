@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class PhaseTimer(object):
+    TOTAL = 'total'
+
+    def __init__(self, timer=time.time):
+        """
+        Measures the time spent in each phase of a command, the time of a phase measured more than once is summed
+        :param timer: function returning the current time in seconds
+        """
+        self._timer = timer
+        self._start_time = timer()
+        self._durations = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase):
+        """
+        Measures the time of the block as the phase, also when the block raises
+        :param str phase:
+        """
+        start_time = self._timer()
+        try:
+            yield
+        finally:
+            self.add(phase, self._timer() - start_time)
+
+    def add(self, phase, seconds):
+        """
+        :param str phase:
+        :param float seconds:
+        """
+        with self._lock:
+            self._durations[phase] = self._durations.get(phase, 0) + seconds
+
+    def get_durations(self):
+        """
+        :return: the seconds of each phase in the order the phases started, and the total since the timer was created
+        :rtype: OrderedDict
+        """
+        durations = OrderedDict([(self.TOTAL, round(self._timer() - self._start_time, 3))])
+        with self._lock:
+            durations.update((phase, round(seconds, 3)) for phase, seconds in self._durations.items())
+        return durations
+
+    def get_summary(self):
+        """
+        :return: the durations as a json object, so the logs of many commands can be parsed and compared
+        :rtype: str
+        """
+        return json.dumps(self.get_durations())
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from Queue import Queue
+
+
+class TaskGraph(object):
+    def __init__(self, max_workers=4, check_cancelled=None, stop_on_error=True):
+        """
+        Runs tasks on up to max_workers threads, each task once all the tasks it depends on succeeded
+        :param int max_workers:
+        :param check_cancelled: function with no arguments called before each task starts, raises if the command
+        was cancelled
+        :param bool stop_on_error: when False a failed task only skips the tasks that depend on it, and run records
+        the errors instead of raising
+        """
+        if max_workers < 1:
+            raise ValueError('TaskGraph needs at least one worker')
+
+        self.max_workers = max_workers
+        self.check_cancelled = check_cancelled
+        self.stop_on_error = stop_on_error
+        self.results = {}  # type: dict
+        """the result of each task that succeeded by its name"""
+        self.errors = OrderedDict()
+        """the error of each task that failed by its name, in the order the tasks failed"""
+        self.skipped = []  # type: list[str]
+        """the names of the tasks that did not run"""
+        self._tasks = OrderedDict()
+
+    def add(self, name, func, depends_on=None):
+        """
+        :param str name: the unique name of the task
+        :param func: function with no arguments, the results of the tasks it depends on are in self.results
+        :param list[str] depends_on: the names of already added tasks that must succeed before this task starts
+        """
+        if name in self._tasks:
+            raise ValueError('Task {0} was already added'.format(name))
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            if dependency not in self._tasks:
+                raise ValueError('Task {0} depends on unknown task {1}'.format(name, dependency))
+        self._tasks[name] = (func, depends_on)
+
+    @property
+    def names(self):
+        """
+        :return: the names of the tasks in the order they were added
+        :rtype: list[str]
+        """
+        return list(self._tasks)
+
+    def run(self):
+        """
+        Runs all the tasks. Once a task fails or the command is cancelled no new task starts, the running tasks
+        are waited for and the first error is raised. Unless stop_on_error, a failed task only skips the tasks that
+        depend on it
+        :return: the result of each task by its name
+        :rtype: dict
+        """
+        pending = OrderedDict(self._tasks)
+        completed = Queue()
+        running = 0
+        error = None
+
+        while True:
+            if error is None:
+                for name in self._get_ready_tasks(pending):
+                    if running >= self.max_workers:
+                        break
+                    try:
+                        if self.check_cancelled:
+                            self.check_cancelled()
+                    except Exception as e:
+                        error = e
+                        break
+                    self._start(name, pending.pop(name)[0], completed)
+                    running += 1
+
+            if not running:
+                break
+
+            name, result, task_error = completed.get()
+            running -= 1
+            if task_error is not None:
+                self.errors[name] = task_error
+                if self.stop_on_error:
+                    error = error or task_error
+            else:
+                self.results[name] = result
+
+        # the tasks left depend on a failed task, or were not started because of an error
+        self.skipped = list(pending)
+        if error is not None:
+            raise error
+        return self.results
+
+    def _get_ready_tasks(self, pending):
+        return [name for name, (_, depends_on) in pending.items()
+                if all(dependency in self.results for dependency in depends_on)]
+
+    @staticmethod
+    def _start(name, func, completed):
+        def run_task():
+            try:
+                completed.put((name, func(), None))
+            except Exception as e:
+                completed.put((name, None, e))
+
+        thread = threading.Thread(target=run_task, name='TaskGraph-{0}'.format(name))
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    def __init__(self, ttl, max_size, timer=time.time):
+        """
+        Thread safe in-memory cache with time-to-live expiration and least-recently-used eviction
+        :param ttl: the time in seconds an entry is kept in the cache. None means entries never expire
+        :type ttl: float
+        :param max_size: the max number of entries, the least recently used entry is evicted above it
+        :type max_size: int
+        :param timer: function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks = {}
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value of the key, or default if it is missing or expired
+        :param key:
+        :param default:
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._timer():
+                return default
+            # re-insert to mark the entry as the most recently used one
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        """
+        Caches the value under the key, evicting the least recently used entries if the cache is full
+        :param key:
+        :param value:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            expires_at = self._timer() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the cached value of the key, creating and caching it with factory if it is missing or expired.
+        The factory is called while holding a lock of the key only, so concurrent callers create each value once
+        and the other keys are read and created meanwhile
+        :param key:
+        :param factory: function with no arguments that creates the value
+        :return:
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                # created by the caller that held the key lock before
+                value = self.get(key, _MISSING)
+                if value is _MISSING:
+                    value = factory()
+                    self.set(key, value)
+                return value
+        finally:
+            with self._lock:
+                # the callers still waiting for the lock find the value cached
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+
+    def pop(self, key, default=None):
+        """
+        Removes the key from the cache and returns its value
+        :param key:
+        :param default:
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[0] if entry is not None else default
+
+    def remove_if(self, predicate):
+        """
+        Removes all the entries whose key matches the predicate
+        :param predicate: function receiving a key and returning True if the entry should be removed
+        :return: the number of removed entries
+        :rtype: int
+        """
+        with self._lock:
+            keys = [key for key in self._entries.keys() if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_MISSING = object()
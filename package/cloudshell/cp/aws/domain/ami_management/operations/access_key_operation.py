@@ -1,4 +1,5 @@
 from cloudshell.cp.aws.domain.services.ec2.keypair import KeyPairService
+from cloudshell.cp.aws.domain.services.ec2.warm_instance_pool import WarmInstancePool
 from cloudshell.cp.aws.domain.services.s3.bucket import S3BucketService
 from cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model import AWSEc2CloudProviderResourceModel
 
@@ -12,14 +13,22 @@ class GetAccessKeyOperation(object):
         """
         self.key_pair_service = key_pair_service
 
-    def get_access_key(self, s3_session, aws_ec2_resource_model, reservation_id):
+    def get_access_key(self, s3_session, aws_ec2_resource_model, reservation_id, ec2_session=None, instance_id=None):
         """
-        Returns the content of the pem file stores in s3 for the given reservation
+        Returns the content of the pem file stores in s3 for the given reservation, or the pem file of the instance
+        when it was claimed from the warm pool, since it was launched with a key pair of its own
         :param s3_session:
         :param AWSEc2CloudProviderResourceModel aws_ec2_resource_model: The resource model of the AMI deployment option
         :param str reservation_id:
+        :param ec2_session:
+        :param str instance_id: the instance of the deployed app
         :return:
         """
+        if ec2_session and instance_id and WarmInstancePool.is_claimed(ec2_session.Instance(instance_id)):
+            return self.key_pair_service.load_instance_key(s3_session=s3_session,
+                                                           bucket_name=aws_ec2_resource_model.key_pairs_location,
+                                                           reservation_id=reservation_id,
+                                                           instance_id=instance_id)
         return self.key_pair_service.load_key_pair_by_name(s3_session=s3_session,
                                                            bucket_name=aws_ec2_resource_model.key_pairs_location,
                                                            reservation_id=reservation_id)
@@ -1,17 +1,32 @@
+import json
 import traceback
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
 from multiprocessing import TimeoutError
 
+from cloudshell.cp.aws.common.phase_timer import PhaseTimer
+from cloudshell.cp.aws.common.task_graph import TaskGraph
 from cloudshell.cp.aws.domain.common.cancellation_service import CommandCancellationService
+from cloudshell.cp.aws.domain.common.exceptions import CancellationException
+from cloudshell.cp.aws.domain.common.image_metadata_cache import ImageMetadataCache
 from cloudshell.cp.aws.domain.common.list_helper import first_or_default
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
 from cloudshell.cp.aws.domain.common.vm_details_provider import VmDetailsProvider
+from cloudshell.cp.aws.domain.common.windows_credentials_jobs import WindowsCredentialsJobs
+from cloudshell.cp.aws.domain.services.cloudshell.deployed_app_credentials import DeployedAppCredentialsService
 from cloudshell.cp.aws.domain.services.ec2.security_group import SecurityGroupService
 from cloudshell.cp.aws.domain.services.ec2.tags import IsolationTagValues, TypeTagValues
 from cloudshell.cp.aws.domain.services.ec2.elastic_ip import ElasticIpService
+from cloudshell.cp.aws.domain.services.ec2.warm_instance_pool import WarmInstancePool
 from cloudshell.cp.aws.domain.services.parsers.port_group_attribute_parser import PortGroupAttributeParser
 from cloudshell.cp.aws.domain.services.strategy.device_index import *
 from cloudshell.cp.aws.models.ami_deployment_model import AMIDeploymentModel
+from cloudshell.cp.aws.models.app_deployment import AppDeployment
+from cloudshell.cp.aws.models.aws_api import create_resource_for_thread
 from cloudshell.cp.aws.models.deploy_aws_ec2_ami_instance_resource_model import DeployAWSEc2AMIInstanceResourceModel
+from cloudshell.cp.aws.models.image_metadata import ImageMetadata
 from cloudshell.shell.core.driver_context import CancellationContext
 from cloudshell.cp.aws.domain.services.ec2.instance import InstanceService
 from cloudshell.cp.aws.domain.services.ec2.instance_credentials import InstanceCredentialsService
@@ -21,16 +36,34 @@ from cloudshell.cp.aws.domain.services.ec2.vpc import VPCService
 from cloudshell.cp.aws.domain.services.ec2.subnet import SubnetService
 from cloudshell.cp.aws.domain.services.ec2.network_interface import NetworkInterfaceService
 from cloudshell.cp.aws.models.network_actions_models import DeployNetworkingResultModel
+from cloudshell.cp.aws.models.rollback_report import RollbackReport
 from cloudshell.cp.core.models import ConnectToSubnetActionResult, ConnectToSubnetParams, ConnectSubnet, DeployAppResult
 from cloudshell.cp.core.utils import convert_dict_to_attributes_list
 
 
 class DeployAMIOperation(object):
     MAX_IO1_IOPS = 20000
+    PRE_LAUNCH_MAX_WORKERS = 4
+    SECURITY_GROUP_TASK = 'security_group'
+    IMAGE_TASK = 'image'
+    SANDBOX_SECURITY_GROUP_TASK = 'sandbox_security_group'
+    SINGLE_SUBNET_TASK = 'single_subnet'
+    DEPLOYMENT_PARAMETERS_TASK = 'deployment_parameters'
+    ROLLBACK_MAX_WORKERS = 8
+    CREDENTIALS_MAX_WORKERS = 8
+    SANDBOX_LOOKUP_PHASE = 'sandbox_lookup'
+    PRE_LAUNCH_PHASE = 'pre_launch'
+    ELASTIC_IPS_PHASE = 'elastic_ips'
+    CREDENTIALS_PHASE = 'credentials'
+    WARM_POOL_PHASE = 'warm_pool'
+    ROLLBACK_PHASE = 'rollback'
+    TERMINATE_INSTANCES_TASK = 'terminate_instances'
 
     def __init__(self, instance_service, ami_credential_service, security_group_service, tag_service,
                  vpc_service, key_pair_service, subnet_service, elastic_ip_service, network_interface_service,
-                 cancellation_service, device_index_strategy, vm_details_provider):
+                 cancellation_service, device_index_strategy, vm_details_provider, sandbox_footprint_cache=None,
+                 windows_credentials_jobs=None, warm_instance_pool=None,
+                 image_metadata_cache=None):
         """
         :param InstanceService instance_service: Instance Service
         :param InstanceCredentialsService ami_credential_service: AMI Credential Service
@@ -44,6 +77,10 @@ class DeployAMIOperation(object):
         :param CommandCancellationService cancellation_service:
         :param AbstractDeviceIndexStrategy device_index_strategy:
         :param VmDetailsProvider vm_details_provider:
+        :param SandboxFootprintCache sandbox_footprint_cache: the sandbox vpc and security groups are taken from it
+        :param WindowsCredentialsJobs windows_credentials_jobs: retrieves windows credentials in the background
+        :param WarmInstancePool warm_instance_pool: standby instances claimed by deploys instead of launching
+        :param ImageMetadataCache image_metadata_cache: the metadata of the deployed AMIs
         """
         self.tag_service = tag_service
         self.instance_service = instance_service
@@ -56,10 +93,16 @@ class DeployAMIOperation(object):
         self.elastic_ip_service = elastic_ip_service
         self.network_interface_service = network_interface_service
         self.device_index_strategy = device_index_strategy
+        self.sandbox_footprint_cache = sandbox_footprint_cache or SandboxFootprintCache()
         self.vm_details_provider = vm_details_provider
+        self.windows_credentials_jobs = windows_credentials_jobs or \
+            WindowsCredentialsJobs(ami_credential_service, DeployedAppCredentialsService())
+        self.warm_instance_pool = warm_instance_pool
+        self.image_metadata_cache = image_metadata_cache or ImageMetadataCache()
 
     def deploy(self, ec2_session, s3_session, name, reservation, aws_ec2_cp_resource_model,
-               ami_deploy_action, network_actions, ec2_client, cancellation_context, logger):
+               ami_deploy_action, network_actions, ec2_client, cancellation_context, logger,
+               create_cloudshell_session=None, create_aws_api=None):
         """
         :param ec2_client: boto3.ec2.client
         :param ec2_session: EC2 session
@@ -76,16 +119,26 @@ class DeployAMIOperation(object):
         :type network_actions: cloudshell.cp.core.models.ConnectSubnet
         :param logging.Logger logger:
         :param CancellationContext cancellation_context:
+        :param create_cloudshell_session: function with no arguments that opens a CloudShell API session, the windows
+        credentials retrieved in the background are set with it
+        :param create_aws_api: function with no arguments that creates aws api clients of their own boto3 session,
+        the warm pool is replenished with them in the background
         :return: Deploy Result
         :rtype: list[RequestActionBase]
         """
+        phase_timer = PhaseTimer()
         ami_deployment_model = ami_deploy_action.actionParams.deployment.customModel
-        vpc = self.vpc_service.find_vpc_for_reservation(ec2_session=ec2_session,
-                                                        reservation_id=reservation.reservation_id)
-        if not vpc:
-            raise ValueError('VPC is not set for this reservation')
-
-        key_name = self.key_pair_service.get_reservation_key_name(reservation_id=reservation.reservation_id)
+        with phase_timer.span(self.SANDBOX_LOOKUP_PHASE):
+            vpc = self.sandbox_footprint_cache.get_vpc(
+                ec2_session=ec2_session,
+                region=aws_ec2_cp_resource_model.region,
+                reservation_id=reservation.reservation_id,
+                find_vpc=lambda: self.vpc_service.find_vpc_for_reservation(ec2_session=ec2_session,
+                                                                           reservation_id=reservation.reservation_id))
+            if not vpc:
+                raise ValueError('VPC is not set for this reservation')
+
+            key_name = self.key_pair_service.get_reservation_key_name(reservation_id=reservation.reservation_id)
         logger.info("Found shared sandbox key pair '{0}'".format(key_name))
 
         self.cancellation_service.check_if_cancelled(cancellation_context)
@@ -93,78 +146,481 @@ class DeployAMIOperation(object):
         instance = None
         security_group = None
         network_config_results = self._prepare_network_result_models(network_actions=network_actions)
+        pre_launch = self._create_pre_launch_graph(ec2_session=ec2_session,
+                                                   aws_ec2_resource_model=aws_ec2_cp_resource_model,
+                                                   ami_deployment_model=ami_deployment_model,
+                                                   network_actions=network_actions,
+                                                   vpc=vpc,
+                                                   key_pair=key_name,
+                                                   reservation=reservation,
+                                                   network_config_results=network_config_results,
+                                                   cancellation_context=cancellation_context,
+                                                   logger=logger)
         try:
-            security_group = self._create_security_group_for_instance(ami_deployment_model=ami_deployment_model,
-                                                                      ec2_session=ec2_session,
-                                                                      reservation=reservation,
-                                                                      vpc=vpc,
-                                                                      logger=logger)
-
-            self.cancellation_service.check_if_cancelled(cancellation_context)
-
-            ami_deployment_info = self._create_deployment_parameters(ec2_session=ec2_session,
-                                                                     aws_ec2_resource_model=aws_ec2_cp_resource_model,
-                                                                     ami_deployment_model=ami_deployment_model,
-                                                                     network_actions=network_actions,
-                                                                     vpc=vpc,
-                                                                     security_group=security_group,
-                                                                     key_pair=key_name,
-                                                                     reservation=reservation,
-                                                                     network_config_results=network_config_results,
-                                                                     logger=logger)
-
-            instance = self.instance_service.create_instance(
-                ec2_session=ec2_session,
-                name=name,
-                reservation=reservation,
-                ami_deployment_info=ami_deployment_info,
-                ec2_client=ec2_client,
-                wait_for_status_check=ami_deployment_model.wait_for_status_check,
-                cancellation_context=cancellation_context,
-                logger=logger)
+            try:
+                with phase_timer.span(self.PRE_LAUNCH_PHASE):
+                    pre_launch.run()
+            finally:
+                security_group = pre_launch.results.get(self.SECURITY_GROUP_TASK)
+            ami_deployment_info = pre_launch.results[self.DEPLOYMENT_PARAMETERS_TASK]
+
+            pooled_instance = self._claim_pooled_instance(ec2_session=ec2_session,
+                                                          ec2_client=ec2_client,
+                                                          s3_session=s3_session,
+                                                          aws_ec2_cp_resource_model=aws_ec2_cp_resource_model,
+                                                          reservation_id=reservation.reservation_id,
+                                                          ami_deployment_model=ami_deployment_model,
+                                                          ami_deployment_info=ami_deployment_info,
+                                                          image=pre_launch.results[self.IMAGE_TASK],
+                                                          network_config_results=network_config_results,
+                                                          logger=logger,
+                                                          phase_timer=phase_timer,
+                                                          create_aws_api=create_aws_api)
+            if pooled_instance:
+                instance = pooled_instance
+                self.instance_service.start_pooled_instance(
+                    ec2_client=ec2_client,
+                    instance=instance,
+                    name=name,
+                    reservation=reservation,
+                    ami_deployment_info=ami_deployment_info,
+                    wait_for_status_check=ami_deployment_model.wait_for_status_check,
+                    cancellation_context=cancellation_context,
+                    logger=logger,
+                    phase_timer=phase_timer)
+            else:
+                instance = self.instance_service.create_instance(
+                    ec2_session=ec2_session,
+                    name=name,
+                    reservation=reservation,
+                    ami_deployment_info=ami_deployment_info,
+                    ec2_client=ec2_client,
+                    wait_for_status_check=ami_deployment_model.wait_for_status_check,
+                    cancellation_context=cancellation_context,
+                    logger=logger,
+                    phase_timer=phase_timer)
 
             logger.info("Instance created, populating results with interface data")
             self.instance_service.wait_for_instance_to_run_in_aws(ec2_client=ec2_client,
                                                  instance=instance,
                                                  wait_for_status_check=ami_deployment_model.wait_for_status_check,
                                                  cancellation_context=cancellation_context,
-                                                 logger=logger)
+                                                 logger=logger,
+                                                 phase_timer=phase_timer)
 
             self._populate_network_config_results_with_interface_data(instance=instance,
                                                                       network_config_results=network_config_results)
 
             self.cancellation_service.check_if_cancelled(cancellation_context)
 
-            self.elastic_ip_service.set_elastic_ips(ec2_session=ec2_session,
-                                                    ec2_client=ec2_client,
-                                                    instance=instance,
-                                                    ami_deployment_model=ami_deployment_model,
-                                                    network_actions=network_actions,
-                                                    network_config_results=network_config_results,
-                                                    logger=logger)
+            with phase_timer.span(self.ELASTIC_IPS_PHASE):
+                self.elastic_ip_service.set_elastic_ips(ec2_session=ec2_session,
+                                                        ec2_client=ec2_client,
+                                                        instance=instance,
+                                                        ami_deployment_model=ami_deployment_model,
+                                                        network_actions=network_actions,
+                                                        network_config_results=network_config_results,
+                                                        logger=logger)
 
             self.cancellation_service.check_if_cancelled(cancellation_context)
 
         except Exception as e:
-            self._rollback_deploy(ec2_session=ec2_session,
-                                  instance_id=self._extract_instance_id_on_cancellation(e, instance),
-                                  custom_security_group=security_group,
-                                  network_config_results=network_config_results,
-                                  logger=logger)
+            with phase_timer.span(self.ROLLBACK_PHASE):
+                report = self._rollback_deploy(ec2_session=ec2_session,
+                                               instance_id=self._extract_instance_id_on_cancellation(e, instance),
+                                               custom_security_group=security_group,
+                                               network_config_results=network_config_results,
+                                               logger=logger)
+            self._attach_rollback_errors(e, report)
+            logger.info("Deploy timing of '{0}': {1}".format(name, phase_timer.get_summary()))
             raise  # re-raise original exception after rollback
 
         logger.info("Instance {} created, getting ami credentials".format(instance.id))
-        ami_credentials = self._get_ami_credentials(key_pair_location=aws_ec2_cp_resource_model.key_pairs_location,
-                                                    wait_for_credentials=ami_deployment_model.wait_for_credentials,
-                                                    instance=instance,
-                                                    reservation=reservation,
-                                                    s3_session=s3_session,
-                                                    ami_deploy_action=ami_deploy_action,
-                                                    cancellation_context=cancellation_context,
-                                                    logger=logger)
+        with phase_timer.span(self.CREDENTIALS_PHASE):
+            ami_credentials = self._get_ami_credentials(
+                key_pair_location=aws_ec2_cp_resource_model.key_pairs_location,
+                wait_for_credentials=ami_deployment_model.wait_for_credentials,
+                instance=instance,
+                reservation=reservation,
+                s3_session=s3_session,
+                ami_deploy_action=ami_deploy_action,
+                cancellation_context=cancellation_context,
+                logger=logger,
+                in_background=ami_deployment_model.retrieve_credentials_in_background,
+                create_cloudshell_session=create_cloudshell_session,
+                from_warm_pool=pooled_instance is not None)
 
         logger.info("Preparing result")
+        deploy_timing = phase_timer.get_durations()
+        logger.info("Deploy timing of '{0}': {1}".format(name, phase_timer.get_summary()))
+
+        return self._prepare_deploy_results(instance=instance,
+                                            ami_credentials=ami_credentials,
+                                            ami_deploy_action=ami_deploy_action,
+                                            network_actions=network_actions,
+                                            network_config_results=network_config_results,
+                                            deploy_timing=deploy_timing)
+
+    def deploy_many(self, ec2_session, s3_session, reservation, aws_ec2_cp_resource_model, app_deployments,
+                    ec2_client, cancellation_context, logger, create_cloudshell_session=None):
+        """
+        Deploys many apps of the same reservation together. The sandbox lookups are shared, the apps with identical
+        launch parameters are launched by a single RunInstances call and all the instances are waited for together.
+        An app that fails, or whose shared launch or wait fails, is rolled back alone and reported by a failed
+        DeployAppResult, a cancellation rolls back all the apps and is raised
+        :param ec2_client: boto3.ec2.client
+        :param ec2_session: EC2 session
+        :param s3_session: S3 Session
+        :param reservation: reservation model
+        :type reservation: cloudshell.cp.aws.models.reservation_model.ReservationModel
+        :param aws_ec2_cp_resource_model: The resource model of the AMI deployment option
+        :type aws_ec2_cp_resource_model: cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel
+        :param list[AppDeployment] app_deployments: the apps to deploy
+        :param CancellationContext cancellation_context:
+        :param logging.Logger logger:
+        :param create_cloudshell_session: function with no arguments that opens a CloudShell API session, the windows
+        credentials retrieved in the background are set with it
+        :return: the results of all the apps
+        :rtype: list[RequestActionBase]
+        """
+        vpc = self.sandbox_footprint_cache.get_vpc(
+            ec2_session=ec2_session,
+            region=aws_ec2_cp_resource_model.region,
+            reservation_id=reservation.reservation_id,
+            find_vpc=lambda: self.vpc_service.find_vpc_for_reservation(ec2_session=ec2_session,
+                                                                       reservation_id=reservation.reservation_id))
+        if not vpc:
+            raise ValueError('VPC is not set for this reservation')
+
+        key_name = self.key_pair_service.get_reservation_key_name(reservation_id=reservation.reservation_id)
+        logger.info("Found shared sandbox key pair '{0}'".format(key_name))
+
+        self.cancellation_service.check_if_cancelled(cancellation_context)
+
+        try:
+            with self._failing_app_deployments(ec2_session, app_deployments, logger):
+                for app_deployment in app_deployments:
+                    self._prepare_app_deployment(ec2_session=ec2_session,
+                                                 app_deployment=app_deployment,
+                                                 aws_ec2_cp_resource_model=aws_ec2_cp_resource_model,
+                                                 vpc=vpc,
+                                                 key_name=key_name,
+                                                 reservation=reservation,
+                                                 cancellation_context=cancellation_context,
+                                                 logger=logger)
+
+                self._launch_app_deployments(ec2_session=ec2_session,
+                                             app_deployments=app_deployments,
+                                             reservation=reservation,
+                                             logger=logger)
+
+                self._wait_for_app_deployments(ec2_session=ec2_session,
+                                               ec2_client=ec2_client,
+                                               app_deployments=app_deployments,
+                                               cancellation_context=cancellation_context,
+                                               logger=logger)
+
+                for app_deployment in app_deployments:
+                    self._complete_app_deployment(ec2_session=ec2_session,
+                                                  ec2_client=ec2_client,
+                                                  app_deployment=app_deployment,
+                                                  cancellation_context=cancellation_context,
+                                                  logger=logger)
+        except CancellationException as e:
+            report = self._rollback_app_deployments(ec2_session=ec2_session,
+                                                    app_deployments=[a for a in app_deployments if not a.failed],
+                                                    logger=logger)
+            self._attach_rollback_errors(e, report)
+            raise
+
+        ami_credentials = self._get_app_deployments_credentials(ec2_session=ec2_session,
+                                                                s3_session=s3_session,
+                                                                aws_ec2_cp_resource_model=aws_ec2_cp_resource_model,
+                                                                app_deployments=app_deployments,
+                                                                reservation=reservation,
+                                                                cancellation_context=cancellation_context,
+                                                                create_cloudshell_session=create_cloudshell_session,
+                                                                logger=logger)
+
+        results = []
+        for app_deployment in app_deployments:
+            if app_deployment.failed:
+                results.append(self._prepare_failed_deploy_result(app_deployment))
+                continue
 
+            action_id = app_deployment.deploy_action.actionId
+            results.extend(self._prepare_deploy_results(instance=app_deployment.instance,
+                                                        ami_credentials=ami_credentials[action_id],
+                                                        ami_deploy_action=app_deployment.deploy_action,
+                                                        network_actions=app_deployment.network_actions,
+                                                        network_config_results=app_deployment.network_config_results))
+        return results
+
+    def _get_app_deployments_credentials(self, ec2_session, s3_session, aws_ec2_cp_resource_model, app_deployments,
+                                         reservation, cancellation_context, create_cloudshell_session, logger):
+        """
+        Gets the credentials of the apps concurrently, an app whose credentials fail is failed and rolled back on
+        its own
+        :param list[AppDeployment] app_deployments:
+        :return: the credentials of each app that did not fail by its action id
+        :rtype: dict
+        """
+        credentials = TaskGraph(max_workers=self.CREDENTIALS_MAX_WORKERS, stop_on_error=False)
+        for app_deployment in app_deployments:
+            if app_deployment.failed:
+                continue
+            logger.info("Instance {} created, getting ami credentials".format(app_deployment.instance.id))
+            credentials.add(app_deployment.deploy_action.actionId, partial(
+                self._get_ami_credentials,
+                key_pair_location=aws_ec2_cp_resource_model.key_pairs_location,
+                wait_for_credentials=app_deployment.ami_deployment_model.wait_for_credentials,
+                instance=app_deployment.instance,
+                reservation=reservation,
+                s3_session=s3_session,
+                ami_deploy_action=app_deployment.deploy_action,
+                cancellation_context=cancellation_context,
+                logger=logger,
+                in_background=app_deployment.ami_deployment_model.retrieve_credentials_in_background,
+                create_cloudshell_session=create_cloudshell_session))
+        credentials.run()
+
+        cancellation = first_or_default(credentials.errors.values(), lambda e: isinstance(e, CancellationException))
+        if cancellation:
+            report = self._rollback_app_deployments(ec2_session=ec2_session,
+                                                    app_deployments=[a for a in app_deployments if not a.failed],
+                                                    logger=logger)
+            self._attach_rollback_errors(cancellation, report)
+            raise cancellation
+
+        for app_deployment in app_deployments:
+            error = credentials.errors.get(app_deployment.deploy_action.actionId)
+            if error is not None:
+                self._fail_app_deployment(ec2_session, app_deployment, error, logger)
+        return credentials.results
+
+    def _prepare_app_deployment(self, ec2_session, app_deployment, aws_ec2_cp_resource_model, vpc, key_name,
+                                reservation, cancellation_context, logger):
+        """
+        Creates the custom security group and the launch parameters of the app
+        :param AppDeployment app_deployment:
+        """
+        app_deployment.network_config_results = \
+            self._prepare_network_result_models(network_actions=app_deployment.network_actions)
+        pre_launch = self._create_pre_launch_graph(ec2_session=ec2_session,
+                                                   aws_ec2_resource_model=aws_ec2_cp_resource_model,
+                                                   ami_deployment_model=app_deployment.ami_deployment_model,
+                                                   network_actions=app_deployment.network_actions,
+                                                   vpc=vpc,
+                                                   key_pair=key_name,
+                                                   reservation=reservation,
+                                                   network_config_results=app_deployment.network_config_results,
+                                                   cancellation_context=cancellation_context,
+                                                   logger=logger)
+        try:
+            try:
+                pre_launch.run()
+            finally:
+                app_deployment.security_group = pre_launch.results.get(self.SECURITY_GROUP_TASK)
+            app_deployment.ami_deployment_info = pre_launch.results[self.DEPLOYMENT_PARAMETERS_TASK]
+        except CancellationException:
+            raise
+        except Exception as e:
+            self._fail_app_deployment(ec2_session, app_deployment, e, logger)
+
+    def _launch_app_deployments(self, ec2_session, app_deployments, reservation, logger):
+        """
+        Launches the instances of each group of apps with identical launch parameters in a single call
+        :param list[AppDeployment] app_deployments:
+        """
+        launch_groups = OrderedDict()
+        for app_deployment in app_deployments:
+            if not app_deployment.failed:
+                launch_groups.setdefault(self._get_launch_group_key(app_deployment), []).append(app_deployment)
+
+        for group in launch_groups.values():
+            names = [app_deployment.name for app_deployment in group]
+            try:
+                instances = self.instance_service.create_instances(
+                    ec2_session=ec2_session,
+                    names=names,
+                    reservation=reservation,
+                    ami_deployment_info=group[0].ami_deployment_info,
+                    logger=logger)
+            except Exception as e:
+                for app_deployment in group:
+                    self._fail_app_deployment(ec2_session, app_deployment, e, logger)
+                continue
+
+            for app_deployment, instance in zip(group, instances):
+                app_deployment.instance = instance
+
+    def _wait_for_app_deployments(self, ec2_session, ec2_client, app_deployments, cancellation_context, logger):
+        """
+        Waits for the instances of all the apps in batched calls and sets their names
+        :param list[AppDeployment] app_deployments:
+        """
+        launched = [app_deployment for app_deployment in app_deployments if not app_deployment.failed]
+        if not launched:
+            return
+
+        with self._failing_app_deployments(ec2_session, launched, logger):
+            self.instance_service.wait_for_instances_to_run_in_aws(
+                ec2_client=ec2_client,
+                instances=[app_deployment.instance for app_deployment in launched],
+                wait_for_status_check=False,
+                cancellation_context=cancellation_context,
+                logger=logger)
+
+            self.instance_service.set_instances_names(
+                ec2_client=ec2_client,
+                instances=[app_deployment.instance for app_deployment in launched],
+                names=[app_deployment.name for app_deployment in launched])
+
+        status_checked = [app_deployment for app_deployment in launched
+                          if not app_deployment.failed and app_deployment.ami_deployment_model.wait_for_status_check]
+        if not status_checked:
+            return
+
+        impaired_instance_ids = []
+        with self._failing_app_deployments(ec2_session, status_checked, logger):
+            impaired_instance_ids = self.instance_service.wait_for_instances_to_run_in_aws(
+                ec2_client=ec2_client,
+                instances=[app_deployment.instance for app_deployment in status_checked],
+                wait_for_status_check=True,
+                cancellation_context=cancellation_context,
+                logger=logger)
+
+        for app_deployment in status_checked:
+            if not app_deployment.failed and app_deployment.instance.id in impaired_instance_ids:
+                error = ValueError('Instance status check is not OK. Check the log and aws console for more details')
+                self._fail_app_deployment(ec2_session, app_deployment, error, logger)
+
+    def _complete_app_deployment(self, ec2_session, ec2_client, app_deployment, cancellation_context, logger):
+        """
+        :param AppDeployment app_deployment: an app whose instance is running
+        """
+        if app_deployment.failed:
+            return
+
+        try:
+            self._populate_network_config_results_with_interface_data(
+                instance=app_deployment.instance,
+                network_config_results=app_deployment.network_config_results)
+
+            self.cancellation_service.check_if_cancelled(cancellation_context)
+
+            self.elastic_ip_service.set_elastic_ips(ec2_session=ec2_session,
+                                                    ec2_client=ec2_client,
+                                                    instance=app_deployment.instance,
+                                                    ami_deployment_model=app_deployment.ami_deployment_model,
+                                                    network_actions=app_deployment.network_actions,
+                                                    network_config_results=app_deployment.network_config_results,
+                                                    logger=logger)
+        except CancellationException:
+            raise
+        except Exception as e:
+            self._fail_app_deployment(ec2_session, app_deployment, e, logger)
+
+    @staticmethod
+    def _get_launch_group_key(app_deployment):
+        """
+        Apps with the same key can be launched by a single RunInstances call
+        :param AppDeployment app_deployment:
+        :rtype: str
+        """
+        ami_deployment_info = app_deployment.ami_deployment_info
+        if ami_deployment_info.private_ip_address or \
+                any('PrivateIpAddress' in network_interface
+                    for network_interface in ami_deployment_info.network_interfaces):
+            # instances with static private ips cannot be launched together
+            return app_deployment.deploy_action.actionId
+
+        return json.dumps([ami_deployment_info.aws_ami_id,
+                           ami_deployment_info.instance_type,
+                           ami_deployment_info.aws_key,
+                           ami_deployment_info.iam_role,
+                           ami_deployment_info.user_data,
+                           ami_deployment_info.custom_tags,
+                           ami_deployment_info.block_device_mappings,
+                           ami_deployment_info.network_interfaces],
+                          sort_keys=True)
+
+    @contextmanager
+    def _failing_app_deployments(self, ec2_session, app_deployments, logger):
+        """
+        Fails and rolls back the apps that did not fail yet when a step shared by them raises, a cancellation is
+        raised to roll back all the apps
+        :param list[AppDeployment] app_deployments: the apps of the step
+        """
+        try:
+            yield
+        except CancellationException:
+            raise
+        except Exception as e:
+            for app_deployment in app_deployments:
+                if not app_deployment.failed:
+                    self._fail_app_deployment(ec2_session, app_deployment, e, logger)
+
+    def _fail_app_deployment(self, ec2_session, app_deployment, error, logger):
+        """
+        :param AppDeployment app_deployment:
+        :param Exception error:
+        """
+        logger.error("Failed to deploy app '{0}': {1}".format(app_deployment.name, error))
+        app_deployment.error = error
+        self._rollback_app_deployment(ec2_session, app_deployment, logger)
+
+    def _rollback_app_deployment(self, ec2_session, app_deployment, logger):
+        """
+        :param AppDeployment app_deployment:
+        """
+        try:
+            report = self._rollback_deploy(ec2_session=ec2_session,
+                                           instance_id=app_deployment.instance.id if app_deployment.instance else None,
+                                           custom_security_group=app_deployment.security_group,
+                                           network_config_results=app_deployment.network_config_results,
+                                           logger=logger)
+            app_deployment.rollback_errors = report.errors
+        except Exception as e:
+            logger.exception("Failed to rollback the deployment of app '{0}'".format(app_deployment.name))
+            app_deployment.rollback_errors = ['rollback failed: {0}'.format(e)]
+
+    def _prepare_failed_deploy_result(self, app_deployment):
+        """
+        The error message reports the resources that were not rolled back, so they can be cleaned up manually
+        :param AppDeployment app_deployment:
+        :rtype: DeployAppResult
+        """
+        error_message = str(app_deployment.error)
+        if app_deployment.rollback_errors:
+            error_message += '. Rollback did not complete: {0}'.format('; '.join(app_deployment.rollback_errors))
+        return DeployAppResult(actionId=app_deployment.deploy_action.actionId,
+                               success=False,
+                               errorMessage=error_message)
+
+    @staticmethod
+    def _attach_rollback_errors(error, report):
+        """
+        Records the failed rollback steps on the error raised by the deploy, the error is raised as is so a
+        cancellation is still reported as a cancellation
+        :param Exception error:
+        :param RollbackReport report:
+        """
+        if not report.succeeded:
+            error.rollback_errors = report.errors
+
+    def _prepare_deploy_results(self, instance, ami_credentials, ami_deploy_action, network_actions,
+                                network_config_results, deploy_timing=None):
+        """
+        :param instance: the deployed instance
+        :param cloudshell.cp.aws.models.ami_credentials.AMICredentials ami_credentials:
+        :param cloudshell.cp.core.models.DeployApp ami_deploy_action:
+        :param list[cloudshell.cp.core.models.ConnectSubnet] network_actions:
+        :param list[DeployNetworkingResultModel] network_config_results:
+        :param dict deploy_timing: the seconds of each deploy phase, added to the deployed app additional data
+        :rtype: list[RequestActionBase]
+        """
+        ami_deployment_model = ami_deploy_action.actionParams.deployment.customModel
         deployed_app_attributes = self._prepare_deployed_app_attributes(ami_credentials=ami_credentials,
                                                                         ami_deployment_model=ami_deployment_model,
                                                                         network_config_results=network_config_results)
@@ -175,17 +631,88 @@ class DeployAMIOperation(object):
             self._prepare_network_config_results_dto(network_config_results=network_config_results,
                                                      network_actions=network_actions)
 
+        deployed_app_additional_data = {'inbound_ports': ami_deployment_model.inbound_ports,
+                                        'public_ip': instance.public_ip_address}
+        if deploy_timing:
+            deployed_app_additional_data['deploy_timing'] = dict(deploy_timing)
+
         deploy_app_result = DeployAppResult(vmName=self._get_name_from_tags(instance),
                                             vmUuid=instance.instance_id,
                                             deployedAppAttributes=convert_dict_to_attributes_list(deployed_app_attributes),
-                                            deployedAppAddress=instance.private_ip_address,
+                                            deployedAppAddress=self._get_deployed_app_address(instance,
+                                                                                              network_config_results),
                                             vmDetailsData=vm_details_data,
-                                            deployedAppAdditionalData={'inbound_ports': ami_deployment_model.inbound_ports,
-                                                                       'public_ip': instance.public_ip_address})
+                                            deployedAppAdditionalData=deployed_app_additional_data)
         deploy_app_result.actionId = ami_deploy_action.actionId
         network_actions_results_dtos.append(deploy_app_result)
         return network_actions_results_dtos
 
+    @staticmethod
+    def _get_deployed_app_address(instance, network_config_results):
+        """
+        :return: the private ip of the first sandbox interface, which is not the primary interface of an instance
+        claimed from the warm pool
+        :rtype: str
+        """
+        results = sorted([r for r in network_config_results if r.private_ip], key=lambda r: r.device_index)
+        return results[0].private_ip if results else instance.private_ip_address
+
+    def _claim_pooled_instance(self, ec2_session, ec2_client, s3_session, aws_ec2_cp_resource_model, reservation_id,
+                               ami_deployment_model, ami_deployment_info, image, network_config_results, logger,
+                               phase_timer, create_aws_api=None):
+        """
+        Claims a standby instance of the warm pool when the deployment can be served by one, and replenishes the pool
+        :param str reservation_id: the reservation the private key of the claimed instance is moved to
+        :param DeployAWSEc2AMIInstanceResourceModel ami_deployment_model:
+        :param AMIDeploymentModel ami_deployment_info:
+        :param image: the image of the deployment
+        :param list[DeployNetworkingResultModel] network_config_results:
+        :param PhaseTimer phase_timer:
+        :param create_aws_api: function with no arguments that creates the aws api clients the pool is replenished
+        with, the pool is not replenished without it
+        :return: the claimed stopped instance, None if the deployment launches its instance, which it also does when
+        the claim failed
+        """
+        if not self.warm_instance_pool or \
+                not self.warm_instance_pool.is_enabled(aws_ec2_cp_resource_model, ami_deployment_info.aws_ami_id):
+            return None
+
+        # user data runs on the first boot only, and elastic ips of a single subnet are set on the primary interface
+        if ami_deployment_model.user_data_url or ami_deployment_model.allocate_elastic_ip:
+            return None
+
+        profile = self.warm_instance_pool.get_profile(ami_deployment_info, image)
+        if not profile:
+            return None
+
+        with phase_timer.span(self.WARM_POOL_PHASE):
+            try:
+                instance = self.warm_instance_pool.claim(ec2_session=ec2_session,
+                                                         ec2_client=ec2_client,
+                                                         s3_session=s3_session,
+                                                         bucket=aws_ec2_cp_resource_model.key_pairs_location,
+                                                         reservation_id=reservation_id,
+                                                         profile=profile,
+                                                         network_interfaces=ami_deployment_info.network_interfaces,
+                                                         logger=logger)
+            except Exception:
+                # the claim released what it created, the deployment launches its instance instead
+                logger.warning("Failed to claim an instance of the warm pool, launching the instance. Error: {0}"
+                               .format(traceback.format_exc()))
+                instance = None
+
+        if create_aws_api:
+            self.warm_instance_pool.replenish_in_background(create_aws_api=create_aws_api,
+                                                            aws_ec2_resource_model=aws_ec2_cp_resource_model,
+                                                            ami_deployment_info=ami_deployment_info,
+                                                            profile=profile,
+                                                            logger=logger)
+        if instance:
+            # the sandbox interfaces are attached after the holding interface
+            for network_config_result in network_config_results:
+                network_config_result.device_index += 1
+        return instance
+
     def _validate_public_subnet_exist_if_requested_public_or_elastic_ips(self, ami_deployment_model, network_actions,
                                                                          logger):
         """
@@ -259,9 +786,12 @@ class DeployAMIOperation(object):
         return instance_id
 
     def _get_ami_credentials(self, s3_session, key_pair_location, reservation, wait_for_credentials, instance,
-                             ami_deploy_action, cancellation_context, logger):
+                             ami_deploy_action, cancellation_context, logger, in_background=False,
+                             create_cloudshell_session=None, from_warm_pool=False):
         """
         Will load win
+        When the deployment retrieves the windows credentials in the background and the password is not published
+        yet, a background job sets the credentials on the deployed app resource and None is returned
         :param s3_session:
         :param key_pair_location:
         :param reservation: reservation model
@@ -270,14 +800,36 @@ class DeployAMIOperation(object):
         :param instance:
         :param logging.Logger logger:
         :param CancellationContext cancellation_context:
+        :param bool in_background: whether the windows credentials are retrieved in the background
+        :param create_cloudshell_session: function with no arguments that opens the CloudShell API session of the
+        background job
+        :param bool from_warm_pool: whether the instance was claimed from the warm pool, so it has a key of its own
         :return:
         :rtype: cloudshell.cp.aws.models.ami_credentials.AMICredentials
         """
         # has value for windows instances only
         if instance.platform:
-            key_value = self.key_pair_service.load_key_pair_by_name(s3_session=s3_session,
+            if from_warm_pool:
+                key_value = self.key_pair_service.load_instance_key(s3_session=s3_session,
                                                                     bucket_name=key_pair_location,
-                                                                    reservation_id=reservation.reservation_id)
+                                                                    reservation_id=reservation.reservation_id,
+                                                                    instance_id=instance.id)
+            else:
+                key_value = self.key_pair_service.load_key_pair_by_name(s3_session=s3_session,
+                                                                        bucket_name=key_pair_location,
+                                                                        reservation_id=reservation.reservation_id)
+            if wait_for_credentials and in_background and create_cloudshell_session:
+                result = self.credentials_service.get_windows_credentials(instance=instance,
+                                                                          key_value=key_value,
+                                                                          wait_for_password=False)
+                if not result:
+                    self.windows_credentials_jobs.start(instance=instance,
+                                                        key_value=key_value,
+                                                        reservation_id=reservation.reservation_id,
+                                                        create_cloudshell_session=create_cloudshell_session,
+                                                        logger=logger)
+                return result
+
             result = None
             try:
                 result = self.credentials_service.get_windows_credentials(instance=instance,
@@ -347,6 +899,64 @@ class DeployAMIOperation(object):
 
         return security_group
 
+    def _create_pre_launch_graph(self, ec2_session, aws_ec2_resource_model, ami_deployment_model, network_actions,
+                                 vpc, key_pair, reservation, network_config_results, cancellation_context, logger):
+        """
+        The steps before the launch of the instance as a graph whose independent aws round trips run concurrently:
+        the custom security group creation with its rules, the image describe, the sandbox security group lookup
+        and the subnet lookup of single subnet mode. The created custom security group is in the results of the
+        graph even if another step failed, so it can be rolled back. The concurrent steps each use their own boto3
+        resources
+        :param vpc: The reservation VPC
+        :param str key_pair: The Key pair name
+        :param list[DeployNetworkingResultModel] network_config_results:
+        :param CancellationContext cancellation_context:
+        :param logging.Logger logger:
+        :rtype: TaskGraph
+        """
+        pre_launch = TaskGraph(max_workers=self.PRE_LAUNCH_MAX_WORKERS,
+                               check_cancelled=lambda: self.cancellation_service.check_if_cancelled(
+                                   cancellation_context))
+
+        dependencies = [self.SECURITY_GROUP_TASK, self.IMAGE_TASK, self.SANDBOX_SECURITY_GROUP_TASK]
+        security_group_session = create_resource_for_thread(ec2_session)
+        pre_launch.add(self.SECURITY_GROUP_TASK,
+                       lambda: self._create_security_group_for_instance(ami_deployment_model=ami_deployment_model,
+                                                                        ec2_session=security_group_session,
+                                                                        reservation=reservation,
+                                                                        vpc=security_group_session.Vpc(vpc.id),
+                                                                        logger=logger))
+        # the image is described with the low level client, which is thread safe
+        pre_launch.add(self.IMAGE_TASK, lambda: self._get_image(ec2_session, ami_deployment_model.aws_ami_id))
+        # caches the id of the sandbox security group for the deployment parameters
+        sandbox_security_group_vpc = create_resource_for_thread(ec2_session).Vpc(vpc.id)
+        pre_launch.add(self.SANDBOX_SECURITY_GROUP_TASK,
+                       lambda: self._get_sandbox_security_group_id(aws_ec2_resource_model.region, reservation,
+                                                                   sandbox_security_group_vpc,
+                                                                   ami_deployment_model.allow_all_sandbox_traffic))
+        if self._is_single_subnet_mode(network_actions):
+            single_subnet_vpc = create_resource_for_thread(ec2_session).Vpc(vpc.id)
+            pre_launch.add(self.SINGLE_SUBNET_TASK,
+                           lambda: self.subnet_service.get_first_subnet_from_vpc(single_subnet_vpc))
+            dependencies.append(self.SINGLE_SUBNET_TASK)
+
+        pre_launch.add(self.DEPLOYMENT_PARAMETERS_TASK,
+                       lambda: self._create_deployment_parameters(
+                           ec2_session=ec2_session,
+                           aws_ec2_resource_model=aws_ec2_resource_model,
+                           ami_deployment_model=ami_deployment_model,
+                           network_actions=network_actions,
+                           vpc=vpc,
+                           security_group=pre_launch.results[self.SECURITY_GROUP_TASK],
+                           key_pair=key_pair,
+                           reservation=reservation,
+                           network_config_results=network_config_results,
+                           logger=logger,
+                           image=pre_launch.results[self.IMAGE_TASK],
+                           single_subnet=pre_launch.results.get(self.SINGLE_SUBNET_TASK)),
+                       depends_on=dependencies)
+        return pre_launch
+
     def _create_deployment_parameters(self,
                                       ec2_session,
                                       aws_ec2_resource_model,
@@ -357,7 +967,9 @@ class DeployAMIOperation(object):
                                       key_pair,
                                       reservation,
                                       network_config_results,
-                                      logger):
+                                      logger,
+                                      image=None,
+                                      single_subnet=None):
         """
         :param ec2_session:
         :param aws_ec2_resource_model: The resource model of the AMI deployment option
@@ -376,13 +988,12 @@ class DeployAMIOperation(object):
         :param network_config_results: list of network configuration result objects
         :type network_config_results: list[DeployNetworkingResultModel]
         :param logging.Logger logger:
+        :param image: The already described image of the AMI, described here if not given
+        :param single_subnet: The already found subnet for single subnet mode, found here if not given
         """
         aws_model = AMIDeploymentModel()
-        if not ami_deployment_model.aws_ami_id:
-            raise ValueError('AWS Image Id cannot be empty')
-
-        image = ec2_session.Image(ami_deployment_model.aws_ami_id)
-        self._validate_image_available(image, ami_deployment_model.aws_ami_id)
+        if image is None:
+            image = self._get_image(ec2_session, ami_deployment_model.aws_ami_id)
 
         aws_model.custom_tags = self._get_custom_tags(custom_tags=ami_deployment_model.custom_tags)
         aws_model.user_data = self._get_user_data(user_data_url=ami_deployment_model.user_data_url,
@@ -399,7 +1010,8 @@ class DeployAMIOperation(object):
                                                                           aws_ec2_resource_model=aws_ec2_resource_model)
         aws_model.aws_key = key_pair
 
-        security_group_ids = self._get_security_group_param(reservation, security_group, vpc,
+        security_group_ids = self._get_security_group_param(aws_ec2_resource_model.region, reservation,
+                                                            security_group, vpc,
                                                             ami_deployment_model.allow_all_sandbox_traffic)
         aws_model.security_group_ids = security_group_ids
 
@@ -409,10 +1021,25 @@ class DeployAMIOperation(object):
                                              network_actions=network_actions,
                                              security_group_ids=security_group_ids,
                                              network_config_results=network_config_results,
-                                             logger=logger)
+                                             logger=logger,
+                                             single_subnet=single_subnet)
 
         return aws_model
 
+    def _get_image(self, ec2_session, ami_id):
+        """
+        :param ec2_session:
+        :param str ami_id:
+        :return: the metadata of the image, validated to be available
+        :rtype: ImageMetadata
+        """
+        if not ami_id:
+            raise ValueError('AWS Image Id cannot be empty')
+
+        image = self.image_metadata_cache.get_image(ec2_session.meta.client, ami_id)
+        self._validate_image_available(image, ami_id)
+        return image
+
     def _get_iam_instance_profile_request(self, ami_deployment_model):
         role = ami_deployment_model.iam_role
         if not role:
@@ -423,7 +1050,8 @@ class DeployAMIOperation(object):
 
     def _prepare_network_interfaces(self, vpc, ami_deployment_model, network_actions, security_group_ids,
                                     network_config_results,
-                                    logger):
+                                    logger,
+                                    single_subnet=None):
         """
         :param vpc: The reservation VPC
         :param DeployAWSEc2AMIInstanceResourceModel ami_deployment_model:
@@ -431,6 +1059,7 @@ class DeployAMIOperation(object):
         :param [str] security_group_ids:
         :param list[DeployNetworkingResultModel] network_config_results: list of network configuration result objects
         :param logging.Logger logger:
+        :param single_subnet: The already found subnet for single subnet mode
         :return:
         """
         if not network_actions:
@@ -440,7 +1069,8 @@ class DeployAMIOperation(object):
                 add_public_ip=ami_deployment_model.add_public_ip,
                 security_group_ids=security_group_ids,
                 vpc=vpc,
-                private_ip=ami_deployment_model.private_ip_address)]
+                private_ip=ami_deployment_model.private_ip_address,
+                subnet=single_subnet)]
 
         self._validate_network_interfaces_request(ami_deployment_model, network_actions, logger)
 
@@ -480,7 +1110,8 @@ class DeployAMIOperation(object):
                 add_public_ip=ami_deployment_model.add_public_ip,
                 security_group_ids=security_group_ids,
                 vpc=vpc,
-                private_ip=ami_deployment_model.private_ip_address)]
+                private_ip=ami_deployment_model.private_ip_address,
+                subnet=single_subnet)]
 
         logger.info("Created dtos for {} network interfaces".format(len(net_interfaces)))
 
@@ -511,25 +1142,41 @@ class DeployAMIOperation(object):
             if ami_deployment_model.instance_type \
             else aws_ec2_resource_model.instance_type
 
-    def _get_security_group_param(self, reservation, security_group, vpc, allow_sandbox_traffic):
-        security_group_ids = []
+    def _get_security_group_param(self, region, reservation, security_group, vpc, allow_sandbox_traffic):
+        security_group_ids = [self._get_sandbox_security_group_id(region, reservation, vpc, allow_sandbox_traffic)]
+
+        if security_group:
+            security_group_ids.append(security_group.group_id)
+
+        return security_group_ids
 
+    def _get_sandbox_security_group_id(self, region, reservation, vpc, allow_sandbox_traffic):
         if allow_sandbox_traffic:
             default_sg_name = self.security_group_service.sandbox_default_sg_name(reservation.reservation_id)
         else:
             default_sg_name = self.security_group_service.sandbox_isolated_sg_name(reservation.reservation_id)
 
-        sg = self.security_group_service.get_security_group_by_name(vpc, default_sg_name)
-        security_group_ids.append(sg.id)
-
-        if security_group:
-            security_group_ids.append(security_group.group_id)
+        sg_id = self.sandbox_footprint_cache.get_security_group_id(
+            region=region,
+            reservation_id=reservation.reservation_id,
+            name=default_sg_name,
+            find_security_group=lambda: self.security_group_service.get_security_group_by_name(vpc, default_sg_name))
+        if not sg_id:
+            raise ValueError('Security group {0} was not found in the sandbox VPC'.format(default_sg_name))
+        return sg_id
 
-        return security_group_ids
+    @staticmethod
+    def _is_single_subnet_mode(network_actions):
+        """
+        :param list[cloudshell.cp.core.models.ConnectSubnet] network_actions:
+        :rtype: bool
+        """
+        return not network_actions or \
+            not any(isinstance(action.actionParams, ConnectToSubnetParams) for action in network_actions)
 
     def _get_block_device_mappings(self, image, ami_deployment_model, aws_ec2_resource_model):
         """
-        :param image: A resource representing an EC2 image
+        :param ImageMetadata image: The metadata of the EC2 image
         :param aws_ec2_resource_model: The resource model of the AMI deployment option
         :type aws_ec2_resource_model: cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel
         :param ami_deployment_model: The resource model on which the AMI will be deployed on
@@ -624,29 +1271,97 @@ class DeployAMIOperation(object):
         :param custom_security_group: Security Group object
         :param list[DeployNetworkingResultModel] network_config_results:
         :param logging.Logger logger:
-        :return:
+        :rtype: RollbackReport
         """
-        logger.info("Starting rollback for deploy operation")
-
-        if instance_id:
-            instance = self.instance_service.get_instance_by_id(ec2_session=ec2_session,
-                                                                id=instance_id)
-            logger.debug("Terminating instance id: {}".format(instance.id))
-            self.instance_service.terminate_instance(instance=instance)
+        return self._rollback(ec2_session=ec2_session,
+                              instance_ids=[instance_id] if instance_id else [],
+                              security_groups=[custom_security_group] if custom_security_group else [],
+                              elastic_ips=self._get_elastic_ips(network_config_results),
+                              logger=logger)
 
-        if custom_security_group:
-            logger.debug("Deleting custom security group {0} - {1}".format(custom_security_group.id,
-                                                                           custom_security_group.group_name))
-            self.security_group_service.delete_security_group(custom_security_group)
+    def _rollback_app_deployments(self, ec2_session, app_deployments, logger):
+        """
+        Rolls back the apps together, so all their instances are terminated by a single batched wait
+        :param list[AppDeployment] app_deployments:
+        :rtype: RollbackReport
+        """
+        return self._rollback(ec2_session=ec2_session,
+                              instance_ids=[a.instance.id for a in app_deployments if a.instance],
+                              security_groups=[a.security_group for a in app_deployments if a.security_group],
+                              elastic_ips=[elastic_ip for a in app_deployments
+                                           for elastic_ip in self._get_elastic_ips(a.network_config_results)],
+                              logger=logger)
+
+    def _rollback(self, ec2_session, instance_ids, security_groups, elastic_ips, logger):
+        """
+        Terminates the instances and releases the elastic ips in parallel. The security groups are deleted once the
+        instances are terminated, since a security group cannot be deleted while an instance uses it.
+        A failed step does not stop the other steps, it is recorded in the report
+        :param ec2_session:
+        :param list[str] instance_ids:
+        :param list security_groups:
+        :param list[str] elastic_ips:
+        :param logging.Logger logger:
+        :rtype: RollbackReport
+        """
+        logger.info("Starting rollback for deploy operation")
+        report = RollbackReport()
+        graph = TaskGraph(max_workers=self.ROLLBACK_MAX_WORKERS, stop_on_error=False)
+
+        termination_tasks = []
+        if instance_ids:
+            graph.add(self.TERMINATE_INSTANCES_TASK,
+                      partial(self._rollback_instances, ec2_session, instance_ids, report, logger))
+            termination_tasks.append(self.TERMINATE_INSTANCES_TASK)
+
+        for elastic_ip in OrderedDict.fromkeys(elastic_ips):
+            graph.add('release_elastic_ip_{0}'.format(elastic_ip),
+                      partial(self._rollback_elastic_ip, ec2_session, elastic_ip, report, logger))
+
+        for security_group in security_groups:
+            graph.add('delete_security_group_{0}'.format(security_group.id),
+                      partial(self._rollback_security_group, security_group, report, logger),
+                      depends_on=termination_tasks)
+
+        graph.run()
+
+        report.errors.extend('{0} failed: {1}'.format(name, error) for name, error in graph.errors.items())
+        report.errors.extend('{0} was skipped'.format(name) for name in graph.skipped)
+        if report.succeeded:
+            logger.info("Rollback for deploy operation completed")
+        else:
+            logger.error("Rollback for deploy operation did not complete: {0}".format('; '.join(report.errors)))
+        return report
+
+    def _rollback_instances(self, ec2_session, instance_ids, report, logger):
+        instances = [self.instance_service.get_instance_by_id(ec2_session=ec2_session, id=instance_id)
+                     for instance_id in instance_ids]
+        logger.debug("Terminating instances: {0}".format(', '.join(instance_ids)))
+        self.instance_service.terminate_instances(instances)
+        report.terminated_instance_ids.extend(instance_ids)
+
+    def _rollback_elastic_ip(self, ec2_session, elastic_ip, report, logger):
+        logger.debug("Releasing elastic ip {}".format(elastic_ip))
+        self.elastic_ip_service.find_and_release_elastic_address(ec2_session=ec2_session, elastic_ip=elastic_ip)
+        report.released_elastic_ips.append(elastic_ip)
+
+    def _rollback_security_group(self, security_group, report, logger):
+        logger.debug("Deleting custom security group {0} - {1}".format(security_group.id,
+                                                                       security_group.group_name))
+        self.security_group_service.delete_security_group(security_group)
+        report.deleted_security_group_ids.append(security_group.id)
 
-        if network_config_results and len(network_config_results):
-            for r in filter(lambda x: x.public_ip, network_config_results):
-                logger.debug("Releasing elastic ip {}".format(r.public_ip))
-                self.elastic_ip_service.find_and_release_elastic_address(ec2_session=ec2_session,
-                                                                         elastic_ip=r.public_ip)
+    @staticmethod
+    def _get_elastic_ips(network_config_results):
+        """
+        :param list[DeployNetworkingResultModel] network_config_results:
+        :return: the elastic ips of the deploy, auto assigned public ips are freed by the instance termination
+        :rtype: list[str]
+        """
+        return [r.public_ip for r in network_config_results or [] if r.public_ip and r.is_elastic_ip]
 
     def _validate_image_available(self, image, ami_id):
-        if hasattr(image, 'state') and image.state == 'available':
+        if image and image.state == ImageMetadataCache.AVAILABLE_STATE:
             return
         raise ValueError('AMI {} not found'.format(ami_id))
 
@@ -658,6 +1373,9 @@ class DeployAMIOperation(object):
         for interface in instance.network_interfaces_attribute:
             result = first_or_default(network_config_results,
                                       lambda x: x.device_index == interface["Attachment"]["DeviceIndex"])
+            if not result:
+                # the holding interface of an instance claimed from the warm pool
+                continue
             result.interface_id = interface["NetworkInterfaceId"]
             result.private_ip = interface["PrivateIpAddress"]
             result.mac_address = interface["MacAddress"]
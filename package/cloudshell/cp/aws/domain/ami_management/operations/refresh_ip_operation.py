@@ -1,5 +1,7 @@
 from cloudshell.api.cloudshell_api import CloudShellAPISession
 
+from cloudshell.cp.aws.domain.services.ec2.warm_instance_pool import WarmInstancePool
+
 
 class RefreshIpOperation(object):
     PUBLIC_IP = "Public IP"
@@ -26,13 +28,22 @@ class RefreshIpOperation(object):
 
         deployed_instance = self.instance_service.get_active_instance_by_id(ec2_session, deployed_instance_id)
 
-        public_ip_on_aws = deployed_instance.public_ip_address
-        private_ip_on_aws = deployed_instance.private_ip_address
+        if WarmInstancePool.is_claimed(deployed_instance):
+            # the primary interface of an instance claimed from the warm pool is in the holding subnet
+            sandbox_network_interfaces_attribute = \
+                [net for net in deployed_instance.network_interfaces_attribute if net["Attachment"]["DeviceIndex"]]
+            public_ip_on_aws = None
+            private_ip_on_aws = min(sandbox_network_interfaces_attribute,
+                                    key=lambda x: x["Attachment"]["DeviceIndex"])["PrivateIpAddress"]
+        else:
+            sandbox_network_interfaces_attribute = deployed_instance.network_interfaces_attribute
+            public_ip_on_aws = deployed_instance.public_ip_address
+            private_ip_on_aws = deployed_instance.private_ip_address
 
         if not public_ip_on_aws:
             # find first elastic ip
             sorted_network_interfaces_attribute = \
-                sorted(deployed_instance.network_interfaces_attribute, key=lambda x: x["Attachment"]["DeviceIndex"])
+                sorted(sandbox_network_interfaces_attribute, key=lambda x: x["Attachment"]["DeviceIndex"])
             for net in sorted_network_interfaces_attribute:
                 if "Association" in net and "PublicIp" in net["Association"] and net["Association"]["PublicIp"]:
                     public_ip_on_aws = net["Association"]["PublicIp"]
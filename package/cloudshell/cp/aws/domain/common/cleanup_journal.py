@@ -0,0 +1,289 @@
+import errno
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import TimeoutError
+
+
+class CleanupJournal(object):
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    FILE_EXTENSION = '.json'
+    TEMP_FILE_EXTENSION = '.tmp'
+    LOCK_FILE_EXTENSION = '.lock'
+    FINISHED_DIRECTORY = 'finished'
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.aws_shell', 'cleanup_journal')
+    FINISHED_ENTRY_TTL = 7 * 24 * 60 * 60
+    HEARTBEAT_INTERVAL = 60
+    OWNER_TIMEOUT = 5 * 60
+    LOCK_TIMEOUT = 30
+    STALE_LOCK_AGE = 60
+
+    def __init__(self, directory=None, finished_entry_ttl=FINISHED_ENTRY_TTL, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 owner_timeout=OWNER_TIMEOUT, lock_timeout=LOCK_TIMEOUT, stale_lock_age=STALE_LOCK_AGE):
+        """
+        The asynchronous cleanups of the driver processes, each one is kept in its own json file named after the
+        reservation so a restarted driver can find and resume the cleanups that did not end. The entries of the
+        completed and failed cleanups are moved to a subdirectory, so finding the pending cleanups reads the pending
+        entries only, and are deleted once they are older than the finished entry ttl.
+        The directory can be shared by several driver processes, so each entry is read and written under a lock file
+        of its own, and records the process running the cleanup, which refreshes the heartbeat of the entry while it
+        runs. A cleanup is resumed by another process only once its heartbeat is older than the owner timeout
+        :param str directory: a persistent local directory of the journal, created on the first write
+        :param float finished_entry_ttl: the time in seconds the entry of a completed or failed cleanup is kept
+        :param float heartbeat_interval: the time in seconds between the heartbeats of the entries of the process
+        :param float owner_timeout: the time in seconds since its last heartbeat before a cleanup can be resumed by
+        another process
+        :param float lock_timeout: the time in seconds to wait for the lock of an entry
+        :param float stale_lock_age: the time in seconds before the lock file of an entry is considered left by a
+        process that stopped while holding it
+        """
+        self.directory = directory or self.DEFAULT_DIRECTORY
+        self.finished_entry_ttl = finished_entry_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.owner_timeout = owner_timeout
+        self.lock_timeout = lock_timeout
+        self.stale_lock_age = stale_lock_age
+        self.owner = '{0}/{1}'.format(socket.gethostname(), os.getpid())
+        self._owned = set()
+        self._heartbeat_thread = None
+        self._lock = threading.Lock()
+
+    def add(self, reservation_id, cloud_provider, region):
+        """
+        Records the cleanup of the reservation as pending and owned by the process, a cleanup recorded before is
+        started over
+        :param str reservation_id:
+        :param str cloud_provider: the name of the cloud provider resource, the cleanup is resumed by its commands
+        :param str region:
+        :rtype: dict
+        """
+        entry = {'reservation_id': reservation_id,
+                 'cloud_provider': cloud_provider,
+                 'region': region,
+                 'status': self.PENDING,
+                 'attempts': 0,
+                 'resources': {},
+                 'errors': {},
+                 'owner': self.owner,
+                 'heartbeat': time.time(),
+                 'created': time.time(),
+                 'updated': time.time()}
+        with self._entry_lock(reservation_id):
+            self._write(entry)
+            self._remove(self._get_path(reservation_id, finished=True))
+        self._own(reservation_id)
+        return entry
+
+    def acquire(self, reservation_id):
+        """
+        Makes the process the owner of the pending cleanup of the reservation, unless another process runs it
+        :param str reservation_id:
+        :return: the acquired entry, None if the cleanup is not pending or its owner is alive
+        :rtype: dict
+        """
+        with self._entry_lock(reservation_id):
+            entry = self._read(self._get_path(reservation_id))
+            if entry is None or entry['status'] != self.PENDING:
+                return None
+            if entry.get('owner') != self.owner and \
+                    time.time() - entry.get('heartbeat', 0) < self.owner_timeout:
+                return None
+            entry['owner'] = self.owner
+            entry['heartbeat'] = time.time()
+            self._write(entry)
+        self._own(reservation_id)
+        return entry
+
+    def release(self, reservation_id):
+        """
+        Stops the heartbeat of the cleanup of the reservation, a cleanup that is still pending is resumed once its
+        heartbeat is older than the owner timeout
+        :param str reservation_id:
+        """
+        with self._lock:
+            self._owned.discard(reservation_id)
+
+    def update(self, reservation_id, **fields):
+        """
+        :param str reservation_id:
+        :param fields: the fields of the entry to set, an entry whose status is set to completed or failed is moved
+        to the finished entries
+        :return: the updated entry
+        :rtype: dict
+        """
+        with self._entry_lock(reservation_id):
+            entry = self._read(self._get_path(reservation_id))
+            if entry is None:
+                raise ValueError('No pending cleanup was recorded for reservation {0}'.format(reservation_id))
+            if entry.get('owner') != self.owner:
+                raise ValueError('The cleanup of reservation {0} was resumed by {1}'
+                                 .format(reservation_id, entry.get('owner')))
+            entry.update(fields)
+            entry['updated'] = entry['heartbeat'] = time.time()
+            if entry['status'] == self.PENDING:
+                self._write(entry)
+            else:
+                self._write(entry, finished=True)
+                self._remove(self._get_path(reservation_id))
+                self._prune_finished_entries()
+        if entry['status'] != self.PENDING:
+            self.release(reservation_id)
+        return entry
+
+    def get(self, reservation_id):
+        """
+        :param str reservation_id:
+        :return: the entry of the reservation, None if no cleanup was recorded for it
+        :rtype: dict
+        """
+        with self._lock:
+            return self._read(self._get_path(reservation_id)) or \
+                self._read(self._get_path(reservation_id, finished=True))
+
+    def get_pending(self, cloud_provider):
+        """
+        :param str cloud_provider:
+        :return: the entries of the cloud provider that did not complete or fail
+        :rtype: list[dict]
+        """
+        if not os.path.isdir(self.directory):
+            return []
+
+        with self._lock:
+            reservation_ids = set(file_name.split(self.FILE_EXTENSION)[0]
+                                  for file_name in os.listdir(self.directory)
+                                  if self.FILE_EXTENSION in file_name)
+            entries = [self._read(self._get_path(reservation_id)) for reservation_id in sorted(reservation_ids)]
+        return [entry for entry in entries
+                if entry and entry['cloud_provider'] == cloud_provider and entry['status'] == self.PENDING]
+
+    def _own(self, reservation_id):
+        with self._lock:
+            self._owned.add(reservation_id)
+            if not self._heartbeat_thread:
+                self._heartbeat_thread = threading.Thread(target=self._run_heartbeat, name='CleanupJournalHeartbeat')
+                self._heartbeat_thread.daemon = True
+                self._heartbeat_thread.start()
+
+    def _run_heartbeat(self):
+        """
+        Refreshes the heartbeat of the entries owned by the process until it owns none
+        """
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                if not self._owned:
+                    self._heartbeat_thread = None
+                    return
+                reservation_ids = list(self._owned)
+            for reservation_id in reservation_ids:
+                try:
+                    self._beat(reservation_id)
+                except Exception:
+                    # the heartbeat is retried on the next interval, the cleanup is resumed by another process only
+                    # if the heartbeats keep failing for the owner timeout
+                    pass
+
+    def _beat(self, reservation_id):
+        with self._entry_lock(reservation_id):
+            entry = self._read(self._get_path(reservation_id))
+            if entry is not None and entry['status'] == self.PENDING and entry.get('owner') == self.owner:
+                entry['heartbeat'] = time.time()
+                self._write(entry)
+                return
+        # the cleanup ended or was resumed by another process
+        self.release(reservation_id)
+
+    @contextmanager
+    def _entry_lock(self, reservation_id):
+        """
+        Holds the lock file of the entry of the reservation, which excludes the threads of the process and the other
+        processes sharing the directory. The lock file of a process that stopped while holding it is removed once it
+        is older than the stale lock age
+        """
+        self._make_directory(self.directory)
+        path = os.path.join(self.directory, reservation_id + self.LOCK_FILE_EXTENSION)
+        start_time = time.time()
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(path) > self.stale_lock_age:
+                    os.remove(path)
+                    continue
+            except OSError:
+                # the lock was released meanwhile
+                continue
+            if time.time() - start_time > self.lock_timeout:
+                raise TimeoutError('Timeout: Waiting for the journal lock of the cleanup of reservation {0}'
+                                   .format(reservation_id))
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.remove(path)
+
+    def _get_path(self, reservation_id, finished=False):
+        directory = os.path.join(self.directory, self.FINISHED_DIRECTORY) if finished else self.directory
+        return os.path.join(directory, reservation_id + self.FILE_EXTENSION)
+
+    def _read(self, path):
+        # a write interrupted between removing the entry and renaming its new version leaves only the new version
+        for candidate in (path, path + self.TEMP_FILE_EXTENSION):
+            if os.path.exists(candidate):
+                try:
+                    with open(candidate) as f:
+                        return json.load(f)
+                except ValueError:
+                    # an entry interrupted while being written
+                    continue
+        return None
+
+    def _write(self, entry, finished=False):
+        """
+        Writes the entry to a temporary file first so an interrupted write never truncates the entry
+        """
+        path = self._get_path(entry['reservation_id'], finished)
+        self._make_directory(os.path.dirname(path))
+        temp_path = path + self.TEMP_FILE_EXTENSION
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        # windows does not rename over an existing file
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+    @staticmethod
+    def _make_directory(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by another process meanwhile
+            if not os.path.isdir(directory):
+                raise
+
+    def _remove(self, path):
+        for candidate in (path, path + self.TEMP_FILE_EXTENSION):
+            if os.path.exists(candidate):
+                os.remove(candidate)
+
+    def _prune_finished_entries(self):
+        directory = os.path.join(self.directory, self.FINISHED_DIRECTORY)
+        expiry = time.time() - self.finished_entry_ttl
+        for file_name in os.listdir(directory):
+            path = os.path.join(directory, file_name)
+            try:
+                if os.path.getmtime(path) < expiry:
+                    os.remove(path)
+            except OSError:
+                # pruned by another process meanwhile
+                pass
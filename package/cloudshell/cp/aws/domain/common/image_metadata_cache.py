@@ -0,0 +1,94 @@
+import copy
+import threading
+
+from botocore.exceptions import ClientError
+
+from cloudshell.cp.aws.common.ttl_cache import TTLCache
+from cloudshell.cp.aws.models.aws_api import AwsApiClients
+from cloudshell.cp.aws.models.image_metadata import ImageMetadata
+
+
+class ImageMetadataCache(object):
+    TTL = 60 * 60
+    MISSING_IMAGE_TTL = 60
+    MAX_SIZE = 512
+    AVAILABLE_STATE = 'available'
+    INVALID_AMI_ID_ERROR_PREFIX = 'InvalidAMIID.'
+
+    def __init__(self, ttl=TTL, missing_image_ttl=MISSING_IMAGE_TTL, max_size=MAX_SIZE):
+        """
+        Caches the metadata of the AMIs by their region, account and id, so deploying the same AMI many times describes
+        it once. The account is part of the key because private and shared AMIs are not visible to all the accounts.
+        Missing and not available AMIs are cached for a shorter time, so a failing sandbox does not describe them
+        for each of its apps while a just created AMI becomes deployable soon
+        :param int ttl: the time in seconds the metadata of an available AMI is kept
+        :param int missing_image_ttl: the time in seconds a missing or not available AMI is kept
+        :param int max_size: the max number of cached AMIs of each kind
+        """
+        self._images = TTLCache(ttl=ttl, max_size=max_size)
+        self._missing_images = TTLCache(ttl=missing_image_ttl, max_size=max_size)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get_image(self, ec2_client, ami_id):
+        """
+        Returns the metadata of the available AMI, describing it only if it is not cached yet
+        :param ec2_client:
+        :param str ami_id:
+        :return: a copy of the metadata, None if the AMI is missing or not available
+        :rtype: ImageMetadata
+        """
+        key = self._get_key(ec2_client, ami_id)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # concurrent deploys of the same AMI wait for the first one to describe it, other AMIs are described meanwhile
+        with key_lock:
+            image = self._images.get(key)
+            if not image and not self._missing_images.get(key):
+                image = self._describe_image(ec2_client, ami_id)
+                if image:
+                    self._images.set(key, image)
+                else:
+                    self._missing_images.set(key, True)
+
+        with self._lock:
+            # the deploys still waiting for the lock find the image cached
+            if self._key_locks.get(key) is key_lock:
+                del self._key_locks[key]
+
+        # the callers cannot change the cached block device mappings
+        return copy.deepcopy(image)
+
+    def invalidate(self, ec2_client, ami_id):
+        """
+        :param ec2_client:
+        :param str ami_id:
+        """
+        key = self._get_key(ec2_client, ami_id)
+        self._images.pop(key)
+        self._missing_images.pop(key)
+
+    @staticmethod
+    def _get_key(ec2_client, ami_id):
+        """
+        :rtype: tuple[str, str, str]
+        """
+        return ec2_client.meta.region_name, AwsApiClients.get_access_key_id(ec2_client), ami_id
+
+    def _describe_image(self, ec2_client, ami_id):
+        try:
+            images = ec2_client.describe_images(ImageIds=[ami_id])['Images']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code', '').startswith(self.INVALID_AMI_ID_ERROR_PREFIX):
+                return None
+            raise
+
+        if not images or images[0].get('State') != self.AVAILABLE_STATE:
+            return None
+
+        return ImageMetadata(image_id=images[0]['ImageId'],
+                             state=images[0]['State'],
+                             platform=images[0].get('Platform'),
+                             root_device_name=images[0].get('RootDeviceName'),
+                             block_device_mappings=images[0].get('BlockDeviceMappings', []))
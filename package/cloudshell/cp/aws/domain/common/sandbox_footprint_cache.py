@@ -0,0 +1,101 @@
+import threading
+
+from cloudshell.cp.aws.common.ttl_cache import TTLCache
+from cloudshell.cp.aws.models.sandbox_footprint import SandboxFootprint
+
+
+class SandboxFootprintCache(object):
+    TTL = 5 * 60
+    MAX_SIZE = 256
+
+    def __init__(self, ttl=TTL, max_size=MAX_SIZE):
+        """
+        Caches the footprint of the sandboxes by their region and reservation id, so the commands of a sandbox do not
+        look up the same aws resources over and over again. The cached ids are not validated against aws, the short
+        ttl bounds how long the ids of resources deleted outside the driver are used
+        :param ttl: the time in seconds a footprint is kept
+        :type ttl: int
+        :param max_size: the max number of cached sandboxes
+        :type max_size: int
+        """
+        self._cache = TTLCache(ttl=ttl, max_size=max_size)
+        self._lock = threading.RLock()
+
+    def get(self, region, reservation_id):
+        """
+        :param str region:
+        :param str reservation_id:
+        :rtype: SandboxFootprint
+        """
+        return self._cache.get((region, reservation_id))
+
+    def set_vpc_id(self, region, reservation_id, vpc_id):
+        """
+        Caches the vpc of the sandbox, a different vpc than the cached one resets the footprint
+        :param str region:
+        :param str reservation_id:
+        :param str vpc_id:
+        """
+        key = (region, reservation_id)
+        with self._lock:
+            footprint = self._cache.get(key)
+            if not footprint or footprint.vpc_id != vpc_id:
+                self._cache.set(key, SandboxFootprint(vpc_id))
+
+    def set_security_group_id(self, region, reservation_id, name, security_group_id):
+        with self._lock:
+            footprint = self._cache.get((region, reservation_id))
+            if footprint:
+                footprint.security_group_ids[name] = security_group_id
+
+    def set_subnet_name(self, region, reservation_id, subnet_id, subnet_name):
+        with self._lock:
+            footprint = self._cache.get((region, reservation_id))
+            if footprint:
+                footprint.subnet_names[subnet_id] = subnet_name
+
+    def set_private_route_table_id(self, region, reservation_id, route_table_id):
+        with self._lock:
+            footprint = self._cache.get((region, reservation_id))
+            if footprint:
+                footprint.private_route_table_id = route_table_id
+
+    def invalidate(self, region, reservation_id):
+        self._cache.pop((region, reservation_id))
+
+    def get_vpc(self, ec2_session, region, reservation_id, find_vpc):
+        """
+        Returns the vpc of the sandbox, looking it up and caching it only if it is not cached yet
+        :param ec2_session: EC2 session
+        :param str region:
+        :param str reservation_id:
+        :param find_vpc: function with no arguments returning the vpc of the sandbox or None
+        """
+        footprint = self.get(region, reservation_id)
+        if footprint:
+            return ec2_session.Vpc(footprint.vpc_id)
+
+        vpc = find_vpc()
+        if vpc:
+            self.set_vpc_id(region, reservation_id, vpc.id)
+        return vpc
+
+    def get_security_group_id(self, region, reservation_id, name, find_security_group):
+        """
+        Returns the id of the security group of the sandbox by its name, looking it up and caching it only if it is
+        not cached yet
+        :param str region:
+        :param str reservation_id:
+        :param str name: the name of the security group
+        :param find_security_group: function with no arguments returning the security group or None
+        :rtype: str
+        """
+        footprint = self.get(region, reservation_id)
+        if footprint and name in footprint.security_group_ids:
+            return footprint.security_group_ids[name]
+
+        security_group = find_security_group()
+        if not security_group:
+            return None
+        self.set_security_group_id(region, reservation_id, name, security_group.id)
+        return security_group.id
@@ -0,0 +1,103 @@
+import threading
+import time
+from multiprocessing import TimeoutError
+
+
+class WindowsCredentialsJobs(object):
+    def __init__(self, credentials_service, deployed_app_credentials_service, resource_lookup_delay=10,
+                 max_resource_lookups=60):
+        """
+        Background jobs of the driver process that wait for the password of deployed windows instances and set the
+        credentials on their deployed app resources, so deploy does not wait for windows to publish its password
+        :param cloudshell.cp.aws.domain.services.ec2.instance_credentials.InstanceCredentialsService credentials_service:
+        :param cloudshell.cp.aws.domain.services.cloudshell.deployed_app_credentials.DeployedAppCredentialsService deployed_app_credentials_service:
+        :param resource_lookup_delay: the time in seconds between each lookup of the deployed app resource
+        :type resource_lookup_delay: float
+        :param int max_resource_lookups: the deployed app resource is created by CloudShell once deploy returns
+        """
+        self.credentials_service = credentials_service
+        self.deployed_app_credentials_service = deployed_app_credentials_service
+        self.resource_lookup_delay = resource_lookup_delay
+        self.max_resource_lookups = max_resource_lookups
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, instance, key_value, reservation_id, create_cloudshell_session, logger):
+        """
+        Starts a background job retrieving the credentials of the windows instance
+        :param instance: the deployed windows instance
+        :param str key_value: pem lines of the sandbox key pair
+        :param str reservation_id:
+        :param create_cloudshell_session: function with no arguments that opens a CloudShell API session of the job,
+        the session of the command that started the job is closed once the command returns
+        :param logging.Logger logger:
+        """
+        thread = threading.Thread(target=self._run,
+                                  args=(instance, key_value, reservation_id, create_cloudshell_session, logger),
+                                  name='WindowsCredentials-{0}'.format(instance.id))
+        thread.daemon = True
+        with self._lock:
+            self._jobs[instance.id] = thread
+        thread.start()
+        logger.info("Retrieving the credentials of instance {0} in the background".format(instance.id))
+
+    def is_running(self, instance_id):
+        """
+        :param str instance_id:
+        :rtype: bool
+        """
+        with self._lock:
+            return instance_id in self._jobs
+
+    def _run(self, instance, key_value, reservation_id, create_cloudshell_session, logger):
+        try:
+            ami_credentials, error = self._get_credentials(instance, key_value, logger)
+
+            cloudshell_session = create_cloudshell_session()
+            resource_name = self._find_resource_name(cloudshell_session, reservation_id, instance.id)
+            if not resource_name:
+                logger.error("Deployed app resource of instance {0} was not found, its credentials were not set"
+                             .format(instance.id))
+                return
+
+            if error:
+                self.deployed_app_credentials_service.set_credentials_error(cloudshell_session, resource_name, error)
+            else:
+                self.deployed_app_credentials_service.set_credentials(cloudshell_session, resource_name,
+                                                                      ami_credentials)
+                logger.info("Credentials of instance {0} were set on {1}".format(instance.id, resource_name))
+        except Exception:
+            logger.exception("Failed to set the credentials of instance {0}".format(instance.id))
+        finally:
+            with self._lock:
+                self._jobs.pop(instance.id, None)
+
+    def _get_credentials(self, instance, key_value, logger):
+        """
+        :return: the credentials and the error message recorded on the resource when they were not retrieved
+        :rtype: (cloudshell.cp.aws.models.ami_credentials.AMICredentials, str)
+        """
+        try:
+            ami_credentials = self.credentials_service.get_windows_credentials(instance=instance,
+                                                                               key_value=key_value,
+                                                                               wait_for_password=True)
+        except TimeoutError:
+            logger.info("Timeout when waiting for the windows credentials of instance {0}".format(instance.id))
+            return None, 'Timeout when waiting for windows credentials'
+        except Exception as e:
+            logger.exception("Failed to retrieve the windows credentials of instance {0}".format(instance.id))
+            return None, 'Failed to retrieve windows credentials: {0}'.format(e)
+
+        if not ami_credentials or not ami_credentials.password:
+            return None, 'Failed to decrypt windows credentials'
+        return ami_credentials, None
+
+    def _find_resource_name(self, cloudshell_session, reservation_id, instance_id):
+        for lookup in range(self.max_resource_lookups):
+            if lookup:
+                time.sleep(self.resource_lookup_delay)
+            resource_name = self.deployed_app_credentials_service.find_deployed_app_resource_name(
+                cloudshell_session, reservation_id, instance_id)
+            if resource_name:
+                return resource_name
+        return None
@@ -1,11 +1,40 @@
+import json
+import threading
+import time
 import traceback
+from functools import partial
 
+from botocore.exceptions import ClientError
+
+from cloudshell.cp.aws.common.task_graph import TaskGraph
+from cloudshell.cp.aws.domain.common.cleanup_journal import CleanupJournal
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
+from cloudshell.cp.aws.domain.services.ec2.tags import TagService
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy
 from cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model import AWSEc2CloudProviderResourceModel
+from cloudshell.cp.aws.models.teardown_report import TeardownReport
 from cloudshell.cp.core.models import CleanupNetwork
 
 
 class CleanupSandboxInfraOperation(object):
-    def __init__(self, vpc_service, key_pair_service, route_table_service, traffic_mirror_service):
+    MAX_WORKERS = 8
+    DEPENDENCY_VIOLATION_ERROR = 'DependencyViolation'
+    KEY_PAIR = 'key pair'
+    VPC_LOOKUP = 'vpc lookup'
+    INSTANCES = 'instances'
+    TRAFFIC_MIRROR_ELEMENTS = 'traffic mirror elements'
+    INTERNET_GATEWAY = 'internet gateway {0}'
+    SECURITY_GROUP = 'security group {0}'
+    SUBNET = 'subnet {0}'
+    PEERING = 'peering {0}'
+    BLACKHOLE_ROUTES = 'blackhole routes of route table {0}'
+    PEERING_ROUTES = 'management routes of peering {0}'
+    ROUTE_TABLE = 'route table {0}'
+    VPC = 'vpc {0}'
+
+    def __init__(self, vpc_service, key_pair_service, route_table_service, traffic_mirror_service,
+                 sandbox_footprint_cache=None, dependency_violation_timeout=300, max_retry_delay=15,
+                 cleanup_journal=None, max_async_attempts=5):
         """
         :param vpc_service: VPC Service
         :type vpc_service: cloudshell.cp.aws.domain.services.ec2.vpc.VPCService
@@ -14,11 +43,26 @@ class CleanupSandboxInfraOperation(object):
         :param route_table_service:
         :type route_table_service: cloudshell.cp.aws.domain.services.ec2.route_table.RouteTablesService
         :param cloudshell.cp.aws.domain.services.ec2.mirroring.TrafficMirrorService traffic_mirror_service:
+        :param SandboxFootprintCache sandbox_footprint_cache:
+        :param int dependency_violation_timeout: the time in seconds a deletion failing with DependencyViolation is
+        retried, the resources a resource depends on are released by aws some time after their deletion
+        :param int max_retry_delay: the max time in seconds between the retries of a deletion
+        :param CleanupJournal cleanup_journal: the asynchronous cleanups of the driver process, used by the cloud
+        providers that do not set the directory of their journal
+        :param int max_async_attempts: the number of times an asynchronous cleanup runs the teardown before it fails
         """
         self.vpc_service = vpc_service
         self.key_pair_service = key_pair_service
         self.route_table_service = route_table_service
         self.traffic_mirror_service = traffic_mirror_service
+        self.sandbox_footprint_cache = sandbox_footprint_cache or SandboxFootprintCache()
+        self.dependency_violation_timeout = dependency_violation_timeout
+        self.backoff_policy = BackoffPolicy(initial_delay=1, max_delay=max_retry_delay)
+        self.cleanup_journal = cleanup_journal or CleanupJournal()
+        self._cleanup_journals = {}
+        self.max_async_attempts = max_async_attempts
+        self._running = set()
+        self._lock = threading.Lock()
 
     def cleanup(self, ec2_client, ec2_session, s3_session, aws_ec2_data_model, reservation_id, actions, logger):
         """
@@ -38,50 +82,348 @@ class CleanupSandboxInfraOperation(object):
         result.actionId = actions[0].actionId
         result.success = True
 
-        try:
-            # need to remove the keypair before we try to find the VPC
-            self._remove_keypair(aws_ec2_data_model, ec2_session, logger, reservation_id, s3_session)
-            vpc = self.vpc_service.find_vpc_for_reservation(ec2_session, reservation_id)
-
-            if not vpc:
-                raise ValueError('No VPC was created for this reservation')
+        # the sandbox resources are deleted, even partially, so their cached ids must not be used anymore
+        self.sandbox_footprint_cache.invalidate(aws_ec2_data_model.region, reservation_id)
 
-            logger.info("Deleting all instances")
-            self.vpc_service.delete_all_instances(vpc)
+        try:
+            report = self.teardown(ec2_client, ec2_session, s3_session, aws_ec2_data_model, reservation_id, logger)
+            if not report.succeeded:
+                result.success = False
+                result.errorMessage = 'CleanupSandboxInfra ended with the error: {0}'.format(
+                    '; '.join('{0}: {1}'.format(resource, error) for resource, error in report.errors.items()))
+        except Exception as exc:
+            logger.error("Error in cleanup connectivity. Error: {0}".format(traceback.format_exc()))
+            result.success = False
+            result.errorMessage = 'CleanupSandboxInfra ended with the error: {0}'.format(exc)
+        return result
 
-            logger.info("Deleting vpc and removing dependencies")
-            self.vpc_service.remove_all_internet_gateways(vpc)
-            self.vpc_service.remove_all_security_groups(vpc, reservation_id)
-            self.vpc_service.remove_all_subnets(vpc)
-            self.vpc_service.remove_all_peering(vpc)
-            self._delete_blackhole_routes_in_vpc_route_table(ec2_session, ec2_client, aws_ec2_data_model)
-            self.vpc_service.remove_custom_route_tables(ec2_session, vpc)
+    def cleanup_async(self, create_aws_api, aws_ec2_data_model, reservation_id,
+                      cloud_provider, actions, logger):
+        """
+        Records the cleanup in the journal, starts the termination of the instances and returns, the teardown runs
+        on a background thread and is resumed by the commands of the cloud provider after a driver restart
+        :param create_aws_api: function with no arguments that creates aws api clients of their own boto3 session,
+        the background teardown keeps using them after the command returned
+        :param AWSEc2CloudProviderResourceModel aws_ec2_data_model: The AWS EC2 data model
+        :param str reservation_id:
+        :param str cloud_provider: the name of the cloud provider resource
+        :param list[NetworkAction] actions:
+        :param logging.Logger logger:
+        :return:
+        """
+        if not actions:
+            raise ValueError("No cleanup action was found")
 
-            logger.info('Deleting traffic mirror elements')
-            self.vpc_service.delete_traffic_mirror_elements(ec2_client, self.traffic_mirror_service, reservation_id,
-                                                            logger)
+        aws_api = create_aws_api()
+        vpc = self.vpc_service.find_vpc_for_reservation(aws_api.ec2_session, reservation_id)
+        if not vpc:
+            # there is nothing slow to wait for
+            return self.cleanup(aws_api.ec2_client, aws_api.ec2_session, aws_api.s3_session, aws_ec2_data_model,
+                                reservation_id, actions, logger)
 
-            self.vpc_service.delete_vpc(vpc)
+        result = CleanupNetwork()
+        result.actionId = actions[0].actionId
+        result.success = True
 
+        self.sandbox_footprint_cache.invalidate(aws_ec2_data_model.region, reservation_id)
 
-            
+        cleanup_journal = self.get_cleanup_journal(aws_ec2_data_model)
+        try:
+            # the journal is written first, so a driver stopped right after the instances started terminating still
+            # resumes the cleanup
+            cleanup_journal.add(reservation_id, cloud_provider, aws_ec2_data_model.region)
+            self.vpc_service.delete_instances(
+                self.vpc_service.get_reservation_instances(aws_api.ec2_session, vpc, reservation_id), wait=False)
+            self._run_async_cleanup_in_background(aws_api, aws_ec2_data_model, reservation_id, logger)
         except Exception as exc:
             logger.error("Error in cleanup connectivity. Error: {0}".format(traceback.format_exc()))
+            # a journaled cleanup that did not start is resumed by the next command
+            cleanup_journal.release(reservation_id)
             result.success = False
             result.errorMessage = 'CleanupSandboxInfra ended with the error: {0}'.format(exc)
         return result
 
+    def resume_async_cleanups(self, create_aws_api, aws_ec2_data_model, cloud_provider, logger):
+        """
+        Resumes the pending cleanups of the cloud provider that are not running in the driver process and whose
+        owner did not refresh their heartbeat, which are the cleanups of a driver process that stopped. The journal
+        directory may be shared by several driver processes, so a cleanup is acquired in the journal before it is
+        resumed
+        :param create_aws_api: function with no arguments that creates aws api clients of their own boto3 session,
+        each resumed cleanup gets its own clients
+        :param AWSEc2CloudProviderResourceModel aws_ec2_data_model: The AWS EC2 data model
+        :param str cloud_provider: the name of the cloud provider resource
+        :param logging.Logger logger:
+        """
+        cleanup_journal = self.get_cleanup_journal(aws_ec2_data_model)
+        for entry in cleanup_journal.get_pending(cloud_provider):
+            with self._lock:
+                if entry['reservation_id'] in self._running:
+                    continue
+            if not cleanup_journal.acquire(entry['reservation_id']):
+                continue
+            self._run_async_cleanup_in_background(create_aws_api(), aws_ec2_data_model, entry['reservation_id'],
+                                                  logger)
+
+    def get_cleanup_status(self, aws_ec2_data_model, reservation_id):
+        """
+        :param AWSEc2CloudProviderResourceModel aws_ec2_data_model: The AWS EC2 data model
+        :param str reservation_id:
+        :return: the journal entry of the asynchronous cleanup of the reservation
+        :rtype: dict
+        """
+        entry = self.get_cleanup_journal(aws_ec2_data_model).get(reservation_id)
+        if entry is None:
+            raise ValueError('No asynchronous cleanup was recorded for reservation {0}'.format(reservation_id))
+        return entry
+
+    def get_cleanup_journal(self, aws_ec2_data_model):
+        """
+        :param AWSEc2CloudProviderResourceModel aws_ec2_data_model: The AWS EC2 data model
+        :return: the journal of the directory set on the cloud provider, the default journal if none is set
+        :rtype: CleanupJournal
+        """
+        directory = aws_ec2_data_model.async_cleanup_journal_directory
+        if not directory:
+            return self.cleanup_journal
+        with self._lock:
+            if directory not in self._cleanup_journals:
+                self._cleanup_journals[directory] = CleanupJournal(directory)
+            return self._cleanup_journals[directory]
+
+    def _run_async_cleanup_in_background(self, aws_api, aws_ec2_data_model, reservation_id, logger):
+        """
+        Runs the asynchronous cleanup of the reservation on a background thread, unless it is already running
+        :param cloudshell.cp.aws.models.aws_api.AwsApiClients aws_api: clients used by the background thread only
+        """
+        with self._lock:
+            if reservation_id in self._running:
+                return
+            self._running.add(reservation_id)
+
+        thread = threading.Thread(target=self._run_async_cleanup,
+                                  args=(aws_api, aws_ec2_data_model, reservation_id, logger),
+                                  name='CleanupSandboxInfra-{0}'.format(reservation_id))
+        thread.daemon = True
+        thread.start()
+
+    def _run_async_cleanup(self, aws_api, aws_ec2_data_model, reservation_id, logger):
+        try:
+            self._retry_teardown(aws_api.ec2_client, aws_api.ec2_session, aws_api.s3_session, aws_ec2_data_model,
+                                 reservation_id, logger)
+        except Exception:
+            logger.exception("Failed to run the cleanup of reservation {0}".format(reservation_id))
+        finally:
+            self.get_cleanup_journal(aws_ec2_data_model).release(reservation_id)
+            with self._lock:
+                self._running.discard(reservation_id)
+
+    def _retry_teardown(self, ec2_client, ec2_session, s3_session, aws_ec2_data_model, reservation_id, logger):
+        """
+        Runs the teardown of a journaled cleanup until it succeeds or the attempts are exhausted, the outcome of each
+        attempt is recorded in the journal
+        :return: the journal entry of the cleanup
+        :rtype: dict
+        """
+        cleanup_journal = self.get_cleanup_journal(aws_ec2_data_model)
+        entry = cleanup_journal.get(reservation_id)
+        errors = entry['errors']
+        for attempt in range(entry['attempts'], self.max_async_attempts):
+            if attempt > 0:
+                time.sleep(self.backoff_policy.get_delay(attempt - 1))
+            try:
+                # the vpc of a resumed cleanup may have been deleted by an earlier attempt
+                report = self.teardown(ec2_client, ec2_session, s3_session, aws_ec2_data_model, reservation_id,
+                                       logger, vpc_required=False)
+                resources = report.resources
+                errors = report.errors
+                succeeded = report.succeeded
+            except Exception as exc:
+                logger.error("Error in cleanup connectivity. Error: {0}".format(traceback.format_exc()))
+                resources = {}
+                errors = {'cleanup': str(exc)}
+                succeeded = False
+
+            if succeeded:
+                logger.info("Cleanup of reservation {0} completed".format(reservation_id))
+                return cleanup_journal.update(reservation_id, attempts=attempt + 1, resources=resources,
+                                              errors=errors, status=CleanupJournal.COMPLETED)
+            cleanup_journal.update(reservation_id, attempts=attempt + 1, resources=resources, errors=errors)
+
+        logger.error("Cleanup of reservation {0} failed after {1} attempts with the errors: {2}"
+                     .format(reservation_id, self.max_async_attempts, json.dumps(errors)))
+        return cleanup_journal.update(reservation_id, status=CleanupJournal.FAILED)
+
+    def teardown(self, ec2_client, ec2_session, s3_session, aws_ec2_data_model, reservation_id, logger,
+                 vpc_required=True):
+        """
+        Deletes the resources of the sandbox as a graph of their aws dependencies, the resources that do not depend on
+        each other are deleted concurrently. A resource whose deletion failed is kept with all the resources that
+        depend on it, and the other resources are still deleted
+        :param ec2_client:
+        :param ec2_session:
+        :param s3_session:
+        :param AWSEc2CloudProviderResourceModel aws_ec2_data_model: The AWS EC2 data model
+        :param str reservation_id:
+        :param logging.Logger logger:
+        :param bool vpc_required: whether a missing vpc fails the teardown, otherwise only the key pair is removed
+        :return: the status of each resource of the sandbox
+        :rtype: TeardownReport
+        """
+        # the key pair is removed even if the vpc of the sandbox is not found
+        lookup = TaskGraph(max_workers=2, stop_on_error=False)
+        lookup.add(self.KEY_PAIR,
+                   lambda: self._remove_keypair(aws_ec2_data_model, ec2_session, logger, reservation_id, s3_session))
+        lookup.add(self.VPC_LOOKUP, lambda: self.vpc_service.find_vpc_for_reservation(ec2_session, reservation_id))
+        lookup.run()
+
+        report = TeardownReport()
+        self._add_to_report(report, lookup, [self.KEY_PAIR])
+        if self.VPC_LOOKUP in lookup.errors:
+            raise lookup.errors[self.VPC_LOOKUP]
+
+        vpc = lookup.results[self.VPC_LOOKUP]
+        if not vpc:
+            if not vpc_required:
+                return report
+            raise ValueError('No VPC was created for this reservation')
+
+        logger.info("Deleting vpc and removing dependencies")
+        teardown = self._create_teardown_graph(ec2_client, ec2_session, aws_ec2_data_model, reservation_id, vpc,
+                                               logger)
+        teardown.run()
+        self._add_to_report(report, teardown, teardown.names)
+
+        logger.info("Cleanup report: {0}".format(json.dumps(report.resources)))
+        return report
+
+    def _create_teardown_graph(self, ec2_client, ec2_session, aws_ec2_data_model, reservation_id, vpc, logger):
+        """
+        :rtype: TaskGraph
+        """
+        instances = self.vpc_service.get_reservation_instances(ec2_session, vpc, reservation_id)
+        internet_gateways = self.vpc_service.get_all_internet_gateways(vpc)
+        security_groups = self.vpc_service.get_all_security_groups(vpc)
+        subnets = self.vpc_service.get_all_subnets(vpc)
+        peerings = self.vpc_service.get_all_peerings(vpc)
+        route_tables = self.route_table_service.get_custom_route_tables(ec2_session, vpc.id)
+
+        teardown = TaskGraph(max_workers=self.MAX_WORKERS, stop_on_error=False)
+
+        # the network interfaces of the instances use the subnets and the security groups, and their public ips
+        # keep the internet gateways attached
+        teardown.add(self.INSTANCES, lambda: self.vpc_service.delete_instances(instances))
+        teardown.add(self.TRAFFIC_MIRROR_ELEMENTS,
+                     lambda: self.vpc_service.delete_traffic_mirror_elements(ec2_client, self.traffic_mirror_service,
+                                                                             reservation_id, logger))
+
+        vpc_dependencies = [self.INSTANCES, self.TRAFFIC_MIRROR_ELEMENTS]
+        for internet_gateway in internet_gateways:
+            name = self.INTERNET_GATEWAY.format(internet_gateway.id)
+            self._add_deletion(teardown, name, partial(self.vpc_service.remove_internet_gateway, vpc, internet_gateway),
+                               [self.INSTANCES])
+            vpc_dependencies.append(name)
+
+        # the rules of the other groups may reference the isolated group, so it is deleted last
+        isolated_sg_name = self.vpc_service.sg_service.sandbox_isolated_sg_name(reservation_id)
+        security_group_names = []
+        for security_group in sorted(security_groups, key=lambda sg: sg.group_name == isolated_sg_name):
+            name = self.SECURITY_GROUP.format(security_group.id)
+            dependencies = [self.INSTANCES]
+            if security_group.group_name == isolated_sg_name:
+                dependencies.extend(security_group_names)
+            self._add_deletion(teardown, name, partial(self.vpc_service.remove_security_group, security_group),
+                               dependencies)
+            security_group_names.append(name)
+        vpc_dependencies.extend(security_group_names)
+
+        subnet_names = []
+        for subnet in subnets:
+            name = self.SUBNET.format(subnet.id)
+            self._add_deletion(teardown, name, partial(self.vpc_service.remove_subnet, subnet), [self.INSTANCES])
+            subnet_names.append(name)
+        vpc_dependencies.extend(subnet_names)
+
+        # the routes of the management vpc to a deleted peering become blackhole routes
+        peering_names = []
+        for peering in peerings:
+            name = self.PEERING.format(peering.id)
+            self._add_deletion(teardown, name, partial(self.vpc_service.remove_peering, peering))
+            peering_names.append(name)
+        vpc_dependencies.extend(peering_names)
+
+        # the routes of the peerings indexed by the prepare are deleted from their route tables only, the route tables
+        # of the management vpc are scanned when an index is missing
+        management_routes = [TagService.find_management_routes(peering.tags) for peering in peerings]
+        if peerings and all(management_routes):
+            for peering, (route_table_ids, destination_cidr) in zip(peerings, management_routes):
+                self._add_deletion(teardown, self.PEERING_ROUTES.format(peering.id),
+                                   partial(self.route_table_service.delete_peering_routes, ec2_client,
+                                           route_table_ids, destination_cidr, peering.id),
+                                   peering_names)
+        else:
+            management_route_tables = self.route_table_service.get_all_route_tables(
+                ec2_session=ec2_session, vpc_id=aws_ec2_data_model.aws_management_vpc_id)
+            for route_table in management_route_tables:
+                self._add_deletion(teardown, self.BLACKHOLE_ROUTES.format(route_table.id),
+                                   partial(self.route_table_service.delete_blackhole_routes, route_table, ec2_client),
+                                   peering_names)
+
+        # a route table is deleted once no subnet is associated to it
+        for route_table in route_tables:
+            name = self.ROUTE_TABLE.format(route_table.id)
+            self._add_deletion(teardown, name, partial(self.route_table_service.delete_table, route_table),
+                               subnet_names)
+            vpc_dependencies.append(name)
+
+        self._add_deletion(teardown, self.VPC.format(vpc.id), partial(self.vpc_service.delete_vpc, vpc),
+                           vpc_dependencies)
+        return teardown
+
+    def _add_deletion(self, teardown, name, delete, depends_on=None):
+        teardown.add(name, partial(self._retry_dependency_violation, delete), depends_on)
+
+    def _retry_dependency_violation(self, delete):
+        """
+        Retries the deletion with backoff while it fails because of a resource that aws did not release yet
+        :param delete: function with no arguments
+        """
+        start_time = time.time()
+        attempt = 0
+        while True:
+            try:
+                return delete()
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != self.DEPENDENCY_VIOLATION_ERROR or \
+                        time.time() - start_time >= self.dependency_violation_timeout:
+                    raise
+            time.sleep(self.backoff_policy.get_delay(attempt))
+            attempt += 1
+
+    @staticmethod
+    def _add_to_report(report, graph, names):
+        """
+        :param TeardownReport report:
+        :param TaskGraph graph: a graph that ran
+        :param list[str] names: the names of the tasks in the order they are reported
+        """
+        for name in names:
+            if name in graph.errors:
+                report.add(name, TeardownReport.FAILED, str(graph.errors[name]))
+            elif name in graph.skipped:
+                report.add(name, TeardownReport.SKIPPED)
+            else:
+                report.add(name, TeardownReport.DELETED)
+
     def _remove_keypair(self, aws_ec2_data_model, ec2_session, logger, reservation_id, s3_session):
         logger.info("Removing private key (pem file) from s3")
         self.key_pair_service.remove_key_pair_for_reservation_in_s3(s3_session,
                                                                     aws_ec2_data_model.key_pairs_location,
                                                                     reservation_id)
+        # the keys of the instances claimed from the warm pool
+        self.key_pair_service.remove_instance_keys_for_reservation_in_s3(s3_session,
+                                                                         aws_ec2_data_model.key_pairs_location,
+                                                                         reservation_id)
         logger.info("Removing key pair from ec2")
         self.key_pair_service.remove_key_pair_for_reservation_in_ec2(ec2_session=ec2_session,
                                                                      reservation_id=reservation_id)
-
-    def _delete_blackhole_routes_in_vpc_route_table(self, ec2_session, ec2_client, aws_ec2_data_model):
-        rts = self.route_table_service.get_all_route_tables(ec2_session=ec2_session,
-                                                            vpc_id=aws_ec2_data_model.aws_management_vpc_id)
-        for rt in rts:
-            self.route_table_service.delete_blackhole_routes(rt, ec2_client)
@@ -3,6 +3,8 @@ import traceback
 import jsonpickle
 from cloudshell.shell.core.driver_context import CancellationContext
 
+from cloudshell.cp.aws.common.task_graph import TaskGraph
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
 from cloudshell.cp.aws.domain.conncetivity.operations.prepare_subnet_executor import PrepareSubnetExecutor, \
     SubnetActionHelper
 from cloudshell.cp.aws.domain.services.ec2.tags import *
@@ -18,8 +20,16 @@ INVALID_REQUEST_ERROR = 'Invalid request: {0}'
 
 
 class PrepareSandboxInfraOperation(object):
+    NETWORK_TASK = 'network'
+    KEY_TASK = 'key'
+    DNS_TASK = 'dns'
+    INTERNET_GATEWAY_TASK = 'internet_gateway'
+    PEERING_TASK = 'peering'
+    SECURITY_GROUPS_TASK = 'security_groups'
+    NETWORK_MAX_WORKERS = 3
+
     def __init__(self, vpc_service, security_group_service, key_pair_service, tag_service, route_table_service,
-                 cancellation_service, subnet_service, subnet_waiter):
+                 cancellation_service, subnet_service, subnet_waiter, sandbox_footprint_cache=None):
         """
         :param vpc_service: VPC Service
         :type vpc_service: cloudshell.cp.aws.domain.services.ec2.vpc.VPCService
@@ -37,6 +47,7 @@ class PrepareSandboxInfraOperation(object):
         :type subnet_service: cloudshell.cp.aws.domain.services.ec2.subnet.SubnetService
         :param subnet_waiter: Subnet Waiter
         :type subnet_waiter: cloudshell.cp.aws.domain.services.waiters.subnet.SubnetWaiter
+        :param SandboxFootprintCache sandbox_footprint_cache: populated with the ids of the sandbox resources
         """
         self.vpc_service = vpc_service
         self.security_group_service = security_group_service
@@ -46,9 +57,10 @@ class PrepareSandboxInfraOperation(object):
         self.cancellation_service = cancellation_service
         self.subnet_service = subnet_service
         self.subnet_waiter = subnet_waiter
+        self.sandbox_footprint_cache = sandbox_footprint_cache or SandboxFootprintCache()
 
     def prepare_connectivity(self, ec2_client, ec2_session, s3_session, reservation, aws_ec2_datamodel, actions,
-                             cancellation_context, logger):
+                             cancellation_context, logger, cloud_provider_owner=None):
         """
         Will create a vpc for the reservation and will peer it to the management vpc
         also will create a key pair for that reservation
@@ -62,6 +74,8 @@ class PrepareSandboxInfraOperation(object):
         :param list[RequestActionBase] actions: Parsed prepare connectivity actions
         :param CancellationContext cancellation_context:
         :param logging.Logger logger:
+        :param str cloud_provider_owner: the cloudshell server and the name of the cloud provider resource, tagged on
+        the vpc of the reservation so only this cloud provider sweeps it
         :rtype list[ActionResultBase]
         """
         if not aws_ec2_datamodel.aws_management_vpc_id:
@@ -78,20 +92,25 @@ class PrepareSandboxInfraOperation(object):
         if not create_keys_action:
             raise ValueError("Actions list must contain a CreateKeys.")
 
-        try:
-            result = self._prepare_network(ec2_client, ec2_session, reservation, aws_ec2_datamodel,
-                                           network_action, cancellation_context, logger)
-            results.append(result)
-        except Exception as e:
-            logger.error("Error in prepare connectivity. Error: {0}".format(traceback.format_exc()))
-            results.append(self._create_fault_action_result(network_action, e))
-        try:
-            result = self._prepare_key(ec2_session, s3_session, aws_ec2_datamodel, reservation, create_keys_action,
-                                       logger)
-            results.append(result)
-        except Exception as e:
-            logger.error("Error in prepare key. Error: {0}".format(traceback.format_exc()))
-            results.append(self._create_fault_action_result(create_keys_action, e))
+        # the key pair shares nothing with the network, so it is created while the network is prepared
+        prepare = TaskGraph(max_workers=2)
+        prepare.add(self.NETWORK_TASK,
+                    lambda: self._run_action(network_action,
+                                             lambda: self._prepare_network(ec2_client, ec2_session, reservation,
+                                                                           aws_ec2_datamodel, network_action,
+                                                                           cancellation_context, logger,
+                                                                           cloud_provider_owner),
+                                             "Error in prepare connectivity",
+                                             logger))
+        prepare.add(self.KEY_TASK,
+                    lambda: self._run_action(create_keys_action,
+                                             lambda: self._prepare_key(ec2_session, s3_session, aws_ec2_datamodel,
+                                                                       reservation, create_keys_action, logger),
+                                             "Error in prepare key",
+                                             logger))
+        prepare.run()
+        results.append(prepare.results[self.NETWORK_TASK])
+        results.append(prepare.results[self.KEY_TASK])
 
         # Execute prepareSubnet actions
         subnet_actions = [a for a in actions if isinstance(a, PrepareSubnet)]
@@ -106,7 +125,8 @@ class PrepareSandboxInfraOperation(object):
             cancellation_context=cancellation_context,
             logger=logger,
             ec2_session=ec2_session,
-            ec2_client=ec2_client).execute(subnet_actions)
+            ec2_client=ec2_client,
+            sandbox_footprint_cache=self.sandbox_footprint_cache).execute(subnet_actions)
 
         for subnet_result in subnet_results:
             results.append(subnet_result)
@@ -116,6 +136,20 @@ class PrepareSandboxInfraOperation(object):
 
         return results
 
+    def _run_action(self, action, prepare, error_message, logger):
+        """
+        :param action:
+        :param prepare: function with no arguments returning the result of the action
+        :param str error_message:
+        :param logging.Logger logger:
+        :return: the result of the action, a fault result if it failed
+        """
+        try:
+            return prepare()
+        except Exception as e:
+            logger.error("{0}. Error: {1}".format(error_message, traceback.format_exc()))
+            return self._create_fault_action_result(action, e)
+
     def _prepare_key(self, ec2_session, s3_session, aws_ec2_datamodel, reservation, action, logger):
         logger.info("Get or create existing key pair")
         access_key = self._get_or_create_key_pair(ec2_session=ec2_session,
@@ -125,7 +159,7 @@ class PrepareSandboxInfraOperation(object):
         return self._create_prepare_create_keys_result(action, access_key)
 
     def _prepare_network(self, ec2_client, ec2_session, reservation, aws_ec2_datamodel, action, cancellation_context,
-                         logger):
+                         logger, cloud_provider_owner=None):
         """
         :param ec2_client:
         :param ec2_session:
@@ -134,6 +168,7 @@ class PrepareSandboxInfraOperation(object):
         :param PrepareCloudInfra action: NetworkAction
         :param CancellationContext cancellation_context:
         :param logging.Logger logger:
+        :param str cloud_provider_owner:
         :return:
         """
         logger.info("PrepareCloudInfra")
@@ -145,34 +180,54 @@ class PrepareSandboxInfraOperation(object):
         # will get or create a vpc for the reservation
         self.cancellation_service.check_if_cancelled(cancellation_context)
         logger.info("Get or create existing VPC (no subnets yet)")
-        vpc = self._get_or_create_vpc(cidr, ec2_session, reservation)
+        vpc = self._get_or_create_vpc(cidr, ec2_session, reservation, cloud_provider_owner)
+
+        # once the vpc exists, its dns, internet gateway with the peering and security groups are independent
+        network = TaskGraph(max_workers=self.NETWORK_MAX_WORKERS,
+                            check_cancelled=lambda: self.cancellation_service.check_if_cancelled(cancellation_context))
 
         # will enable dns for the vpc
-        self.cancellation_service.check_if_cancelled(cancellation_context)
-        logger.info("Enable dns for the vpc")
-        self._enable_dns_hostnames(ec2_client=ec2_client, vpc_id=vpc.id)
+        network.add(self.DNS_TASK, lambda: self._enable_dns_hostnames(ec2_client=ec2_client, vpc_id=vpc.id))
 
         # will get or create an Internet-Gateway (IG) for the vpc
-        self.cancellation_service.check_if_cancelled(cancellation_context)
-        logger.info("Get or create and attach existing internet gateway")
-        internet_gateway_id = self._create_and_attach_internet_gateway(ec2_session, vpc, reservation)
+        network.add(self.INTERNET_GATEWAY_TASK,
+                    lambda: self._create_and_attach_internet_gateway(ec2_session, vpc, reservation))
 
         # will try to peer sandbox VPC to mgmt VPC if not exist
         # note, if vpc_mode == static, will not create peering
-        self._peer_to_mgmt_if_needed(aws_ec2_datamodel, cancellation_context, cidr, ec2_client, ec2_session,
-                                     internet_gateway_id, logger, reservation, vpc)
+        network.add(self.PEERING_TASK,
+                    lambda: self._peer_to_mgmt_if_needed(aws_ec2_datamodel, cancellation_context, cidr, ec2_client,
+                                                         ec2_session, network.results[self.INTERNET_GATEWAY_TASK],
+                                                         logger, reservation, vpc),
+                    depends_on=[self.INTERNET_GATEWAY_TASK])
 
         # will get or create default Security Group
-        self.cancellation_service.check_if_cancelled(cancellation_context)
-        logger.info("Get or create default Security Group")
-        security_groups = \
-            self._get_or_create_default_security_groups(ec2_session=ec2_session,
-                                                        reservation=reservation,
-                                                        vpc=vpc,
-                                                        management_sg_id=aws_ec2_datamodel.aws_management_sg_id,
-                                                        need_management_access=not aws_ec2_datamodel.is_static_vpc_mode)
+        network.add(self.SECURITY_GROUPS_TASK,
+                    lambda: self._get_or_create_default_security_groups(
+                        ec2_session=ec2_session,
+                        reservation=reservation,
+                        vpc=vpc,
+                        management_sg_id=aws_ec2_datamodel.aws_management_sg_id,
+                        need_management_access=not aws_ec2_datamodel.is_static_vpc_mode))
+
+        logger.info("Enable dns, get or create and attach internet gateway and get or create default Security Groups")
+        network.run()
+        security_groups = network.results[self.SECURITY_GROUPS_TASK]
+        self._cache_sandbox_footprint(aws_ec2_datamodel.region, reservation, vpc, security_groups,
+                                      network.results[self.PEERING_TASK])
         return self._create_prepare_network_result(action, security_groups, vpc)
 
+    def _cache_sandbox_footprint(self, region, reservation, vpc, security_groups, private_route_table):
+        self.sandbox_footprint_cache.set_vpc_id(region, reservation.reservation_id, vpc.id)
+        for security_group in security_groups:
+            self.sandbox_footprint_cache.set_security_group_id(region,
+                                                               reservation.reservation_id,
+                                                               security_group.group_name,
+                                                               security_group.id)
+        self.sandbox_footprint_cache.set_private_route_table_id(region,
+                                                                reservation.reservation_id,
+                                                                private_route_table.route_table_id)
+
     def _get_vpc_cidr(self, action, aws_ec2_datamodel, logger):
         if aws_ec2_datamodel.is_static_vpc_mode and aws_ec2_datamodel.vpc_cidr != '':
             cidr = aws_ec2_datamodel.vpc_cidr
@@ -205,6 +260,8 @@ class PrepareSandboxInfraOperation(object):
         else:
             logger.info("We are using static VPC mode, not creating VPC peering with management vpc")
 
+        return sandbox_private_route_table
+
     @retry(stop_max_attempt_number=30, wait_fixed=1000)
     def _enable_dns_hostnames(self, ec2_client, vpc_id):
         """
@@ -283,6 +340,13 @@ class PrepareSandboxInfraOperation(object):
                                              ec2_session=ec2_session,
                                              ec2_client=ec2_client)
 
+        # the cleanup deletes the routes of the peering from the indexed route tables only
+        management_routes_tags = self.tag_service.get_management_routes_tags(
+            route_table_ids=[mgmt_route_table.id for mgmt_route_table in mgmt_rts],
+            destination_cidr=sandbox_vpc_cidr)
+        if management_routes_tags:
+            self.tag_service.set_ec2_resources_tags(ec2_client, [vpc_peer_connection_id], management_routes_tags)
+
         # add route in sandbox route table to the management vpc
         sandbox_main_route_table = self.route_table_service.get_main_route_table(ec2_session=ec2_session,
                                                                                  vpc_id=vpc_id)
@@ -410,13 +474,14 @@ class PrepareSandboxInfraOperation(object):
 
         return security_group
 
-    def _get_or_create_vpc(self, cidr, ec2_session, reservation):
+    def _get_or_create_vpc(self, cidr, ec2_session, reservation, cloud_provider_owner=None):
         vpc = self.vpc_service.find_vpc_for_reservation(ec2_session=ec2_session,
                                                         reservation_id=reservation.reservation_id)
         if not vpc:
             vpc = self.vpc_service.create_vpc_for_reservation(ec2_session=ec2_session,
                                                               reservation=reservation,
-                                                              cidr=cidr)
+                                                              cidr=cidr,
+                                                              cloud_provider_owner=cloud_provider_owner)
         return vpc
 
     def _create_prepare_create_keys_result(self, action, access_key):
@@ -1,14 +1,19 @@
 import traceback
 import ipaddress
+from collections import OrderedDict
+from functools import partial
 from logging import Logger
 
 from cloudshell.shell.core.driver_context import CancellationContext
 
+from cloudshell.cp.aws.common.task_graph import TaskGraph
 from cloudshell.cp.aws.domain.common.cancellation_service import CommandCancellationService
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
 from cloudshell.cp.aws.domain.services.ec2.subnet import SubnetService
-from cloudshell.cp.aws.domain.services.ec2.tags import TagService
+from cloudshell.cp.aws.domain.services.ec2.tags import TagNames, TagService
 from cloudshell.cp.aws.domain.services.ec2.vpc import VPCService
 from cloudshell.cp.aws.domain.services.waiters.subnet import SubnetWaiter
+from cloudshell.cp.aws.models.aws_api import create_resource_for_thread
 from cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model import AWSEc2CloudProviderResourceModel
 from cloudshell.cp.core.models import PrepareCloudInfraResult
 from cloudshell.cp.aws.models.reservation_model import ReservationModel
@@ -17,6 +22,7 @@ from cloudshell.cp.core.models import PrepareSubnet
 
 class PrepareSubnetExecutor(object):
     SUBNET_RESERVATION = '{0} Reservation: {1}'
+    MAX_WORKERS = 8
 
     class ActionItem:
         def __init__(self, action):
@@ -27,7 +33,7 @@ class PrepareSubnetExecutor(object):
 
     def __init__(self, cancellation_service, vpc_service, subnet_service,
                  tag_service, subnet_waiter, reservation, aws_ec2_datamodel, cancellation_context, logger, ec2_session,
-                 ec2_client):
+                 ec2_client, sandbox_footprint_cache=None):
         """
         :param CommandCancellationService cancellation_service:
         :param VPCService vpc_service:
@@ -40,6 +46,7 @@ class PrepareSubnetExecutor(object):
         :param Logger logger:
         :param ec2_session:
         :param ec2_client:
+        :param SandboxFootprintCache sandbox_footprint_cache:
         """
         self.ec2_client = ec2_client
         self.ec2_session = ec2_session
@@ -52,6 +59,7 @@ class PrepareSubnetExecutor(object):
         self.subnet_service = subnet_service
         self.tag_service = tag_service
         self.subnet_waiter = subnet_waiter
+        self.sandbox_footprint_cache = sandbox_footprint_cache or SandboxFootprintCache()
 
     def execute(self, subnet_actions):
         if any(not isinstance(a, PrepareSubnet) for a in subnet_actions):
@@ -78,24 +86,65 @@ class PrepareSubnetExecutor(object):
         for item in action_items:
             self._step_get_existing_subnet(item, vpc, is_multi_subnet_mode)
 
-        # create new subnet for the non-existing ones
-        for item in action_items:
-            self._step_create_new_subnet_if_needed(item, vpc, availability_zone, is_multi_subnet_mode)
+        # create new subnet for the non-existing ones, all at once
+        self._run_steps([partial(self._step_create_new_subnet_if_needed, item, self._get_vpc_for_thread(vpc),
+                                 availability_zone, is_multi_subnet_mode)
+                         for item in action_items])
 
         # wait for the new ones to be available
-        for item in action_items:
-            self._step_wait_till_available(item)
+        self._run_batch_step(self._step_wait_till_available,
+                             [item for item in action_items if item.is_new_subnet])
 
-        # set tags
+        # set the tags shared by the subnets with one call for each is public value
+        items_by_is_public = OrderedDict()
         for item in action_items:
-            self._step_set_tags(item)
+            items_by_is_public.setdefault(item.action.actionParams.isPublic, []).append(item)
+        for is_public, items in items_by_is_public.items():
+            self._run_batch_step(partial(self._step_set_shared_tags, is_public=is_public), items)
 
-        # set non-public subnets with private route table
-        for item in action_items:
-            self._step_attach_to_private_route_table(item, vpc)
+        # set the name of each subnet and set non-public subnets with private route table
+        steps = [partial(self._step_set_name_tag, item) for item in action_items]
+        steps.extend(partial(self._step_attach_to_private_route_table, item,
+                             create_resource_for_thread(self.ec2_session), vpc.id)
+                     for item in action_items)
+        self._run_steps(steps)
 
         return [self._create_result(item) for item in action_items]
 
+    def _run_steps(self, steps):
+        """
+        Runs the steps of different action items on up to MAX_WORKERS threads, each step records its own error
+        :param list steps: functions with no arguments
+        """
+        graph = TaskGraph(max_workers=self.MAX_WORKERS)
+        for index, step in enumerate(steps):
+            graph.add(str(index), step)
+        graph.run()
+
+    def _get_vpc_for_thread(self, vpc):
+        """
+        The steps run concurrently and boto3 resources are not thread safe, so each step gets its own resources
+        :rtype: EC2.Vpc
+        """
+        return create_resource_for_thread(self.ec2_session).Vpc(vpc.id)
+
+    def _run_batch_step(self, step, items):
+        """
+        Runs a step handling many action items at once, its error is recorded on each of the items
+        :param step: function receiving the action items without error
+        :param list[PrepareSubnetExecutor.ActionItem] items:
+        """
+        self.cancellation_service.check_if_cancelled(self.cancellation_context)
+        items = [item for item in items if not item.error]
+        if not items:
+            return
+        try:
+            step(items)
+        except Exception as e:
+            self.logger.error("Error in prepare connectivity. Error: {0}".format(traceback.format_exc()))
+            for item in items:
+                item.error = e
+
     # DECORATOR! First argument is the decorated function!
     def step_wrapper(step):
         def wrapper(self, item, *args, **kwargs):
@@ -132,33 +181,47 @@ class PrepareSubnetExecutor(object):
             item.subnet = self.subnet_service.create_subnet_nowait(vpc, cidr, availability_zone)
             item.is_new_subnet = True
 
-    @step_wrapper
-    def _step_wait_till_available(self, item):
-        if item.is_new_subnet:
-            self.logger.info("Waiting for subnet {0} - start".format(item.action.actionParams.cidr))
-            self.subnet_waiter.wait(item.subnet, self.subnet_waiter.AVAILABLE)
-            self.logger.info("Waiting for subnet {0} - end".format(item.action.actionParams.cidr))
+    def _step_wait_till_available(self, items):
+        cidrs = [item.action.actionParams.cidr for item in items]
+        self.logger.info("Waiting for subnets {0} - start".format(cidrs))
+        self.subnet_waiter.multi_wait([item.subnet for item in items], self.subnet_waiter.AVAILABLE)
+        self.logger.info("Waiting for subnets {0} - end".format(cidrs))
+
+    def _step_set_shared_tags(self, items, is_public):
+        tags = [tag for tag in self.tag_service.get_default_tags('', self.reservation) if tag['Key'] != TagNames.Name]
+        tags.append(self.tag_service.get_is_public_tag(is_public))
+        self.tag_service.set_ec2_resources_tags(self.ec2_client, [item.subnet.subnet_id for item in items], tags)
 
     @step_wrapper
-    def _step_set_tags(self, item):
+    def _step_set_name_tag(self, item):
         alias = item.action.actionParams.alias or "Subnet-{0}".format(item.action.actionParams.cidr)
         subnet_name = self.SUBNET_RESERVATION.format(alias, self.reservation.reservation_id)
-        is_public_tag = self.tag_service.get_is_public_tag(item.action.actionParams.isPublic)
-        tags = self.tag_service.get_default_tags(subnet_name, self.reservation)
-        tags.append(is_public_tag)
-        self.tag_service.set_ec2_resource_tags(item.subnet, tags)
+        self.tag_service.set_ec2_resource_tags(item.subnet, [self.tag_service.get_name_tag(subnet_name)])
+        self.sandbox_footprint_cache.set_subnet_name(self.aws_ec2_datamodel.region, self.reservation.reservation_id,
+                                                     item.subnet.subnet_id, alias)
 
     @step_wrapper
-    def _step_attach_to_private_route_table(self, item, vpc):
+    def _step_attach_to_private_route_table(self, item, ec2_session, vpc_id):
         if item.action.actionParams.isPublic:
             self.logger.info("Subnet is public - no need to attach private routing table")
         else:
             self.logger.info("Subnet is private - getting and attaching private routing table")
-            private_route_table = self.vpc_service.get_or_throw_private_route_table(self.ec2_session, self.reservation,
-                                                                                    vpc.vpc_id)
             self.subnet_service.set_subnet_route_table(ec2_client=self.ec2_client,
                                                        subnet_id=item.subnet.subnet_id,
-                                                       route_table_id=private_route_table.route_table_id)
+                                                       route_table_id=self._get_private_route_table_id(ec2_session,
+                                                                                                       vpc_id))
+
+    def _get_private_route_table_id(self, ec2_session, vpc_id):
+        footprint = self.sandbox_footprint_cache.get(self.aws_ec2_datamodel.region, self.reservation.reservation_id)
+        if footprint and footprint.private_route_table_id:
+            return footprint.private_route_table_id
+
+        private_route_table = self.vpc_service.get_or_throw_private_route_table(ec2_session, self.reservation,
+                                                                                vpc_id)
+        self.sandbox_footprint_cache.set_private_route_table_id(self.aws_ec2_datamodel.region,
+                                                                self.reservation.reservation_id,
+                                                                private_route_table.route_table_id)
+        return private_route_table.route_table_id
 
     def _create_result(self, item):
         action_result = PrepareCloudInfraResult()
@@ -0,0 +1,199 @@
+import json
+import time
+from functools import partial
+
+from cloudshell.cp.aws.common.task_graph import TaskGraph
+from cloudshell.cp.aws.domain.services.ec2.keypair import KEY_FORMAT, RESERVATION_KEY_PAIR
+from cloudshell.cp.aws.domain.services.ec2.tags import TagNames, TagService
+from cloudshell.cp.aws.models.sweep_report import SweepReport
+from cloudshell.cp.aws.models.teardown_report import TeardownReport
+
+
+class SweepOrphanedResourcesOperation(object):
+    MAX_WORKERS = 4
+    VPC = 'vpc'
+    NETWORK_INTERFACE = 'network interface'
+    ELASTIC_IP = 'elastic ip'
+    TRAFFIC_MIRROR_FILTER = 'traffic mirror filter'
+    TRAFFIC_MIRROR_TARGET = 'traffic mirror target'
+    KEY_PAIR = 'key pair'
+    S3_KEY = 's3 key'
+    # the resources tagged by the sandbox commands, found with one paginated describe each:
+    # resource type, describe operation, the list of the response and the id of each resource
+    TAGGED_RESOURCES = [(VPC, 'describe_vpcs', 'Vpcs', 'VpcId'),
+                        (NETWORK_INTERFACE, 'describe_network_interfaces', 'NetworkInterfaces', 'NetworkInterfaceId'),
+                        (ELASTIC_IP, 'describe_addresses', 'Addresses', 'AllocationId'),
+                        (TRAFFIC_MIRROR_FILTER, 'describe_traffic_mirror_filters', 'TrafficMirrorFilters',
+                         'TrafficMirrorFilterId'),
+                        (TRAFFIC_MIRROR_TARGET, 'describe_traffic_mirror_targets', 'TrafficMirrorTargets',
+                         'TrafficMirrorTargetId')]
+    AVAILABLE_NETWORK_INTERFACE_STATUS = 'available'
+    # the reservations created more recently may still be prepared or cleaned up by another command
+    MIN_AGE = 24 * 60 * 60
+
+    def __init__(self, cleanup_operation):
+        """
+        :param cloudshell.cp.aws.domain.conncetivity.operations.cleanup.CleanupSandboxInfraOperation cleanup_operation:
+        """
+        self.cleanup_operation = cleanup_operation
+
+    def sweep(self, ec2_client, ec2_session, s3_session, aws_ec2_data_model, active_reservation_ids, cloud_provider,
+              cloud_provider_owner, dry_run, logger, reservation_ids=None, min_age=MIN_AGE):
+        """
+        Finds the resources of the region left by the reservations that are not active anymore, and deletes the ones
+        of the given reservations unless it is a dry run. Only the reservations whose vpc was tagged by this cloud
+        provider at prepare more than the min age ago are swept, the account may be shared with other cloud providers
+        and cloudshell servers. The resources of each orphaned reservation are deleted like its cleanup would,
+        and the reservations are swept concurrently
+        :param ec2_client:
+        :param ec2_session:
+        :param s3_session:
+        :param cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel aws_ec2_data_model:
+        :param list[str] active_reservation_ids: the reservations of cloudshell whose resources are kept
+        :param str cloud_provider: the name of the cloud provider resource, its pending asynchronous cleanups are kept
+        :param str cloud_provider_owner: the cloudshell server and the name of the cloud provider resource, as tagged
+        on the vpcs of its reservations
+        :param bool dry_run: whether to only report the orphaned resources
+        :param logging.Logger logger:
+        :param list[str] reservation_ids: the reservations to delete the orphaned resources of, e.g. the ones reported
+        by a dry run, required unless it is a dry run
+        :param float min_age: the time in seconds since the vpc of a reservation was created before it is swept
+        :rtype: SweepReport
+        """
+        if not dry_run and not reservation_ids:
+            raise ValueError('The reservations to sweep must be given, run a dry run to find the orphaned reservations')
+
+        kept_reservation_ids = set(active_reservation_ids)
+        cleanup_journal = self.cleanup_operation.get_cleanup_journal(aws_ec2_data_model)
+        kept_reservation_ids.update(entry['reservation_id'] for entry in cleanup_journal.get_pending(cloud_provider))
+
+        report = SweepReport(dry_run)
+        resources = self._find_sandbox_resources(ec2_client, s3_session, aws_ec2_data_model.key_pairs_location,
+                                                 cloud_provider_owner, time.time() - min_age, logger)
+        for reservation_id, resource_type, resource_id in resources:
+            if reservation_id in kept_reservation_ids or (not dry_run and reservation_id not in reservation_ids):
+                continue
+            report.add_orphan(reservation_id, resource_type, resource_id)
+
+        logger.info("Orphaned resources: {0}".format(json.dumps(report.orphans)))
+        if dry_run or not report.orphans:
+            return report
+
+        sweep = TaskGraph(max_workers=self.MAX_WORKERS, stop_on_error=False)
+        for reservation_id, orphans in report.orphans.items():
+            sweep.add(reservation_id, partial(self._sweep_reservation, ec2_client, ec2_session, s3_session,
+                                              aws_ec2_data_model, reservation_id, orphans, logger))
+        sweep.run()
+
+        for reservation_id in report.orphans:
+            if reservation_id in sweep.errors:
+                report.errors[reservation_id] = {'sweep': str(sweep.errors[reservation_id])}
+                continue
+            teardown_report = sweep.results[reservation_id]
+            report.resources[reservation_id] = teardown_report.resources
+            if not teardown_report.succeeded:
+                report.errors[reservation_id] = teardown_report.errors
+
+        logger.info("Sweep report: {0}".format(json.dumps(report.resources)))
+        return report
+
+    def _sweep_reservation(self, ec2_client, ec2_session, s3_session, aws_ec2_data_model, reservation_id, orphans,
+                           logger):
+        """
+        :param dict orphans: the ids of the orphaned resources of the reservation by their type
+        :rtype: TeardownReport
+        """
+        # detached interfaces keep their subnet and security groups from being deleted
+        for network_interface_id in orphans.get(self.NETWORK_INTERFACE, []):
+            ec2_client.delete_network_interface(NetworkInterfaceId=network_interface_id)
+
+        # the key pair, the vpc and everything it contains, including the traffic mirror elements, are deleted with
+        # the dependency ordering of the cleanup
+        report = self.cleanup_operation.teardown(ec2_client, ec2_session, s3_session, aws_ec2_data_model,
+                                                 reservation_id, logger, vpc_required=False)
+
+        # the instances holding the addresses are terminated by the teardown
+        for allocation_id in orphans.get(self.ELASTIC_IP, []):
+            name = '{0} {1}'.format(self.ELASTIC_IP, allocation_id)
+            try:
+                ec2_client.release_address(AllocationId=allocation_id)
+                report.add(name, TeardownReport.DELETED)
+            except Exception as exc:
+                report.add(name, TeardownReport.FAILED, str(exc))
+        return report
+
+    def _find_sandbox_resources(self, ec2_client, s3_session, bucket, cloud_provider_owner, created_before, logger):
+        """
+        :param float created_before: the time the vpcs of the swept reservations were created before
+        :return: the reservation id, the type and the id of each resource of the sandboxes of the region that were
+        created by the cloud provider before the given time
+        :rtype: list[tuple[str, str, str]]
+        """
+        resources = []
+        filters = [{'Name': 'tag:' + TagNames.CreatedBy, 'Values': [TagService.CREATED_BY_QUALI]},
+                   {'Name': 'tag-key', 'Values': [TagNames.ReservationId]}]
+        owned_reservation_ids = set()
+        for resource_type, operation, result_key, id_key in self.TAGGED_RESOURCES:
+            for resource in self._describe(ec2_client, operation, result_key, Filters=filters):
+                # the attached interfaces are deleted with their instances
+                if resource_type == self.NETWORK_INTERFACE and \
+                        resource.get('Status') != self.AVAILABLE_NETWORK_INTERFACE_STATUS:
+                    continue
+                # the tags of the network interfaces are returned as their tag set
+                tags = resource.get('Tags') or resource.get('TagSet') or []
+                reservation_id = self._get_tag_value(tags, TagNames.ReservationId)
+                if resource_type == self.VPC and self._is_owned(tags, cloud_provider_owner, created_before):
+                    owned_reservation_ids.add(reservation_id)
+                resources.append((reservation_id, resource_type, resource[id_key]))
+
+        # key pairs are not tagged, their name contains the reservation id
+        key_name_prefix = RESERVATION_KEY_PAIR.format('')
+        key_pairs = ec2_client.describe_key_pairs(Filters=[{'Name': 'key-name',
+                                                            'Values': [key_name_prefix + '*']}])['KeyPairs']
+        for key_pair in key_pairs:
+            resources.append((key_pair['KeyName'][len(key_name_prefix):], self.KEY_PAIR, key_pair['KeyName']))
+
+        s3_key_prefix = KEY_FORMAT.split('{0}')[0]
+        paginator = s3_session.meta.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=s3_key_prefix):
+            for s3_object in page.get('Contents', []):
+                reservation_id = s3_object['Key'].split('/')[0][len(s3_key_prefix):]
+                resources.append((reservation_id, self.S3_KEY, s3_object['Key']))
+
+        not_owned_reservation_ids = set(resource[0] for resource in resources) - owned_reservation_ids
+        if not_owned_reservation_ids:
+            logger.info("Reservations not swept, their vpc was not created by the cloud provider or is too recent: "
+                        "{0}".format(', '.join(sorted(not_owned_reservation_ids))))
+        return [resource for resource in resources if resource[0] in owned_reservation_ids]
+
+    def _is_owned(self, vpc_tags, cloud_provider_owner, created_before):
+        """
+        :return: whether the vpc was created by the cloud provider before the given time
+        :rtype: bool
+        """
+        if self._get_tag_value(vpc_tags, TagNames.CloudProvider) != cloud_provider_owner:
+            return False
+        try:
+            return float(self._get_tag_value(vpc_tags, TagNames.CreatedAt)) <= created_before
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _describe(ec2_client, operation, result_key, **kwargs):
+        """
+        :return: all the resources of the describe operation, reading all the pages of the operations that have them
+        :rtype: list[dict]
+        """
+        if not ec2_client.can_paginate(operation):
+            return getattr(ec2_client, operation)(**kwargs)[result_key]
+        resources = []
+        for page in ec2_client.get_paginator(operation).paginate(**kwargs):
+            resources.extend(page[result_key])
+        return resources
+
+    @staticmethod
+    def _get_tag_value(tags, key):
+        for tag in tags:
+            if tag['Key'] == key:
+                return tag['Value']
+        return None
@@ -18,6 +18,7 @@ class AwsShellContext(object):
         self.context = context
         self.aws_session_manager = aws_session_manager
         self.model_parser = AWSModelsParser()
+        self.shell_context_model = None
 
     def __enter__(self):
         """
@@ -31,20 +32,24 @@ class AwsShellContext(object):
                         with AwsApiSessionContext(aws_session_manager=self.aws_session_manager,
                                                   cloudshell_session=cloudshell_session,
                                                   aws_ec2_resource_model=aws_ec2_resource_model) as aws_api:
-                            return AwsShellContextModel(logger=logger,
-                                                        cloudshell_session=cloudshell_session,
-                                                        aws_ec2_resource_model=aws_ec2_resource_model,
-                                                        aws_api=aws_api)
+                            self.shell_context_model = AwsShellContextModel(
+                                logger=logger,
+                                cloudshell_session=cloudshell_session,
+                                aws_ec2_resource_model=aws_ec2_resource_model,
+                                aws_api=aws_api)
+                            return self.shell_context_model
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
-        Called upon end of the context. Does nothing
+        Called upon end of the context. Logs which aws api clients were used by the command
         :param exc_type: Exception type
         :param exc_val: Exception value
         :param exc_tb: Exception traceback
         :return:
         """
-        pass
+        if self.shell_context_model:
+            self.shell_context_model.logger.debug(
+                'AWS api clients usage: {0}'.format(self.shell_context_model.aws_api.get_usage_summary()))
 
 
 class AwsShellContextModel(object):
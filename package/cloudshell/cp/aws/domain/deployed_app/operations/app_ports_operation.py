@@ -4,6 +4,7 @@ import re
 from cloudshell.shell.core.driver_context import ResourceContextDetails
 from jsonpickle import json
 
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
 from cloudshell.cp.aws.domain.services.parsers.aws_model_parser import AWSModelsParser
 from cloudshell.cp.aws.domain.services.parsers.port_group_attribute_parser import PortGroupAttributeParser
 from cloudshell.cp.aws.models.port_data import PortData
@@ -11,16 +12,19 @@ from cloudshell.cp.aws.domain.services.parsers.custom_param_extractor import VmC
 
 
 class DeployedAppPortsOperation(object):
-    def __init__(self, vm_custom_params_extractor, security_group_service, instance_service):
+    def __init__(self, vm_custom_params_extractor, security_group_service, instance_service,
+                 sandbox_footprint_cache=None):
         """
         :param VmCustomParamsExtractor vm_custom_params_extractor:
         :param security_group_service:
         :type security_group_service: cloudshell.cp.aws.domain.services.ec2.security_group.SecurityGroupService
+        :param SandboxFootprintCache sandbox_footprint_cache: the sandbox subnet names are taken from it
         :return:
         """
         self.vm_custom_params_extractor = vm_custom_params_extractor
         self.security_group_service = security_group_service
         self.instance_service = instance_service
+        self.sandbox_footprint_cache = sandbox_footprint_cache or SandboxFootprintCache()
 
     def get_formated_deployed_app_ports(self, custom_params):
         """
@@ -52,12 +56,15 @@ class DeployedAppPortsOperation(object):
 
         return '\n'.join(result_str_list).strip()
 
-    def get_app_ports_from_cloud_provider(self, ec2_session, instance_id, resource, allow_all_storage_traffic):
+    def get_app_ports_from_cloud_provider(self, ec2_session, instance_id, resource, allow_all_storage_traffic,
+                                          region=None, reservation_id=None):
         """
         :param ec2_session: EC2 session
         :param string instance_id:
         :param ResourceContextDetails resource:
         :param string allow_all_storage_traffic:
+        :param str region: the region of the app, used with the reservation to take the subnet names from the cache
+        :param str reservation_id: the reservation of the app, used to take the subnet names from the cache
         """
         instance = self.instance_service.get_active_instance_by_id(ec2_session, instance_id)
         network_interfaces = instance.network_interfaces
@@ -72,7 +79,7 @@ class DeployedAppPortsOperation(object):
 
         for key, value in network_interfaces_dict.iteritems():
             for network_interface in value:
-                subnet_name = self._get_network_interface_subnet_name(network_interface)
+                subnet_name = self._get_network_interface_subnet_name(network_interface, region, reservation_id)
                 result_str_list.append('Subnet Id: ' + key)
                 result_str_list.append('Subnet Name: ' + subnet_name)
 
@@ -99,7 +106,18 @@ class DeployedAppPortsOperation(object):
 
         return '\n'.join(result_str_list).strip()
 
-    def _get_network_interface_subnet_name(self, network_interface):
+    def _get_network_interface_subnet_name(self, network_interface, region=None, reservation_id=None):
+        footprint = self.sandbox_footprint_cache.get(region, reservation_id) if reservation_id else None
+        if footprint and network_interface.subnet_id in footprint.subnet_names:
+            return footprint.subnet_names[network_interface.subnet_id]
+
+        subnet_name = self._get_subnet_name_from_tags(network_interface)
+        if footprint:
+            self.sandbox_footprint_cache.set_subnet_name(region, reservation_id, network_interface.subnet_id,
+                                                         subnet_name)
+        return subnet_name
+
+    def _get_subnet_name_from_tags(self, network_interface):
         if network_interface.subnet.tags:
             subnet_tags = {d["Key"]: d["Value"] for d in network_interface.subnet.tags}
             subnet_full_name = AWSModelsParser.get_attribute_value_by_name_ignoring_namespace(subnet_tags, 'Name')
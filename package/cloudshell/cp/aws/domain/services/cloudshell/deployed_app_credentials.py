@@ -0,0 +1,46 @@
+from cloudshell.api.cloudshell_api import AttributeNameValue, ResourceAttributesUpdateRequest
+
+
+class DeployedAppCredentialsService(object):
+    USER_ATTRIBUTE = 'User'
+    PASSWORD_ATTRIBUTE = 'Password'
+    ERROR_LIVE_STATUS = 'Error'
+
+    def find_deployed_app_resource_name(self, cloudshell, reservation_id, instance_id):
+        """
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell:
+        :param str reservation_id:
+        :param str instance_id: the id of the instance deployed for the app
+        :return: the name of the deployed app resource, None if CloudShell did not create it yet
+        :rtype: str
+        """
+        reservation = cloudshell.GetReservationDetails(reservationId=reservation_id, disableCache=True)
+        for resource in reservation.ReservationDescription.Resources:
+            if resource.VmDetails and resource.VmDetails.UID == instance_id:
+                return resource.Name
+        return None
+
+    def set_credentials(self, cloudshell, resource_name, ami_credentials):
+        """
+        Sets the credentials on the User and Password attributes of the resource, while respecting 2nd gen shell
+        namespaces
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell:
+        :param str resource_name: the name of the deployed app resource
+        :param cloudshell.cp.aws.models.ami_credentials.AMICredentials ami_credentials:
+        """
+        attribute_names = [attribute.Name for attribute in
+                           cloudshell.GetResourceDetails(resource_name).ResourceAttributes]
+        values = {self.USER_ATTRIBUTE: ami_credentials.user_name,
+                  self.PASSWORD_ATTRIBUTE: ami_credentials.password}
+
+        attributes = [AttributeNameValue(attribute_name, values[attribute_name.split('.')[-1]])
+                      for attribute_name in attribute_names if attribute_name.split('.')[-1] in values]
+        cloudshell.SetAttributesValues([ResourceAttributesUpdateRequest(resource_name, attributes)])
+
+    def set_credentials_error(self, cloudshell, resource_name, message):
+        """
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell:
+        :param str resource_name: the name of the deployed app resource
+        :param str message:
+        """
+        cloudshell.SetResourceLiveStatus(resource_name, self.ERROR_LIVE_STATUS, message)
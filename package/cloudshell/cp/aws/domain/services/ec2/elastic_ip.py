@@ -1,3 +1,4 @@
+from botocore.exceptions import ClientError
 from retrying import retry
 
 from cloudshell.cp.aws.common.retry_helper import retry_if_client_error
@@ -8,8 +9,14 @@ from cloudshell.cp.core.models import ConnectToSubnetParams
 
 
 class ElasticIpService(object):
-    def __init__(self):
-        pass
+    ASSOCIATION_NOT_FOUND_ERROR = 'InvalidAssociationID.NotFound'
+
+    def __init__(self, elastic_ip_pool=None):
+        """
+        :param cloudshell.cp.aws.domain.services.ec2.elastic_ip_pool.ElasticIpPool elastic_ip_pool: when enabled for
+        the region and account elastic ips are claimed from the pool and returned to it instead of being released
+        """
+        self.elastic_ip_pool = elastic_ip_pool
 
     def set_elastic_ips(self, ec2_session, ec2_client, instance, ami_deployment_model, network_actions, network_config_results, logger):
         """
@@ -26,6 +33,13 @@ class ElasticIpService(object):
         if not ami_deployment_model.allocate_elastic_ip:
             return
 
+        try:
+            self._set_elastic_ips(ec2_session, ec2_client, instance, network_actions, network_config_results, logger)
+        finally:
+            if self._is_pool_enabled(ec2_client):
+                self.elastic_ip_pool.refill_in_background(ec2_client, logger)
+
+    def _set_elastic_ips(self, ec2_session, ec2_client, instance, network_actions, network_config_results, logger):
         if self._is_single_subnet_mode(network_actions):
             elastic_ip = self._create_and_associate_elastic_ip(
                 ec2_client, ec2_session, instance
@@ -62,7 +76,10 @@ class ElasticIpService(object):
     def _create_and_associate_elastic_ip(
             self, ec2_client, ec2_session, instance_or_interface_id
     ):
-        elastic_ip = None
+        elastic_ip = self._claim_pooled_elastic_ip(ec2_client, instance_or_interface_id)
+        if elastic_ip:
+            return elastic_ip
+
         try:
             elastic_ip = self.allocate_elastic_address(ec2_client)
             if isinstance(instance_or_interface_id, str):
@@ -79,6 +96,21 @@ class ElasticIpService(object):
             raise
         return elastic_ip
 
+    def _claim_pooled_elastic_ip(self, ec2_client, instance_or_interface_id):
+        """
+        :return: the elastic ip claimed from the pool, None if the pool is disabled or has no free address
+        :rtype: str
+        """
+        if not self._is_pool_enabled(ec2_client):
+            return None
+
+        if isinstance(instance_or_interface_id, str):
+            return self.elastic_ip_pool.claim(ec2_client, network_interface_id=instance_or_interface_id)
+        return self.elastic_ip_pool.claim(ec2_client, instance_id=instance_or_interface_id.id)
+
+    def _is_pool_enabled(self, ec2_client):
+        return self.elastic_ip_pool is not None and self.elastic_ip_pool.is_enabled(ec2_client)
+
     def _is_single_subnet_mode(self, network_actions):
         # todo move code to networking service
         return network_actions is None or \
@@ -141,6 +173,19 @@ class ElasticIpService(object):
 
     def release_elastic_address(self, vpc_address):
         """
+        Releases the elastic ip, or returns it to the pool when the pool of the region is enabled and not full
         :param vpc_address:
         """
+        ec2_client = vpc_address.meta.client
+        if self._is_pool_enabled(ec2_client) and \
+                self.elastic_ip_pool.give_back(ec2_client, vpc_address.allocation_id, vpc_address.association_id):
+            return
+
+        # an associated vpc address cannot be released, rollback releases it while the instance is terminated
+        if vpc_address.association_id:
+            try:
+                ec2_client.disassociate_address(AssociationId=vpc_address.association_id)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != self.ASSOCIATION_NOT_FOUND_ERROR:
+                    raise
         vpc_address.release()
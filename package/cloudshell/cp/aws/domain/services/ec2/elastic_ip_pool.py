@@ -0,0 +1,190 @@
+import threading
+
+from botocore.exceptions import ClientError
+
+from cloudshell.cp.aws.domain.services.ec2.tags import TagNames, TagService, TypeTagValues
+from cloudshell.cp.aws.models.aws_api import AwsApiClients
+
+
+class ElasticIpPool(object):
+    ALREADY_ASSOCIATED_ERROR = 'Resource.AlreadyAssociated'
+    ASSOCIATION_NOT_FOUND_ERROR = 'InvalidAssociationID.NotFound'
+
+    def __init__(self):
+        """
+        Per region and account pool of pre-allocated elastic ips. The free addresses of the pool are the tagged
+        addresses that are not associated, so the pool is shared by all the driver processes of the same account and
+        region
+        """
+        self._sizes = {}
+        self._claiming = set()
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    def configure(self, ec2_client, min_size, max_size):
+        """
+        Sets the sizes of the pool of the region and account of the ec2 client
+        :param ec2_client:
+        :param int min_size: the number of free addresses the pool is refilled to, zero disables the pool
+        :param int max_size: the max number of free addresses, addresses above it are released
+        """
+        pool_key = self._get_pool_key(ec2_client)
+        with self._lock:
+            self._sizes[pool_key] = (max(min_size, 0), max(min_size, max_size))
+
+    def is_enabled(self, ec2_client):
+        """
+        :param ec2_client:
+        :rtype: bool
+        """
+        return self._get_sizes(ec2_client)[0] > 0
+
+    def claim(self, ec2_client, instance_id=None, network_interface_id=None):
+        """
+        Associates a free address of the pool to the instance or to the network interface
+        :param ec2_client:
+        :param str instance_id:
+        :param str network_interface_id:
+        :return: the public ip of the claimed address, None if the pool has no free address
+        :rtype: str
+        """
+        target = {'InstanceId': instance_id} if instance_id else {'NetworkInterfaceId': network_interface_id}
+
+        for address in self.get_free_addresses(ec2_client):
+            allocation_id = address['AllocationId']
+            with self._lock:
+                if allocation_id in self._claiming:
+                    continue
+                self._claiming.add(allocation_id)
+
+            try:
+                ec2_client.associate_address(AllocationId=allocation_id, AllowReassociation=False, **target)
+                return address['PublicIp']
+            except ClientError as e:
+                # another driver process claimed the address first
+                if self._get_error_code(e) != self.ALREADY_ASSOCIATED_ERROR:
+                    raise
+            finally:
+                with self._lock:
+                    self._claiming.discard(allocation_id)
+
+        return None
+
+    def give_back(self, ec2_client, allocation_id, association_id=None):
+        """
+        Returns a no longer used address to the pool
+        :param ec2_client:
+        :param str allocation_id:
+        :param str association_id: the association of the address if it is still associated
+        :return: False if the pool is disabled or full and the address should be released
+        :rtype: bool
+        """
+        min_size, max_size = self._get_sizes(ec2_client)
+        if not min_size or len(self.get_free_addresses(ec2_client)) >= max_size:
+            return False
+
+        if association_id:
+            try:
+                ec2_client.disassociate_address(AssociationId=association_id)
+            except ClientError as e:
+                if self._get_error_code(e) != self.ASSOCIATION_NOT_FOUND_ERROR:
+                    raise
+
+        ec2_client.create_tags(Resources=[allocation_id], Tags=self._get_pool_tags())
+        return True
+
+    def refill(self, ec2_client, logger):
+        """
+        Allocates addresses until the pool has min size free addresses and releases the free addresses above max size
+        :param ec2_client:
+        :param logging.Logger logger:
+        """
+        min_size, max_size = self._get_sizes(ec2_client)
+        if not min_size:
+            return
+
+        free_addresses = self.get_free_addresses(ec2_client)
+
+        for _ in range(min_size - len(free_addresses)):
+            public_ip = self._allocate(ec2_client)
+            logger.info("Allocated elastic ip {0} to the pool".format(public_ip))
+
+        with self._lock:
+            extra_addresses = [address for address in free_addresses[max_size:]
+                               if address['AllocationId'] not in self._claiming]
+        for address in extra_addresses:
+            try:
+                ec2_client.release_address(AllocationId=address['AllocationId'])
+                logger.info("Released elastic ip {0} above the pool max size".format(address['PublicIp']))
+            except ClientError:
+                # the address was claimed meanwhile
+                logger.debug("Elastic ip {0} was not released".format(address['PublicIp']), exc_info=True)
+
+    def refill_in_background(self, ec2_client, logger):
+        """
+        Refills the pool on a background thread, unless the pool of the region is already being refilled
+        :param ec2_client:
+        :param logging.Logger logger:
+        """
+        pool_key = self._get_pool_key(ec2_client)
+        with self._lock:
+            if pool_key in self._refilling:
+                return
+            self._refilling.add(pool_key)
+
+        thread = threading.Thread(target=self._run_refill, args=(ec2_client, logger),
+                                  name='ElasticIpPool-{0}'.format(pool_key[0]))
+        thread.daemon = True
+        thread.start()
+
+    def get_free_addresses(self, ec2_client):
+        """
+        :param ec2_client:
+        :return: the address descriptions of the pool that are not associated
+        :rtype: list[dict]
+        """
+        filters = [{'Name': 'domain', 'Values': ['vpc']}]
+        filters.extend({'Name': 'tag:' + tag['Key'], 'Values': [tag['Value']]} for tag in self._get_pool_tags())
+        addresses = ec2_client.describe_addresses(Filters=filters)['Addresses']
+        return [address for address in addresses if not address.get('AssociationId')]
+
+    def _run_refill(self, ec2_client, logger):
+        try:
+            self.refill(ec2_client, logger)
+        except Exception:
+            logger.exception("Failed to refill the elastic ip pool")
+        finally:
+            with self._lock:
+                self._refilling.discard(self._get_pool_key(ec2_client))
+
+    def _allocate(self, ec2_client):
+        result = ec2_client.allocate_address(Domain='vpc')
+        try:
+            ec2_client.create_tags(Resources=[result['AllocationId']], Tags=self._get_pool_tags())
+        except Exception:
+            ec2_client.release_address(AllocationId=result['AllocationId'])
+            raise
+        return result['PublicIp']
+
+    def _get_sizes(self, ec2_client):
+        pool_key = self._get_pool_key(ec2_client)
+        with self._lock:
+            return self._sizes.get(pool_key, (0, 0))
+
+    @staticmethod
+    def _get_pool_key(ec2_client):
+        """
+        The key is (region, access key id) like the key of the cached aws api clients, the access key id is the one
+        registered when the cloud provider created the client
+        :rtype: tuple[str, str]
+        """
+        return ec2_client.meta.region_name, AwsApiClients.get_access_key_id(ec2_client)
+
+    @staticmethod
+    def _get_pool_tags():
+        return [{'Key': TagNames.CreatedBy, 'Value': TagService.CREATED_BY_QUALI},
+                {'Key': TagNames.Type, 'Value': TypeTagValues.ElasticIpPool}]
+
+    @staticmethod
+    def _get_error_code(client_error):
+        return client_error.response.get('Error', {}).get('Code')
@@ -1,7 +1,21 @@
-from cloudshell.cp.aws.common import retry_helper
+from botocore.exceptions import ClientError
+
+from cloudshell.cp.aws.common.phase_timer import PhaseTimer
+from cloudshell.cp.aws.domain.services.ec2.tags import TagNames
 
 
 class InstanceService(object):
+    INSTANCE_RESOURCE_TYPE = 'instance'
+    VOLUME_RESOURCE_TYPE = 'volume'
+    RUN_INSTANCES_PHASE = 'run_instances'
+    WAIT_RUNNING_PHASE = 'wait_running'
+    WAIT_STATUS_CHECK_PHASE = 'wait_status_check'
+    SET_NAME_PHASE = 'set_name'
+    START_PHASE = 'start'
+    # the ids that did not terminate are looked up with a single instance-id filter, which takes up to 200 values
+    MAX_INSTANCE_IDS_PER_TERMINATE = 200
+    INSTANCE_NOT_FOUND_ERROR = 'InvalidInstanceID.NotFound'
+
     def __init__(self, tags_creator_service, instance_waiter):
         """
         :param tags_creator_service: Tags Service
@@ -13,7 +27,7 @@ class InstanceService(object):
         self.tags_creator_service = tags_creator_service
 
     def create_instance(self, ec2_session, name, reservation, ami_deployment_info, ec2_client, wait_for_status_check,
-                        cancellation_context, logger):
+                        cancellation_context, logger, phase_timer=None):
         """
         Deploys an AMI
         :param wait_for_status_check: bool
@@ -24,34 +38,120 @@ class InstanceService(object):
         :param cloudshell.cp.aws.models.ami_deployment_model.AMIDeploymentModel ami_deployment_info: request details of the AMI
         :param CancellationContext cancellation_context:
         :param logging.Logger logger: logger
+        :param PhaseTimer phase_timer: measures the launch, the waits and the naming of the instance
         :return:
         """
-        instance = ec2_session.create_instances(
-                ImageId=ami_deployment_info.aws_ami_id,
-                MinCount=ami_deployment_info.min_count,
-                MaxCount=ami_deployment_info.max_count,
-                InstanceType=ami_deployment_info.instance_type,
-                KeyName=ami_deployment_info.aws_key,
-                BlockDeviceMappings=ami_deployment_info.block_device_mappings,
-                NetworkInterfaces=ami_deployment_info.network_interfaces,
-                IamInstanceProfile=ami_deployment_info.iam_role,
-                UserData=ami_deployment_info.user_data
-        )[0]
+        phase_timer = phase_timer or PhaseTimer()
+
+        with phase_timer.span(self.RUN_INSTANCES_PHASE):
+            instance = self._run_instances(ec2_session=ec2_session,
+                                           tags=self.tags_creator_service.get_default_tags(name, reservation),
+                                           ami_deployment_info=ami_deployment_info,
+                                           min_count=ami_deployment_info.min_count,
+                                           max_count=ami_deployment_info.max_count)[0]
 
         self.wait_for_instance_to_run_in_aws(ec2_client=ec2_client,
                                              instance=instance,
                                              wait_for_status_check=wait_for_status_check,
                                              cancellation_context=cancellation_context,
-                                             logger=logger)
+                                             logger=logger,
+                                             phase_timer=phase_timer)
+
+        with phase_timer.span(self.SET_NAME_PHASE):
+            self._set_name_tag(ec2_client, instance, name)
+        return instance
+
+    def start_pooled_instance(self, ec2_client, instance, name, reservation, ami_deployment_info,
+                              wait_for_status_check, cancellation_context, logger, phase_timer=None):
+        """
+        Starts an instance claimed from the warm pool as the instance of the deployed app, after tagging it and its
+        volumes like a launched instance
+        :param ec2_client: boto3.ec2.client
+        :param instance: the claimed instance
+        :param str name: Will assign the deployed vm with the name
+        :param cloudshell.cp.aws.models.reservation_model.ReservationModel reservation: reservation model
+        :param cloudshell.cp.aws.models.ami_deployment_model.AMIDeploymentModel ami_deployment_info: request details of the AMI
+        :param bool wait_for_status_check:
+        :param CancellationContext cancellation_context:
+        :param logging.Logger logger: logger
+        :param PhaseTimer phase_timer:
+        :return:
+        """
+        phase_timer = phase_timer or PhaseTimer()
 
-        self._set_tags(instance, name, reservation, ami_deployment_info.custom_tags)
+        tags = [tag for tag in self.tags_creator_service.get_default_tags(name, reservation)
+                if tag['Key'] != TagNames.Name]
+        tags += self.tags_creator_service.get_custom_tags(ami_deployment_info.custom_tags)
+        volume_ids = [block_device['Ebs']['VolumeId'] for block_device in instance.block_device_mappings or []
+                      if 'Ebs' in block_device]
+        self.tags_creator_service.set_ec2_resources_tags(ec2_client, [instance.instance_id] + volume_ids, tags)
 
-        # Reload the instance attributes
-        retry_helper.do_with_retry(lambda: instance.load())
+        with phase_timer.span(self.START_PHASE):
+            instance.start()
+
+        self.wait_for_instance_to_run_in_aws(ec2_client=ec2_client,
+                                             instance=instance,
+                                             wait_for_status_check=wait_for_status_check,
+                                             cancellation_context=cancellation_context,
+                                             logger=logger,
+                                             phase_timer=phase_timer)
+
+        with phase_timer.span(self.SET_NAME_PHASE):
+            self._set_name_tag(ec2_client, instance, name)
         return instance
 
+    def create_instances(self, ec2_session, names, reservation, ami_deployment_info, logger):
+        """
+        Launches identical instances of the AMI in a single RunInstances call, without waiting for them to run.
+        The name of each instance is set by set_instances_names once they run
+        :param boto3.ec2.session ec2_session:
+        :param list[str] names: the names of the launched instances
+        :param cloudshell.cp.aws.models.reservation_model.ReservationModel reservation: reservation model
+        :param cloudshell.cp.aws.models.ami_deployment_model.AMIDeploymentModel ami_deployment_info: request details of the AMI
+        :param logging.Logger logger: logger
+        :return: the launched instances, one for each name
+        :rtype: list
+        """
+        tags = [tag for tag in self.tags_creator_service.get_default_tags(names[0], reservation)
+                if tag['Key'] != TagNames.Name]
+
+        instances = self._run_instances(ec2_session=ec2_session,
+                                        tags=tags,
+                                        ami_deployment_info=ami_deployment_info,
+                                        min_count=len(names),
+                                        max_count=len(names))
+        logger.info("Launched instances {0} of AMI {1}".format([instance.id for instance in instances],
+                                                               ami_deployment_info.aws_ami_id))
+        return instances
+
+    def set_instances_names(self, ec2_client, instances, names):
+        """
+        :param ec2_client:
+        :param list instances: running instances
+        :param list[str] names: the name of each instance
+        """
+        for instance, name in zip(instances, names):
+            self._set_name_tag(ec2_client, instance, name)
+
+    def _run_instances(self, ec2_session, tags, ami_deployment_info, min_count, max_count):
+        tags = tags + self.tags_creator_service.get_custom_tags(ami_deployment_info.custom_tags)
+
+        return ec2_session.create_instances(
+                ImageId=ami_deployment_info.aws_ami_id,
+                MinCount=min_count,
+                MaxCount=max_count,
+                InstanceType=ami_deployment_info.instance_type,
+                KeyName=ami_deployment_info.aws_key,
+                BlockDeviceMappings=ami_deployment_info.block_device_mappings,
+                NetworkInterfaces=ami_deployment_info.network_interfaces,
+                IamInstanceProfile=ami_deployment_info.iam_role,
+                UserData=ami_deployment_info.user_data,
+                TagSpecifications=self.tags_creator_service.get_tag_specifications(
+                    [self.INSTANCE_RESOURCE_TYPE, self.VOLUME_RESOURCE_TYPE], tags)
+        )
+
     def wait_for_instance_to_run_in_aws(self, ec2_client, instance, wait_for_status_check, cancellation_context,
-                                        logger):
+                                        logger, phase_timer=None):
         """
 
         :param ec2_client:
@@ -59,40 +159,121 @@ class InstanceService(object):
         :param bool wait_for_status_check:
         :param CancellationContext cancellation_context:
         :param logging.Logger logger:
+        :param PhaseTimer phase_timer: measures the running state wait and the status check wait
         :return:
         """
-        self.instance_waiter.wait(instance=instance,
-                                  state=self.instance_waiter.RUNNING,
-                                  cancellation_context=cancellation_context)
+        phase_timer = phase_timer or PhaseTimer()
+
+        with phase_timer.span(self.WAIT_RUNNING_PHASE):
+            self.instance_waiter.wait(instance=instance,
+                                      state=self.instance_waiter.RUNNING,
+                                      cancellation_context=cancellation_context)
 
         if wait_for_status_check:
-            self.instance_waiter.wait_status_ok(ec2_client=ec2_client,
-                                                instance=instance,
-                                                logger=logger,
-                                                cancellation_context=cancellation_context)
+            with phase_timer.span(self.WAIT_STATUS_CHECK_PHASE):
+                self.instance_waiter.wait_status_ok(ec2_client=ec2_client,
+                                                    instance=instance,
+                                                    logger=logger,
+                                                    cancellation_context=cancellation_context)
             logger.info("Instance created with status: instance_status_ok.")
 
+    def wait_for_instances_to_run_in_aws(self, ec2_client, instances, wait_for_status_check, cancellation_context,
+                                         logger):
+        """
+        Waits for all the instances together, polling their state and status checks in batched calls
+        :param ec2_client:
+        :param list instances:
+        :param bool wait_for_status_check:
+        :param CancellationContext cancellation_context:
+        :param logging.Logger logger:
+        :return: the ids of the instances whose status check is impaired
+        :rtype: list[str]
+        """
+        self.instance_waiter.multi_wait(instances=instances,
+                                        state=self.instance_waiter.RUNNING,
+                                        cancellation_context=cancellation_context)
+
+        if not wait_for_status_check:
+            return []
+
+        instance_statuses = self.instance_waiter.multi_wait_status_ok(ec2_client=ec2_client,
+                                                                      instances=instances,
+                                                                      logger=logger,
+                                                                      cancellation_context=cancellation_context)
+        impaired_instance_ids = self.instance_waiter.get_impaired_instance_ids(instance_statuses)
+        logger.info("{0} instances created with status: instance_status_ok."
+                    .format(len(instances) - len(impaired_instance_ids)))
+        return impaired_instance_ids
+
     def terminate_instance(self, instance):
         return self.terminate_instances([instance])[0]
 
-    def terminate_instances(self, instances):
+    def terminate_instances(self, instances, wait=True):
+        """
+        Terminates the instances using TerminateInstances calls of up to MAX_INSTANCE_IDS_PER_TERMINATE instance ids
+        each and waits for the termination of all of them with batched DescribeInstances calls. The instances that
+        are already terminated or that do not exist anymore are not waited for
+        :param list instances: ec2 instances of the same session
+        :param bool wait: whether to wait for the termination, the termination is irreversible once it started
+        :return: the instances
+        :rtype: list
+        """
         if len(instances) == 0:
             return
 
-        for instance in instances:
-            instance.terminate()
-        return self.instance_waiter.multi_wait(instances, self.instance_waiter.TERMINATED)
+        ec2_client = instances[0].meta.client
+        instance_ids = [instance.id for instance in instances]
+        current_states = {}
+        for i in range(0, len(instance_ids), self.MAX_INSTANCE_IDS_PER_TERMINATE):
+            chunk = instance_ids[i:i + self.MAX_INSTANCE_IDS_PER_TERMINATE]
+            current_states.update(self._terminate_chunk(ec2_client, chunk))
 
-    def _set_tags(self, instance, name, reservation, custom_tags):
+        pending_instances = [instance for instance in instances
+                             if current_states.get(instance.id, self.instance_waiter.TERMINATED) !=
+                             self.instance_waiter.TERMINATED]
+        if wait and pending_instances:
+            self.instance_waiter.multi_wait(pending_instances, self.instance_waiter.TERMINATED)
+        return instances
+
+    def _terminate_chunk(self, ec2_client, instance_ids):
+        """
+        :param ec2_client:
+        :param list[str] instance_ids:
+        :return: the state of each existing instance after the call, a missing id fails the whole call so the chunk
+        is terminated again without the ids that do not exist
+        :rtype: dict
+        """
+        try:
+            response = ec2_client.terminate_instances(InstanceIds=instance_ids)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != self.INSTANCE_NOT_FOUND_ERROR:
+                raise
+            # filters do not fail on missing ids
+            response = ec2_client.describe_instances(Filters=[{'Name': 'instance-id', 'Values': instance_ids}])
+            existing_ids = [instance_data['InstanceId'] for reservation in response['Reservations']
+                            for instance_data in reservation['Instances']]
+            if not existing_ids:
+                return {}
+            response = ec2_client.terminate_instances(InstanceIds=existing_ids)
+
+        return dict((instance_data['InstanceId'], instance_data['CurrentState']['Name'])
+                    for instance_data in response['TerminatingInstances'])
+
+    def _set_name_tag(self, ec2_client, instance, name):
+        """
+        All the tags are set when the instance and its volumes are created, only the name contains the instance id
+        which is known after the launch
+        """
         # todo create the name with a name generator
-        new_name = name + ' ' + instance.instance_id
-        default_tags = self.tags_creator_service.get_default_tags(new_name, reservation) + \
-                       self.tags_creator_service.get_custom_tags(custom_tags)
+        name_tag = self.tags_creator_service.get_name_tag(name + ' ' + instance.instance_id)
+        volume_ids = [block_device['Ebs']['VolumeId'] for block_device in instance.block_device_mappings or []
+                      if 'Ebs' in block_device]
 
-        self.tags_creator_service.set_ec2_resource_tags(instance, default_tags)
+        self.tags_creator_service.set_ec2_resources_tags(ec2_client, [instance.instance_id] + volume_ids, [name_tag])
 
-        for volume in instance.volumes.all():
-            self.tags_creator_service.set_ec2_resource_tags(volume, default_tags)
+        # update the loaded attributes instead of reloading the whole instance
+        instance.meta.data['Tags'] = [tag for tag in instance.tags or [] if tag['Key'] != name_tag['Key']] + \
+                                     [name_tag]
 
     @staticmethod
     def get_instance_by_id(ec2_session, id):
@@ -2,6 +2,8 @@ from boto3 import ec2
 
 RESERVATION_KEY_PAIR = 'reservation key pair {0}'
 KEY_FORMAT = 'reservation-id-{0}/{1}.pem'
+INSTANCE_KEY_PREFIX = 'reservation-id-{0}/instance '
+INSTANCE_KEY_FORMAT = INSTANCE_KEY_PREFIX + '{1}.pem'
 
 
 class KeyPairService(object):
@@ -37,6 +39,35 @@ class KeyPairService(object):
 
         return self.s3_service.get_body_of_object(s3_obj)
 
+    def load_instance_key(self, s3_session, bucket_name, reservation_id, instance_id):
+        """
+        Will load the key of an instance of the reservation that was not launched with the reservation key pair
+        :param s3_session: s3 session
+        :param str bucket_name: The bucket name
+        :param str reservation_id: Reservation Id
+        :param str instance_id:
+        :return: the private key, None if the instance has no key of its own
+        """
+        s3_obj = self.s3_service.get_key(s3_session, bucket_name, INSTANCE_KEY_FORMAT.format(reservation_id,
+                                                                                             instance_id))
+        if not s3_obj:
+            return None
+
+        return self.s3_service.get_body_of_object(s3_obj)
+
+    def save_instance_key(self, s3_session, bucket, reservation_id, instance_id, key_material):
+        """
+        Keeps the private key of an instance of the reservation that was not launched with the reservation key pair,
+        it is removed with the key pair of the reservation
+        :param s3_session: s3 session
+        :param str bucket: The bucket name
+        :param str reservation_id: Reservation Id
+        :param str instance_id:
+        :param str key_material: the private key
+        """
+        self.s3_service.put_key(s3_session, bucket_name=bucket,
+                                key=INSTANCE_KEY_FORMAT.format(reservation_id, instance_id), value=key_material)
+
     def create_key_pair(self, ec2_session, s3_session, bucket, reservation_id):
         key_pair = ec2_session.create_key_pair(KeyName=self.get_reservation_key_name(reservation_id))
         self._save_key_to_s3(bucket, key_pair, reservation_id, s3_session)
@@ -57,6 +88,10 @@ class KeyPairService(object):
         key = self.get_key_for_reservation(s3_session, bucket, reservation_id)
         return self.s3_service.delete_key(s3_session=s3_session, bucket=bucket, key=key)
 
+    def remove_instance_keys_for_reservation_in_s3(self, s3_session, bucket, reservation_id):
+        self.s3_service.delete_keys(s3_session=s3_session, bucket=bucket,
+                                    prefix=INSTANCE_KEY_PREFIX.format(reservation_id))
+
     def remove_key_pair_for_reservation_in_ec2(self, ec2_session, reservation_id):
         reservation_key_name = self.get_reservation_key_name(reservation_id=reservation_id)
         key_pair = ec2_session.KeyPair(reservation_key_name)
@@ -6,16 +6,19 @@ class NetworkInterfaceService(object):
         """
         self.subnet_service = subnet_service
 
-    def get_network_interface_for_single_subnet_mode(self, add_public_ip, security_group_ids, vpc, private_ip=None):
+    def get_network_interface_for_single_subnet_mode(self, add_public_ip, security_group_ids, vpc, private_ip=None,
+                                                     subnet=None):
         """
         :param bool add_public_ip:
         :param list[str] security_group_ids:
         :param vpc: VPC instance
         :param str private_ip:
+        :param subnet: the first subnet of the vpc if it was already found
         :return:
         """
+        subnet = subnet or self.subnet_service.get_first_subnet_from_vpc(vpc)
         return self.build_network_interface_dto(
-                subnet_id=self.subnet_service.get_first_subnet_from_vpc(vpc).subnet_id,
+                subnet_id=subnet.subnet_id,
                 device_index=0,
                 groups=security_group_ids,
                 public_ip=add_public_ip,
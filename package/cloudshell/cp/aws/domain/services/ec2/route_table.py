@@ -94,6 +94,37 @@ class RouteTablesService(object):
                     else:
                         raise e
 
+    def delete_peering_routes(self, ec2_client, route_table_ids, destination_cidr, peer_connection_id):
+        """
+        Removes the routes of the route tables to the destination through the peering, or that became blackhole
+        routes, without reading the other route tables
+        :param ec2_client:
+        :param list[str] route_table_ids:
+        :param str destination_cidr:
+        :param str peer_connection_id:
+        :return:
+        """
+        if not route_table_ids:
+            return True
+
+        # filters do not fail on route tables that were deleted
+        route_tables = ec2_client.describe_route_tables(Filters=[{'Name': 'route-table-id',
+                                                                  'Values': route_table_ids}])['RouteTables']
+        for route_table in route_tables:
+            for route in route_table['Routes']:
+                if route.get('DestinationCidrBlock') != destination_cidr:
+                    continue
+                # the route of a sandbox that reused the cidr is kept
+                if route.get('VpcPeeringConnectionId') != peer_connection_id and route.get('State') != 'blackhole':
+                    continue
+                try:
+                    ec2_client.delete_route(RouteTableId=route_table['RouteTableId'],
+                                            DestinationCidrBlock=destination_cidr)
+                except Exception as e:
+                    if 'InvalidRoute.NotFound' not in str(e):
+                        raise
+        return True
+
     def replace_route(self, route_table, route, peer_connection_id, ec2_client):
         if type(route) is dict:
             ec2_client.replace_route(RouteTableId=route_table.id, DestinationCidrBlock=route['DestinationCidrBlock'],
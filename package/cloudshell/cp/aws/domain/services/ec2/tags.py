@@ -1,3 +1,5 @@
+import time
+
 from retrying import retry
 
 
@@ -11,6 +13,13 @@ class TagNames(object):
     Isolation = 'Isolation'
     IsPublic = 'IsPublic'
     Type = 'Type'
+    WarmPool = 'WarmPool'
+    WarmPoolProfile = 'WarmPoolProfile'
+    WarmPoolKeyPair = 'WarmPoolKeyPair'
+    ManagementRouteTables = 'ManagementRouteTables'
+    ManagementRouteCidr = 'ManagementRouteCidr'
+    CloudProvider = 'CloudProvider'
+    CreatedAt = 'CreatedAt'
 
 
 class IsolationTagValues(object):
@@ -18,15 +27,22 @@ class IsolationTagValues(object):
     Shared = 'Shared'
 
 
+class WarmPoolTagValues(object):
+    Standby = 'Standby'
+    Claimed = 'Claimed'
+
+
 class TypeTagValues(object):
     Default = 'Default'
     Isolated = 'Isolated'
     InboundPorts = 'InboundPorts'
     Interface = 'Interface'
+    ElasticIpPool = 'ElasticIpPool'
 
 
 class TagService(object):
     CREATED_BY_QUALI = "Cloudshell"
+    MAX_TAG_VALUE_LENGTH = 256
 
     def __init__(self, client_err_wrapper):
         """
@@ -118,6 +134,44 @@ class TagService(object):
     def get_is_public_tag(self, value):
         return self._get_kvp(TagNames.IsPublic, str(value))
 
+    def get_cloud_provider_tags(self, cloud_provider_owner):
+        """
+        Returns the tags of the cloud provider that created a sandbox and of the creation time, the sweep of a cloud
+        provider only deletes the sandboxes it created
+        :param str cloud_provider_owner: the cloudshell server and the name of the cloud provider resource
+        :return: list[dict]
+        """
+        return [self._get_kvp(TagNames.CloudProvider, cloud_provider_owner),
+                self._get_kvp(TagNames.CreatedAt, str(int(time.time())))]
+
+    def get_management_routes_tags(self, route_table_ids, destination_cidr):
+        """
+        Returns the tags indexing the routes a sandbox peering added to the management vpc
+        :param list[str] route_table_ids: the management route tables with a route to the sandbox
+        :param str destination_cidr: the cidr of the sandbox vpc
+        :return: list[dict], None if the route tables do not fit in a tag value
+        """
+        route_tables_value = ','.join(route_table_ids)
+        if len(route_tables_value) > self.MAX_TAG_VALUE_LENGTH:
+            return None
+        return [self._get_kvp(TagNames.ManagementRouteTables, route_tables_value),
+                self._get_kvp(TagNames.ManagementRouteCidr, destination_cidr)]
+
+    @staticmethod
+    def find_management_routes(tags):
+        """
+        :param list[dict] tags: the tags of a sandbox peering
+        :return: the management route table ids and the destination cidr of the routes of the peering, None if the
+        peering was not indexed
+        :rtype: tuple[list[str], str]
+        """
+        tags = dict((tag['Key'], tag['Value']) for tag in tags or [])
+        if TagNames.ManagementRouteTables not in tags or TagNames.ManagementRouteCidr not in tags:
+            return None
+        route_table_ids = [route_table_id for route_table_id in tags[TagNames.ManagementRouteTables].split(',')
+                           if route_table_id]
+        return route_table_ids, tags[TagNames.ManagementRouteCidr]
+
     @retry(stop_max_attempt_number=30, wait_fixed=1000)
     def set_ec2_resource_tags(self, resource, tags):
         """
@@ -130,6 +184,30 @@ class TagService(object):
         with self.client_err_wrapper.wrap():
             resource.create_tags(Tags=tags)
 
+    @retry(stop_max_attempt_number=30, wait_fixed=1000)
+    def set_ec2_resources_tags(self, ec2_client, resource_ids, tags):
+        """
+        Will set tags on many EC2 resources with a single call
+        :param ec2_client: EC2 client
+        :param list[str] resource_ids: the ids of the EC2 resources
+        :param tags: Array of key pair tags
+        :type tags: list[dict]
+        :return:
+        """
+        with self.client_err_wrapper.wrap():
+            ec2_client.create_tags(Resources=resource_ids, Tags=tags)
+
+    @staticmethod
+    def get_tag_specifications(resource_types, tags):
+        """
+        Returns the TagSpecifications that tag the resources on their creation
+        :param list[str] resource_types: e.g. instance, volume
+        :param tags: Array of key pair tags
+        :type tags: list[dict]
+        :return: list[dict]
+        """
+        return [{'ResourceType': resource_type, 'Tags': tags} for resource_type in resource_types]
+
     def get_created_by_kvp(self):
         return self._get_kvp(TagNames.CreatedBy, TagService.CREATED_BY_QUALI)
 
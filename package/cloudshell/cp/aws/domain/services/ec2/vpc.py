@@ -2,6 +2,7 @@ import traceback
 from retrying import retry
 from cloudshell.cp.aws.common import retry_helper
 from cloudshell.cp.aws.domain.conncetivity.operations.traffic_mirror_cleaner import TrafficMirrorCleaner
+from cloudshell.cp.aws.domain.services.ec2.tags import TagNames
 from cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model import AWSEc2CloudProviderResourceModel
 from cloudshell.cp.aws.domain.common.list_helper import index_of
 
@@ -12,6 +13,7 @@ class VPCService(object):
     MAIN_ROUTE_TABLE_RESERVATION = 'Main RoutingTable Reservation: {0}'
     PRIVATE_ROUTE_TABLE_RESERVATION = 'Private RoutingTable Reservation: {0}'
     PEERING_CONNECTION = "Peering connection for {0} with management vpc"
+    NOT_TERMINATED_INSTANCE_STATES = ['pending', 'running', 'shutting-down', 'stopping', 'stopped']
 
     def __init__(self, tag_service, subnet_service, instance_service, vpc_waiter, vpc_peering_waiter, sg_service,
                  route_table_service, traffic_mirror_service):
@@ -40,7 +42,7 @@ class VPCService(object):
         self.route_table_service = route_table_service
         self.traffic_mirror_service = traffic_mirror_service
 
-    def create_vpc_for_reservation(self, ec2_session, reservation, cidr):
+    def create_vpc_for_reservation(self, ec2_session, reservation, cidr, cloud_provider_owner=None):
         """
         Will create a vpc for reservation and will save it in a folder in the s3 bucket
         :param ec2_session: Ec2 Session
@@ -48,6 +50,8 @@ class VPCService(object):
         :type reservation: cloudshell.cp.aws.models.reservation_model.ReservationModel
         :param cidr: The CIDR block
         :type cidr: str
+        :param str cloud_provider_owner: the cloudshell server and the name of the cloud provider creating the vpc,
+        the sandboxes without it are never swept
         :return: vpc
         """
         vpc = ec2_session.create_vpc(CidrBlock=cidr)
@@ -55,7 +59,7 @@ class VPCService(object):
         self.vpc_waiter.wait(vpc=vpc, state=self.vpc_waiter.AVAILABLE)
 
         vpc_name = self.VPC_RESERVATION.format(reservation.reservation_id)
-        self._set_tags(vpc_name=vpc_name, reservation=reservation, vpc=vpc)
+        self._set_tags(vpc_name=vpc_name, reservation=reservation, vpc=vpc, cloud_provider_owner=cloud_provider_owner)
 
         return vpc
 
@@ -176,8 +180,10 @@ class VPCService(object):
     def _get_peering_connection_name(self, reservation_model):
         return self.PEERING_CONNECTION.format(reservation_model.reservation_id)
 
-    def _set_tags(self, vpc_name, reservation, vpc):
+    def _set_tags(self, vpc_name, reservation, vpc, cloud_provider_owner=None):
         tags = self.tag_service.get_default_tags(vpc_name, reservation)
+        if cloud_provider_owner:
+            tags += self.tag_service.get_cloud_provider_tags(cloud_provider_owner)
         self.tag_service.set_ec2_resource_tags(vpc, tags)
 
     def remove_all_internet_gateways(self, vpc):
@@ -187,8 +193,16 @@ class VPCService(object):
         """
         internet_gateways = self.get_all_internet_gateways(vpc)
         for ig in internet_gateways:
-            ig.detach_from_vpc(VpcId=vpc.id)
-            ig.delete()
+            self.remove_internet_gateway(vpc, ig)
+
+    def remove_internet_gateway(self, vpc, internet_gateway):
+        """
+        Detaches the internet gateway from the VPC and deletes it
+        :param vpc: EC2 VPC instance
+        :param internet_gateway:
+        """
+        internet_gateway.detach_from_vpc(VpcId=vpc.id)
+        internet_gateway.delete()
 
     def get_all_internet_gateways(self, vpc):
         """
@@ -226,10 +240,21 @@ class VPCService(object):
         :param vpc: EC2 VPC instance
         :return:
         """
-        peerings = list(vpc.accepted_vpc_peering_connections.all())
+        peerings = self.get_all_peerings(vpc)
         for peer in peerings:
-            if peer.status['Code'] != 'failed':
-                peer.delete()
+            self.remove_peering(peer)
+        return True
+
+    def get_all_peerings(self, vpc):
+        """
+        :param vpc: EC2 VPC instance
+        :rtype: list
+        """
+        return list(vpc.accepted_vpc_peering_connections.all())
+
+    def remove_peering(self, peering):
+        if peering.status['Code'] != 'failed':
+            peering.delete()
         return True
 
     def remove_all_security_groups(self, vpc, reservation_id):
@@ -239,7 +264,7 @@ class VPCService(object):
         :param str reservation_id: The reservation id
         :return:
         """
-        security_groups = list(vpc.security_groups.all())
+        security_groups = self.get_all_security_groups(vpc)
 
         # its possible that a group is dependent on an isolated group so we must delete the isolated group LAST
         isolated_sg_name = self.sg_service.sandbox_isolated_sg_name(reservation_id)
@@ -267,13 +292,66 @@ class VPCService(object):
         :param vpc: EC2 VPC instance
         :return:
         """
-        subnets = list(vpc.subnets.all())
+        subnets = self.get_all_subnets(vpc)
         for subnet in subnets:
             self.subnet_service.delete_subnet(subnet)
         return True
 
+    def remove_security_group(self, security_group):
+        return self.sg_service.delete_security_group(security_group)
+
+    def remove_subnet(self, subnet):
+        return self.subnet_service.delete_subnet(subnet)
+
+    def delete_instances(self, instances, wait=True):
+        """
+        Terminates the instances and waits for their termination
+        :param list instances:
+        :param bool wait: whether to wait for the termination
+        """
+        self.instance_service.terminate_instances(instances, wait=wait)
+        return True
+
+    def get_all_security_groups(self, vpc):
+        """
+        :param vpc: EC2 VPC instance
+        :rtype: list
+        """
+        return list(vpc.security_groups.all())
+
+    def get_all_subnets(self, vpc):
+        """
+        :param vpc: EC2 VPC instance
+        :rtype: list
+        """
+        return list(vpc.subnets.all())
+
+    def get_all_instances(self, vpc):
+        """
+        :param vpc: EC2 VPC instance
+        :rtype: list
+        """
+        return list(vpc.instances.all())
+
+    def get_reservation_instances(self, ec2_session, vpc, reservation_id):
+        """
+        :param ec2_session: EC2 session
+        :param vpc: EC2 VPC instance
+        :param str reservation_id:
+        :return: the instances of the vpc and the instances of the reservation outside of it, i.e. the instances
+        claimed from the warm pool, whose primary interface stays in the holding subnet
+        :rtype: list
+        """
+        instances = self.get_all_instances(vpc)
+        instance_ids = set(instance.id for instance in instances)
+        filters = [{'Name': 'tag:' + TagNames.ReservationId, 'Values': [reservation_id]},
+                   {'Name': 'instance-state-name', 'Values': self.NOT_TERMINATED_INSTANCE_STATES}]
+        instances.extend(instance for instance in ec2_session.instances.filter(Filters=filters)
+                         if instance.id not in instance_ids)
+        return instances
+
     def delete_all_instances(self, vpc):
-        instances = list(vpc.instances.all())
+        instances = self.get_all_instances(vpc)
         self.instance_service.terminate_instances(instances)
         return True
 
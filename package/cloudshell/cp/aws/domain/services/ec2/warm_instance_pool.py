@@ -0,0 +1,342 @@
+import hashlib
+import json
+import threading
+import uuid
+
+from botocore.exceptions import ClientError
+
+from cloudshell.cp.aws.domain.services.ec2.tags import TagNames, WarmPoolTagValues
+
+
+class WarmInstancePool(object):
+    KEY_PAIR_ID_FORMAT = 'warm-pool-{0}'
+    WINDOWS_PLATFORM = 'windows'
+    STANDBY_STATES = ['pending', 'running', 'stopping', 'stopped']
+    CLAIMABLE_STATE = 'stopped'
+    HOLDING_DEVICE_INDEX = 0
+    DEVICE_INDEX_TAKEN_ERROR = 'InvalidParameterValue'
+    # the error code is generic, e.g. "Instance 'i-1' already has an interface attached at device index '1'."
+    DEVICE_INDEX_TAKEN_MESSAGE = 'already has an interface attached at device index'
+    DUPLICATE_SECURITY_GROUP_ERROR = 'InvalidGroup.Duplicate'
+    ISOLATION_SECURITY_GROUP_NAME = 'Warm pool isolation'
+
+    def __init__(self, tag_service, key_pair_service, instance_waiter, password_waiter):
+        """
+        Stopped windows instances launched ahead of the deploys in a holding subnet. The primary interface of an
+        instance cannot move to another vpc, so a deploy claims an instance by attaching new interfaces of the sandbox
+        subnets after its holding interface. The holding interface cannot be detached, so a claimed instance moves it
+        to a security group without rules of the holding vpc, which keeps the sandboxes of the claimed instances
+        apart. Each instance is launched with a key pair of its own, which is kept in the key pairs bucket like the
+        sandbox key pairs and is moved to the keys of the reservation that claims the instance. Instances are stopped
+        once windows published their password
+        :param cloudshell.cp.aws.domain.services.ec2.tags.TagService tag_service:
+        :param cloudshell.cp.aws.domain.services.ec2.keypair.KeyPairService key_pair_service:
+        :param cloudshell.cp.aws.domain.services.waiters.instance.InstanceWaiter instance_waiter:
+        :param cloudshell.cp.aws.domain.services.waiters.password.PasswordWaiter password_waiter:
+        """
+        self.tag_service = tag_service
+        self.key_pair_service = key_pair_service
+        self.instance_waiter = instance_waiter
+        self.password_waiter = password_waiter
+        self._claiming = set()
+        self._replenishing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled(aws_ec2_resource_model, ami_id):
+        """
+        :param cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel aws_ec2_resource_model:
+        :param str ami_id:
+        :rtype: bool
+        """
+        return bool(aws_ec2_resource_model.warm_pool_subnet_id) and aws_ec2_resource_model.warm_pool_size > 0 \
+            and ami_id in aws_ec2_resource_model.warm_pool_ami_ids
+
+    @staticmethod
+    def is_claimed(instance):
+        """
+        :param instance:
+        :return: whether the instance was claimed from the pool, so its primary interface is the holding interface
+        :rtype: bool
+        """
+        return any(tag['Key'] == TagNames.WarmPool and tag['Value'] == WarmPoolTagValues.Claimed
+                   for tag in instance.tags or [])
+
+    def get_profile(self, ami_deployment_info, image):
+        """
+        :param cloudshell.cp.aws.models.ami_deployment_model.AMIDeploymentModel ami_deployment_info:
+        :param image: the image of the deployment
+        :return: the pool profile of the AMI, instance type and storage of the deployment, None if a pooled instance
+        cannot serve it
+        :rtype: str
+        """
+        if image.platform != self.WINDOWS_PLATFORM or ami_deployment_info.iam_role \
+                or ami_deployment_info.private_ip_address:
+            return None
+        # addresses and public ips are set on the interfaces a launch creates only
+        if any('PrivateIpAddress' in network_interface or network_interface.get('AssociatePublicIpAddress')
+               for network_interface in ami_deployment_info.network_interfaces):
+            return None
+
+        profile = json.dumps([ami_deployment_info.aws_ami_id,
+                              ami_deployment_info.instance_type,
+                              ami_deployment_info.block_device_mappings],
+                             sort_keys=True)
+        return hashlib.sha1(profile.encode('utf-8')).hexdigest()
+
+    def claim(self, ec2_session, ec2_client, s3_session, bucket, reservation_id, profile, network_interfaces, logger):
+        """
+        Claims a stopped instance of the profile by attaching new interfaces of the sandbox subnets to it, the
+        interface of device index 0 of the deployment is attached at device index 1 and so on. The private key of the
+        instance is moved to the keys of the reservation
+        :param ec2_session:
+        :param ec2_client:
+        :param s3_session:
+        :param str bucket: the key pairs bucket
+        :param str reservation_id: the reservation claiming the instance
+        :param str profile:
+        :param list[dict] network_interfaces: the network interfaces the deployment would launch the instance with
+        :param logging.Logger logger:
+        :return: the claimed instance, None if the pool has no instance in the availability zone of the subnets
+        """
+        subnet_ids = list(set(network_interface['SubnetId'] for network_interface in network_interfaces))
+        zones = set(subnet['AvailabilityZone']
+                    for subnet in ec2_client.describe_subnets(SubnetIds=subnet_ids)['Subnets'])
+        if len(zones) != 1:
+            return None
+
+        candidates = self._get_standby_instances(ec2_session, profile, [self.CLAIMABLE_STATE], zones.pop())
+        if not candidates:
+            return None
+
+        network_interfaces = sorted(network_interfaces, key=lambda network_interface: network_interface['DeviceIndex'])
+        interface_ids = []
+        attached_interface_ids = []
+        instance = None
+        try:
+            for network_interface in network_interfaces:
+                interface_ids.append(ec2_client.create_network_interface(
+                    SubnetId=network_interface['SubnetId'],
+                    Groups=network_interface['Groups'])['NetworkInterface']['NetworkInterfaceId'])
+
+            # attaching the first interface is the claim, it fails if another deploy attached its interface first
+            instance = self._claim_first(ec2_client, candidates, interface_ids[0])
+            if not instance:
+                return None
+            attached_interface_ids.append(interface_ids[0])
+
+            for device_index, interface_id in enumerate(interface_ids[1:], self.HOLDING_DEVICE_INDEX + 2):
+                self._attach(ec2_client, instance.id, interface_id, device_index)
+                attached_interface_ids.append(interface_id)
+
+            self._isolate_holding_interface(ec2_client, instance)
+            self._hand_over_key_pair(ec2_session, s3_session, bucket, reservation_id, instance)
+
+            self.tag_service.set_ec2_resources_tags(ec2_client, [instance.id],
+                                                    [{'Key': TagNames.WarmPool, 'Value': WarmPoolTagValues.Claimed}])
+            instance.reload()
+            logger.info("Claimed instance {0} of the warm pool".format(instance.id))
+            return instance
+        except Exception:
+            if instance:
+                # the attached interfaces are deleted with the instance
+                instance.terminate()
+            raise
+        finally:
+            for interface_id in interface_ids:
+                if interface_id not in attached_interface_ids:
+                    ec2_client.delete_network_interface(NetworkInterfaceId=interface_id)
+
+    def replenish(self, ec2_session, s3_session, aws_ec2_resource_model, ami_deployment_info, profile, logger):
+        """
+        Launches the instances missing for the pool of the profile to reach the pool size, waits for windows to
+        publish their password and stops them
+        :param ec2_session:
+        :param s3_session:
+        :param cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel aws_ec2_resource_model:
+        :param cloudshell.cp.aws.models.ami_deployment_model.AMIDeploymentModel ami_deployment_info:
+        :param str profile:
+        :param logging.Logger logger:
+        """
+        missing = aws_ec2_resource_model.warm_pool_size - \
+            len(self._get_standby_instances(ec2_session, profile, self.STANDBY_STATES))
+        if missing <= 0:
+            return
+
+        tags = [self.tag_service.get_name_tag('Warm pool {0}'.format(ami_deployment_info.aws_ami_id)),
+                self.tag_service.get_created_by_kvp(),
+                {'Key': TagNames.WarmPool, 'Value': WarmPoolTagValues.Standby},
+                {'Key': TagNames.WarmPoolProfile, 'Value': profile}]
+        bucket = aws_ec2_resource_model.key_pairs_location
+
+        instances = []
+        key_pair_ids = []
+        try:
+            # the password of a windows instance is encrypted with the key pair of its launch, so each instance gets
+            # its own key pair and is launched on its own
+            for _ in range(missing):
+                key_pair_id = self.KEY_PAIR_ID_FORMAT.format(uuid.uuid4().hex)
+                self.key_pair_service.create_key_pair(ec2_session, s3_session, bucket, key_pair_id)
+                key_pair_ids.append(key_pair_id)
+                instances.extend(ec2_session.create_instances(
+                    ImageId=ami_deployment_info.aws_ami_id,
+                    MinCount=1,
+                    MaxCount=1,
+                    InstanceType=ami_deployment_info.instance_type,
+                    KeyName=self.key_pair_service.get_reservation_key_name(key_pair_id),
+                    BlockDeviceMappings=ami_deployment_info.block_device_mappings,
+                    NetworkInterfaces=[{'DeviceIndex': self.HOLDING_DEVICE_INDEX,
+                                        'SubnetId': aws_ec2_resource_model.warm_pool_subnet_id}],
+                    TagSpecifications=self.tag_service.get_tag_specifications(
+                        ['instance', 'volume'], tags + [{'Key': TagNames.WarmPoolKeyPair, 'Value': key_pair_id}])))
+            logger.info("Launched instances {0} for the warm pool of AMI {1}"
+                        .format([instance.id for instance in instances], ami_deployment_info.aws_ami_id))
+
+            self.instance_waiter.multi_wait(instances, self.instance_waiter.RUNNING)
+            # windows publishes the password once its first boot completed
+            self.password_waiter.multi_wait(instances, on_password=lambda instance: instance.stop())
+        except Exception:
+            # the instances of a failed launch would be counted forever by the pool without being claimable
+            for instance in instances:
+                instance.terminate()
+            for key_pair_id in key_pair_ids:
+                self._remove_key_pair(ec2_session, s3_session, bucket, key_pair_id)
+            raise
+
+    def replenish_in_background(self, create_aws_api, aws_ec2_resource_model, ami_deployment_info, profile, logger):
+        """
+        Replenishes the pool of the profile on a background thread, unless it is already being replenished
+        :param create_aws_api: function with no arguments that creates aws api clients of their own boto3 session,
+        the replenish keeps using them after the command returned
+        """
+        with self._lock:
+            if profile in self._replenishing:
+                return
+            self._replenishing.add(profile)
+
+        try:
+            aws_api = create_aws_api()
+            thread = threading.Thread(target=self._run_replenish,
+                                      args=(aws_api.ec2_session, aws_api.s3_session, aws_ec2_resource_model,
+                                            ami_deployment_info, profile, logger),
+                                      name='WarmInstancePool-{0}'.format(profile[:8]))
+            thread.daemon = True
+            thread.start()
+        except Exception:
+            logger.exception("Failed to replenish the warm pool of AMI {0}".format(ami_deployment_info.aws_ami_id))
+            with self._lock:
+                self._replenishing.discard(profile)
+
+    def _run_replenish(self, ec2_session, s3_session, aws_ec2_resource_model, ami_deployment_info, profile, logger):
+        try:
+            self.replenish(ec2_session, s3_session, aws_ec2_resource_model, ami_deployment_info, profile, logger)
+        except Exception:
+            logger.exception("Failed to replenish the warm pool of AMI {0}".format(ami_deployment_info.aws_ami_id))
+        finally:
+            with self._lock:
+                self._replenishing.discard(profile)
+
+    def _get_standby_instances(self, ec2_session, profile, states, availability_zone=None):
+        filters = [{'Name': 'tag:' + TagNames.WarmPool, 'Values': [WarmPoolTagValues.Standby]},
+                   {'Name': 'tag:' + TagNames.WarmPoolProfile, 'Values': [profile]},
+                   {'Name': 'instance-state-name', 'Values': states}]
+        if availability_zone:
+            filters.append({'Name': 'availability-zone', 'Values': [availability_zone]})
+        return list(ec2_session.instances.filter(Filters=filters))
+
+    def _claim_first(self, ec2_client, candidates, interface_id):
+        for instance in candidates:
+            with self._lock:
+                if instance.id in self._claiming:
+                    continue
+                self._claiming.add(instance.id)
+
+            try:
+                self._attach(ec2_client, instance.id, interface_id, self.HOLDING_DEVICE_INDEX + 1)
+                return instance
+            except ClientError as e:
+                if not self._is_device_index_taken(e):
+                    raise
+            finally:
+                with self._lock:
+                    self._claiming.discard(instance.id)
+        return None
+
+    def _is_device_index_taken(self, error):
+        """
+        :param ClientError error:
+        :return: whether attaching the interface failed because another deploy claimed the instance first
+        :rtype: bool
+        """
+        error = error.response.get('Error', {})
+        return error.get('Code') == self.DEVICE_INDEX_TAKEN_ERROR and \
+            self.DEVICE_INDEX_TAKEN_MESSAGE in error.get('Message', '')
+
+    def _isolate_holding_interface(self, ec2_client, instance):
+        """
+        Blocks all the traffic of the holding interface of the claimed instance
+        """
+        holding_interface_ids = [network_interface['NetworkInterfaceId']
+                                 for network_interface in instance.network_interfaces_attribute
+                                 if network_interface['Attachment']['DeviceIndex'] == self.HOLDING_DEVICE_INDEX]
+        group_id = self._get_isolation_security_group_id(ec2_client, instance.vpc_id)
+        for interface_id in holding_interface_ids:
+            ec2_client.modify_network_interface_attribute(NetworkInterfaceId=interface_id, Groups=[group_id])
+
+    def _get_isolation_security_group_id(self, ec2_client, vpc_id):
+        """
+        :return: the id of the security group of the holding vpc that has no inbound and no outbound rule, it is
+        created on the first claim
+        :rtype: str
+        """
+        filters = [{'Name': 'vpc-id', 'Values': [vpc_id]},
+                   {'Name': 'group-name', 'Values': [self.ISOLATION_SECURITY_GROUP_NAME]}]
+        security_groups = ec2_client.describe_security_groups(Filters=filters)['SecurityGroups']
+        if security_groups:
+            return security_groups[0]['GroupId']
+
+        try:
+            group_id = ec2_client.create_security_group(GroupName=self.ISOLATION_SECURITY_GROUP_NAME,
+                                                        Description='Blocks the holding interfaces of the claimed '
+                                                                    'instances of the warm pool',
+                                                        VpcId=vpc_id)['GroupId']
+        except ClientError as e:
+            # another deploy created it first
+            if e.response.get('Error', {}).get('Code') != self.DUPLICATE_SECURITY_GROUP_ERROR:
+                raise
+            return ec2_client.describe_security_groups(Filters=filters)['SecurityGroups'][0]['GroupId']
+
+        # a new security group allows all the outbound traffic
+        ec2_client.revoke_security_group_egress(GroupId=group_id,
+                                                IpPermissions=[{'IpProtocol': '-1',
+                                                                'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}])
+        self.tag_service.set_ec2_resources_tags(ec2_client, [group_id],
+                                                [self.tag_service.get_name_tag(self.ISOLATION_SECURITY_GROUP_NAME),
+                                                 self.tag_service.get_created_by_kvp()])
+        return group_id
+
+    @staticmethod
+    def _attach(ec2_client, instance_id, interface_id, device_index):
+        attachment_id = ec2_client.attach_network_interface(DeviceIndex=device_index,
+                                                            InstanceId=instance_id,
+                                                            NetworkInterfaceId=interface_id)['AttachmentId']
+        ec2_client.modify_network_interface_attribute(NetworkInterfaceId=interface_id,
+                                                      Attachment={'AttachmentId': attachment_id,
+                                                                  'DeleteOnTermination': True})
+
+    def _hand_over_key_pair(self, ec2_session, s3_session, bucket, reservation_id, instance):
+        """
+        Moves the private key of the claimed instance to the keys of the reservation, so it is returned to the
+        reservation that claimed the instance only
+        """
+        key_pair_id = next((tag['Value'] for tag in instance.tags or [] if tag['Key'] == TagNames.WarmPoolKeyPair),
+                           None)
+        key_material = key_pair_id and self.key_pair_service.load_key_pair_by_name(s3_session, bucket, key_pair_id)
+        if not key_material:
+            raise ValueError('The key pair of instance {0} of the warm pool was not found'.format(instance.id))
+        self.key_pair_service.save_instance_key(s3_session, bucket, reservation_id, instance.id, key_material)
+        self._remove_key_pair(ec2_session, s3_session, bucket, key_pair_id)
+
+    def _remove_key_pair(self, ec2_session, s3_session, bucket, key_pair_id):
+        self.key_pair_service.remove_key_pair_for_reservation_in_s3(s3_session, bucket, key_pair_id)
+        self.key_pair_service.remove_key_pair_for_reservation_in_ec2(ec2_session, key_pair_id)
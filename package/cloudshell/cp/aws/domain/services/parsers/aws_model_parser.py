@@ -3,6 +3,7 @@ import re
 import jsonpickle
 from cloudshell.shell.core.driver_context import ReservationContextDetails
 
+from cloudshell.cp.aws.common.converters import convert_to_bool
 from cloudshell.cp.aws.common.deploy_data_holder import DeployDataHolder
 from cloudshell.cp.aws.domain.services.parsers.security_group_parser import SecurityGroupParser
 from cloudshell.cp.aws.models.app_security_groups_model import AppSecurityGroupModel, DeployedApp, VmDetails
@@ -68,8 +69,43 @@ class AWSModelsParser(object):
         aws_ec2_resource_model.vpc_cidr = resource_context['VPC CIDR']
         # aws_ec2_resource_model.reserved_ips_in_subnet = resource_context['Reserved IPs in Subnet']
 
+        # transport attributes may be missing on cloud providers created with an older data model
+        aws_ec2_resource_model.max_pool_connections = \
+            AWSModelsParser._get_int_attribute(resource_context, 'Max Pool Connections')
+        aws_ec2_resource_model.max_retry_attempts = \
+            AWSModelsParser._get_int_attribute(resource_context, 'Max Retry Attempts')
+        aws_ec2_resource_model.connect_timeout = AWSModelsParser._get_int_attribute(resource_context, 'Connect Timeout')
+        aws_ec2_resource_model.read_timeout = AWSModelsParser._get_int_attribute(resource_context, 'Read Timeout')
+        aws_ec2_resource_model.elastic_ip_pool_size = \
+            AWSModelsParser._get_int_attribute(resource_context, 'Elastic IP Pool Size')
+        aws_ec2_resource_model.elastic_ip_pool_max_size = \
+            AWSModelsParser._get_int_attribute(resource_context, 'Elastic IP Pool Max Size')
+        aws_ec2_resource_model.warm_pool_subnet_id = resource_context.get('Warm Pool Subnet ID', '').strip()
+        aws_ec2_resource_model.warm_pool_size = AWSModelsParser._get_int_attribute(resource_context, 'Warm Pool Size')
+        aws_ec2_resource_model.warm_pool_ami_ids = \
+            [ami_id.strip() for ami_id in resource_context.get('Warm Pool AMI IDs', '').split(',') if ami_id.strip()]
+        aws_ec2_resource_model.async_cleanup = convert_to_bool(resource_context.get('Async Cleanup', False))
+        aws_ec2_resource_model.async_cleanup_journal_directory = \
+            resource_context.get('Async Cleanup Journal Directory', '').strip()
+
         return aws_ec2_resource_model
 
+    @staticmethod
+    def _get_int_attribute(attributes, name):
+        """
+        :param dict attributes:
+        :param str name:
+        :return: the attribute value as int, 0 if it is missing or empty
+        :rtype: int
+        """
+        value = attributes.get(name)
+        if not value:
+            return 0
+        try:
+            return int(float(value))
+        except ValueError:
+            raise ValueError("Attribute '{0}' must be a number, got '{1}'".format(name, value))
+
     @staticmethod
     def parse_public_ip_options_attribute(attr_value):
         """
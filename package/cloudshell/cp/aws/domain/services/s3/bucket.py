@@ -80,3 +80,19 @@ class S3BucketService(object):
             return False
 
         return obj.delete()
+
+    @staticmethod
+    def delete_keys(s3_session, bucket, prefix):
+        """
+        Will delete all the keys that start with the prefix
+        :param s3_session: S3 Session
+        :param bucket: The bucket name
+        :type bucket: str
+        :param prefix: The prefix of the keys to delete
+        :type prefix: str
+        :return:
+        """
+        if not prefix:
+            raise ValueError('S3 key prefix cannot be empty')
+
+        s3_session.Bucket(bucket).objects.filter(Prefix=prefix).delete()
@@ -1,20 +1,40 @@
 import ConfigParser
+import hashlib
 import os
+import threading
 
 
 import boto3
+from botocore.config import Config
 
-from cloudshell.cp.aws.models.aws_api import AwsApiClients
+from cloudshell.cp.aws.common.ttl_cache import TTLCache
+from cloudshell.cp.aws.models.aws_api import AwsApiClients, LazyClient
 
 
 class AWSSessionProvider(object):
     EC2 = 'ec2'
     S3 = 's3'
 
-    def __init__(self):
+    CLIENTS_CACHE_TTL = 30 * 60  # seconds
+    CLIENTS_CACHE_MAX_SIZE = 32
+    CREDENTIALS_CACHE_TTL = 10 * 60  # seconds
+    CREDENTIALS_CACHE_MAX_SIZE = 32
+
+    def __init__(self, clients_cache_ttl=CLIENTS_CACHE_TTL, clients_cache_max_size=CLIENTS_CACHE_MAX_SIZE,
+                 credentials_cache_ttl=CREDENTIALS_CACHE_TTL, credentials_cache_max_size=CREDENTIALS_CACHE_MAX_SIZE):
+        """
+        :param float clients_cache_ttl: the time in seconds a set of aws api clients is reused
+        :param int clients_cache_max_size: the max number of cached sets of aws api clients
+        :param float credentials_cache_ttl: the time in seconds decrypted credentials are reused
+        :param int credentials_cache_max_size: the max number of cached decrypted credentials
+        """
         self.test_cred_path = os.path.join(os.path.dirname(__file__), 'test_cred.ini')
         if not os.path.isfile(self.test_cred_path):
             self.test_cred_path = ''
+        self.clients_cache = TTLCache(ttl=clients_cache_ttl, max_size=clients_cache_max_size)
+        # decrypted credentials are kept in memory only, keyed by the encrypted attribute values so
+        # changing the credentials on the cloud provider resource results in a cache miss
+        self.credentials_cache = TTLCache(ttl=credentials_cache_ttl, max_size=credentials_cache_max_size)
 
     def get_clients(self, cloudshell_session, aws_ec2_data_model):
         """
@@ -24,38 +44,128 @@ class AWSSessionProvider(object):
         :return:
         :rtype: AwsApiClients
         """
-        aws_session = self._get_aws_session(aws_ec2_data_model, cloudshell_session)
-        if not aws_session:
-            raise ValueError('Could not create AWS Session')
-        return AwsApiClients(ec2_session=aws_session.resource(self.EC2),
-                             s3_session=aws_session.resource(self.S3),
-                             ec2_client=aws_session.client(self.EC2))
+        credentials = self._get_aws_credentials(cloudshell_session, aws_ec2_data_model)
+        key = self._get_clients_cache_key(aws_ec2_data_model, credentials)
 
-    def get_s3_session(self, cloudshell_session, aws_ec2_data_model):
-        aws_session = self._get_aws_session(aws_ec2_data_model, cloudshell_session)
+        # the secret of the same access key was changed, the clients created with the old one are stale. Clients of
+        # other transport settings stay valid, cloud providers sharing the access key may use different settings
+        self.clients_cache.remove_if(lambda cached_key: cached_key[:2] == key[:2] and cached_key[2] != key[2])
 
-        if not aws_session:
-            raise ValueError('Could not create AWS Session')
-        return aws_session.resource(self.S3)
+        aws_api = self.clients_cache.get_or_create(
+            key, lambda: self._create_clients(aws_ec2_data_model, credentials))
+        return aws_api.for_command()
 
-    def get_ec2_session(self, cloudshell_session, aws_ec2_data_model):
-        aws_session = self._get_aws_session(aws_ec2_data_model, cloudshell_session)
+    def create_dedicated_clients(self, cloudshell_session, aws_ec2_data_model):
+        """
+        Creates aws api clients of their own boto3 session that are not cached, for work that outlives the command
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
+        :param cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel aws_ec2_data_model:
+        :rtype: AwsApiClients
+        """
+        credentials = self._get_aws_credentials(cloudshell_session, aws_ec2_data_model)
+        return self._create_clients(aws_ec2_data_model, credentials)
 
-        if not aws_session:
-            raise ValueError('Could not create AWS Session')
-        return aws_session.resource(self.EC2)
+    def get_s3_session(self, cloudshell_session, aws_ec2_data_model):
+        return self.get_clients(cloudshell_session, aws_ec2_data_model).s3_session
+
+    def get_ec2_session(self, cloudshell_session, aws_ec2_data_model):
+        return self.get_clients(cloudshell_session, aws_ec2_data_model).ec2_session
 
     def get_ec2_client(self, cloudshell_session, aws_ec2_data_model):
-        aws_session = self._get_aws_session(aws_ec2_data_model, cloudshell_session)
+        return self.get_clients(cloudshell_session, aws_ec2_data_model).ec2_client
+
+    def invalidate_clients(self, aws_ec2_data_model=None):
+        """
+        Drops the cached aws api clients of the data model region, or all of them if no data model is given
+        :param cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel aws_ec2_data_model:
+        """
+        if aws_ec2_data_model is None:
+            self.clients_cache.clear()
+        else:
+            self.clients_cache.remove_if(lambda cached_key: cached_key[0] == aws_ec2_data_model.region)
 
-        if not aws_session:
-            raise ValueError('Could not create AWS Client')
-        return aws_session.client(self.EC2)
+    def _create_clients(self, aws_ec2_data_model, credentials):
+        """
+        Creates aws api clients that build the boto3 session and each of its resources/clients on first access
+        :rtype: AwsApiClients
+        """
+        # boto3 sessions are not thread safe, all the objects of a session are created under the same lock
+        lock = threading.RLock()
+        aws_session = LazyClient(lambda: self._create_aws_session(aws_ec2_data_model, credentials), lock)
+
+        def get_aws_session():
+            session = aws_session.get()
+            if not session:
+                raise ValueError('Could not create AWS Session')
+            return session
+
+        config = self._get_client_config(aws_ec2_data_model)
+
+        def create_resource(service_name):
+            session = get_aws_session()
+            resource = session.resource(service_name, config=config)
+            AwsApiClients.register_client(resource.meta.client, self._get_session_access_key_id(session))
+            return resource
+
+        def create_client(service_name):
+            session = get_aws_session()
+            client = session.client(service_name, config=config)
+            AwsApiClients.register_client(client, self._get_session_access_key_id(session))
+            return client
+
+        return AwsApiClients(ec2_session=LazyClient(lambda: create_resource(self.EC2), lock),
+                             s3_session=LazyClient(lambda: create_resource(self.S3), lock),
+                             ec2_client=LazyClient(lambda: create_client(self.EC2), lock))
+
+    def _get_client_config(self, aws_ec2_data_model):
+        """
+        Builds the botocore transport config from the cloud provider attributes
+        :param cloudshell.cp.aws.models.aws_ec2_cloud_provider_resource_model.AWSEc2CloudProviderResourceModel aws_ec2_data_model:
+        :return: None if no transport attribute is set
+        :rtype: botocore.config.Config
+        """
+        config_kwargs = {}
+        if aws_ec2_data_model.max_pool_connections:
+            config_kwargs['max_pool_connections'] = aws_ec2_data_model.max_pool_connections
+        if aws_ec2_data_model.connect_timeout:
+            config_kwargs['connect_timeout'] = aws_ec2_data_model.connect_timeout
+        if aws_ec2_data_model.read_timeout:
+            config_kwargs['read_timeout'] = aws_ec2_data_model.read_timeout
+
+        retries = {}
+        if aws_ec2_data_model.max_retry_attempts:
+            retries['max_attempts'] = aws_ec2_data_model.max_retry_attempts
+        if retries:
+            config_kwargs['retries'] = retries
+
+        return Config(**config_kwargs) if config_kwargs else None
 
-    def _get_aws_session(self, aws_ec2_data_model, cloudshell_session):
-        credentials = self._get_aws_credentials(cloudshell_session, aws_ec2_data_model)
-        aws_session = self._create_aws_session(aws_ec2_data_model, credentials)
-        return aws_session
+    @staticmethod
+    def _get_session_access_key_id(session):
+        """
+        :param boto3.Session session:
+        :return: the access key id the clients of the session sign their requests with, None if no credentials
+        :rtype: str
+        """
+        credentials = session.get_credentials()
+        return credentials.access_key if credentials else None
+
+    @staticmethod
+    def _get_clients_cache_key(aws_ec2_data_model, credentials):
+        """
+        The key is (region, access key id, credentials fingerprint, transport settings).
+        The secret itself is never part of the key
+        :rtype: tuple
+        """
+        transport_settings = (aws_ec2_data_model.max_pool_connections,
+                              aws_ec2_data_model.max_retry_attempts,
+                              aws_ec2_data_model.connect_timeout,
+                              aws_ec2_data_model.read_timeout)
+        if not credentials:
+            return aws_ec2_data_model.region, None, None, transport_settings
+        fingerprint = hashlib.sha256('{0}:{1}'.format(credentials.access_key_id,
+                                                       credentials.secret_access_key)).hexdigest()
+        return aws_ec2_data_model.region, credentials.access_key_id, fingerprint, transport_settings
 
     @staticmethod
     def _create_aws_session(aws_ec2_data_model, credentials):
@@ -72,9 +182,10 @@ class AWSSessionProvider(object):
         if self.test_cred_path:
             return self._get_test_credentials()
         if cloudshell_session and aws_ec2_data_model.aws_access_key_id and aws_ec2_data_model.aws_secret_access_key:
-            return AWSCredentials(
+            key = (aws_ec2_data_model.aws_access_key_id, aws_ec2_data_model.aws_secret_access_key)
+            return self.credentials_cache.get_or_create(key, lambda: AWSCredentials(
                 self._decrypt_key(cloudshell_session, aws_ec2_data_model.aws_access_key_id),
-                self._decrypt_key(cloudshell_session, aws_ec2_data_model.aws_secret_access_key))
+                self._decrypt_key(cloudshell_session, aws_ec2_data_model.aws_secret_access_key)))
         return None
 
     def _get_test_credentials(self):
@@ -3,6 +3,10 @@ from multiprocessing import TimeoutError
 from cloudshell.shell.core.driver_context import CancellationContext
 from retrying import retry
 
+from cloudshell.cp.aws.domain.services.waiters.instance_state_poller import describe_instances_data, \
+    is_instance_in_state, MAX_INSTANCE_IDS_PER_DESCRIBE
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy, poll_until
+
 
 class InstanceWaiter(object):
     PENDING = 'pending'
@@ -21,18 +25,28 @@ class InstanceWaiter(object):
     STATUS_OK = 'ok'
     STATUS_IMPAIRED = 'impaired'
 
-    def __init__(self, cancellation_service, delay=15, timeout=10):
+    MAX_INSTANCE_IDS_PER_DESCRIBE = MAX_INSTANCE_IDS_PER_DESCRIBE
+    MAX_INSTANCE_IDS_PER_DESCRIBE_STATUS = 100
+
+    def __init__(self, cancellation_service, delay=15, timeout=10, initial_delay=2, instance_state_poller=None):
         """
-        :param delay: the time in seconds between each pull
+        :param delay: the max time in seconds between each pull
         :type delay: int
         :param timeout: timeout in minutes until time out exception will raised
         :type timeout: int
         :param cancellation_service:
         :type cancellation_service: cloudshell.cp.aws.domain.common.cancellation_service.CommandCancellationService
+        :param initial_delay: the time in seconds before the first pull, the delay backs off up to delay
+        :type initial_delay: int
+        :param instance_state_poller: when set, the instance states are polled by this poller shared by all the
+                                      concurrent waiters instead of each waiter polling on its own
+        :type instance_state_poller: cloudshell.cp.aws.domain.services.waiters.instance_state_poller.InstanceStatePoller
         """
         self.delay = delay
         self.timeout = timeout * 60
         self.cancellation_service = cancellation_service
+        self.backoff_policy = BackoffPolicy(initial_delay=initial_delay, max_delay=delay)
+        self.instance_state_poller = instance_state_poller
 
     def wait(self, instance, state, cancellation_context=None):
         """
@@ -46,7 +60,8 @@ class InstanceWaiter(object):
 
     def multi_wait(self, instances, state, cancellation_context=None):
         """
-        Will sync wait for the change of state of the instance
+        Will sync wait for the change of state of the instances.
+        Each poll issues one DescribeInstances call for all the instances that did not reach the state yet
         :param instances:
         :param str state:
         :param CancellationContext cancellation_context:
@@ -57,26 +72,60 @@ class InstanceWaiter(object):
         if state not in self.INSTANCE_STATES:
             raise ValueError('Unsupported instance state')
 
-        instance_ids = filter(lambda x: str(x.id), instances)
+        instance_ids = [instance.id for instance in instances]
+
+        if self.instance_state_poller:
+            return self._wait_with_poller(instances, state, instance_ids, cancellation_context)
 
+        pending_instances = [instance for instance in instances if not is_instance_in_state(instance, state)]
+
+        def refresh():
+            self._reload_instances(pending_instances)
+            pending_instances[:] = [instance for instance in pending_instances
+                                    if not is_instance_in_state(instance, state)]
+
+        poll_until(is_done=lambda: not pending_instances,
+                   refresh=refresh,
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: TimeoutError('Timeout: Waiting for instance to be {0} from {1}'
+                                                   .format(state, pending_instances[0].state)),
+                   check_cancelled=lambda: self.cancellation_service.check_if_cancelled(
+                       cancellation_context, {'instance_ids': instance_ids}))
+
+        return instances
+
+    def _wait_with_poller(self, instances, state, instance_ids, cancellation_context):
+        instances_watch = self.instance_state_poller.watch(instances, state)
         start_time = time.time()
-        last_item = 0
-        while len(instances) - last_item:
-            instance = instances[last_item]
-            if instance.state['Name'] != state:
-                self._reload_instance(instance)
+        try:
+            while not instances_watch.wait(self.instance_state_poller.interval):
                 if time.time() - start_time >= self.timeout:
-                    instance = instance or instances[0]
-                    raise TimeoutError('Timeout: Waiting for instance to be {0} from'.format(state, instance.state))
-                time.sleep(self.delay)
-            else:
-                last_item += 1
+                    raise TimeoutError('Timeout: Waiting for instance to be {0} from {1}'
+                                       .format(state, instances_watch.pending_instances[0].state))
 
-            self.cancellation_service.check_if_cancelled(cancellation_context,
-                                                         {'instance_ids': instance_ids})
+                self.cancellation_service.check_if_cancelled(cancellation_context,
+                                                             {'instance_ids': instance_ids})
+        finally:
+            self.instance_state_poller.unwatch(instances_watch)
 
+        if instances_watch.error:
+            raise instances_watch.error
         return instances
 
+    def _reload_instances(self, instances):
+        """
+        Reloads the attributes of all the instances using DescribeInstances calls of up to
+        MAX_INSTANCE_IDS_PER_DESCRIBE instance ids each
+        :param list instances: ec2 instances of the same session
+        """
+        instances_data = describe_instances_data(ec2_client=instances[0].meta.client,
+                                                 instance_ids=[instance.id for instance in instances],
+                                                 max_instance_ids_per_describe=self.MAX_INSTANCE_IDS_PER_DESCRIBE)
+        for instance in instances:
+            if instance.id in instances_data:
+                instance.meta.data = instances_data[instance.id]
+
     def wait_status_ok(self, ec2_client, instance, logger, cancellation_context=None):
         """
 
@@ -89,23 +138,63 @@ class InstanceWaiter(object):
         if not instance:
             raise ValueError('Instance cannot be null')
 
-        start_time = time.time()
-
-        instance_status = self._get_instance_status(ec2_client, instance)
-        while not self._is_instance_status_ok(instance_status):
-            if time.time() - start_time >= self.timeout:
-                raise TimeoutError('Timeout: Waiting for instance status check to be OK')
-            if self._is_instance_status_impaired(instance_status):
-                logger.error("Instance status check is not OK: {}".format(instance_status))
-                raise ValueError('Instance status check is not OK. Check the log and aws console for more details')
-
-            self.cancellation_service.check_if_cancelled(cancellation_context, {'instance_ids': [instance.id]})
+        instance_status = self.multi_wait_status_ok(ec2_client=ec2_client,
+                                                    instances=[instance],
+                                                    logger=logger,
+                                                    cancellation_context=cancellation_context).get(instance.id)
+        if self._is_instance_status_impaired(instance_status):
+            raise ValueError('Instance status check is not OK. Check the log and aws console for more details')
 
-            time.sleep(self.delay)
+        return instance_status
 
-            instance_status = self._get_instance_status(ec2_client, instance)
+    def multi_wait_status_ok(self, ec2_client, instances, logger, cancellation_context=None):
+        """
+        Will sync wait for the status checks of the instances to be OK.
+        Each poll issues one DescribeInstanceStatus call for all the instances that are still initializing.
+        Instances whose status check is impaired are logged and not waited for anymore
+        :param ec2_client: EC2 client
+        :param list instances:
+        :param logging.Logger logger:
+        :param CancellationContext cancellation_context:
+        :return: the last status of each instance by its id
+        :rtype: dict
+        """
+        if not instances:
+            raise ValueError('Instance cannot be null')
 
-        return instance_status
+        instance_ids = [instance.id for instance in instances]
+        pending_instance_ids = list(instance_ids)
+        instance_statuses = {}
+
+        def refresh():
+            instance_statuses.update(self._get_instances_status(ec2_client, pending_instance_ids))
+            for instance_id in list(pending_instance_ids):
+                instance_status = instance_statuses.get(instance_id)
+                if self._is_instance_status_ok(instance_status):
+                    pending_instance_ids.remove(instance_id)
+                elif self._is_instance_status_impaired(instance_status):
+                    logger.error("Instance {0} status check is not OK: {1}".format(instance_id, instance_status))
+                    pending_instance_ids.remove(instance_id)
+
+        refresh()
+        poll_until(is_done=lambda: not pending_instance_ids,
+                   refresh=refresh,
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: TimeoutError('Timeout: Waiting for instance status check to be OK for {0}'
+                                                   .format(', '.join(pending_instance_ids))),
+                   check_cancelled=lambda: self.cancellation_service.check_if_cancelled(
+                       cancellation_context, {'instance_ids': instance_ids}))
+
+        return instance_statuses
+
+    def get_impaired_instance_ids(self, instance_statuses):
+        """
+        :param dict instance_statuses: the status of each instance by its id, as returned by multi_wait_status_ok
+        :rtype: list[str]
+        """
+        return [instance_id for instance_id, instance_status in instance_statuses.iteritems()
+                if self._is_instance_status_impaired(instance_status)]
 
     def _is_instance_status_ok(self, instance_status):
         if not instance_status:
@@ -119,15 +208,19 @@ class InstanceWaiter(object):
         return instance_status['SystemStatus']['Status'] == self.STATUS_IMPAIRED \
                or instance_status['InstanceStatus']['Status'] == self.STATUS_IMPAIRED
 
+    def _get_instances_status(self, ec2_client, instance_ids):
+        """
+        :return: the status of each found instance by its id
+        :rtype: dict
+        """
+        instance_statuses = {}
+        for i in range(0, len(instance_ids), self.MAX_INSTANCE_IDS_PER_DESCRIBE_STATUS):
+            chunk = instance_ids[i:i + self.MAX_INSTANCE_IDS_PER_DESCRIBE_STATUS]
+            response = self._describe_instance_status(ec2_client, chunk)
+            for instance_status in response.get('InstanceStatuses', []):
+                instance_statuses[instance_status['InstanceId']] = instance_status
+        return instance_statuses
+
     @retry(stop_max_attempt_number=3, wait_fixed=1000)
-    def _get_instance_status(self, ec2_client, instance):
-        instance_status = ec2_client.describe_instance_status(InstanceIds=[instance.id], IncludeAllInstances=True)
-        if hasattr(instance_status, 'InstanceStatuses'):
-            return instance_status.InstanceStatuses[0]
-        if 'InstanceStatuses' in instance_status:
-            return instance_status['InstanceStatuses'][0]
-        return None
-
-    @retry(stop_max_attempt_number=30, wait_fixed=1000)
-    def _reload_instance(self, instance):
-        instance.reload()
+    def _describe_instance_status(self, ec2_client, instance_ids):
+        return ec2_client.describe_instance_status(InstanceIds=instance_ids, IncludeAllInstances=True)
@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+
+from retrying import retry
+
+MAX_INSTANCE_IDS_PER_DESCRIBE = 200
+
+
+def _describe_instances_once(ec2_client, instance_ids):
+    return ec2_client.describe_instances(InstanceIds=instance_ids)
+
+
+@retry(stop_max_attempt_number=30, wait_fixed=1000)
+def _describe_instances(ec2_client, instance_ids):
+    return _describe_instances_once(ec2_client, instance_ids)
+
+
+def describe_instances_data(ec2_client, instance_ids, max_instance_ids_per_describe=MAX_INSTANCE_IDS_PER_DESCRIBE,
+                            retry_describe=True):
+    """
+    Describes the instances using DescribeInstances calls of up to max_instance_ids_per_describe instance ids each
+    :param ec2_client:
+    :param list[str] instance_ids:
+    :param int max_instance_ids_per_describe:
+    :param bool retry_describe: whether to retry a failed DescribeInstances call, e.g. for the instances that are
+    not found yet right after they were created
+    :return: the description of each found instance by its id
+    :rtype: dict
+    """
+    describe = _describe_instances if retry_describe else _describe_instances_once
+    instances_data = {}
+    for i in range(0, len(instance_ids), max_instance_ids_per_describe):
+        chunk = instance_ids[i:i + max_instance_ids_per_describe]
+        response = describe(ec2_client, chunk)
+        for reservation in response['Reservations']:
+            for instance_data in reservation['Instances']:
+                instances_data[instance_data['InstanceId']] = instance_data
+    return instances_data
+
+
+def is_instance_in_state(instance, state):
+    # an instance that was never loaded would issue its own describe call when reading its state
+    if instance.meta.data is None:
+        return False
+    return instance.state['Name'] == state
+
+
+class InstancesWatch(object):
+    def __init__(self, instances, state):
+        """
+        Instances watched by the InstanceStatePoller until all of them reach the state
+        :param list instances: ec2 instances of the same session
+        :param str state:
+        """
+        self.instances = instances
+        self.state = state
+        self.pending_instances = [instance for instance in instances if not is_instance_in_state(instance, state)]
+        self.error = None
+        self.consecutive_errors = 0
+        self._done = threading.Event()
+        if not self.pending_instances:
+            self._done.set()
+
+    @property
+    def ec2_client(self):
+        return self.instances[0].meta.client
+
+    def wait(self, timeout):
+        """
+        Blocks until all the instances reached the state, the polling failed or the timeout elapsed
+        :param float timeout: the time in seconds to block
+        :return: True if the watch is done
+        :rtype: bool
+        """
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def update(self, instances_data):
+        """
+        :param dict instances_data: the description of the instances by their ids
+        """
+        self.consecutive_errors = 0
+        for instance in self.pending_instances:
+            if instance.id in instances_data:
+                instance.meta.data = instances_data[instance.id]
+        self.pending_instances = [instance for instance in self.pending_instances
+                                  if not is_instance_in_state(instance, self.state)]
+        if not self.pending_instances:
+            self._done.set()
+
+    def fail(self, error):
+        self.error = error
+        self._done.set()
+
+
+class InstanceStatePoller(object):
+    def __init__(self, interval=5, max_instance_ids_per_describe=MAX_INSTANCE_IDS_PER_DESCRIBE,
+                 max_consecutive_errors=30):
+        """
+        Polls the state of the instances watched by concurrent waiters of the driver process from a single
+        background thread. Each tick issues one batched DescribeInstances call per ec2 client, which is shared
+        by all the commands of the same region and account
+        :param interval: the time in seconds between each tick
+        :type interval: float
+        :param int max_instance_ids_per_describe:
+        :param int max_consecutive_errors: the number of ticks in a row the describe of a watch fails before the
+        watch fails, e.g. the instances are not found yet right after they were created
+        """
+        self.interval = interval
+        self.max_instance_ids_per_describe = max_instance_ids_per_describe
+        self.max_consecutive_errors = max_consecutive_errors
+        self._watches = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._logger = logging.getLogger(__name__)
+
+    def watch(self, instances, state):
+        """
+        Registers the instances to be polled until all of them reach the state
+        :param list instances: ec2 instances of the same session
+        :param str state:
+        :rtype: InstancesWatch
+        """
+        instances_watch = InstancesWatch(instances, state)
+        if instances_watch.pending_instances:
+            with self._lock:
+                self._watches.append(instances_watch)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='InstanceStatePoller')
+                    self._thread.daemon = True
+                    self._thread.start()
+        return instances_watch
+
+    def unwatch(self, instances_watch):
+        with self._lock:
+            if instances_watch in self._watches:
+                self._watches.remove(instances_watch)
+
+    def _run(self):
+        try:
+            while True:
+                time.sleep(self.interval)
+                with self._lock:
+                    if not self._watches:
+                        # the next watch starts a new thread
+                        self._thread = None
+                        return
+                try:
+                    self.poll()
+                except Exception:
+                    self._logger.exception('Failed to poll the state of the watched instances')
+        finally:
+            with self._lock:
+                # a thread that died lets the next watch start a new one
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def poll(self):
+        """
+        Describes all the pending instances of the watches, once per ec2 client, and updates the watches.
+        When the describe of several watches fails, e.g. one of their instances is not found, each of the watches
+        is described on its own so the failure fails only the watches it belongs to
+        """
+        with self._lock:
+            watches_by_client = {}
+            for instances_watch in self._watches:
+                watches_by_client.setdefault(instances_watch.ec2_client, []).append(instances_watch)
+
+        for ec2_client, watches in watches_by_client.items():
+            if len(watches) == 1:
+                self._poll_watch(ec2_client, watches[0])
+                continue
+
+            instance_ids = self._get_pending_instance_ids(watches)
+            try:
+                instances_data = describe_instances_data(ec2_client, instance_ids,
+                                                         self.max_instance_ids_per_describe, retry_describe=False)
+            except Exception:
+                self._logger.warning('Failed to describe the instances {0} of {1} watches, describing each watch '
+                                     'separately'.format(instance_ids, len(watches)), exc_info=True)
+                for instances_watch in watches:
+                    self._poll_watch(ec2_client, instances_watch)
+                continue
+
+            for instances_watch in watches:
+                self._update_watch(instances_watch, instances_data)
+
+    def _poll_watch(self, ec2_client, instances_watch):
+        """
+        Describes the pending instances of the watch once, the shared thread never blocks on retries. The watch
+        fails once its describe failed on max consecutive errors ticks in a row
+        """
+        instance_ids = self._get_pending_instance_ids([instances_watch])
+        try:
+            instances_data = describe_instances_data(ec2_client, instance_ids, self.max_instance_ids_per_describe,
+                                                     retry_describe=False)
+        except Exception as e:
+            instances_watch.consecutive_errors += 1
+            if instances_watch.consecutive_errors < self.max_consecutive_errors:
+                self._logger.warning('Failed to describe the instances {0}, retrying on the next tick'
+                                     .format(instance_ids), exc_info=True)
+                return
+            self._logger.exception('Failed to describe the instances {0}'.format(instance_ids))
+            instances_watch.fail(e)
+            self.unwatch(instances_watch)
+            return
+        self._update_watch(instances_watch, instances_data)
+
+    def _update_watch(self, instances_watch, instances_data):
+        instances_watch.update(instances_data)
+        if not instances_watch.pending_instances:
+            self.unwatch(instances_watch)
+
+    @staticmethod
+    def _get_pending_instance_ids(watches):
+        return sorted({instance.id for instances_watch in watches for instance in instances_watch.pending_instances})
@@ -1,21 +1,25 @@
-import time
 from multiprocessing import TimeoutError
 from cloudshell.shell.core.driver_context import CancellationContext
 
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy, poll_until
+
 
 class PasswordWaiter(object):
-    def __init__(self, cancellation_service, delay=5, timeout=15):
+    def __init__(self, cancellation_service, delay=5, timeout=15, initial_delay=5):
         """
-        :param delay: the time in seconds between each pull
+        :param delay: the max time in seconds between each pull
         :type delay: int
         :param timeout: timeout in minutes until time out exception will raised
         :type timeout: int
         :param cancellation_service:
         :type cancellation_service: cloudshell.cp.aws.domain.common.cancellation_service.CommandCancellationService
+        :param initial_delay: the time in seconds before the first pull, the delay backs off up to delay
+        :type initial_delay: int
         """
         self.delay = delay
         self.timeout = timeout * 60
         self.cancellation_service = cancellation_service
+        self.backoff_policy = BackoffPolicy(initial_delay=initial_delay, max_delay=delay)
 
     def wait(self, instance, cancellation_context=None):
         """
@@ -27,19 +31,54 @@ class PasswordWaiter(object):
         if not instance:
             raise ValueError('Instance cannot be null')
 
-        start_time = time.time()
+        password_data = [self._get_password(instance)]
 
-        password_data = self._get_password(instance)
-        while not password_data:
-            if time.time() - start_time >= self.timeout:
-                raise TimeoutError('Timeout: Waiting for instance to get password')
+        def refresh():
+            password_data[0] = self._get_password(instance)
 
-            self.cancellation_service.check_if_cancelled(cancellation_context)
+        poll_until(is_done=lambda: password_data[0],
+                   refresh=refresh,
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: TimeoutError('Timeout: Waiting for instance to get password'),
+                   check_cancelled=lambda: self.cancellation_service.check_if_cancelled(cancellation_context))
 
-            time.sleep(self.delay)
-            password_data = self._get_password(instance)
+        return password_data[0]
 
-        return password_data
+    def multi_wait(self, instances, on_password=None, cancellation_context=None):
+        """
+        will wait for the passwords of the machines to be set, all the machines are polled together
+        :param list instances: Amazon AMI instances
+        :param on_password: function called with each instance as soon as its password is set
+        :param CancellationContext cancellation_context:
+        :return: the password data of each instance by its id
+        :rtype: dict
+        """
+        if not instances:
+            raise ValueError('Instance cannot be null')
+
+        passwords = {}
+        pending_instances = list(instances)
+
+        def refresh():
+            for instance in list(pending_instances):
+                password_data = self._get_password(instance)
+                if password_data:
+                    passwords[instance.id] = password_data
+                    pending_instances.remove(instance)
+                    if on_password:
+                        on_password(instance)
+
+        refresh()
+        poll_until(is_done=lambda: not pending_instances,
+                   refresh=refresh,
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: TimeoutError('Timeout: Waiting for instances {0} to get password'
+                                                   .format(', '.join(instance.id for instance in pending_instances))),
+                   check_cancelled=lambda: self.cancellation_service.check_if_cancelled(cancellation_context))
+
+        return passwords
 
     @staticmethod
     def _get_password(instance):
@@ -0,0 +1,70 @@
+import random
+import time
+
+
+class BackoffPolicy(object):
+    def __init__(self, initial_delay, max_delay, backoff_factor=2, jitter=0.2):
+        """
+        Delay policy that polls quickly at first and backs off exponentially up to max_delay
+        :param initial_delay: the time in seconds before the first poll
+        :type initial_delay: float
+        :param max_delay: the max time in seconds between each poll
+        :type max_delay: float
+        :param backoff_factor: the delay is multiplied by it after each poll
+        :type backoff_factor: float
+        :param jitter: fraction of the delay that is randomly cut, so concurrent waiters do not poll together
+        :type jitter: float
+        """
+        if initial_delay < 0 or max_delay < 0:
+            raise ValueError('Polling delays cannot be negative')
+        if backoff_factor < 1:
+            raise ValueError('Backoff factor cannot be lower than 1')
+        if not 0 <= jitter <= 1:
+            raise ValueError('Jitter must be between 0 and 1')
+
+        self.initial_delay = min(initial_delay, max_delay)
+        self.max_delay = max_delay
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+
+    def get_delay(self, attempt):
+        """
+        :param int attempt: the zero based number of the poll
+        :return: the time in seconds to sleep before the poll
+        :rtype: float
+        """
+        # the factor is only raised while it matters so long waits do not overflow
+        delay = self.initial_delay
+        for _ in range(attempt):
+            if delay >= self.max_delay:
+                break
+            delay *= self.backoff_factor
+        delay = min(delay, self.max_delay)
+        return delay - delay * self.jitter * random.random()
+
+
+def poll_until(is_done, refresh, backoff_policy, timeout, on_timeout, check_cancelled=None):
+    """
+    Sleeps according to the backoff policy and refreshes until is_done returns True
+    :param is_done: function with no arguments returning True when the wait is over, can raise to stop waiting
+    :param refresh: function with no arguments reloading the state checked by is_done
+    :param BackoffPolicy backoff_policy:
+    :param timeout: the time in seconds until on_timeout is raised
+    :type timeout: float
+    :param on_timeout: function with no arguments returning the exception to raise on timeout
+    :param check_cancelled: function with no arguments called before each sleep, raises if the command was cancelled
+    """
+    start_time = time.time()
+    attempt = 0
+    while not is_done():
+        elapsed = time.time() - start_time
+        if elapsed >= timeout:
+            raise on_timeout()
+
+        if check_cancelled:
+            check_cancelled()
+
+        # never sleep past the timeout, so the state is checked one last time when it expires
+        time.sleep(min(backoff_policy.get_delay(attempt), timeout - elapsed))
+        attempt += 1
+        refresh()
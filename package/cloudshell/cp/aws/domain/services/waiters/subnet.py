@@ -1,6 +1,5 @@
-import time
-
 from cloudshell.cp.aws.common import retry_helper
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy, poll_until
 
 
 class SubnetWaiter(object):
@@ -9,15 +8,18 @@ class SubnetWaiter(object):
     INSTANCE_STATES = [PENDING,
                        AVAILABLE]
 
-    def __init__(self, delay=10, timeout=10):
+    def __init__(self, delay=10, timeout=10, initial_delay=1):
         """
-        :param delay: the time in seconds between each pull
+        :param delay: the max time in seconds between each pull
         :type delay: int
         :param timeout: timeout in minutes until time out exception will raised
         :type timeout: int
+        :param initial_delay: the time in seconds before the first pull, the delay backs off up to delay
+        :type initial_delay: int
         """
         self.delay = delay
         self.timeout = timeout * 60
+        self.backoff_policy = BackoffPolicy(initial_delay=initial_delay, max_delay=delay)
 
     def wait(self, subnet, state, load=False):
         """
@@ -34,16 +36,54 @@ class SubnetWaiter(object):
 
         retry_helper.do_with_retry(lambda: subnet.reload())
 
-        start_time = time.time()
-        while subnet.state != state:
-
-            retry_helper.do_with_retry(lambda: subnet.reload())
-
-            if time.time() - start_time >= self.timeout:
-                raise Exception('Timeout: Waiting for instance to be {0} from'.format(state, subnet.state))
-            time.sleep(self.delay)
+        poll_until(is_done=lambda: subnet.state == state,
+                   refresh=lambda: retry_helper.do_with_retry(lambda: subnet.reload()),
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: Exception('Timeout: Waiting for instance to be {0} from {1}'
+                                                .format(state, subnet.state)))
 
         if load:
             subnet.reload()
 
         return subnet
+
+    def multi_wait(self, subnets, state):
+        """
+        Will sync wait for the change of state of the subnets.
+        Each poll issues one DescribeSubnets call for all the subnets that did not reach the state yet
+        :param list subnets: ec2 subnets of the same session
+        :param str state:
+        :return:
+        """
+        if not subnets:
+            raise ValueError('Subnets cannot be empty')
+        if state not in self.INSTANCE_STATES:
+            raise ValueError('Unsupported subnet state')
+
+        pending_subnets = list(subnets)
+
+        def refresh():
+            retry_helper.do_with_retry(lambda: self._reload_subnets(pending_subnets))
+            pending_subnets[:] = [subnet for subnet in pending_subnets if subnet.state != state]
+
+        refresh()
+        poll_until(is_done=lambda: not pending_subnets,
+                   refresh=refresh,
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: Exception('Timeout: Waiting for subnet {0} to be {1} from {2}'
+                                                .format(pending_subnets[0].id, state, pending_subnets[0].state)))
+        return subnets
+
+    @staticmethod
+    def _reload_subnets(subnets):
+        """
+        Reloads the attributes of all the subnets with a single DescribeSubnets call
+        :param list subnets: ec2 subnets of the same session
+        """
+        descriptions = subnets[0].meta.client.describe_subnets(SubnetIds=[subnet.id for subnet in subnets])['Subnets']
+        descriptions = dict((description['SubnetId'], description) for description in descriptions)
+        for subnet in subnets:
+            if subnet.id in descriptions:
+                subnet.meta.data = descriptions[subnet.id]
@@ -1,6 +1,5 @@
-import time
-
 from cloudshell.cp.aws.common import retry_helper
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy, poll_until
 
 
 class VPCWaiter(object):
@@ -9,15 +8,18 @@ class VPCWaiter(object):
     INSTANCE_STATES = [PENDING,
                        AVAILABLE]
 
-    def __init__(self, delay=10, timeout=10):
+    def __init__(self, delay=10, timeout=10, initial_delay=1):
         """
-        :param delay: the time in seconds between each pull
+        :param delay: the max time in seconds between each pull
         :type delay: int
         :param timeout: timeout in minutes until time out exception will raised
         :type timeout: int
+        :param initial_delay: the time in seconds before the first pull, the delay backs off up to delay
+        :type initial_delay: int
         """
         self.delay = delay
         self.timeout = timeout * 60
+        self.backoff_policy = BackoffPolicy(initial_delay=initial_delay, max_delay=delay)
 
     def wait(self, vpc, state):
         """
@@ -32,13 +34,12 @@ class VPCWaiter(object):
         if state not in self.INSTANCE_STATES:
             raise ValueError('Unsupported instance state')
 
-        start_time = time.time()
-        while vpc.state != state:
-            time.sleep(self.delay)
-            if time.time() - start_time >= self.timeout:
-                raise Exception('Timeout: Waiting for instance to be {0} from'.format(state, vpc.state))
-
-            retry_helper.do_with_retry(lambda: vpc.reload())
+        poll_until(is_done=lambda: vpc.state == state,
+                   refresh=lambda: retry_helper.do_with_retry(lambda: vpc.reload()),
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: Exception('Timeout: Waiting for instance to be {0} from {1}'
+                                                .format(state, vpc.state)))
 
         return vpc
 
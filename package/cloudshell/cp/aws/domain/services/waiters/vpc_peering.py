@@ -1,6 +1,5 @@
-import time
-
 from cloudshell.cp.aws.common import retry_helper
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy, poll_until
 
 
 class VpcPeeringConnectionWaiter(object):
@@ -24,15 +23,18 @@ class VpcPeeringConnectionWaiter(object):
               PROVISIONING,
               DELETING]
 
-    def __init__(self, delay=10, timeout=10):
+    def __init__(self, delay=10, timeout=10, initial_delay=1):
         """
-        :param delay: the time in seconds between each pull
+        :param delay: the max time in seconds between each pull
         :type delay: int
         :param timeout: timeout in minutes until time out exception will raised
         :type timeout: int
+        :param initial_delay: the time in seconds before the first pull, the delay backs off up to delay
+        :type initial_delay: int
         """
         self.delay = delay
         self.timeout = timeout * 60
+        self.backoff_policy = BackoffPolicy(initial_delay=initial_delay, max_delay=delay)
 
     def wait(self, vpc_peering_connection, state, throw_on_error=True, load=False):
         """
@@ -48,21 +50,22 @@ class VpcPeeringConnectionWaiter(object):
         if state not in self.STATES:
             raise ValueError('Unsupported vpc peering connection state')
 
-        start_time = time.time()
-        while vpc_peering_connection.status['Code'] != state:
-            retry_helper.do_with_retry(lambda: vpc_peering_connection.reload())
-
+        def is_done():
             if vpc_peering_connection.status['Code'] == state:
-                break
+                return True
             if throw_on_error and vpc_peering_connection.status['Code'] in [VpcPeeringConnectionWaiter.REJECTED,
                                                                             VpcPeeringConnectionWaiter.FAILED]:
                 raise Exception('Error: vpc peering connection state is {0}. Expected state: {1}'
                                 .format(vpc_peering_connection.status['Code'], state))
+            return False
 
-            if time.time() - start_time >= self.timeout:
-                raise Exception('Timeout waiting for vpc peering connection to be {0}. Current state is {1}'
-                                .format(state, vpc_peering_connection.status['Code']))
-            time.sleep(self.delay)
+        poll_until(is_done=is_done,
+                   refresh=lambda: retry_helper.do_with_retry(lambda: vpc_peering_connection.reload()),
+                   backoff_policy=self.backoff_policy,
+                   timeout=self.timeout,
+                   on_timeout=lambda: Exception('Timeout waiting for vpc peering connection to be {0}. '
+                                                'Current state is {1}'
+                                                .format(state, vpc_peering_connection.status['Code'])))
 
         if load:
             retry_helper.do_with_retry(lambda: vpc_peering_connection.reload())
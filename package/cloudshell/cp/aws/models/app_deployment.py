@@ -0,0 +1,22 @@
+class AppDeployment(object):
+    def __init__(self, deploy_action, network_actions):
+        """
+        The state of a single app deployed by a batch deploy
+        :param cloudshell.cp.core.models.DeployApp deploy_action:
+        :param list[cloudshell.cp.core.models.ConnectSubnet] network_actions: the network actions of the app
+        """
+        self.deploy_action = deploy_action
+        self.network_actions = network_actions
+        self.name = deploy_action.actionParams.appName  # type: str
+        self.ami_deployment_model = deploy_action.actionParams.deployment.customModel
+        self.network_config_results = []  # type: list[cloudshell.cp.aws.models.network_actions_models.DeployNetworkingResultModel]
+        self.security_group = None
+        self.ami_deployment_info = None  # type: cloudshell.cp.aws.models.ami_deployment_model.AMIDeploymentModel
+        self.instance = None
+        self.error = None  # type: Exception
+        self.rollback_errors = []  # type: list[str]
+        """the failed and skipped steps of the rollback of the failed app"""
+
+    @property
+    def failed(self):
+        return self.error is not None
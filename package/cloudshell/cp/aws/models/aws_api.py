@@ -1,11 +1,145 @@
+import threading
+import weakref
+
+
+def create_resource_for_thread(resource):
+    """
+    boto3 resources are not thread safe while their low level clients are, so each thread builds its own service
+    resource on the low level client of the resource
+    :param boto3.resources.base.ServiceResource resource: a service resource, e.g. the ec2 resource of a session
+    :rtype: boto3.resources.base.ServiceResource
+    """
+    return resource.__class__(client=resource.meta.client)
+
+
+class LazyClient(object):
+    def __init__(self, factory, lock=None):
+        """
+        Creates the wrapped aws api object on first access only
+        :param factory: function with no arguments that creates the aws api object
+        :param threading.RLock lock: lock guarding the creation, can be shared by clients of the same boto3 session
+        """
+        self._factory = factory
+        self._lock = lock or threading.RLock()
+        self._value = None
+        self._created = False
+
+    @classmethod
+    def of(cls, value):
+        """
+        Wraps an already created aws api object
+        :rtype: LazyClient
+        """
+        lazy_client = cls(factory=lambda: value)
+        lazy_client.get()
+        return lazy_client
+
+    @property
+    def created(self):
+        return self._created
+
+    def get(self):
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    self._value = self._factory()
+                    self._created = True
+        return self._value
+
+
 class AwsApiClients(object):
+    EC2_SESSION = 'ec2_session'
+    S3_SESSION = 's3_session'
+    EC2_CLIENT = 'ec2_client'
+
+    # the access key id of each low level client created for the clients, the resources built on a low level client
+    # share it, so the account of any aws api object is found by its low level client
+    _access_key_ids = weakref.WeakKeyDictionary()
+    _access_key_ids_lock = threading.Lock()
+
     def __init__(self, ec2_session, s3_session, ec2_client):
         """
-        :param boto3.resources.base.ServiceResource ec2_session:
-        :param boto3.resources.base.ServiceResource s3_session:
-        :param EC2.Client ec2_client:
+        Each of the aws api objects is created on first access. Instances returned by for_command share the
+        created low level client, get their own resources and count the accesses of a single command
+        :param boto3.resources.base.ServiceResource | LazyClient ec2_session:
+        :param boto3.resources.base.ServiceResource | LazyClient s3_session:
+        :param EC2.Client | LazyClient ec2_client:
         :return:
         """
-        self.ec2_session = ec2_session
-        self.s3_session = s3_session
-        self.ec2_client = ec2_client
+        self._clients = {self.EC2_SESSION: self._to_lazy_client(ec2_session),
+                         self.S3_SESSION: self._to_lazy_client(s3_session),
+                         self.EC2_CLIENT: self._to_lazy_client(ec2_client)}
+        self.usage_counters = {name: 0 for name in self._clients}
+        self._counters_lock = threading.Lock()
+
+    @property
+    def ec2_session(self):
+        return self._get_client(self.EC2_SESSION)
+
+    @property
+    def s3_session(self):
+        return self._get_client(self.S3_SESSION)
+
+    @property
+    def ec2_client(self):
+        return self._get_client(self.EC2_CLIENT)
+
+    def for_command(self):
+        """
+        Returns clients with zeroed usage counters sharing the low level client of this instance.
+        boto3 resources are not thread safe, so each command gets new resources built on the low level clients of
+        the resources of this instance
+        :rtype: AwsApiClients
+        """
+        return AwsApiClients(ec2_session=self._get_resource_for_command(self.EC2_SESSION),
+                             s3_session=self._get_resource_for_command(self.S3_SESSION),
+                             ec2_client=self._clients[self.EC2_CLIENT])
+
+    @classmethod
+    def register_client(cls, client, access_key_id):
+        """
+        :param client: a low level aws api client
+        :param str access_key_id: the access key id the client signs its requests with
+        """
+        with cls._access_key_ids_lock:
+            cls._access_key_ids[client] = access_key_id
+
+    @classmethod
+    def get_access_key_id(cls, client):
+        """
+        :param client: a low level aws api client
+        :return: the access key id registered for the client, None if the client was not registered
+        :rtype: str
+        """
+        with cls._access_key_ids_lock:
+            return cls._access_key_ids.get(client)
+
+    def get_used_clients(self):
+        """
+        :return: names of the aws api objects that were accessed
+        :rtype: list[str]
+        """
+        return sorted(name for name, count in self.usage_counters.items() if count)
+
+    def get_usage_summary(self):
+        """
+        :rtype: str
+        """
+        return ', '.join('{0}={1}'.format(name, self.usage_counters[name]) for name in sorted(self.usage_counters))
+
+    def _get_client(self, name):
+        with self._counters_lock:
+            self.usage_counters[name] += 1
+        return self._clients[name].get()
+
+    def _get_resource_for_command(self, name):
+        """
+        :rtype: LazyClient
+        """
+        lazy_resource = self._clients[name]
+
+        return LazyClient(lambda: create_resource_for_thread(lazy_resource.get()))
+
+    @staticmethod
+    def _to_lazy_client(client):
+        return client if isinstance(client, LazyClient) else LazyClient.of(client)
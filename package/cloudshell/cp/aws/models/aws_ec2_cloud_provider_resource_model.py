@@ -12,6 +12,22 @@ class AWSEc2CloudProviderResourceModel(object):
         self.reserved_ips_in_subnet = ''  # type: int
         self.vpc_mode = ''  # type: str
         self.vpc_cidr = ''  # type: str
+        # botocore transport settings, zero or empty means the botocore default is used
+        self.max_pool_connections = 0  # type: int
+        self.max_retry_attempts = 0  # type: int
+        self.connect_timeout = 0  # type: int
+        self.read_timeout = 0  # type: int
+        # warm elastic ip pool, zero pool size means the pool is disabled
+        self.elastic_ip_pool_size = 0  # type: int
+        self.elastic_ip_pool_max_size = 0  # type: int
+        # warm standby instances, an empty subnet or zero size means the pool is disabled
+        self.warm_pool_subnet_id = ''  # type: str
+        self.warm_pool_size = 0  # type: int
+        self.warm_pool_ami_ids = []  # type: list[str]
+        # the cleanup returns once the instances started terminating and the teardown continues in the background
+        self.async_cleanup = False  # type: bool
+        # the persistent local directory of the asynchronous cleanup journal, empty means the default directory
+        self.async_cleanup_journal_directory = ''  # type: str
 
     @property
     def is_static_vpc_mode(self):
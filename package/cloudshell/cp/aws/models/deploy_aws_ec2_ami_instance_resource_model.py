@@ -39,6 +39,7 @@ class DeployAWSEc2AMIInstanceResourceModel(object):
         self.outbound_ports = ''  # type: str
         self.inbound_ports = ''  # type: str
         self.wait_for_credentials = ''  # type: str
+        self.retrieve_credentials_in_background = False  # type: bool
         self.add_public_ip = False  # type: bool
         self.allocate_elastic_ip = False  # type: bool
         self.network_configurations = None  # type: list[NetworkAction]
@@ -57,6 +58,9 @@ class DeployAWSEc2AMIInstanceResourceModel(object):
         self.autoload = convert_to_bool(attributes['Autoload'])
         self.inbound_ports = attributes['Inbound Ports']
         self.wait_for_credentials = convert_to_bool(attributes['Wait for Credentials'])
+        # optional so apps of older blueprints keep waiting for the credentials in deploy
+        self.retrieve_credentials_in_background = \
+            convert_to_bool(attributes.get('Retrieve Credentials in Background', False))
         (self.add_public_ip, self.allocate_elastic_ip) = \
             AWSModelsParser.parse_public_ip_options_attribute(attributes['Public IP Options'])
         self.custom_tags = attributes['Custom Tags']
@@ -0,0 +1,15 @@
+class ImageMetadata(object):
+    def __init__(self, image_id, state, platform, root_device_name, block_device_mappings):
+        """
+        The attributes of an AMI a deploy reads, named like the attributes of the boto3 Image resource
+        :param str image_id:
+        :param str state:
+        :param str platform: 'windows' for windows images, None otherwise
+        :param str root_device_name:
+        :param list[dict] block_device_mappings:
+        """
+        self.image_id = image_id
+        self.state = state
+        self.platform = platform
+        self.root_device_name = root_device_name
+        self.block_device_mappings = block_device_mappings
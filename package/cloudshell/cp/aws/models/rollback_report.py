@@ -0,0 +1,14 @@
+class RollbackReport(object):
+    def __init__(self):
+        """
+        The outcome of rolling back a deploy
+        """
+        self.terminated_instance_ids = []  # type: list[str]
+        self.deleted_security_group_ids = []  # type: list[str]
+        self.released_elastic_ips = []  # type: list[str]
+        self.errors = []  # type: list[str]
+        """the failed and skipped rollback steps"""
+
+    @property
+    def succeeded(self):
+        return not self.errors
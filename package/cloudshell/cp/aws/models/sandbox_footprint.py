@@ -0,0 +1,12 @@
+class SandboxFootprint(object):
+    def __init__(self, vpc_id):
+        """
+        The ids of the aws resources created for a sandbox by prepare connectivity
+        :param str vpc_id: the id of the sandbox vpc
+        """
+        self.vpc_id = vpc_id
+        self.security_group_ids = {}  # type: dict[str, str]
+        """the ids of the sandbox default and isolated security groups by their names"""
+        self.subnet_names = {}  # type: dict[str, str]
+        """the names of the sandbox subnets, without the reservation, by their ids"""
+        self.private_route_table_id = None  # type: str
@@ -0,0 +1,28 @@
+from collections import OrderedDict
+
+
+class SweepReport(object):
+    def __init__(self, dry_run):
+        """
+        The outcome of sweeping the orphaned resources of a region
+        :param bool dry_run: whether the orphaned resources were only reported
+        """
+        self.dry_run = dry_run
+        self.orphans = OrderedDict()
+        """the ids of the orphaned resources of each reservation by their type, e.g. {'res': {'vpc': ['vpc-1']}}"""
+        self.resources = OrderedDict()
+        """the teardown status of the resources of each swept reservation by their name"""
+        self.errors = OrderedDict()
+        """the error messages of each swept reservation by the name of the failed resource"""
+
+    def add_orphan(self, reservation_id, resource_type, resource_id):
+        """
+        :param str reservation_id:
+        :param str resource_type:
+        :param str resource_id:
+        """
+        self.orphans.setdefault(reservation_id, OrderedDict()).setdefault(resource_type, []).append(resource_id)
+
+    @property
+    def succeeded(self):
+        return not self.errors
@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+
+class TeardownReport(object):
+    DELETED = 'deleted'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    def __init__(self):
+        """
+        The outcome of deleting each resource of a sandbox
+        """
+        self.resources = OrderedDict()
+        """the status of each resource by its name, e.g. 'subnet subnet-1'"""
+        self.errors = OrderedDict()
+        """the error message of each failed resource by its name"""
+
+    def add(self, resource, status, error=None):
+        """
+        :param str resource:
+        :param str status: DELETED, FAILED or SKIPPED
+        :param str error:
+        """
+        self.resources[resource] = status
+        if error:
+            self.errors[resource] = error
+
+    def get_resources(self, status):
+        """
+        :param str status:
+        :rtype: list[str]
+        """
+        return [resource for resource, resource_status in self.resources.items() if resource_status == status]
+
+    @property
+    def succeeded(self):
+        return all(status == self.DELETED for status in self.resources.values())
@@ -1,10 +1,14 @@
+from multiprocessing import TimeoutError
 from unittest import TestCase
 
-from mock import Mock, call, MagicMock
+from mock import Mock, call, MagicMock, ANY, patch
 
 from cloudshell.cp.aws.domain.ami_management.operations.deploy_operation import DeployAMIOperation
 from cloudshell.cp.aws.domain.common.exceptions import CancellationException
+from cloudshell.cp.aws.models.ami_deployment_model import AMIDeploymentModel
+from cloudshell.cp.aws.models.app_deployment import AppDeployment
 from cloudshell.cp.aws.models.network_actions_models import DeployNetworkingResultModel
+from cloudshell.cp.aws.models.rollback_report import RollbackReport
 from cloudshell.cp.core.models import ConnectToSubnetParams, PrepareCloudInfra, ConnectSubnet
 
 
@@ -40,6 +44,24 @@ class TestDeployOperation(TestCase):
                                                    device_index_strategy=self.device_index_strategy,
                                                    vm_details_provider=self.vm_details_provider)
 
+    def test_get_security_group_param_from_sandbox_footprint(self):
+        reservation = Mock(reservation_id='res')
+        self.security_group_service.sandbox_default_sg_name = Mock(return_value='default sg')
+        self.deploy_operation.sandbox_footprint_cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.deploy_operation.sandbox_footprint_cache.set_security_group_id('region', 'res', 'default sg', 'sg-1')
+
+        res = self.deploy_operation._get_security_group_param('region', reservation, None, Mock(), True)
+
+        self.assertEqual(res, ['sg-1'])
+        self.security_group_service.get_security_group_by_name.assert_not_called()
+
+    def test_get_security_group_param_missing_default_security_group(self):
+        reservation = Mock(reservation_id='res')
+        self.security_group_service.get_security_group_by_name = Mock(return_value=None)
+
+        self.assertRaises(ValueError, self.deploy_operation._get_security_group_param, 'region', reservation, None,
+                          Mock(), False)
+
     def test_deploy_rollback_called(self):
         # arrange
         ami_deploy_action = Mock()
@@ -59,31 +81,212 @@ class TestDeployOperation(TestCase):
                           self.logger)
         self.deploy_operation._rollback_deploy.assert_called_once()
 
+    def test_deploy_rolls_back_security_group_created_before_a_pre_launch_failure(self):
+        ami_deploy_action = Mock()
+        security_group = Mock()
+        self.deploy_operation._create_security_group_for_instance = Mock(return_value=security_group)
+        self.deploy_operation._get_image = Mock(side_effect=ValueError('AMI ami-1 not found'))
+        self.deploy_operation._rollback_deploy = Mock()
+
+        self.assertRaisesRegexp(ValueError, 'not found', self.deploy_operation.deploy, self.ec2_session,
+                                self.s3_session, 'my name', Mock(), self.ec2_datamodel, ami_deploy_action, None,
+                                self.ec2_client, Mock(), self.logger)
+
+        self.instance_service.create_instance.assert_not_called()
+        self.assertEqual(self.deploy_operation._rollback_deploy.call_args[1]['custom_security_group'], security_group)
+
+    def test_deploy_attaches_the_rollback_errors_to_the_raised_error(self):
+        report = RollbackReport()
+        report.errors.append('delete_security_group_sg-1 failed: DependencyViolation')
+        self.deploy_operation._create_security_group_for_instance = Mock()
+        self.deploy_operation._get_image = Mock(side_effect=ValueError('AMI ami-1 not found'))
+        self.deploy_operation._rollback_deploy = Mock(return_value=report)
+
+        with self.assertRaises(ValueError) as context:
+            self.deploy_operation.deploy(self.ec2_session, self.s3_session, 'my name', Mock(), self.ec2_datamodel,
+                                         Mock(), None, self.ec2_client, Mock(), self.logger)
+
+        self.assertEqual(context.exception.rollback_errors, report.errors)
+
+    def test_deploy_cancelled_before_pre_launch(self):
+        self.cancellation_service.check_if_cancelled = Mock(side_effect=CancellationException('cancelled', {}))
+        self.deploy_operation._create_security_group_for_instance = Mock()
+
+        self.assertRaises(CancellationException, self.deploy_operation.deploy, self.ec2_session, self.s3_session,
+                          'my name', Mock(), self.ec2_datamodel, Mock(), None, self.ec2_client, Mock(), self.logger)
+
+        self.deploy_operation._create_security_group_for_instance.assert_not_called()
+
+    @patch('cloudshell.cp.aws.domain.ami_management.operations.deploy_operation.create_resource_for_thread')
+    def test_pre_launch_graph_prefetches_image_and_single_subnet(self, create_resource_for_thread):
+        thread_sessions = [Mock(), Mock(), Mock()]
+        create_resource_for_thread.side_effect = thread_sessions
+        ami_deployment_model = Mock()
+        image = Mock()
+        subnet = Mock()
+        security_group = Mock()
+        self.deploy_operation._create_security_group_for_instance = Mock(return_value=security_group)
+        self.deploy_operation._get_image = Mock(return_value=image)
+        self.deploy_operation._get_sandbox_security_group_id = Mock(return_value='sg-1')
+        self.subnet_service.get_first_subnet_from_vpc = Mock(return_value=subnet)
+        self.deploy_operation._create_deployment_parameters = Mock()
+        vpc = Mock()
+
+        pre_launch = self.deploy_operation._create_pre_launch_graph(
+            ec2_session=self.ec2_session, aws_ec2_resource_model=self.ec2_datamodel,
+            ami_deployment_model=ami_deployment_model, network_actions=None, vpc=vpc, key_pair='key',
+            reservation=Mock(), network_config_results=[], cancellation_context=None, logger=self.logger)
+        res = pre_launch.run()
+
+        # the concurrent steps do not share boto3 resources
+        self.assertEqual(create_resource_for_thread.call_args_list, [call(self.ec2_session)] * 3)
+        self.assertEqual(self.deploy_operation._create_security_group_for_instance.call_args[1]['ec2_session'],
+                         thread_sessions[0])
+        self.assertEqual(self.deploy_operation._create_security_group_for_instance.call_args[1]['vpc'],
+                         thread_sessions[0].Vpc.return_value)
+        self.assertEqual(self.deploy_operation._get_sandbox_security_group_id.call_args[0][2],
+                         thread_sessions[1].Vpc.return_value)
+        thread_sessions[2].Vpc.assert_called_once_with(vpc.id)
+        self.subnet_service.get_first_subnet_from_vpc.assert_called_once_with(thread_sessions[2].Vpc.return_value)
+        kwargs = self.deploy_operation._create_deployment_parameters.call_args[1]
+        self.assertEqual(kwargs['image'], image)
+        self.assertEqual(kwargs['single_subnet'], subnet)
+        self.assertEqual(kwargs['security_group'], security_group)
+        self.assertEqual(res[DeployAMIOperation.DEPLOYMENT_PARAMETERS_TASK],
+                         self.deploy_operation._create_deployment_parameters.return_value)
+
+    def test_pre_launch_graph_does_not_look_up_single_subnet_when_connected_to_subnets(self):
+        self.deploy_operation._create_security_group_for_instance = Mock()
+        self.deploy_operation._get_image = Mock()
+        self.deploy_operation._get_sandbox_security_group_id = Mock()
+        self.deploy_operation._create_deployment_parameters = Mock()
+        network_action = ConnectSubnet()
+        network_action.actionParams = ConnectToSubnetParams()
+
+        self.deploy_operation._create_pre_launch_graph(
+            ec2_session=self.ec2_session, aws_ec2_resource_model=self.ec2_datamodel,
+            ami_deployment_model=Mock(), network_actions=[network_action], vpc=Mock(), key_pair='key',
+            reservation=Mock(), network_config_results=[], cancellation_context=None, logger=self.logger).run()
+
+        self.subnet_service.get_first_subnet_from_vpc.assert_not_called()
+        self.assertIsNone(self.deploy_operation._create_deployment_parameters.call_args[1]['single_subnet'])
+
+    def test_get_ami_credentials_in_background_starts_a_job_when_password_is_not_ready(self):
+        self.deploy_operation.windows_credentials_jobs = Mock()
+        self.credentials_manager.get_windows_credentials = Mock(return_value=None)
+        instance = Mock(platform='windows')
+        create_cloudshell_session = Mock()
+
+        res = self.deploy_operation._get_ami_credentials(s3_session=self.s3_session, key_pair_location='bucket',
+                                                         reservation=Mock(reservation_id='res'),
+                                                         wait_for_credentials=True, instance=instance,
+                                                         ami_deploy_action=Mock(), cancellation_context=Mock(),
+                                                         logger=self.logger, in_background=True,
+                                                         create_cloudshell_session=create_cloudshell_session)
+
+        self.assertIsNone(res)
+        key_value = self.key_pair.load_key_pair_by_name.return_value
+        self.credentials_manager.get_windows_credentials.assert_called_once_with(instance=instance,
+                                                                                 key_value=key_value,
+                                                                                 wait_for_password=False)
+        self.deploy_operation.windows_credentials_jobs.start.assert_called_once_with(
+            instance=instance, key_value=key_value, reservation_id='res',
+            create_cloudshell_session=create_cloudshell_session, logger=self.logger)
+
+    def test_get_ami_credentials_of_instance_claimed_from_the_warm_pool(self):
+        self.credentials_manager.get_windows_credentials = Mock()
+        instance = Mock(id='i-1', platform='windows')
+
+        self.deploy_operation._get_ami_credentials(s3_session=self.s3_session, key_pair_location='bucket',
+                                                   reservation=Mock(reservation_id='res'),
+                                                   wait_for_credentials=True, instance=instance,
+                                                   ami_deploy_action=Mock(), cancellation_context=Mock(),
+                                                   logger=self.logger, from_warm_pool=True)
+
+        self.key_pair.load_instance_key.assert_called_once_with(s3_session=self.s3_session, bucket_name='bucket',
+                                                                reservation_id='res', instance_id='i-1')
+        self.key_pair.load_key_pair_by_name.assert_not_called()
+        self.assertEqual(self.credentials_manager.get_windows_credentials.call_args[1]['key_value'],
+                         self.key_pair.load_instance_key.return_value)
+
+    def test_get_ami_credentials_in_background_returns_published_password(self):
+        self.deploy_operation.windows_credentials_jobs = Mock()
+        ami_credentials = Mock()
+        self.credentials_manager.get_windows_credentials = Mock(return_value=ami_credentials)
+
+        res = self.deploy_operation._get_ami_credentials(s3_session=self.s3_session, key_pair_location='bucket',
+                                                         reservation=Mock(), wait_for_credentials=True,
+                                                         instance=Mock(platform='windows'),
+                                                         ami_deploy_action=Mock(), cancellation_context=Mock(),
+                                                         logger=self.logger, in_background=True,
+                                                         create_cloudshell_session=Mock())
+
+        self.assertEqual(res, ami_credentials)
+        self.deploy_operation.windows_credentials_jobs.start.assert_not_called()
+
     def test_rollback(self):
         # prepare
         self.deploy_operation._extract_instance_id_on_cancellation = Mock()
-        inst_id = Mock()
+        inst_id = 'i-1'
         security_group = Mock()
         instance = Mock()
-        network_config_results = [Mock(public_ip='pub1'), Mock(public_ip='pub2')]
+        network_config_results = [Mock(public_ip='pub1'), Mock(public_ip='pub2'),
+                                  Mock(public_ip='pub3', is_elastic_ip=False)]
         self.deploy_operation.instance_service.get_instance_by_id = Mock(return_value=instance)
 
         # act
-        self.deploy_operation._rollback_deploy(ec2_session=self.ec2_session,
-                                               instance_id=inst_id,
-                                               custom_security_group=security_group,
-                                               network_config_results=network_config_results,
-                                               logger=self.logger)
+        report = self.deploy_operation._rollback_deploy(ec2_session=self.ec2_session,
+                                                        instance_id=inst_id,
+                                                        custom_security_group=security_group,
+                                                        network_config_results=network_config_results,
+                                                        logger=self.logger)
 
         # assert
         self.deploy_operation.instance_service.get_instance_by_id.assert_called_once_with(ec2_session=self.ec2_session,
                                                                                           id=inst_id)
-        self.deploy_operation.instance_service.terminate_instance.assert_called_once_with(instance=instance)
+        self.deploy_operation.instance_service.terminate_instances.assert_called_once_with([instance])
         self.deploy_operation.security_group_service.delete_security_group.assert_called_once_with(security_group)
         self.deploy_operation.elastic_ip_service.find_and_release_elastic_address.assert_has_calls(
                 [call(ec2_session=self.ec2_session, elastic_ip='pub1'),
                  call(ec2_session=self.ec2_session, elastic_ip='pub2')],
                 any_order=True)
+        self.assertEqual(self.deploy_operation.elastic_ip_service.find_and_release_elastic_address.call_count, 2)
+        self.assertTrue(report.succeeded)
+        self.assertEqual(report.terminated_instance_ids, [inst_id])
+        self.assertEqual(report.deleted_security_group_ids, [security_group.id])
+        self.assertEqual(sorted(report.released_elastic_ips), ['pub1', 'pub2'])
+
+    def test_rollback_deletes_security_group_after_termination(self):
+        order = []
+        self.deploy_operation.instance_service.terminate_instances = Mock(
+            side_effect=lambda instances: order.append('terminate'))
+        self.deploy_operation.security_group_service.delete_security_group = Mock(
+            side_effect=lambda security_group: order.append('delete security group'))
+
+        self.deploy_operation._rollback_deploy(ec2_session=self.ec2_session,
+                                               instance_id='i-1',
+                                               custom_security_group=Mock(),
+                                               network_config_results=[],
+                                               logger=self.logger)
+
+        self.assertEqual(order, ['terminate', 'delete security group'])
+
+    def test_rollback_continues_after_failed_step(self):
+        self.deploy_operation.instance_service.terminate_instances = Mock(side_effect=ValueError('terminate'))
+        network_config_results = [Mock(public_ip='pub1')]
+
+        report = self.deploy_operation._rollback_deploy(ec2_session=self.ec2_session,
+                                                        instance_id='i-1',
+                                                        custom_security_group=Mock(id='sg-1'),
+                                                        network_config_results=network_config_results,
+                                                        logger=self.logger)
+
+        self.assertFalse(report.succeeded)
+        self.assertEqual(report.released_elastic_ips, ['pub1'])
+        self.deploy_operation.security_group_service.delete_security_group.assert_not_called()
+        self.assertEqual(report.errors, ['terminate_instances failed: terminate',
+                                         'delete_security_group_sg-1 was skipped'])
+        self.logger.error.assert_called_once()
 
     def test_extract_instance_id_on_cancellation(self):
         # prepare
@@ -133,6 +336,8 @@ class TestDeployOperation(TestCase):
         # assert
         self.assertEqual(res[0].vmName, 'my name')
         self.assertEqual(res[0].deployedAppAdditionalData["inbound_ports"], ami_datamodel.inbound_ports)
+        self.assertIn('total', res[0].deployedAppAdditionalData['deploy_timing'])
+        self.assertIn('pre_launch', res[0].deployedAppAdditionalData['deploy_timing'])
         self.assertEqual(res[0].vmUuid, instance.instance_id)
         attributes = {attr.attributeName: attr.attributeValue for attr in res[0].deployedAppAttributes}
         self.assertEqual(attributes['Password'], ami_credentials.password)
@@ -159,7 +364,8 @@ class TestDeployOperation(TestCase):
                                                                       ec2_client=self.ec2_client,
                                                                       wait_for_status_check=ami_datamodel.wait_for_status_check,
                                                                       cancellation_context=cancellation_context,
-                                                                      logger=self.logger)
+                                                                      logger=self.logger,
+                                                                      phase_timer=ANY)
 
         self.deploy_operation.elastic_ip_service.set_elastic_ips.assert_called_once_with(
                 ec2_session=self.ec2_session,
@@ -230,7 +436,8 @@ class TestDeployOperation(TestCase):
                                                                       ec2_client=self.ec2_client,
                                                                       wait_for_status_check=ami_datamodel.wait_for_status_check,
                                                                       cancellation_context=cancellation_context,
-                                                                      logger=self.logger)
+                                                                      logger=self.logger,
+                                                                      phase_timer=ANY)
 
         self.deploy_operation.elastic_ip_service.set_elastic_ips.assert_called_once_with(
                 ec2_session=self.ec2_session,
@@ -243,6 +450,7 @@ class TestDeployOperation(TestCase):
 
     def _mock_deploy_operation(self, ami_deployment_info, network_config_results):
         self.deploy_operation._get_block_device_mappings = Mock()
+        self.deploy_operation._get_image = Mock()
         self.deploy_operation._create_deployment_parameters = Mock(return_value=ami_deployment_info)
         self.deploy_operation._populate_network_config_results_with_interface_data = Mock()
         self.deploy_operation._prepare_network_result_models = Mock(return_value=network_config_results)
@@ -418,11 +626,18 @@ class TestDeployOperation(TestCase):
                           network_config_results=Mock(),
                           logger=self.logger)
 
+    def test_get_image_not_available(self):
+        self.deploy_operation.image_metadata_cache = Mock()
+        self.deploy_operation.image_metadata_cache.get_image.return_value = None
+
+        self.assertRaises(ValueError, self.deploy_operation._get_image, self.ec2_session, 'ami-1')
+        self.deploy_operation.image_metadata_cache.get_image.assert_called_once_with(self.ec2_session.meta.client,
+                                                                                     'ami-1')
+
     def test_create_deployment_parameters_single_subnet(self):
-        image = Mock()
-        image.state = 'available'
         ec2_session = Mock()
-        ec2_session.Image = Mock(return_value=image)
+        ec2_session.meta.client.describe_images.return_value = {'Images': [{'ImageId': 'ami-1',
+                                                                            'State': 'available'}]}
         ami_model = Mock()
         ami_model.aws_ami_id = 'asd'
         ami_model.storage_size = '0'
@@ -451,10 +666,9 @@ class TestDeployOperation(TestCase):
         self.assertTrue(len(aws_model.network_interfaces) == 1)
 
     def test_create_deployment_parameters_no_iam_role(self):
-        image = Mock()
-        image.state = 'available'
         ec2_session = Mock()
-        ec2_session.Image = Mock(return_value=image)
+        ec2_session.meta.client.describe_images.return_value = {'Images': [{'ImageId': 'ami-1',
+                                                                            'State': 'available'}]}
         ami_model = Mock()
         ami_model.iam_role = ""
         ami_model.custom_tags = ""
@@ -477,10 +691,9 @@ class TestDeployOperation(TestCase):
         self.assertTrue(not any(aws_model.iam_role))  # not any(some_dict) => is empty dictionary
 
     def test_create_deployment_parameters_iam_role_not_arn(self):
-        image = Mock()
-        image.state = 'available'
         ec2_session = Mock()
-        ec2_session.Image = Mock(return_value=image)
+        ec2_session.meta.client.describe_images.return_value = {'Images': [{'ImageId': 'ami-1',
+                                                                            'State': 'available'}]}
         ami_model = Mock()
         ami_model.iam_role = "admin_role"
         ami_model.custom_tags = ""
@@ -504,10 +717,9 @@ class TestDeployOperation(TestCase):
         self.assertTrue(aws_model.iam_role['Name'] == ami_model.iam_role)
 
     def test_create_deployment_parameters_iam_role_arn(self):
-        image = Mock()
-        image.state = 'available'
         ec2_session = Mock()
-        ec2_session.Image = Mock(return_value=image)
+        ec2_session.meta.client.describe_images.return_value = {'Images': [{'ImageId': 'ami-1',
+                                                                            'State': 'available'}]}
         ami_model = Mock()
         network_actions = None
         ami_model.iam_role = "arn:aws:iam::admin_role"
@@ -641,6 +853,78 @@ class TestDeployOperation(TestCase):
         self.assertTrue('"Public IP": "pub1"' in dto1.interface)
         self.assertTrue('"MAC Address": "mac1"' in dto1.interface)
 
+    def test_claim_pooled_instance_shifts_the_device_indexes(self):
+        warm_instance_pool = Mock()
+        warm_instance_pool.is_enabled.return_value = True
+        warm_instance_pool.get_profile.return_value = 'profile'
+        self.deploy_operation.warm_instance_pool = warm_instance_pool
+        ami_deployment_model = Mock(user_data_url='', allocate_elastic_ip=False)
+        network_config_results = [DeployNetworkingResultModel('action1'), DeployNetworkingResultModel('action2')]
+        network_config_results[0].device_index = 0
+        network_config_results[1].device_index = 1
+
+        instance = self.deploy_operation._claim_pooled_instance(
+            ec2_session=self.ec2_session, ec2_client=self.ec2_client, s3_session=self.s3_session,
+            aws_ec2_cp_resource_model=self.ec2_datamodel, reservation_id='res-1',
+            ami_deployment_model=ami_deployment_model,
+            ami_deployment_info=Mock(), image=Mock(), network_config_results=network_config_results,
+            logger=self.logger, phase_timer=MagicMock(), create_aws_api=Mock())
+
+        self.assertEqual(instance, warm_instance_pool.claim.return_value)
+        self.assertEqual(warm_instance_pool.claim.call_args[1]['reservation_id'], 'res-1')
+        self.assertEqual([r.device_index for r in network_config_results], [1, 2])
+        warm_instance_pool.replenish_in_background.assert_called_once()
+
+    def test_claim_pooled_instance_launches_the_instance_when_the_claim_failed(self):
+        warm_instance_pool = Mock()
+        warm_instance_pool.is_enabled.return_value = True
+        warm_instance_pool.get_profile.return_value = 'profile'
+        warm_instance_pool.claim.side_effect = ValueError('claim')
+        self.deploy_operation.warm_instance_pool = warm_instance_pool
+        ami_deployment_model = Mock(user_data_url='', allocate_elastic_ip=False)
+        network_config_results = [DeployNetworkingResultModel('action1')]
+        network_config_results[0].device_index = 0
+
+        instance = self.deploy_operation._claim_pooled_instance(
+            ec2_session=self.ec2_session, ec2_client=self.ec2_client, s3_session=self.s3_session,
+            aws_ec2_cp_resource_model=self.ec2_datamodel, reservation_id='res-1',
+            ami_deployment_model=ami_deployment_model,
+            ami_deployment_info=Mock(), image=Mock(), network_config_results=network_config_results,
+            logger=self.logger, phase_timer=MagicMock(), create_aws_api=Mock())
+
+        self.assertIsNone(instance)
+        self.assertEqual(network_config_results[0].device_index, 0)
+        warm_instance_pool.replenish_in_background.assert_called_once()
+
+    def test_claim_pooled_instance_skips_deployments_with_user_data(self):
+        warm_instance_pool = Mock()
+        warm_instance_pool.is_enabled.return_value = True
+        self.deploy_operation.warm_instance_pool = warm_instance_pool
+        ami_deployment_model = Mock(user_data_url='http://script', allocate_elastic_ip=False)
+
+        instance = self.deploy_operation._claim_pooled_instance(
+            ec2_session=self.ec2_session, ec2_client=self.ec2_client, s3_session=self.s3_session,
+            aws_ec2_cp_resource_model=self.ec2_datamodel, reservation_id='res-1',
+            ami_deployment_model=ami_deployment_model,
+            ami_deployment_info=Mock(), image=Mock(), network_config_results=[], logger=self.logger,
+            phase_timer=MagicMock())
+
+        self.assertIsNone(instance)
+        warm_instance_pool.claim.assert_not_called()
+
+    def test_get_deployed_app_address_of_first_sandbox_interface(self):
+        instance = Mock(private_ip_address='10.0.0.5')
+        first_result = DeployNetworkingResultModel('action1')
+        first_result.device_index = 1
+        first_result.private_ip = '1.0.0.1'
+        second_result = DeployNetworkingResultModel('action2')
+        second_result.device_index = 2
+        second_result.private_ip = '1.0.1.1'
+
+        self.assertEqual(DeployAMIOperation._get_deployed_app_address(instance, [second_result, first_result]),
+                         '1.0.0.1')
+        self.assertEqual(DeployAMIOperation._get_deployed_app_address(instance, []), '10.0.0.5')
+
     def test_deploy_raised_no_vpc(self):
         # arrange
         my_vpc_service = Mock()
@@ -740,3 +1024,238 @@ class TestDeployOperation(TestCase):
         self.assertEquals(network_config_results[1].private_ip, "pri_ip_2")
         self.assertEquals(network_config_results[1].mac_address, "mac2")
         self.assertEquals(network_config_results[1].public_ip, "")
+
+    def _create_app_deployment(self, action_id, ami_id='ami-1', private_ip=None, wait_for_status_check=False):
+        ami_deployment_model = Mock(wait_for_status_check=wait_for_status_check, add_public_ip=False,
+                                    allocate_elastic_ip=False)
+        deploy_action = Mock(actionId=action_id)
+        deploy_action.actionParams.appName = 'app ' + action_id
+        deploy_action.actionParams.deployment.customModel = ami_deployment_model
+        app_deployment = AppDeployment(deploy_action, [])
+
+        ami_deployment_info = AMIDeploymentModel()
+        ami_deployment_info.aws_ami_id = ami_id
+        ami_deployment_info.private_ip_address = private_ip
+        ami_deployment_info.network_interfaces = [{'SubnetId': 'subnet-1', 'DeviceIndex': 0}]
+        app_deployment.test_ami_deployment_info = ami_deployment_info
+        return app_deployment
+
+    def _mock_deploy_many(self, app_deployments):
+        ami_deployment_infos = {app_deployment.ami_deployment_model: app_deployment.test_ami_deployment_info
+                                for app_deployment in app_deployments}
+        self.deploy_operation._create_security_group_for_instance = Mock(return_value=None)
+        self.deploy_operation._get_image = Mock()
+        self.deploy_operation._create_deployment_parameters = Mock(
+            side_effect=lambda **kwargs: ami_deployment_infos[kwargs['ami_deployment_model']])
+        self.deploy_operation._populate_network_config_results_with_interface_data = Mock()
+        self.deploy_operation._get_ami_credentials = Mock(return_value=None)
+        self.deploy_operation._rollback_deploy = Mock(return_value=RollbackReport())
+        self.instance_service.create_instances = Mock(
+            side_effect=lambda **kwargs: [Mock(id='i-' + name, instance_id='i-' + name,
+                                               tags=[{'Key': 'Name', 'Value': name}])
+                                          for name in kwargs['names']])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(return_value=[])
+
+    def _deploy_many(self, app_deployments, cancellation_context=None):
+        return self.deploy_operation.deploy_many(ec2_session=self.ec2_session,
+                                                 s3_session=self.s3_session,
+                                                 reservation=Mock(reservation_id='res'),
+                                                 aws_ec2_cp_resource_model=self.ec2_datamodel,
+                                                 app_deployments=app_deployments,
+                                                 ec2_client=self.ec2_client,
+                                                 cancellation_context=cancellation_context,
+                                                 logger=self.logger)
+
+    def test_deploy_many_launches_compatible_apps_together(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2')
+        app3 = self._create_app_deployment('3', ami_id='ami-2')
+        app4 = self._create_app_deployment('4', private_ip='10.0.0.4')
+        app5 = self._create_app_deployment('5', private_ip='10.0.0.4')
+        self._mock_deploy_many([app1, app2, app3, app4, app5])
+
+        res = self._deploy_many([app1, app2, app3, app4, app5])
+
+        self.vpc_service.find_vpc_for_reservation.assert_called_once()
+        self.key_pair.get_reservation_key_name.assert_called_once_with(reservation_id='res')
+        self.assertEqual([c[1]['names'] for c in self.instance_service.create_instances.call_args_list],
+                         [['app 1', 'app 2'], ['app 3'], ['app 4'], ['app 5']])
+        self.instance_service.wait_for_instances_to_run_in_aws.assert_called_once_with(
+            ec2_client=self.ec2_client,
+            instances=[app.instance for app in [app1, app2, app3, app4, app5]],
+            wait_for_status_check=False,
+            cancellation_context=None,
+            logger=self.logger)
+        self.instance_service.set_instances_names.assert_called_once_with(
+            ec2_client=self.ec2_client,
+            instances=[app.instance for app in [app1, app2, app3, app4, app5]],
+            names=['app 1', 'app 2', 'app 3', 'app 4', 'app 5'])
+        self.assertEqual([r.actionId for r in res], ['1', '2', '3', '4', '5'])
+        self.assertTrue(all(r.success for r in res))
+        self.assertEqual(res[0].vmUuid, 'i-app 1')
+        self.deploy_operation._rollback_deploy.assert_not_called()
+
+    def test_deploy_many_rolls_back_failed_app_only(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2', ami_id='ami-2')
+        self._mock_deploy_many([app1, app2])
+        self.elastic_ip_service.set_elastic_ips = Mock(
+            side_effect=lambda **kwargs: self._raise_for_instance(kwargs['instance'], app2.instance))
+
+        res = self._deploy_many([app1, app2])
+
+        self.assertTrue(res[0].success)
+        self.assertFalse(res[1].success)
+        self.assertEqual(res[1].actionId, '2')
+        self.assertEqual(res[1].errorMessage, 'no elastic ip')
+        self.deploy_operation._rollback_deploy.assert_called_once_with(
+            ec2_session=self.ec2_session,
+            instance_id='i-app 2',
+            custom_security_group=None,
+            network_config_results=app2.network_config_results,
+            logger=self.logger)
+
+    @staticmethod
+    def _raise_for_instance(instance, failing_instance):
+        if instance is failing_instance:
+            raise ValueError('no elastic ip')
+
+    def test_deploy_many_fails_all_apps_of_a_failed_launch(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2')
+        app3 = self._create_app_deployment('3', ami_id='ami-2')
+        self._mock_deploy_many([app1, app2, app3])
+        create_instances = self.instance_service.create_instances.side_effect
+
+        def create_instances_of_second_ami(**kwargs):
+            if kwargs['ami_deployment_info'].aws_ami_id == 'ami-1':
+                raise ValueError('InsufficientInstanceCapacity')
+            return create_instances(**kwargs)
+
+        self.instance_service.create_instances.side_effect = create_instances_of_second_ami
+
+        res = self._deploy_many([app1, app2, app3])
+
+        self.assertEqual([r.success for r in res], [False, False, True])
+        self.assertEqual(self.deploy_operation._rollback_deploy.call_count, 2)
+        self.assertEqual(self.instance_service.wait_for_instances_to_run_in_aws.call_args[1]['instances'],
+                         [app3.instance])
+
+    def test_deploy_many_fails_impaired_apps(self):
+        app1 = self._create_app_deployment('1', wait_for_status_check=True)
+        app2 = self._create_app_deployment('2', wait_for_status_check=True)
+        app3 = self._create_app_deployment('3')
+        self._mock_deploy_many([app1, app2, app3])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(side_effect=[[], ['i-app 2']])
+
+        res = self._deploy_many([app1, app2, app3])
+
+        self.assertEqual([r.success for r in res], [True, False, True])
+        status_check_call = self.instance_service.wait_for_instances_to_run_in_aws.call_args_list[1]
+        self.assertEqual(status_check_call[1]['instances'], [app1.instance, app2.instance])
+        self.assertTrue(status_check_call[1]['wait_for_status_check'])
+        self.assertEqual(self.deploy_operation._rollback_deploy.call_args[1]['instance_id'], 'i-app 2')
+
+    def test_deploy_many_fails_the_launched_apps_when_the_wait_failed(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2')
+        self._mock_deploy_many([app1, app2])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(side_effect=TimeoutError('Timeout'))
+
+        res = self._deploy_many([app1, app2])
+
+        self.assertEqual([r.actionId for r in res], ['1', '2'])
+        self.assertEqual([r.success for r in res], [False, False])
+        self.assertEqual(res[0].errorMessage, 'Timeout')
+        self.assertEqual([c[1]['instance_id'] for c in self.deploy_operation._rollback_deploy.call_args_list],
+                         ['i-app 1', 'i-app 2'])
+        self.deploy_operation._get_ami_credentials.assert_not_called()
+
+    def test_deploy_many_fails_only_the_status_checked_apps_when_the_status_check_wait_failed(self):
+        app1 = self._create_app_deployment('1', wait_for_status_check=True)
+        app2 = self._create_app_deployment('2')
+        self._mock_deploy_many([app1, app2])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(side_effect=[[], TimeoutError('Timeout')])
+
+        res = self._deploy_many([app1, app2])
+
+        self.assertEqual([r.success for r in res], [False, True])
+        self.deploy_operation._rollback_deploy.assert_called_once()
+        self.assertEqual(self.deploy_operation._rollback_deploy.call_args[1]['instance_id'], 'i-app 1')
+
+    def test_deploy_many_fails_only_the_app_whose_credentials_failed(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2')
+        self._mock_deploy_many([app1, app2])
+        credentials = Mock()
+        self.deploy_operation._get_ami_credentials = Mock(
+            side_effect=lambda **kwargs: self._raise_for_instance(kwargs['instance'], app2.instance) or credentials)
+
+        res = self._deploy_many([app1, app2])
+
+        self.assertEqual(self.deploy_operation._get_ami_credentials.call_count, 2)
+        self.assertTrue(res[0].success)
+        self.assertFalse(res[1].success)
+        self.assertEqual(res[1].errorMessage, 'no elastic ip')
+        self.deploy_operation._rollback_deploy.assert_called_once_with(
+            ec2_session=self.ec2_session,
+            instance_id='i-app 2',
+            custom_security_group=None,
+            network_config_results=app2.network_config_results,
+            logger=self.logger)
+
+    def test_deploy_many_rolls_back_all_apps_on_cancellation_while_getting_credentials(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2')
+        self._mock_deploy_many([app1, app2])
+        self.deploy_operation._get_ami_credentials = Mock(
+            side_effect=CancellationException('Command was cancelled', {}))
+        self.deploy_operation._rollback = Mock()
+
+        self.assertRaises(CancellationException, self._deploy_many, [app1, app2])
+
+        self.deploy_operation._rollback.assert_called_once()
+        self.assertEqual(self.deploy_operation._rollback.call_args[1]['instance_ids'], ['i-app 1', 'i-app 2'])
+
+    def test_deploy_many_rolls_back_all_apps_on_cancellation(self):
+        app1 = self._create_app_deployment('1')
+        app2 = self._create_app_deployment('2')
+        self._mock_deploy_many([app1, app2])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(
+            side_effect=CancellationException('Command was cancelled', {}))
+
+        self.deploy_operation._rollback = Mock()
+
+        self.assertRaises(CancellationException, self._deploy_many, [app1, app2])
+
+        self.deploy_operation._rollback_deploy.assert_not_called()
+        self.deploy_operation._rollback.assert_called_once()
+        self.assertEqual(self.deploy_operation._rollback.call_args[1]['instance_ids'], ['i-app 1', 'i-app 2'])
+
+    def test_deploy_many_attaches_the_rollback_errors_to_the_cancellation(self):
+        app1 = self._create_app_deployment('1')
+        self._mock_deploy_many([app1])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(
+            side_effect=CancellationException('Command was cancelled', {}))
+        report = RollbackReport()
+        report.errors.append('terminate_instances failed: timeout')
+        self.deploy_operation._rollback = Mock(return_value=report)
+
+        with self.assertRaises(CancellationException) as context:
+            self._deploy_many([app1])
+
+        self.assertEqual(context.exception.rollback_errors, report.errors)
+
+    def test_deploy_many_reports_the_rollback_errors_of_a_failed_app(self):
+        app1 = self._create_app_deployment('1')
+        self._mock_deploy_many([app1])
+        self.instance_service.wait_for_instances_to_run_in_aws = Mock(side_effect=TimeoutError('Timeout'))
+        report = RollbackReport()
+        report.errors.append('terminate_instances failed: timeout')
+        report.errors.append('delete_security_group_sg-1 was skipped')
+        self.deploy_operation._rollback_deploy = Mock(return_value=report)
+
+        res = self._deploy_many([app1])
+
+        self.assertEqual(res[0].errorMessage, 'Timeout. Rollback did not complete: terminate_instances failed: '
+                                              'timeout; delete_security_group_sg-1 was skipped')
@@ -25,6 +25,7 @@ class TestRefreshIpOperation(TestCase):
         instance = Mock()
         instance.private_ip_address = "1.0.0.1"
         instance.public_ip_address = "2.0.0.1"
+        instance.tags = []
 
         attr_name = "Public IP"
         attribute = Mock()
@@ -54,6 +55,7 @@ class TestRefreshIpOperation(TestCase):
         instance = Mock()
         instance.private_ip_address = "1.0.0.1"
         instance.public_ip_address = "2.0.0.1"
+        instance.tags = []
 
         attr_name = "afd.Public IP"
         attribute = Mock()
@@ -73,4 +75,28 @@ class TestRefreshIpOperation(TestCase):
         self.cloudshell_session.UpdateResourceAddress.assert_called_with(resource_name, instance.private_ip_address)
 
         self.cloudshell_session.SetAttributeValue.assert_called_with(resource_name, attr_name,
-                                                                     instance.public_ip_address)
\ No newline at end of file
+                                                                     instance.public_ip_address)
+
+    def test_refresh_ip_of_instance_claimed_from_warm_pool(self):
+        resource_name = "deployed resource"
+        instance = Mock()
+        instance.private_ip_address = "10.0.0.5"
+        instance.public_ip_address = "3.0.0.1"
+        instance.tags = [{'Key': 'WarmPool', 'Value': 'Claimed'}]
+        instance.network_interfaces_attribute = [
+            {"Attachment": {"DeviceIndex": 1}, "PrivateIpAddress": "1.0.0.1",
+             "Association": {"PublicIp": "2.0.0.1"}},
+            {"Attachment": {"DeviceIndex": 0}, "PrivateIpAddress": "10.0.0.5",
+             "Association": {"PublicIp": "3.0.0.1"}}]
+        self.instance_service.get_active_instance_by_id = Mock(return_value=instance)
+
+        self.refresh_ip_operation.refresh_ip(cloudshell_session=self.cloudshell_session,
+                                             ec2_session=self.ec2_session,
+                                             deployed_instance_id="some instance id",
+                                             public_ip_on_resource="",
+                                             public_ip_attribute_name="Public IP",
+                                             private_ip_on_resource="10.0.0.5",
+                                             resource_fullname=resource_name)
+
+        self.cloudshell_session.UpdateResourceAddress.assert_called_with(resource_name, "1.0.0.1")
+        self.cloudshell_session.SetAttributeValue.assert_called_with(resource_name, "Public IP", "2.0.0.1")
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from cloudshell.cp.core.models import DeployApp
+from cloudshell.cp.core.models import DeployApp, ConnectSubnet
 from mock import Mock, patch
 
 from cloudshell.cp.aws.aws_shell import AWSShell
@@ -73,7 +73,12 @@ class TestAWSShell(TestCase):
 
 
         self.assertEqual(res, result)
+        create_aws_api = self.aws_shell.deploy_ami_operation.deploy.call_args[1]['create_aws_api']
+        self.assertEqual(create_aws_api.args, (self.expected_shell_context,))
+        create_cloudshell_session = self.aws_shell.deploy_ami_operation.deploy.call_args[1]['create_cloudshell_session']
+        self.assertEqual(create_cloudshell_session.args, (self.command_context,))
         self.aws_shell.deploy_ami_operation.deploy.assert_called_with(
+                create_aws_api=create_aws_api,
                 ec2_session=self.expected_shell_context.aws_api.ec2_session,
                 s3_session=self.expected_shell_context.aws_api.s3_session,
                 name=deploy_app.actionParams.appName,
@@ -83,12 +88,100 @@ class TestAWSShell(TestCase):
                 network_actions=[],
                 ec2_client=self.expected_shell_context.aws_api.ec2_client,
                 cancellation_context=cancellation_context,
-                logger=self.expected_shell_context.logger)
+                logger=self.expected_shell_context.logger,
+                create_cloudshell_session=create_cloudshell_session)
+
+    def test_deploy_ami_batch_returns_deploy_results(self):
+        cancellation_context = Mock()
+        result = Mock()
+        self.aws_shell.deploy_ami_operation.deploy_many = Mock(return_value=result)
+        app_deployments = Mock()
+        self.aws_shell._get_app_deployments = Mock(return_value=app_deployments)
+        actions = Mock()
+
+        with patch('cloudshell.cp.aws.aws_shell.AwsShellContext') as shell_context:
+            shell_context.return_value = self.mock_context
+
+            res = self.aws_shell.deploy_ami_batch(self.command_context, actions, cancellation_context)
+
+        self.assertEqual(res, result)
+        self.aws_shell._get_app_deployments.assert_called_once_with(actions)
+        create_cloudshell_session = \
+            self.aws_shell.deploy_ami_operation.deploy_many.call_args[1]['create_cloudshell_session']
+        self.assertEqual(create_cloudshell_session.args, (self.command_context,))
+        self.aws_shell.deploy_ami_operation.deploy_many.assert_called_once_with(
+                ec2_session=self.expected_shell_context.aws_api.ec2_session,
+                s3_session=self.expected_shell_context.aws_api.s3_session,
+                reservation=self.reservation_model,
+                aws_ec2_cp_resource_model=self.expected_shell_context.aws_ec2_resource_model,
+                app_deployments=app_deployments,
+                ec2_client=self.expected_shell_context.aws_api.ec2_client,
+                cancellation_context=cancellation_context,
+                logger=self.expected_shell_context.logger,
+                create_cloudshell_session=create_cloudshell_session)
+
+    def test_create_cloudshell_session(self):
+        self.aws_shell.cloudshell_session_helper = Mock()
+
+        res = self.aws_shell._create_cloudshell_session(self.command_context)
+
+        self.assertEqual(res, self.aws_shell.cloudshell_session_helper.get_session.return_value)
+        self.aws_shell.cloudshell_session_helper.get_session.assert_called_once_with(
+            server_address=self.command_context.connectivity.server_address,
+            token=self.command_context.connectivity.admin_auth_token,
+            reservation_domain=self.command_context.reservation.domain)
+
+    def _create_deploy_app(self, app_name):
+        deploy_app = DeployApp()
+        deploy_app.actionParams = Mock(appName=app_name)
+        return deploy_app
+
+    def _create_connect_subnet(self, action_id, target_name=None):
+        connect_subnet = ConnectSubnet()
+        connect_subnet.actionId = action_id
+        if target_name:
+            connect_subnet.actionTarget = Mock(fullName=target_name)
+        return connect_subnet
+
+    def test_get_app_deployments_matches_network_actions_by_target(self):
+        app1 = self._create_deploy_app('app1')
+        app2 = self._create_deploy_app('app2')
+        subnet1 = self._create_connect_subnet('1', 'app2')
+        subnet2 = self._create_connect_subnet('2', 'app1')
+        subnet3 = self._create_connect_subnet('3', 'app2')
+
+        res = self.aws_shell._get_app_deployments([app1, subnet1, app2, subnet2, subnet3])
+
+        self.assertEqual([r.deploy_action for r in res], [app1, app2])
+        self.assertEqual(res[0].network_actions, [subnet2])
+        self.assertEqual(res[1].network_actions, [subnet1, subnet3])
+
+    def test_get_app_deployments_of_single_app_does_not_need_targets(self):
+        app = self._create_deploy_app('app')
+        subnet = self._create_connect_subnet('1')
+
+        res = self.aws_shell._get_app_deployments([app, subnet])
+
+        self.assertEqual(res[0].network_actions, [subnet])
+
+    def test_get_app_deployments_invalid_requests(self):
+        app1 = self._create_deploy_app('app1')
+        app2 = self._create_deploy_app('app2')
+
+        self.assertRaises(ValueError, self.aws_shell._get_app_deployments, [])
+        self.assertRaises(ValueError, self.aws_shell._get_app_deployments,
+                          [app1, app2, self._create_connect_subnet('1')])
+        self.assertRaises(ValueError, self.aws_shell._get_app_deployments,
+                          [app1, app2, self._create_connect_subnet('1', 'app3')])
+        self.assertRaises(ValueError, self.aws_shell._get_app_deployments,
+                          [app1, self._create_deploy_app('app1')])
 
     def test_cleanup_connectivity(self):
         # prepare
         req = '{"driverRequest": {"actions": [{"type": "cleanupNetwork", "actionId": "ba7d54a5-79c3-4b55-84c2-d7d9bdc19356"}]}}'
         self.aws_shell.clean_up_operation.cleanup = Mock(return_value=True)
+        self.aws_shell.clean_up_operation.resume_async_cleanups = Mock()
+        self.expected_shell_context.aws_ec2_resource_model.async_cleanup = False
         actions_mock = Mock()
         result = None
 
@@ -109,6 +202,81 @@ class TestAWSShell(TestCase):
                 logger=self.expected_shell_context.logger)
         self.assertEquals(result, '{"driverResponse": {"actionResults": [true]}}')
 
+    def test_cleanup_connectivity_async(self):
+        self.aws_shell.clean_up_operation.cleanup_async = Mock(return_value=True)
+        self.aws_shell.clean_up_operation.resume_async_cleanups = Mock()
+        self.aws_shell.aws_session_manager.create_dedicated_clients = Mock()
+        self.expected_shell_context.aws_ec2_resource_model.async_cleanup = True
+        actions_mock = Mock()
+
+        with patch('cloudshell.cp.aws.aws_shell.AwsShellContext') as shell_context:
+            shell_context.return_value = self.mock_context
+            result = self.aws_shell.cleanup_connectivity(self.command_context, actions_mock)
+
+        resume_kwargs = self.aws_shell.clean_up_operation.resume_async_cleanups.call_args[1]
+        self.assertEqual(resume_kwargs['aws_ec2_data_model'], self.expected_shell_context.aws_ec2_resource_model)
+        self.assertEqual(resume_kwargs['cloud_provider'], self.command_context.resource.name)
+        cleanup_kwargs = self.aws_shell.clean_up_operation.cleanup_async.call_args[1]
+        self.assertEqual(cleanup_kwargs['aws_ec2_data_model'], self.expected_shell_context.aws_ec2_resource_model)
+        self.assertEqual(cleanup_kwargs['reservation_id'], self.command_context.reservation.reservation_id)
+        self.assertEqual(cleanup_kwargs['cloud_provider'], self.command_context.resource.name)
+        self.assertEqual(cleanup_kwargs['actions'], actions_mock)
+        self.assertEquals(result, '{"driverResponse": {"actionResults": [true]}}')
+
+        # the background cleanup gets clients of its own session rather than the cached clients of the command
+        self.assertIs(cleanup_kwargs['create_aws_api'](),
+                      self.aws_shell.aws_session_manager.create_dedicated_clients.return_value)
+        self.aws_shell.aws_session_manager.create_dedicated_clients.assert_called_once_with(
+            self.expected_shell_context.cloudshell_session, self.expected_shell_context.aws_ec2_resource_model)
+
+    def test_get_cleanup_status(self):
+        self.aws_shell.clean_up_operation.get_cleanup_status = Mock(return_value={'status': 'pending'})
+        self.aws_shell.clean_up_operation.resume_async_cleanups = Mock()
+
+        with patch('cloudshell.cp.aws.aws_shell.AwsShellContext') as shell_context:
+            shell_context.return_value = self.mock_context
+            result = self.aws_shell.get_cleanup_status(self.command_context, 'res-1')
+
+        self.aws_shell.clean_up_operation.get_cleanup_status.assert_called_once_with(
+            self.expected_shell_context.aws_ec2_resource_model, 'res-1')
+        self.assertEqual(result, '{"status": "pending"}')
+
+    def test_get_cleanup_status_when_resuming_the_cleanups_failed(self):
+        self.aws_shell.clean_up_operation.get_cleanup_status = Mock(return_value={'status': 'pending'})
+        self.aws_shell.clean_up_operation.resume_async_cleanups = Mock(side_effect=IOError('journal'))
+
+        with patch('cloudshell.cp.aws.aws_shell.AwsShellContext') as shell_context:
+            shell_context.return_value = self.mock_context
+            result = self.aws_shell.get_cleanup_status(self.command_context, 'res-1')
+
+        self.assertEqual(result, '{"status": "pending"}')
+        self.expected_shell_context.logger.exception.assert_called_once()
+
+    def test_sweep_orphaned_resources(self):
+        self.aws_shell.sweep_operation.sweep = Mock(return_value={'orphans': {}})
+        self.expected_shell_context.cloudshell_session.GetCurrentReservations.return_value.Reservations = \
+            [Mock(Id='res-1'), Mock(Id='res-2')]
+
+        with patch('cloudshell.cp.aws.aws_shell.AwsShellContext') as shell_context:
+            shell_context.return_value = self.mock_context
+            result = self.aws_shell.sweep_orphaned_resources(self.command_context, dry_run=False,
+                                                             reservation_ids=['res-3'], min_age=3600)
+
+        self.aws_shell.sweep_operation.sweep.assert_called_once_with(
+                ec2_client=self.expected_shell_context.aws_api.ec2_client,
+                ec2_session=self.expected_shell_context.aws_api.ec2_session,
+                s3_session=self.expected_shell_context.aws_api.s3_session,
+                aws_ec2_data_model=self.expected_shell_context.aws_ec2_resource_model,
+                active_reservation_ids=['res-1', 'res-2'],
+                cloud_provider=self.command_context.resource.name,
+                cloud_provider_owner='{0}/{1}'.format(self.command_context.connectivity.server_address,
+                                                      self.command_context.resource.name),
+                dry_run=False,
+                logger=self.expected_shell_context.logger,
+                reservation_ids=['res-3'],
+                min_age=3600)
+        self.assertEqual(result, '{"orphans": {}}')
+
     def test_prepare_connectivity(self):
         # Assert
         cancellation_context = Mock()
@@ -132,7 +300,9 @@ class TestAWSShell(TestCase):
                     aws_ec2_datamodel=self.expected_shell_context.aws_ec2_resource_model,
                     actions=actions_mock,
                     cancellation_context=cancellation_context,
-                    logger=self.expected_shell_context.logger)
+                    logger=self.expected_shell_context.logger,
+                    cloud_provider_owner='{0}/{1}'.format(self.command_context.connectivity.server_address,
+                                                          self.command_context.resource.name))
             self.assertEqual(res, True)
 
     def test_delete_instance(self):
@@ -216,7 +386,9 @@ class TestAWSShell(TestCase):
             ec2_session=self.expected_shell_context.aws_api.ec2_session,
             instance_id='instance_id',
             resource=remote_resource,
-            allow_all_storage_traffic='True'
+            allow_all_storage_traffic='True',
+            region=self.expected_shell_context.aws_ec2_resource_model.region,
+            reservation_id=self.command_context.reservation.reservation_id
         )
 
     def test_get_access_key(self):
@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import TimeoutError
+from unittest import TestCase
+
+from cloudshell.cp.aws.domain.common.cleanup_journal import CleanupJournal
+
+
+class TestCleanupJournal(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = CleanupJournal(os.path.join(self.directory, 'journal'), owner_timeout=60, lock_timeout=0.1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_add_creates_pending_entry(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        entry = self.journal.get('res-1')
+        self.assertEqual(entry['status'], CleanupJournal.PENDING)
+        self.assertEqual(entry['cloud_provider'], 'aws')
+        self.assertEqual(entry['region'], 'us-east-1')
+        self.assertEqual(entry['attempts'], 0)
+
+    def test_get_missing_entry(self):
+        self.assertIsNone(self.journal.get('res-1'))
+
+    def test_update(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        self.journal.update('res-1', attempts=1, errors={'vpc vpc-1': 'error'})
+
+        entry = self.journal.get('res-1')
+        self.assertEqual(entry['attempts'], 1)
+        self.assertEqual(entry['errors'], {'vpc vpc-1': 'error'})
+        self.assertFalse(os.path.exists(self.journal._get_path('res-1') + CleanupJournal.TEMP_FILE_EXTENSION))
+
+    def test_update_missing_entry(self):
+        self.assertRaises(ValueError, self.journal.update, 'res-1', attempts=1)
+
+    def test_entries_survive_a_new_journal(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        self.assertEqual(CleanupJournal(self.journal.directory).get('res-1')['reservation_id'], 'res-1')
+
+    def test_get_pending_of_cloud_provider(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self.journal.add('res-2', 'aws', 'us-east-1')
+        self.journal.add('res-3', 'other aws', 'us-east-1')
+        self.journal.update('res-2', status=CleanupJournal.COMPLETED)
+
+        self.assertEqual([entry['reservation_id'] for entry in self.journal.get_pending('aws')], ['res-1'])
+
+    def test_get_pending_without_directory(self):
+        self.assertEqual(self.journal.get_pending('aws'), [])
+
+    def test_read_falls_back_to_interrupted_write(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        path = self.journal._get_path('res-1')
+        os.rename(path, path + CleanupJournal.TEMP_FILE_EXTENSION)
+
+        self.assertEqual(self.journal.get('res-1')['reservation_id'], 'res-1')
+        self.assertEqual(len(self.journal.get_pending('aws')), 1)
+
+    def test_update_moves_finished_entry(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        self.journal.update('res-1', status=CleanupJournal.COMPLETED)
+
+        self.assertFalse(os.path.exists(self.journal._get_path('res-1')))
+        self.assertTrue(os.path.exists(self.journal._get_path('res-1', finished=True)))
+        self.assertEqual(self.journal.get('res-1')['status'], CleanupJournal.COMPLETED)
+        self.assertRaises(ValueError, self.journal.update, 'res-1', status=CleanupJournal.FAILED)
+
+    def test_add_starts_a_finished_cleanup_over(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self.journal.update('res-1', status=CleanupJournal.FAILED)
+
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        self.assertFalse(os.path.exists(self.journal._get_path('res-1', finished=True)))
+        self.assertEqual(self.journal.get('res-1')['status'], CleanupJournal.PENDING)
+
+    def test_update_prunes_expired_finished_entries(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self.journal.add('res-2', 'aws', 'us-east-1')
+        self.journal.update('res-1', status=CleanupJournal.COMPLETED)
+        expired = self.journal._get_path('res-1', finished=True)
+        os.utime(expired, (0, 0))
+
+        self.journal.update('res-2', status=CleanupJournal.COMPLETED)
+
+        self.assertFalse(os.path.exists(expired))
+        self.assertIsNone(self.journal.get('res-1'))
+        self.assertEqual(self.journal.get('res-2')['status'], CleanupJournal.COMPLETED)
+
+    def test_add_owns_the_entry(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        self.assertEqual(self.journal.get('res-1')['owner'], self.journal.owner)
+        self.assertIn('res-1', self.journal._owned)
+        self.assertFalse(os.path.exists(os.path.join(self.journal.directory,
+                                                     'res-1' + CleanupJournal.LOCK_FILE_EXTENSION)))
+
+    def test_acquire_entry_of_a_live_owner(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        other_journal = self._other_process_journal()
+
+        self.assertIsNone(other_journal.acquire('res-1'))
+        self.assertRaises(ValueError, other_journal.update, 'res-1', attempts=1)
+
+    def test_acquire_entry_of_a_stale_owner(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self.journal.release('res-1')
+        self._set_heartbeat('res-1', time.time() - 120)
+        other_journal = self._other_process_journal()
+
+        entry = other_journal.acquire('res-1')
+
+        self.assertEqual(entry['owner'], other_journal.owner)
+        self.assertEqual(self.journal.get('res-1')['owner'], other_journal.owner)
+        self.assertRaises(ValueError, self.journal.update, 'res-1', attempts=1)
+
+    def test_acquire_own_entry(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self.journal.release('res-1')
+
+        self.assertEqual(self.journal.acquire('res-1')['reservation_id'], 'res-1')
+        self.assertIn('res-1', self.journal._owned)
+
+    def test_acquire_finished_entry(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self.journal.update('res-1', status=CleanupJournal.COMPLETED)
+
+        self.assertIsNone(self.journal.acquire('res-1'))
+        self.assertNotIn('res-1', self.journal._owned)
+
+    def test_beat_refreshes_the_heartbeat(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self._set_heartbeat('res-1', 0)
+
+        self.journal._beat('res-1')
+
+        self.assertGreater(self.journal.get('res-1')['heartbeat'], 0)
+        self.assertIn('res-1', self.journal._owned)
+
+    def test_beat_releases_the_entry_resumed_by_another_process(self):
+        self.journal.add('res-1', 'aws', 'us-east-1')
+        self._set_heartbeat('res-1', 0)
+        self._other_process_journal().acquire('res-1')
+
+        self.journal._beat('res-1')
+
+        self.assertNotIn('res-1', self.journal._owned)
+
+    def test_entry_lock_timeout(self):
+        lock_path = os.path.join(self.journal.directory, 'res-1' + CleanupJournal.LOCK_FILE_EXTENSION)
+        os.makedirs(self.journal.directory)
+        open(lock_path, 'w').close()
+
+        self.assertRaises(TimeoutError, self.journal.add, 'res-1', 'aws', 'us-east-1')
+
+    def test_entry_lock_removes_stale_lock(self):
+        lock_path = os.path.join(self.journal.directory, 'res-1' + CleanupJournal.LOCK_FILE_EXTENSION)
+        os.makedirs(self.journal.directory)
+        open(lock_path, 'w').close()
+        os.utime(lock_path, (0, 0))
+
+        self.journal.add('res-1', 'aws', 'us-east-1')
+
+        self.assertFalse(os.path.exists(lock_path))
+        self.assertEqual(self.journal.get('res-1')['status'], CleanupJournal.PENDING)
+
+    def _other_process_journal(self):
+        journal = CleanupJournal(self.journal.directory, owner_timeout=60, lock_timeout=0.1)
+        journal.owner = 'other-host/1'
+        return journal
+
+    def _set_heartbeat(self, reservation_id, heartbeat):
+        entry = self.journal.get(reservation_id)
+        entry['heartbeat'] = heartbeat
+        self.journal._write(entry)
@@ -0,0 +1,121 @@
+import threading
+from unittest import TestCase
+
+from botocore.exceptions import ClientError
+from mock import Mock
+
+from cloudshell.cp.aws.domain.common.image_metadata_cache import ImageMetadataCache
+from cloudshell.cp.aws.models.aws_api import AwsApiClients
+
+
+class TestImageMetadataCache(TestCase):
+    def setUp(self):
+        self.cache = ImageMetadataCache()
+        self.ec2_client = Mock()
+        self.ec2_client.meta.region_name = 'us-east-1'
+        self.ec2_client.describe_images.return_value = {'Images': [self._description('available')]}
+
+    @staticmethod
+    def _description(state):
+        return {'ImageId': 'ami-1',
+                'State': state,
+                'Platform': 'windows',
+                'RootDeviceName': '/dev/sda1',
+                'BlockDeviceMappings': [{'DeviceName': '/dev/sda1', 'Ebs': {'VolumeSize': 30}}]}
+
+    def test_get_image_describes_the_image_once(self):
+        image = self.cache.get_image(self.ec2_client, 'ami-1')
+        self.cache.get_image(self.ec2_client, 'ami-1')
+
+        self.ec2_client.describe_images.assert_called_once_with(ImageIds=['ami-1'])
+        self.assertEqual(image.state, 'available')
+        self.assertEqual(image.platform, 'windows')
+        self.assertEqual(image.root_device_name, '/dev/sda1')
+        self.assertEqual(image.block_device_mappings[0]['Ebs']['VolumeSize'], 30)
+
+    def test_get_image_returns_a_copy(self):
+        self.cache.get_image(self.ec2_client, 'ami-1').block_device_mappings[0]['Ebs']['VolumeSize'] = 100
+
+        self.assertEqual(self.cache.get_image(self.ec2_client, 'ami-1').block_device_mappings[0]['Ebs']['VolumeSize'],
+                         30)
+
+    def test_get_image_of_another_region(self):
+        other_region_client = Mock()
+        other_region_client.meta.region_name = 'eu-west-1'
+        other_region_client.describe_images.return_value = {'Images': [self._description('available')]}
+
+        self.cache.get_image(self.ec2_client, 'ami-1')
+        self.cache.get_image(other_region_client, 'ami-1')
+
+        other_region_client.describe_images.assert_called_once()
+
+    def test_get_image_of_another_account(self):
+        other_account_client = Mock()
+        other_account_client.meta.region_name = 'us-east-1'
+        AwsApiClients.register_client(other_account_client, 'other key id')
+        other_account_client.describe_images.side_effect = \
+            ClientError({'Error': {'Code': 'InvalidAMIID.NotFound'}}, 'DescribeImages')
+
+        self.assertIsNotNone(self.cache.get_image(self.ec2_client, 'ami-1'))
+        self.assertIsNone(self.cache.get_image(other_account_client, 'ami-1'))
+
+        other_account_client.describe_images.assert_called_once()
+
+    def test_get_images_are_described_concurrently(self):
+        image_describing = threading.Event()
+        other_image_described = threading.Event()
+        waits = []
+
+        def describe_images(ImageIds):
+            if ImageIds == ['ami-1']:
+                image_describing.set()
+                # blocks until the other AMI was described meanwhile
+                waits.append(other_image_described.wait(5))
+            else:
+                other_image_described.set()
+            return {'Images': [self._description('available')]}
+
+        self.ec2_client.describe_images.side_effect = describe_images
+        thread = threading.Thread(target=self.cache.get_image, args=(self.ec2_client, 'ami-1'))
+        thread.start()
+        image_describing.wait(5)
+
+        self.cache.get_image(self.ec2_client, 'ami-2')
+        thread.join()
+
+        self.assertEqual(waits, [True])
+        self.assertEqual(self.cache._key_locks, {})
+
+    def test_get_missing_image_is_cached(self):
+        self.ec2_client.describe_images.side_effect = \
+            ClientError({'Error': {'Code': 'InvalidAMIID.NotFound'}}, 'DescribeImages')
+
+        self.assertIsNone(self.cache.get_image(self.ec2_client, 'ami-1'))
+        self.assertIsNone(self.cache.get_image(self.ec2_client, 'ami-1'))
+        self.ec2_client.describe_images.assert_called_once()
+
+    def test_get_not_available_image_is_cached_for_a_shorter_time(self):
+        now = [0]
+        self.cache = ImageMetadataCache(ttl=100, missing_image_ttl=10)
+        for cache in (self.cache._images, self.cache._missing_images):
+            cache._timer = lambda: now[0]
+        self.ec2_client.describe_images.side_effect = [{'Images': [self._description('pending')]},
+                                                       {'Images': [self._description('available')]}]
+
+        self.assertIsNone(self.cache.get_image(self.ec2_client, 'ami-1'))
+        now[0] = 11
+        self.assertEqual(self.cache.get_image(self.ec2_client, 'ami-1').state, 'available')
+
+    def test_get_image_raises_other_errors(self):
+        self.ec2_client.describe_images.side_effect = \
+            ClientError({'Error': {'Code': 'RequestLimitExceeded'}}, 'DescribeImages')
+
+        self.assertRaises(ClientError, self.cache.get_image, self.ec2_client, 'ami-1')
+
+    def test_invalidate(self):
+        self.cache.get_image(self.ec2_client, 'ami-1')
+
+        self.cache.invalidate(self.ec2_client, 'ami-1')
+        self.cache.get_image(self.ec2_client, 'ami-1')
+
+        self.assertEqual(self.ec2_client.describe_images.call_count, 2)
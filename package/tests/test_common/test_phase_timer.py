@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.aws.common.phase_timer import PhaseTimer
+
+
+class TestPhaseTimer(TestCase):
+    def setUp(self):
+        self.now = [100.0]
+        self.timer = PhaseTimer(timer=lambda: self.now[0])
+
+    def _elapse(self, seconds):
+        self.now[0] += seconds
+
+    def test_span_measures_phases_in_start_order(self):
+        with self.timer.span('launch'):
+            self._elapse(2)
+        with self.timer.span('wait'):
+            self._elapse(30.5)
+
+        self.assertEqual(list(self.timer.get_durations().items()),
+                         [('total', 32.5), ('launch', 2), ('wait', 30.5)])
+
+    def test_repeated_phase_is_summed(self):
+        with self.timer.span('wait'):
+            self._elapse(1)
+        with self.timer.span('wait'):
+            self._elapse(2)
+
+        self.assertEqual(self.timer.get_durations()['wait'], 3)
+
+    def test_span_measures_failed_phase(self):
+        def fail():
+            with self.timer.span('launch'):
+                self._elapse(4)
+                raise ValueError('launch failed')
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(self.timer.get_durations()['launch'], 4)
+
+    def test_get_summary(self):
+        self.timer.add('launch', 1.23456)
+
+        self.assertEqual(self.timer.get_summary(), '{"total": 0.0, "launch": 1.235}')
@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.aws.domain.common.sandbox_footprint_cache import SandboxFootprintCache
+
+
+class TestSandboxFootprintCache(TestCase):
+    def setUp(self):
+        self.cache = SandboxFootprintCache()
+        self.ec2_session = Mock()
+
+    def test_footprint_is_populated(self):
+        self.cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.cache.set_security_group_id('region', 'res', 'sg name', 'sg-1')
+        self.cache.set_subnet_name('region', 'res', 'subnet-1', 'subnet name')
+        self.cache.set_private_route_table_id('region', 'res', 'rtb-1')
+
+        footprint = self.cache.get('region', 'res')
+
+        self.assertEqual(footprint.vpc_id, 'vpc-1')
+        self.assertEqual(footprint.security_group_ids, {'sg name': 'sg-1'})
+        self.assertEqual(footprint.subnet_names, {'subnet-1': 'subnet name'})
+        self.assertEqual(footprint.private_route_table_id, 'rtb-1')
+        self.assertIsNone(self.cache.get('region', 'other res'))
+
+    def test_resources_are_not_cached_without_a_vpc(self):
+        self.cache.set_security_group_id('region', 'res', 'sg name', 'sg-1')
+        self.assertIsNone(self.cache.get('region', 'res'))
+
+    def test_other_vpc_resets_footprint(self):
+        self.cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.cache.set_security_group_id('region', 'res', 'sg name', 'sg-1')
+
+        self.cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.assertEqual(self.cache.get('region', 'res').security_group_ids, {'sg name': 'sg-1'})
+
+        self.cache.set_vpc_id('region', 'res', 'vpc-2')
+        self.assertEqual(self.cache.get('region', 'res').security_group_ids, {})
+
+    def test_footprint_per_region(self):
+        self.cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.cache.set_vpc_id('other region', 'res', 'vpc-2')
+
+        self.assertEqual(self.cache.get('region', 'res').vpc_id, 'vpc-1')
+        self.assertEqual(self.cache.get('other region', 'res').vpc_id, 'vpc-2')
+
+        self.cache.invalidate('other region', 'res')
+        self.assertEqual(self.cache.get('region', 'res').vpc_id, 'vpc-1')
+
+    def test_invalidate(self):
+        self.cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.cache.invalidate('region', 'res')
+        self.cache.invalidate('region', 'res')
+        self.assertIsNone(self.cache.get('region', 'res'))
+
+    def test_footprint_expires(self):
+        cache = SandboxFootprintCache(ttl=0)
+        cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.assertIsNone(cache.get('region', 'res'))
+
+    def test_get_vpc_looks_up_only_once(self):
+        vpc = Mock(id='vpc-1')
+        find_vpc = Mock(return_value=vpc)
+
+        self.assertEqual(self.cache.get_vpc(self.ec2_session, 'region', 'res', find_vpc), vpc)
+        res = self.cache.get_vpc(self.ec2_session, 'region', 'res', find_vpc)
+
+        find_vpc.assert_called_once()
+        self.ec2_session.Vpc.assert_called_once_with('vpc-1')
+        self.assertEqual(res, self.ec2_session.Vpc.return_value)
+
+    def test_get_vpc_does_not_cache_missing_vpc(self):
+        find_vpc = Mock(return_value=None)
+
+        self.assertIsNone(self.cache.get_vpc(self.ec2_session, 'region', 'res', find_vpc))
+        self.assertIsNone(self.cache.get_vpc(self.ec2_session, 'region', 'res', find_vpc))
+        self.assertEqual(find_vpc.call_count, 2)
+
+    def test_get_security_group_id_looks_up_only_once(self):
+        self.cache.set_vpc_id('region', 'res', 'vpc-1')
+        find_security_group = Mock(return_value=Mock(id='sg-1'))
+
+        self.assertEqual(self.cache.get_security_group_id('region', 'res', 'sg name', find_security_group), 'sg-1')
+        self.assertEqual(self.cache.get_security_group_id('region', 'res', 'sg name', find_security_group), 'sg-1')
+        find_security_group.assert_called_once()
+
+    def test_get_security_group_id_of_missing_security_group(self):
+        self.assertIsNone(self.cache.get_security_group_id('region', 'res', 'sg name', Mock(return_value=None)))
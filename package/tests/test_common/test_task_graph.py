@@ -0,0 +1,91 @@
+import threading
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.aws.common.task_graph import TaskGraph
+
+
+class TestTaskGraph(TestCase):
+    def test_runs_tasks_after_their_dependencies(self):
+        graph = TaskGraph()
+        order = []
+        graph.add('a', lambda: order.append('a') or 1)
+        graph.add('b', lambda: order.append('b') or graph.results['a'] + 1, depends_on=['a'])
+        graph.add('c', lambda: order.append('c') or graph.results['a'] + graph.results['b'], depends_on=['a', 'b'])
+
+        res = graph.run()
+
+        self.assertEqual(res, {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(order, ['a', 'b', 'c'])
+
+    def test_names_in_the_order_the_tasks_were_added(self):
+        graph = TaskGraph()
+        graph.add('b', lambda: None)
+        graph.add('a', lambda: None, depends_on=['b'])
+
+        self.assertEqual(graph.names, ['b', 'a'])
+
+    def test_runs_independent_tasks_concurrently(self):
+        graph = TaskGraph(max_workers=2)
+        started = threading.Event()
+        # each task waits for the other one to start, so they only complete if they run together
+        graph.add('a', lambda: started.wait(5) or started.is_set())
+        graph.add('b', lambda: started.set() or True)
+
+        self.assertEqual(graph.run(), {'a': True, 'b': True})
+
+    def test_limits_running_tasks_to_max_workers(self):
+        graph = TaskGraph(max_workers=1)
+        lock = threading.Lock()
+        graph.add('a', lambda: lock.acquire(False) and not lock.release())
+        graph.add('b', lambda: lock.acquire(False) and not lock.release())
+
+        self.assertEqual(graph.run(), {'a': True, 'b': True})
+
+    def test_failure_stops_dependent_tasks_and_keeps_completed_results(self):
+        graph = TaskGraph(max_workers=1)
+        dependent_task = Mock()
+        graph.add('a', lambda: 'created')
+        graph.add('b', Mock(side_effect=ValueError('failed')))
+        graph.add('c', dependent_task, depends_on=['b'])
+
+        self.assertRaisesRegexp(ValueError, 'failed', graph.run)
+
+        dependent_task.assert_not_called()
+        self.assertEqual(graph.results, {'a': 'created'})
+
+    def test_failure_without_stop_on_error_skips_only_dependent_tasks(self):
+        graph = TaskGraph(max_workers=1, stop_on_error=False)
+        dependent_task = Mock()
+        error = ValueError('failed')
+        graph.add('a', Mock(side_effect=error))
+        graph.add('b', dependent_task, depends_on=['a'])
+        graph.add('c', lambda: 'created')
+
+        res = graph.run()
+
+        dependent_task.assert_not_called()
+        self.assertEqual(res, {'c': 'created'})
+        self.assertEqual(graph.errors, {'a': error})
+        self.assertEqual(graph.skipped, ['b'])
+
+    def test_cancellation_stops_new_tasks(self):
+        check_cancelled = Mock(side_effect=[None, ValueError('cancelled')])
+        graph = TaskGraph(max_workers=1, check_cancelled=check_cancelled)
+        second_task = Mock()
+        graph.add('a', lambda: 'created')
+        graph.add('b', second_task, depends_on=['a'])
+
+        self.assertRaisesRegexp(ValueError, 'cancelled', graph.run)
+
+        second_task.assert_not_called()
+        self.assertEqual(graph.results, {'a': 'created'})
+
+    def test_invalid_tasks(self):
+        graph = TaskGraph()
+        graph.add('a', Mock())
+
+        self.assertRaises(ValueError, graph.add, 'a', Mock())
+        self.assertRaises(ValueError, graph.add, 'b', Mock(), depends_on=['c'])
+        self.assertRaises(ValueError, TaskGraph, max_workers=0)
@@ -0,0 +1,111 @@
+import threading
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.aws.common.ttl_cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = TTLCache(ttl=10, max_size=2, timer=lambda: self.now)
+
+    def test_get_missing_key(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('key', 'default'), 'default')
+
+    def test_set_and_get(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_entry_expires(self):
+        self.cache.set('key', 'value')
+        self.now = 10
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_no_ttl_never_expires(self):
+        cache = TTLCache(ttl=None, max_size=2, timer=lambda: self.now)
+        cache.set('key', 'value')
+        self.now = 10 ** 9
+        self.assertEqual(cache.get('key'), 'value')
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_get_or_create(self):
+        factory = Mock(return_value='value')
+
+        self.assertEqual(self.cache.get_or_create('key', factory), 'value')
+        self.assertEqual(self.cache.get_or_create('key', factory), 'value')
+
+        factory.assert_called_once_with()
+
+    def test_get_or_create_does_not_cache_on_error(self):
+        factory = Mock(side_effect=ValueError())
+
+        self.assertRaises(ValueError, self.cache.get_or_create, 'key', factory)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_get_or_create_does_not_block_the_other_keys(self):
+        other_key_values = []
+
+        def factory():
+            # the lock of the cache is free while the value is created
+            other_key_values.append(self.cache.get_or_create('other key', lambda: 'other value'))
+            return 'value'
+
+        self.assertEqual(self.cache.get_or_create('key', factory), 'value')
+
+        self.assertEqual(other_key_values, ['other value'])
+        self.assertEqual(self.cache._key_locks, {})
+
+    def test_get_or_create_creates_the_value_once_for_concurrent_callers(self):
+        created = threading.Event()
+        release = threading.Event()
+        factory_calls = []
+
+        def factory():
+            factory_calls.append(1)
+            created.set()
+            release.wait(5)
+            return 'value'
+
+        values = []
+        threads = [threading.Thread(target=lambda: values.append(self.cache.get_or_create('key', factory)))
+                   for _ in range(3)]
+        threads[0].start()
+        created.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(values, ['value'] * 3)
+        self.assertEqual(len(factory_calls), 1)
+
+    def test_pop(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.pop('key'), 'value')
+        self.assertIsNone(self.cache.pop('key'))
+
+    def test_remove_if(self):
+        self.cache.set(('r1', 'a'), 1)
+        self.cache.set(('r2', 'a'), 2)
+
+        removed = self.cache.remove_if(lambda key: key[0] == 'r1')
+
+        self.assertEqual(removed, 1)
+        self.assertIsNone(self.cache.get(('r1', 'a')))
+        self.assertEqual(self.cache.get(('r2', 'a')), 2)
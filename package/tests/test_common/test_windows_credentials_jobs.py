@@ -0,0 +1,104 @@
+from multiprocessing import TimeoutError
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from cloudshell.cp.aws.domain.common.windows_credentials_jobs import WindowsCredentialsJobs
+from cloudshell.cp.aws.models.ami_credentials import AMICredentials
+
+
+class TestWindowsCredentialsJobs(TestCase):
+    def setUp(self):
+        self.credentials_service = Mock()
+        self.deployed_app_credentials_service = Mock()
+        self.deployed_app_credentials_service.find_deployed_app_resource_name = Mock(return_value='app')
+        self.jobs = WindowsCredentialsJobs(self.credentials_service, self.deployed_app_credentials_service,
+                                           resource_lookup_delay=0, max_resource_lookups=3)
+        self.instance = Mock(id='i-1')
+        self.cloudshell = Mock()
+        self.create_cloudshell_session = Mock(return_value=self.cloudshell)
+        self.logger = Mock()
+
+    def _run(self):
+        self.jobs._run(self.instance, 'key', 'res', self.create_cloudshell_session, self.logger)
+
+    def test_sets_retrieved_credentials_on_the_deployed_app(self):
+        ami_credentials = AMICredentials('Administrator', 'pass')
+        self.credentials_service.get_windows_credentials = Mock(return_value=ami_credentials)
+
+        self._run()
+
+        self.credentials_service.get_windows_credentials.assert_called_once_with(instance=self.instance,
+                                                                                 key_value='key',
+                                                                                 wait_for_password=True)
+        self.deployed_app_credentials_service.find_deployed_app_resource_name.assert_called_once_with(
+            self.cloudshell, 'res', 'i-1')
+        self.deployed_app_credentials_service.set_credentials.assert_called_once_with(self.cloudshell, 'app',
+                                                                                      ami_credentials)
+        self.deployed_app_credentials_service.set_credentials_error.assert_not_called()
+        self.create_cloudshell_session.assert_called_once_with()
+
+    def test_records_timeout_on_the_deployed_app(self):
+        self.credentials_service.get_windows_credentials = Mock(side_effect=TimeoutError())
+
+        self._run()
+
+        self.deployed_app_credentials_service.set_credentials_error.assert_called_once_with(
+            self.cloudshell, 'app', 'Timeout when waiting for windows credentials')
+        self.deployed_app_credentials_service.set_credentials.assert_not_called()
+
+    def test_records_failure_on_the_deployed_app(self):
+        self.credentials_service.get_windows_credentials = Mock(side_effect=ValueError('boom'))
+
+        self._run()
+
+        self.deployed_app_credentials_service.set_credentials_error.assert_called_once_with(
+            self.cloudshell, 'app', 'Failed to retrieve windows credentials: boom')
+
+    def test_waits_for_the_deployed_app_resource(self):
+        self.deployed_app_credentials_service.find_deployed_app_resource_name = Mock(side_effect=[None, None, 'app'])
+
+        self._run()
+
+        self.assertEqual(self.deployed_app_credentials_service.find_deployed_app_resource_name.call_count, 3)
+        self.deployed_app_credentials_service.set_credentials.assert_called_once()
+
+    def test_gives_up_when_the_deployed_app_resource_is_not_created(self):
+        self.deployed_app_credentials_service.find_deployed_app_resource_name = Mock(return_value=None)
+
+        self._run()
+
+        self.assertEqual(self.deployed_app_credentials_service.find_deployed_app_resource_name.call_count, 3)
+        self.deployed_app_credentials_service.set_credentials.assert_not_called()
+        self.deployed_app_credentials_service.set_credentials_error.assert_not_called()
+
+    @patch('cloudshell.cp.aws.domain.common.windows_credentials_jobs.threading')
+    def test_start_runs_the_job_in_a_daemon_thread(self, threading):
+        self.jobs.start(self.instance, 'key', 'res', self.create_cloudshell_session, self.logger)
+
+        threading.Thread.assert_called_once_with(target=self.jobs._run,
+                                                 args=(self.instance, 'key', 'res', self.create_cloudshell_session,
+                                                       self.logger),
+                                                 name='WindowsCredentials-i-1')
+        self.assertTrue(threading.Thread.return_value.daemon)
+        threading.Thread.return_value.start.assert_called_once()
+        self.assertTrue(self.jobs.is_running('i-1'))
+
+    def test_finished_job_is_not_running(self):
+        self.jobs._jobs['i-1'] = Mock()
+        self.credentials_service.get_windows_credentials = Mock(return_value=AMICredentials('Administrator', 'p'))
+
+        self._run()
+
+        self.assertFalse(self.jobs.is_running('i-1'))
+
+    def test_failure_to_open_the_cloudshell_session_is_logged(self):
+        self.jobs._jobs['i-1'] = Mock()
+        self.credentials_service.get_windows_credentials = Mock(return_value=AMICredentials('Administrator', 'p'))
+        self.create_cloudshell_session.side_effect = ValueError('boom')
+
+        self._run()
+
+        self.logger.exception.assert_called_once()
+        self.deployed_app_credentials_service.set_credentials.assert_not_called()
+        self.assertFalse(self.jobs.is_running('i-1'))
@@ -1,8 +1,10 @@
 from _ast import Eq
 from unittest import TestCase
 
-from mock import Mock, MagicMock
+from botocore.exceptions import ClientError
+from mock import Mock, MagicMock, patch
 
+from cloudshell.cp.aws.domain.common.cleanup_journal import CleanupJournal
 from cloudshell.cp.aws.domain.conncetivity.operations.cleanup import CleanupSandboxInfraOperation
 from cloudshell.cp.core.models import PrepareCloudInfra
 
@@ -10,15 +12,31 @@ from cloudshell.cp.core.models import PrepareCloudInfra
 class TestCleanupSandboxInfra(TestCase):
     def setUp(self):
         self.vpc_serv = Mock()
+        for getter in (self.vpc_serv.get_reservation_instances, self.vpc_serv.get_all_internet_gateways,
+                       self.vpc_serv.get_all_security_groups, self.vpc_serv.get_all_subnets,
+                       self.vpc_serv.get_all_peerings):
+            getter.return_value = []
         self.key_pair_serv = Mock()
         self.s3_session = Mock()
         self.ec2_session = Mock()
         self.aws_ec2_data_model = Mock()
+        self.aws_ec2_data_model.async_cleanup_journal_directory = ''
         self.reservation_id = Mock()
         self.route_table_service = Mock()
+        self.route_table_service.get_custom_route_tables.return_value = []
+        self.route_table_service.get_all_route_tables.return_value = []
         self.traffic_mirror_service = Mock()
         self.cleanup_operation = CleanupSandboxInfraOperation(self.vpc_serv, self.key_pair_serv,
-                                                              self.route_table_service, self.traffic_mirror_service)
+                                                              self.route_table_service, self.traffic_mirror_service,
+                                                              max_retry_delay=0)
+
+    def _teardown(self):
+        return self.cleanup_operation.teardown(ec2_client=Mock(),
+                                               ec2_session=self.ec2_session,
+                                               s3_session=self.s3_session,
+                                               aws_ec2_data_model=self.aws_ec2_data_model,
+                                               reservation_id=self.reservation_id,
+                                               logger=Mock())
 
     def test_cleanup(self):
         self.route_table_service.get_all_route_tables = Mock(return_value=[Mock(), Mock()])
@@ -36,6 +54,8 @@ class TestCleanupSandboxInfra(TestCase):
         self.assertTrue(self.key_pair_serv.remove_key_pair_for_reservation_in_s3.called_with(self.s3_session,
                                                                                              self.aws_ec2_data_model,
                                                                                              self.reservation_id))
+        self.key_pair_serv.remove_instance_keys_for_reservation_in_s3.assert_called_once_with(
+            self.s3_session, self.aws_ec2_data_model.key_pairs_location, self.reservation_id)
         self.assertTrue(self.vpc_serv.delete_all_instances.called_with(vpc))
         self.assertTrue(self.vpc_serv.remove_all_security_groups.called_with(vpc))
         self.assertTrue(self.vpc_serv.remove_all_subnets.called_with(vpc))
@@ -45,6 +65,21 @@ class TestCleanupSandboxInfra(TestCase):
                                                                               vpc_id=self.aws_ec2_data_model.aws_management_vpc_id)
         self.assertEquals(self.route_table_service.delete_blackhole_routes.call_count, 2)
 
+    def test_cleanup_invalidates_sandbox_footprint(self):
+        sandbox_footprint_cache = Mock()
+        self.cleanup_operation.sandbox_footprint_cache = sandbox_footprint_cache
+
+        self.cleanup_operation.cleanup(ec2_session=self.ec2_session,
+                                       s3_session=self.s3_session,
+                                       aws_ec2_data_model=self.aws_ec2_data_model,
+                                       reservation_id=self.reservation_id,
+                                       logger=Mock(),
+                                       actions=[PrepareCloudInfra()],
+                                       ec2_client=Mock())
+
+        sandbox_footprint_cache.invalidate.assert_called_once_with(self.aws_ec2_data_model.region,
+                                                                   self.reservation_id)
+
     def test_cleanup_no_vpc(self):
         vpc_serv = Mock()
         vpc_serv.find_vpc_for_reservation = Mock(return_value=None)
@@ -59,3 +94,269 @@ class TestCleanupSandboxInfra(TestCase):
                 logger=Mock())
 
         self.assertFalse(result.success)
+
+    def test_teardown_deletes_the_dependent_resources_first(self):
+        calls = []
+        instance = Mock()
+        subnet = Mock(id='subnet-1')
+        security_group = Mock(id='sg-1', group_name='custom')
+        isolated_security_group = Mock(id='sg-2', group_name='isolated')
+        route_table = Mock(id='rtb-1')
+        vpc = self.vpc_serv.find_vpc_for_reservation.return_value
+        vpc.id = 'vpc-1'
+        self.vpc_serv.sg_service.sandbox_isolated_sg_name.return_value = 'isolated'
+        self.vpc_serv.get_reservation_instances.return_value = [instance]
+        self.vpc_serv.get_all_subnets.return_value = [subnet]
+        self.vpc_serv.get_all_security_groups.return_value = [isolated_security_group, security_group]
+        self.route_table_service.get_custom_route_tables.return_value = [route_table]
+        self.vpc_serv.delete_instances.side_effect = lambda instances: calls.append('instances')
+        self.vpc_serv.remove_subnet.side_effect = lambda s: calls.append(s.id)
+        self.vpc_serv.remove_security_group.side_effect = lambda sg: calls.append(sg.id)
+        self.route_table_service.delete_table.side_effect = lambda t: calls.append(t.id)
+        self.vpc_serv.delete_vpc.side_effect = lambda v: calls.append(v.id)
+
+        report = self._teardown()
+
+        self.assertTrue(report.succeeded)
+        self.assertEqual(calls[0], 'instances')
+        self.assertLess(calls.index('sg-1'), calls.index('sg-2'))
+        self.assertLess(calls.index('subnet-1'), calls.index('rtb-1'))
+        self.assertEqual(calls[-1], 'vpc-1')
+        self.assertEqual(report.resources['subnet subnet-1'], 'deleted')
+
+    def test_teardown_keeps_the_resources_depending_on_a_failed_deletion(self):
+        vpc = self.vpc_serv.find_vpc_for_reservation.return_value
+        vpc.id = 'vpc-1'
+        self.vpc_serv.get_all_subnets.return_value = [Mock(id='subnet-1')]
+        self.vpc_serv.get_all_peerings.return_value = [Mock(id='pcx-1', tags=[])]
+        self.vpc_serv.remove_subnet.side_effect = ValueError('subnet in use')
+
+        report = self._teardown()
+
+        self.assertFalse(report.succeeded)
+        self.assertEqual(report.resources['subnet subnet-1'], 'failed')
+        self.assertEqual(report.errors['subnet subnet-1'], 'subnet in use')
+        self.assertEqual(report.resources['peering pcx-1'], 'deleted')
+        self.assertEqual(report.resources['vpc vpc-1'], 'skipped')
+        self.vpc_serv.delete_vpc.assert_not_called()
+
+    def test_teardown_deletes_the_indexed_routes_of_the_peerings(self):
+        self.vpc_serv.find_vpc_for_reservation.return_value.id = 'vpc-1'
+        tags = [{'Key': 'ManagementRouteTables', 'Value': 'rtb-1,rtb-2'},
+                {'Key': 'ManagementRouteCidr', 'Value': '10.0.1.0/24'}]
+        self.vpc_serv.get_all_peerings.return_value = [Mock(id='pcx-1', tags=tags)]
+        ec2_client = Mock()
+
+        report = self.cleanup_operation.teardown(ec2_client=ec2_client,
+                                                 ec2_session=self.ec2_session,
+                                                 s3_session=self.s3_session,
+                                                 aws_ec2_data_model=self.aws_ec2_data_model,
+                                                 reservation_id=self.reservation_id,
+                                                 logger=Mock())
+
+        self.route_table_service.get_all_route_tables.assert_not_called()
+        self.route_table_service.delete_peering_routes.assert_called_once_with(ec2_client, ['rtb-1', 'rtb-2'],
+                                                                               '10.0.1.0/24', 'pcx-1')
+        self.assertEqual(report.resources['management routes of peering pcx-1'], 'deleted')
+
+    def test_teardown_scans_the_management_route_tables_without_index(self):
+        self.vpc_serv.find_vpc_for_reservation.return_value.id = 'vpc-1'
+        tags = [{'Key': 'ManagementRouteTables', 'Value': 'rtb-1'},
+                {'Key': 'ManagementRouteCidr', 'Value': '10.0.1.0/24'}]
+        self.vpc_serv.get_all_peerings.return_value = [Mock(id='pcx-1', tags=tags), Mock(id='pcx-2', tags=None)]
+        self.route_table_service.get_all_route_tables.return_value = [Mock(id='rtb-1')]
+
+        report = self._teardown()
+
+        self.route_table_service.delete_peering_routes.assert_not_called()
+        self.route_table_service.delete_blackhole_routes.assert_called_once()
+        self.assertEqual(report.resources['blackhole routes of route table rtb-1'], 'deleted')
+
+    def test_teardown_retries_dependency_violation(self):
+        self.vpc_serv.find_vpc_for_reservation.return_value.id = 'vpc-1'
+        dependency_violation = ClientError({'Error': {'Code': 'DependencyViolation'}}, 'DeleteVpc')
+        self.vpc_serv.delete_vpc.side_effect = [dependency_violation, True]
+
+        report = self._teardown()
+
+        self.assertTrue(report.succeeded)
+        self.assertEqual(self.vpc_serv.delete_vpc.call_count, 2)
+
+    def test_teardown_removes_the_key_pair_without_vpc(self):
+        self.vpc_serv.find_vpc_for_reservation.return_value = None
+
+        self.assertRaises(ValueError, self._teardown)
+        self.key_pair_serv.remove_key_pair_for_reservation_in_ec2.assert_called_once()
+
+    def test_cleanup_reports_the_failed_resources(self):
+        self.vpc_serv.find_vpc_for_reservation.return_value.id = 'vpc-1'
+        self.vpc_serv.delete_vpc.side_effect = ValueError('vpc in use')
+
+        result = self.cleanup_operation.cleanup(ec2_session=self.ec2_session,
+                                                s3_session=self.s3_session,
+                                                aws_ec2_data_model=self.aws_ec2_data_model,
+                                                reservation_id=self.reservation_id,
+                                                logger=Mock(),
+                                                actions=[PrepareCloudInfra()],
+                                                ec2_client=Mock())
+
+        self.assertFalse(result.success)
+        self.assertEqual(result.errorMessage, 'CleanupSandboxInfra ended with the error: vpc vpc-1: vpc in use')
+
+    def _cleanup_async(self):
+        self.aws_api = Mock(ec2_session=self.ec2_session, s3_session=self.s3_session)
+        return self.cleanup_operation.cleanup_async(create_aws_api=lambda: self.aws_api,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model,
+                                                    reservation_id='res-1',
+                                                    cloud_provider='aws',
+                                                    logger=Mock(),
+                                                    actions=[PrepareCloudInfra()])
+
+    @patch('cloudshell.cp.aws.domain.conncetivity.operations.cleanup.threading')
+    def test_cleanup_async_starts_the_teardown_in_background(self, threading):
+        cleanup_journal = Mock()
+        self.cleanup_operation.cleanup_journal = cleanup_journal
+        instances = [Mock()]
+        self.vpc_serv.get_reservation_instances.return_value = instances
+
+        result = self._cleanup_async()
+
+        self.vpc_serv.get_reservation_instances.assert_called_once_with(
+            self.ec2_session, self.vpc_serv.find_vpc_for_reservation.return_value, 'res-1')
+        self.assertTrue(result.success)
+        cleanup_journal.add.assert_called_once_with('res-1', 'aws', self.aws_ec2_data_model.region)
+        self.vpc_serv.delete_instances.assert_called_once_with(instances, wait=False)
+        self.assertIs(threading.Thread.call_args[1]['args'][0], self.aws_api)
+        self.assertTrue(threading.Thread.return_value.daemon)
+        threading.Thread.return_value.start.assert_called_once()
+        self.vpc_serv.delete_vpc.assert_not_called()
+
+    def test_cleanup_async_without_vpc_runs_the_cleanup(self):
+        cleanup_journal = Mock()
+        self.cleanup_operation.cleanup_journal = cleanup_journal
+        self.vpc_serv.find_vpc_for_reservation.return_value = None
+
+        result = self._cleanup_async()
+
+        self.assertFalse(result.success)
+        cleanup_journal.add.assert_not_called()
+
+    def test_cleanup_async_reports_journal_errors(self):
+        self.cleanup_operation.cleanup_journal = Mock()
+        self.cleanup_operation.cleanup_journal.add.side_effect = IOError('disk full')
+
+        result = self._cleanup_async()
+
+        self.assertFalse(result.success)
+        self.vpc_serv.delete_instances.assert_not_called()
+
+    def test_retry_teardown_completes(self):
+        cleanup_journal = Mock()
+        cleanup_journal.get.return_value = {'attempts': 0, 'errors': {}}
+        self.cleanup_operation.cleanup_journal = cleanup_journal
+        self.vpc_serv.find_vpc_for_reservation.return_value.id = 'vpc-1'
+
+        self.cleanup_operation._retry_teardown(Mock(), self.ec2_session, self.s3_session, self.aws_ec2_data_model,
+                                               'res-1', Mock())
+
+        update_kwargs = cleanup_journal.update.call_args[1]
+        self.assertEqual(update_kwargs['status'], CleanupJournal.COMPLETED)
+        self.assertEqual(update_kwargs['attempts'], 1)
+        self.assertEqual(update_kwargs['resources']['vpc vpc-1'], 'deleted')
+
+    def test_retry_teardown_fails_after_the_attempts(self):
+        cleanup_journal = Mock()
+        cleanup_journal.get.return_value = {'attempts': 0, 'errors': {}}
+        self.cleanup_operation.cleanup_journal = cleanup_journal
+        self.cleanup_operation.max_async_attempts = 2
+        self.vpc_serv.find_vpc_for_reservation.return_value.id = 'vpc-1'
+        self.vpc_serv.delete_vpc.side_effect = ValueError('vpc in use')
+        logger = Mock()
+
+        self.cleanup_operation._retry_teardown(Mock(), self.ec2_session, self.s3_session, self.aws_ec2_data_model,
+                                               'res-1', logger)
+
+        self.assertEqual(self.vpc_serv.delete_vpc.call_count, 2)
+        self.assertEqual(cleanup_journal.update.call_args_list[1][1]['errors'], {'vpc vpc-1': 'vpc in use'})
+        cleanup_journal.update.assert_called_with('res-1', status=CleanupJournal.FAILED)
+        logger.error.assert_called()
+
+    def test_retry_teardown_of_a_deleted_vpc_completes(self):
+        cleanup_journal = Mock()
+        cleanup_journal.get.return_value = {'attempts': 1, 'errors': {'vpc vpc-1': 'error'}}
+        self.cleanup_operation.cleanup_journal = cleanup_journal
+        self.vpc_serv.find_vpc_for_reservation.return_value = None
+
+        self.cleanup_operation._retry_teardown(Mock(), self.ec2_session, self.s3_session, self.aws_ec2_data_model,
+                                               'res-1', Mock())
+
+        self.assertEqual(cleanup_journal.update.call_args[1]['status'], CleanupJournal.COMPLETED)
+        self.key_pair_serv.remove_key_pair_for_reservation_in_ec2.assert_called_once()
+
+    def test_resume_async_cleanups_skips_running_cleanups(self):
+        self.cleanup_operation.cleanup_journal = Mock()
+        self.cleanup_operation.cleanup_journal.get_pending.return_value = [{'reservation_id': 'res-1'},
+                                                                           {'reservation_id': 'res-2'}]
+        self.cleanup_operation.cleanup_journal.acquire.return_value = {'reservation_id': 'res-2'}
+        self.cleanup_operation._running.add('res-1')
+        self.cleanup_operation._run_async_cleanup = Mock()
+        create_aws_api = Mock()
+
+        with patch('cloudshell.cp.aws.domain.conncetivity.operations.cleanup.threading') as threading:
+            self.cleanup_operation.resume_async_cleanups(create_aws_api, self.aws_ec2_data_model, 'aws', Mock())
+
+        self.cleanup_operation.cleanup_journal.get_pending.assert_called_once_with('aws')
+        self.cleanup_operation.cleanup_journal.acquire.assert_called_once_with('res-2')
+        threading.Thread.assert_called_once()
+        create_aws_api.assert_called_once_with()
+        self.assertEqual(threading.Thread.call_args[1]['args'], (create_aws_api.return_value, self.aws_ec2_data_model,
+                                                                 'res-2', threading.Thread.call_args[1]['args'][3]))
+
+    def test_resume_async_cleanups_skips_cleanups_of_live_owners(self):
+        self.cleanup_operation.cleanup_journal = Mock()
+        self.cleanup_operation.cleanup_journal.get_pending.return_value = [{'reservation_id': 'res-1'}]
+        self.cleanup_operation.cleanup_journal.acquire.return_value = None
+        create_aws_api = Mock()
+
+        with patch('cloudshell.cp.aws.domain.conncetivity.operations.cleanup.threading') as threading:
+            self.cleanup_operation.resume_async_cleanups(create_aws_api, self.aws_ec2_data_model, 'aws', Mock())
+
+        threading.Thread.assert_not_called()
+        create_aws_api.assert_not_called()
+
+    def test_run_async_cleanup_marks_the_cleanup_as_not_running(self):
+        self.cleanup_operation.cleanup_journal = Mock()
+        self.cleanup_operation._running.add('res-1')
+        self.cleanup_operation._retry_teardown = Mock(side_effect=ValueError('journal'))
+        logger = Mock()
+
+        aws_api = Mock()
+
+        self.cleanup_operation._run_async_cleanup(aws_api, self.aws_ec2_data_model, 'res-1', logger)
+
+        self.cleanup_operation._retry_teardown.assert_called_once_with(aws_api.ec2_client, aws_api.ec2_session,
+                                                                       aws_api.s3_session, self.aws_ec2_data_model,
+                                                                       'res-1', logger)
+        self.assertNotIn('res-1', self.cleanup_operation._running)
+        self.cleanup_operation.cleanup_journal.release.assert_called_once_with('res-1')
+        logger.exception.assert_called_once()
+
+    def test_get_cleanup_status(self):
+        self.cleanup_operation.cleanup_journal = Mock()
+        self.cleanup_operation.cleanup_journal.get.return_value = None
+
+        self.assertRaises(ValueError, self.cleanup_operation.get_cleanup_status, self.aws_ec2_data_model, 'res-1')
+
+    @patch('cloudshell.cp.aws.domain.conncetivity.operations.cleanup.CleanupJournal')
+    def test_get_cleanup_journal_of_the_directory(self, cleanup_journal_class):
+        self.aws_ec2_data_model.async_cleanup_journal_directory = '/var/aws_shell'
+
+        cleanup_journal = self.cleanup_operation.get_cleanup_journal(self.aws_ec2_data_model)
+
+        self.assertIs(cleanup_journal, cleanup_journal_class.return_value)
+        self.assertIs(self.cleanup_operation.get_cleanup_journal(self.aws_ec2_data_model), cleanup_journal)
+        cleanup_journal_class.assert_called_once_with('/var/aws_shell')
+
+    def test_get_cleanup_journal_without_directory(self):
+        self.assertIs(self.cleanup_operation.get_cleanup_journal(self.aws_ec2_data_model),
+                      self.cleanup_operation.cleanup_journal)
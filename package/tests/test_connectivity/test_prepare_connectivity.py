@@ -150,6 +150,25 @@ class TestPrepareSandboxInfra(TestCase):
         self.assertEqual(results[1].accessKey, access_key)
         self.cancellation_service.check_if_cancelled.assert_called()
 
+    def test_peer_vpcs_indexes_the_management_routes(self):
+        self.vpc_serv.get_peering_connection_by_reservation_id = Mock(return_value=None)
+        self.vpc_serv.peer_vpcs = Mock(return_value='pcx-1')
+        self.route_table_service.get_all_route_tables = Mock(return_value=[Mock(id='rtb-1'), Mock(id='rtb-2')])
+        self.prepare_conn._update_route_to_peered_vpc = Mock()
+        self.tag_service.get_management_routes_tags = Mock(return_value=['tags'])
+
+        self.prepare_conn._peer_vpcs(ec2_client=self.ec2_client,
+                                     ec2_session=self.ec2_session,
+                                     management_vpc_id='vpc-mgmt',
+                                     vpc_id='vpc-1',
+                                     sandbox_vpc_cidr='10.0.1.0/24',
+                                     reservation_model=self.reservation,
+                                     logger=Mock())
+
+        self.tag_service.get_management_routes_tags.assert_called_once_with(route_table_ids=['rtb-1', 'rtb-2'],
+                                                                            destination_cidr='10.0.1.0/24')
+        self.tag_service.set_ec2_resources_tags.assert_called_once_with(self.ec2_client, ['pcx-1'], ['tags'])
+
     def test_prepare_conn_command_no_management_vpc(self):
         request = Mock()
         aws_dm = Mock()
@@ -398,13 +417,75 @@ class TestPrepareSandboxInfra(TestCase):
 
         result = prepare_conn._get_or_create_vpc(cidr=cidr,
                                               ec2_session=self.ec2_session,
-                                              reservation=self.reservation)
+                                              reservation=self.reservation,
+                                              cloud_provider_owner='server/aws')
 
         vpc_service.find_vpc_for_reservation.assert_called_once_with(ec2_session=self.ec2_session,
                                                                      reservation_id=self.reservation.reservation_id)
 
         vpc_service.create_vpc_for_reservation.assert_called_once_with(ec2_session=self.ec2_session,
                                                                        reservation=self.reservation,
-                                                                       cidr=cidr)
+                                                                       cidr=cidr,
+                                                                       cloud_provider_owner='server/aws')
 
         self.assertEqual(vpc, result)
+
+    def test_prepare_conn_prepares_the_key_when_the_network_fails(self):
+        action = PrepareCloudInfra()
+        action.actionId = "1234"
+        action.actionParams = PrepareCloudInfraParams()
+        action2 = CreateKeys()
+        action2.actionId = "123"
+        self.prepare_conn._prepare_network = Mock(side_effect=ValueError('network'))
+        self.prepare_conn._get_or_create_key_pair = Mock(return_value='key')
+
+        results = self.prepare_conn.prepare_connectivity(ec2_client=self.ec2_client,
+                                                         ec2_session=self.ec2_session,
+                                                         s3_session=self.s3_session,
+                                                         reservation=self.reservation,
+                                                         aws_ec2_datamodel=self.aws_dm,
+                                                         actions=[action2, action],
+                                                         cancellation_context=self.cancellation_context,
+                                                         logger=Mock())
+
+        self.assertEqual(results[0].actionId, action.actionId)
+        self.assertFalse(results[0].success)
+        self.assertEqual(results[1].actionId, action2.actionId)
+        self.assertTrue(results[1].success)
+        self.assertEqual(results[1].accessKey, 'key')
+
+    def test_prepare_network_peers_through_the_internet_gateway(self):
+        action = PrepareCloudInfra()
+        action.actionId = "1234"
+        action.actionParams = PrepareCloudInfraParams()
+        vpc = Mock()
+        security_groups = [Mock(), Mock()]
+        private_route_table = Mock()
+        self.prepare_conn._get_or_create_vpc = Mock(return_value=vpc)
+        self.prepare_conn._enable_dns_hostnames = Mock()
+        self.prepare_conn._create_and_attach_internet_gateway = Mock(return_value='igw-1')
+        self.prepare_conn._peer_to_mgmt_if_needed = Mock(return_value=private_route_table)
+        self.prepare_conn._get_or_create_default_security_groups = Mock(return_value=security_groups)
+        self.prepare_conn._cache_sandbox_footprint = Mock()
+
+        result = self.prepare_conn._prepare_network(self.ec2_client, self.ec2_session, self.reservation, self.aws_dm,
+                                                    action, self.cancellation_context, Mock())
+
+        self.assertTrue(result.success)
+        self.prepare_conn._enable_dns_hostnames.assert_called_once_with(ec2_client=self.ec2_client, vpc_id=vpc.id)
+        self.assertEqual(self.prepare_conn._peer_to_mgmt_if_needed.call_args[0][5], 'igw-1')
+        self.prepare_conn._cache_sandbox_footprint.assert_called_once_with(self.aws_dm.region, self.reservation, vpc,
+                                                                           security_groups, private_route_table)
+
+    def test_prepare_network_raises_the_failed_step_error(self):
+        action = PrepareCloudInfra()
+        action.actionParams = PrepareCloudInfraParams()
+        self.prepare_conn._get_or_create_vpc = Mock()
+        self.prepare_conn._enable_dns_hostnames = Mock()
+        self.prepare_conn._create_and_attach_internet_gateway = Mock(side_effect=ValueError('igw'))
+        self.prepare_conn._peer_to_mgmt_if_needed = Mock()
+        self.prepare_conn._get_or_create_default_security_groups = Mock()
+
+        self.assertRaises(ValueError, self.prepare_conn._prepare_network, self.ec2_client, self.ec2_session,
+                          self.reservation, self.aws_dm, action, self.cancellation_context, Mock())
+        self.prepare_conn._peer_to_mgmt_if_needed.assert_not_called()
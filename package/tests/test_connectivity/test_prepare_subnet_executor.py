@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from mock import Mock
+from mock import Mock, patch
 
 from cloudshell.cp.aws.domain.conncetivity.operations.prepare_subnet_executor import PrepareSubnetExecutor
 from cloudshell.cp.aws.domain.services.ec2.tags import TagService, TagNames
@@ -20,6 +20,7 @@ class TestPrepareSandboxInfra(TestCase):
         self.vpc_service = Mock()
         self.subnet_service = Mock()
         self.tag_service = Mock()
+        self.tag_service.get_default_tags.return_value = []
         self.subnet_waiter = Mock()
 
         self.executor = PrepareSubnetExecutor(self.cancellation_service, self.vpc_service, self.subnet_service,
@@ -69,7 +70,7 @@ class TestPrepareSandboxInfra(TestCase):
         result = self.executor.execute(actions)[0]
         # Assert
         self.assertEqual(result.subnetId, "123")
-        self.subnet_waiter.wait.assert_not_called()
+        self.subnet_waiter.multi_wait.assert_not_called()
 
     def test_execute_creates_new_subnet_and_wait(self):
         # Arrange
@@ -87,7 +88,7 @@ class TestPrepareSandboxInfra(TestCase):
         result = self.executor.execute(actions)[0]
         # Assert
         self.assertEqual(result.subnetId, "456")
-        self.subnet_waiter.wait.assert_called_once()
+        self.subnet_waiter.multi_wait.assert_called_once_with([subnet], self.subnet_waiter.AVAILABLE)
 
     def test_execute_sets_tags(self):
         # Arrange
@@ -103,18 +104,23 @@ class TestPrepareSandboxInfra(TestCase):
 
         self.reservation.reservation_id = "123"
         subnet = Mock()
+        subnet.subnet_id = "subnet-1"
         self.subnet_service.get_first_or_none_subnet_from_vpc = Mock(return_value=subnet)
         is_public_tag = Mock()
         self.tag_service.get_is_public_tag = Mock(return_value=is_public_tag)
-        default_tags = [Mock()]
-        self.tag_service.get_default_tags = Mock(return_value=default_tags)
+        reservation_tag = {'Key': TagNames.ReservationId, 'Value': '123'}
+        self.tag_service.get_default_tags = Mock(return_value=[{'Key': TagNames.Name, 'Value': ''}, reservation_tag])
+        name_tag = Mock()
+        self.tag_service.get_name_tag = Mock(return_value=name_tag)
 
         # Act
         self.executor.execute(actions)
 
         # Assert
-        default_tags.append(is_public_tag)
-        self.tag_service.set_ec2_resource_tags.assert_called_once_with(subnet, default_tags)
+        self.tag_service.set_ec2_resources_tags.assert_called_once_with(self.ec2_client, ["subnet-1"],
+                                                                        [reservation_tag, is_public_tag])
+        self.tag_service.get_name_tag.assert_called_once_with("MySubnet Reservation: 123")
+        self.tag_service.set_ec2_resource_tags.assert_called_once_with(subnet, [name_tag])
 
     def test_execute_sets_private_subnet_to_private_routing_table(self):
         # Arrange
@@ -128,3 +134,80 @@ class TestPrepareSandboxInfra(TestCase):
         self.executor.execute(actions)
         # Assert
         self.subnet_service.set_subnet_route_table.assert_called_once()
+
+    def test_execute_creates_and_tags_many_subnets_together(self):
+        actions = []
+        for index, is_public in enumerate([True, False, True]):
+            prepare_subnet = PrepareSubnet()
+            prepare_subnet.actionId = str(index)
+            prepare_subnet.actionParams = PrepareSubnetParams()
+            prepare_subnet.actionParams.cidr = "10.0.{0}.0/24".format(index)
+            prepare_subnet.actionParams.isPublic = is_public
+            actions.append(prepare_subnet)
+        self.subnet_service.get_first_or_none_subnet_from_vpc = Mock(return_value=None)
+        self.subnet_service.create_subnet_nowait = Mock(side_effect=lambda vpc, cidr, zone: Mock(subnet_id=cidr))
+
+        results = self.executor.execute(actions)
+
+        self.assertTrue(all(result.success for result in results))
+        self.subnet_waiter.multi_wait.assert_called_once()
+        self.assertEqual(len(self.subnet_waiter.multi_wait.call_args[0][0]), 3)
+        resource_ids = [c[0][1] for c in self.tag_service.set_ec2_resources_tags.call_args_list]
+        self.assertEqual(resource_ids, [["10.0.0.0/24", "10.0.2.0/24"], ["10.0.1.0/24"]])
+        self.subnet_service.set_subnet_route_table.assert_called_once()
+
+    @patch('cloudshell.cp.aws.domain.conncetivity.operations.prepare_subnet_executor.create_resource_for_thread')
+    def test_execute_gives_each_concurrent_step_its_own_resources(self, create_resource_for_thread):
+        create_resource_for_thread.side_effect = lambda ec2_session: Mock()
+        actions = []
+        for index in range(2):
+            prepare_subnet = PrepareSubnet()
+            prepare_subnet.actionId = str(index)
+            prepare_subnet.actionParams = PrepareSubnetParams()
+            prepare_subnet.actionParams.cidr = "10.0.{0}.0/24".format(index)
+            prepare_subnet.actionParams.isPublic = False
+            actions.append(prepare_subnet)
+        self.subnet_service.get_first_or_none_subnet_from_vpc = Mock(return_value=None)
+        self.subnet_service.create_subnet_nowait = Mock(side_effect=lambda vpc, cidr, zone: Mock(subnet_id=cidr))
+        self.executor._get_private_route_table_id = Mock(return_value='rtb-1')
+
+        self.executor.execute(actions)
+
+        vpc = self.vpc_service.find_vpc_for_reservation.return_value
+        create_vpcs = [c[0][0] for c in self.subnet_service.create_subnet_nowait.call_args_list]
+        self.assertEqual(len(set(create_vpcs)), 2)
+        self.assertNotIn(vpc, create_vpcs)
+        route_table_sessions = [c[0][0] for c in self.executor._get_private_route_table_id.call_args_list]
+        self.assertEqual(len(set(route_table_sessions)), 2)
+        self.assertNotIn(self.ec2_session, route_table_sessions)
+        self.assertTrue(all(c == ((self.ec2_session,),) for c in create_resource_for_thread.call_args_list))
+
+    def test_execute_isolates_the_failed_action(self):
+        actions = []
+        for index in range(2):
+            prepare_subnet = PrepareSubnet()
+            prepare_subnet.actionId = str(index)
+            prepare_subnet.actionParams = PrepareSubnetParams()
+            prepare_subnet.actionParams.cidr = "10.0.{0}.0/24".format(index)
+            actions.append(prepare_subnet)
+        self.subnet_service.get_first_or_none_subnet_from_vpc = Mock(return_value=None)
+        subnet = Mock(subnet_id="subnet-1")
+        self.subnet_service.create_subnet_nowait = Mock(side_effect=[subnet, ValueError('subnet limit')])
+
+        results = self.executor.execute(actions)
+
+        self.assertEqual([result.success for result in results].count(True), 1)
+        self.subnet_waiter.multi_wait.assert_called_once_with([subnet], self.subnet_waiter.AVAILABLE)
+
+    def test_execute_fails_the_actions_of_a_failed_wait(self):
+        prepare_subnet = PrepareSubnet()
+        prepare_subnet.actionId = "1"
+        prepare_subnet.actionParams = PrepareSubnetParams()
+        prepare_subnet.actionParams.cidr = "1.2.3.4/24"
+        self.subnet_service.get_first_or_none_subnet_from_vpc = Mock(return_value=None)
+        self.subnet_waiter.multi_wait.side_effect = Exception('Timeout')
+
+        result = self.executor.execute([prepare_subnet])[0]
+
+        self.assertFalse(result.success)
+        self.tag_service.set_ec2_resources_tags.assert_not_called()
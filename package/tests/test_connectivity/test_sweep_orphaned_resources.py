@@ -0,0 +1,169 @@
+import time
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.aws.domain.conncetivity.operations.sweep import SweepOrphanedResourcesOperation
+from cloudshell.cp.aws.models.teardown_report import TeardownReport
+
+
+class TestSweepOrphanedResourcesOperation(TestCase):
+    def setUp(self):
+        self.cleanup_operation = Mock()
+        self.cleanup_operation.get_cleanup_journal.return_value.get_pending.return_value = []
+        self.cleanup_operation.teardown.side_effect = lambda *args, **kwargs: TeardownReport()
+        self.operation = SweepOrphanedResourcesOperation(self.cleanup_operation)
+        self.ec2_client = Mock()
+        self.ec2_client.can_paginate.side_effect = lambda operation: operation != 'describe_addresses'
+        self.pages = {}
+        self.paginators = {}
+        self.ec2_client.get_paginator.side_effect = self._get_paginator
+        self.ec2_client.describe_addresses.return_value = {'Addresses': []}
+        self.ec2_client.describe_key_pairs.return_value = {'KeyPairs': []}
+        self.s3_session = Mock()
+        self.s3_pages = []
+        self.s3_session.meta.client.get_paginator.return_value.paginate.side_effect = \
+            lambda **kwargs: self.s3_pages
+        self.aws_ec2_data_model = Mock()
+        self.aws_ec2_data_model.key_pairs_location = 'bucket'
+        self.logger = Mock()
+
+    def _get_paginator(self, operation):
+        if operation not in self.paginators:
+            self.paginators[operation] = Mock()
+            self.paginators[operation].paginate.side_effect = lambda **kwargs: self.pages.get(operation, [])
+        return self.paginators[operation]
+
+    @staticmethod
+    def _tags(reservation_id):
+        return [{'Key': 'CreatedBy', 'Value': 'Cloudshell'}, {'Key': 'ReservationId', 'Value': reservation_id}]
+
+    @staticmethod
+    def _vpc(vpc_id, reservation_id, owner='server/aws', created_at=0):
+        tags = TestSweepOrphanedResourcesOperation._tags(reservation_id)
+        tags += [{'Key': 'CloudProvider', 'Value': owner}, {'Key': 'CreatedAt', 'Value': str(created_at)}]
+        return {'VpcId': vpc_id, 'Tags': tags}
+
+    def _sweep(self, active_reservation_ids, dry_run=False, reservation_ids=None):
+        return self.operation.sweep(ec2_client=self.ec2_client,
+                                    ec2_session=Mock(),
+                                    s3_session=self.s3_session,
+                                    aws_ec2_data_model=self.aws_ec2_data_model,
+                                    active_reservation_ids=active_reservation_ids,
+                                    cloud_provider='aws',
+                                    cloud_provider_owner='server/aws',
+                                    dry_run=dry_run,
+                                    logger=self.logger,
+                                    reservation_ids=['res-1', 'res-2'] if reservation_ids is None else reservation_ids)
+
+    def test_dry_run_reports_the_orphans(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1')]},
+                                       {'Vpcs': [self._vpc('vpc-2', 'res-2'), self._vpc('vpc-3', 'res-3')]}]
+        self.ec2_client.describe_key_pairs.return_value = {'KeyPairs': [{'KeyName': 'reservation key pair res-3'}]}
+        self.s3_pages = [{'Contents': [{'Key': 'reservation-id-res-3/reservation key pair res-3.pem'}]}]
+
+        report = self._sweep(['res-2'], dry_run=True, reservation_ids=[])
+
+        self.assertTrue(report.dry_run)
+        self.assertEqual(report.orphans, {'res-1': {'vpc': ['vpc-1']},
+                                          'res-3': {'vpc': ['vpc-3'],
+                                                    'key pair': ['reservation key pair res-3'],
+                                                    's3 key': ['reservation-id-res-3/reservation key pair res-3.pem']}})
+        self.cleanup_operation.teardown.assert_not_called()
+        filters = self.paginators['describe_vpcs'].paginate.call_args[1]['Filters']
+        self.assertIn({'Name': 'tag:CreatedBy', 'Values': ['Cloudshell']}, filters)
+        self.assertIn({'Name': 'tag-key', 'Values': ['ReservationId']}, filters)
+        self.s3_session.meta.client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket='bucket', Prefix='reservation-id-')
+
+    def test_sweep_requires_the_reservations_to_delete(self):
+        self.assertRaises(ValueError, self._sweep, [], reservation_ids=[])
+        self.ec2_client.get_paginator.assert_not_called()
+
+    def test_sweeps_only_the_given_reservations(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1'), self._vpc('vpc-2', 'res-2')]}]
+
+        report = self._sweep([], reservation_ids=['res-2'])
+
+        self.assertEqual(report.orphans, {'res-2': {'vpc': ['vpc-2']}})
+        self.assertEqual(self.cleanup_operation.teardown.call_count, 1)
+        self.assertEqual(self.cleanup_operation.teardown.call_args[0][4], 'res-2')
+
+    def test_sweeps_only_the_reservations_of_the_cloud_provider(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1', owner='other server/aws'),
+                                                 {'VpcId': 'vpc-2', 'Tags': self._tags('res-2')}]}]
+        self.ec2_client.describe_key_pairs.return_value = {'KeyPairs': [{'KeyName': 'reservation key pair res-3'}]}
+
+        report = self._sweep([], dry_run=True)
+
+        self.assertEqual(report.orphans, {})
+
+    def test_does_not_sweep_recent_reservations(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1', created_at=int(time.time())),
+                                                 self._vpc('vpc-2', 'res-2', created_at='not a time')]}]
+
+        report = self._sweep([])
+
+        self.assertEqual(report.orphans, {})
+        self.cleanup_operation.teardown.assert_not_called()
+
+    def test_keeps_the_pending_async_cleanups(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1')]}]
+        cleanup_journal = self.cleanup_operation.get_cleanup_journal.return_value
+        cleanup_journal.get_pending.return_value = [{'reservation_id': 'res-1'}]
+
+        report = self._sweep([])
+
+        self.assertEqual(report.orphans, {})
+        self.cleanup_operation.get_cleanup_journal.assert_called_once_with(self.aws_ec2_data_model)
+        cleanup_journal.get_pending.assert_called_once_with('aws')
+        self.cleanup_operation.teardown.assert_not_called()
+
+    def test_only_detached_network_interfaces_are_orphans(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1')]}]
+        self.pages['describe_network_interfaces'] = [{'NetworkInterfaces': [
+            {'NetworkInterfaceId': 'eni-1', 'Status': 'available', 'TagSet': self._tags('res-1')},
+            {'NetworkInterfaceId': 'eni-2', 'Status': 'in-use', 'TagSet': self._tags('res-1')}]}]
+
+        report = self._sweep([], dry_run=True)
+
+        self.assertEqual(report.orphans, {'res-1': {'vpc': ['vpc-1'], 'network interface': ['eni-1']}})
+
+    def test_sweep_tears_down_the_orphaned_reservations(self):
+        calls = []
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1')]}]
+        self.pages['describe_network_interfaces'] = [{'NetworkInterfaces': [
+            {'NetworkInterfaceId': 'eni-1', 'Status': 'available', 'TagSet': self._tags('res-1')}]}]
+        self.ec2_client.describe_addresses.return_value = {'Addresses': [{'AllocationId': 'eipalloc-1',
+                                                                          'Tags': self._tags('res-1')}]}
+        self.ec2_client.delete_network_interface.side_effect = lambda **kwargs: calls.append('eni')
+        self.cleanup_operation.teardown.side_effect = lambda *args, **kwargs: calls.append('teardown') or \
+            TeardownReport()
+        self.ec2_client.release_address.side_effect = lambda **kwargs: calls.append('eip')
+
+        report = self._sweep([])
+
+        self.assertEqual(calls, ['eni', 'teardown', 'eip'])
+        self.assertEqual(self.cleanup_operation.teardown.call_args[0][4], 'res-1')
+        self.assertFalse(self.cleanup_operation.teardown.call_args[1]['vpc_required'])
+        self.assertEqual(report.resources['res-1'], {'elastic ip eipalloc-1': 'deleted'})
+        self.assertTrue(report.succeeded)
+
+    def test_sweep_reports_the_failed_reservations(self):
+        self.pages['describe_vpcs'] = [{'Vpcs': [self._vpc('vpc-1', 'res-1'), self._vpc('vpc-2', 'res-2')]}]
+
+        def teardown(*args, **kwargs):
+            report = TeardownReport()
+            if args[4] == 'res-1':
+                report.add('vpc vpc-1', TeardownReport.FAILED, 'vpc in use')
+            else:
+                report.add('vpc vpc-2', TeardownReport.DELETED)
+            return report
+
+        self.cleanup_operation.teardown.side_effect = teardown
+
+        report = self._sweep([])
+
+        self.assertFalse(report.succeeded)
+        self.assertEqual(report.errors, {'res-1': {'vpc vpc-1': 'vpc in use'}})
+        self.assertEqual(report.resources['res-2'], {'vpc vpc-2': 'deleted'})
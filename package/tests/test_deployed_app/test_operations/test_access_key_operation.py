@@ -27,3 +27,35 @@ class TestAccessKeyOperation(TestCase):
         self.key_pair_service.load_key_pair_by_name.assert_called_with(s3_session=s3_session,
                                                                        bucket_name=aws_ec2_resource_model.key_pairs_location,
                                                                        reservation_id=reservation_id)
+
+    def test_get_access_key_of_instance_claimed_from_the_warm_pool(self):
+        s3_session = Mock()
+        ec2_session = Mock()
+        ec2_session.Instance.return_value.tags = [{'Key': 'WarmPool', 'Value': 'Claimed'}]
+        aws_ec2_resource_model = Mock()
+        aws_ec2_resource_model.key_pairs_location = 'bucket'
+
+        self.operation.get_access_key(s3_session=s3_session,
+                                      aws_ec2_resource_model=aws_ec2_resource_model,
+                                      reservation_id='reservation_id',
+                                      ec2_session=ec2_session,
+                                      instance_id='i-1')
+
+        ec2_session.Instance.assert_called_once_with('i-1')
+        self.key_pair_service.load_instance_key.assert_called_once_with(s3_session=s3_session,
+                                                                        bucket_name='bucket',
+                                                                        reservation_id='reservation_id',
+                                                                        instance_id='i-1')
+        self.key_pair_service.load_key_pair_by_name.assert_not_called()
+
+    def test_get_access_key_of_launched_instance(self):
+        ec2_session = Mock()
+        ec2_session.Instance.return_value.tags = [{'Key': 'ReservationId', 'Value': 'reservation_id'}]
+
+        self.operation.get_access_key(s3_session=Mock(),
+                                      aws_ec2_resource_model=Mock(),
+                                      reservation_id='reservation_id',
+                                      ec2_session=ec2_session,
+                                      instance_id='i-1')
+
+        self.assertEqual(self.key_pair_service.load_key_pair_by_name.call_args[1]['reservation_id'], 'reservation_id')
@@ -95,3 +95,24 @@ class TestDeployedAppPortsOperation(TestCase):
                                                                   allow_all_storage_traffic=True)
 
         self.assertEquals(result, 'App Name: my ami name\nAllow Sandbox Traffic: True')
+
+    def test_get_network_interface_subnet_name_from_sandbox_footprint(self):
+        self.operation.sandbox_footprint_cache.set_vpc_id('region', 'res', 'vpc-1')
+        self.operation.sandbox_footprint_cache.set_subnet_name('region', 'res', 'subnet-1', 'cached name')
+        network_interface = Mock(subnet_id='subnet-1')
+
+        res = self.operation._get_network_interface_subnet_name(network_interface, 'region', 'res')
+
+        self.assertEqual(res, 'cached name')
+
+    def test_get_network_interface_subnet_name_caches_name_from_tags(self):
+        self.operation.sandbox_footprint_cache.set_vpc_id('region', 'res', 'vpc-1')
+        network_interface = Mock(subnet_id='subnet-1')
+        network_interface.subnet.tags = [{"Key": "Name", "Value": "Subnet A Reservation: res"},
+                                         {"Key": "ReservationId", "Value": "res"}]
+
+        res = self.operation._get_network_interface_subnet_name(network_interface, 'region', 'res')
+
+        self.assertEqual(res, 'Subnet A')
+        self.assertEqual(self.operation.sandbox_footprint_cache.get('region', 'res').subnet_names,
+                         {'subnet-1': 'Subnet A'})
@@ -83,4 +83,15 @@ class TestS3BucketService(TestCase):
         s3_session.Object = Mock(return_value=None)
 
         res = self.bucket_service.delete_key(s3_session, 'buck', None)
-        self.assertFalse(res)
\ No newline at end of file
+        self.assertFalse(res)
+    def test_delete_keys(self):
+        s3_session = Mock()
+
+        self.bucket_service.delete_keys(s3_session, 'buck', 'prefix/')
+
+        s3_session.Bucket.assert_called_once_with('buck')
+        s3_session.Bucket.return_value.objects.filter.assert_called_once_with(Prefix='prefix/')
+        s3_session.Bucket.return_value.objects.filter.return_value.delete.assert_called_once()
+
+    def test_delete_keys_without_prefix(self):
+        self.assertRaises(ValueError, self.bucket_service.delete_keys, Mock(), 'buck', '')
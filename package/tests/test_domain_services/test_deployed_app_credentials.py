@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.aws.domain.services.cloudshell.deployed_app_credentials import DeployedAppCredentialsService
+from cloudshell.cp.aws.models.ami_credentials import AMICredentials
+
+
+class TestDeployedAppCredentialsService(TestCase):
+    def setUp(self):
+        self.service = DeployedAppCredentialsService()
+        self.cloudshell = Mock()
+
+    def test_find_deployed_app_resource_name(self):
+        resource1 = Mock(VmDetails=None)
+        resource1.Name = 'switch'
+        resource2 = Mock(VmDetails=Mock(UID='i-2'))
+        resource2.Name = 'app'
+        self.cloudshell.GetReservationDetails.return_value.ReservationDescription.Resources = [resource1, resource2]
+
+        self.assertEqual(self.service.find_deployed_app_resource_name(self.cloudshell, 'res', 'i-2'), 'app')
+        self.assertIsNone(self.service.find_deployed_app_resource_name(self.cloudshell, 'res', 'i-3'))
+        self.cloudshell.GetReservationDetails.assert_called_with(reservationId='res', disableCache=True)
+
+    def test_set_credentials_on_namespaced_attributes(self):
+        attributes = [Mock(), Mock(), Mock()]
+        attributes[0].Name = 'Gen2.User'
+        attributes[1].Name = 'Gen2.Password'
+        attributes[2].Name = 'Gen2.Public IP'
+        self.cloudshell.GetResourceDetails.return_value.ResourceAttributes = attributes
+
+        self.service.set_credentials(self.cloudshell, 'app', AMICredentials('Administrator', 'pass'))
+
+        request = self.cloudshell.SetAttributesValues.call_args[0][0][0]
+        self.assertEqual(request.ResourceFullName, 'app')
+        self.assertEqual([(a.Name, a.Value) for a in request.AttributeNamesValues],
+                         [('Gen2.User', 'Administrator'), ('Gen2.Password', 'pass')])
+
+    def test_set_credentials_error(self):
+        self.service.set_credentials_error(self.cloudshell, 'app', 'Timeout')
+
+        self.cloudshell.SetResourceLiveStatus.assert_called_once_with('app', 'Error', 'Timeout')
@@ -1,5 +1,6 @@
 from unittest import TestCase
 
+from botocore.exceptions import ClientError
 from mock import Mock, MagicMock, call, patch
 
 from cloudshell.cp.aws.domain.services.ec2.elastic_ip import ElasticIpService
@@ -286,3 +287,93 @@ class TestElasticIpService(TestCase):
         self.assertEquals(allocate_elastic_address.call_count, 3)
         self.assertEquals(find_and_release_elastic_address.call_count, 2)
         self.assertEquals(associate_elastic_ip_to_network_interface.call_count, 3)
+
+    def test__create_and_associate_elastic_ip_claims_from_pool(self):
+        ec2_client = Mock()
+        instance = Mock()
+        elastic_ip_pool = Mock()
+        elastic_ip_pool.is_enabled.return_value = True
+        elastic_ip_pool.claim.return_value = '1.2.3.4'
+        self.elastic_ip_service = ElasticIpService(elastic_ip_pool=elastic_ip_pool)
+        self.elastic_ip_service.allocate_elastic_address = Mock()
+
+        ip = self.elastic_ip_service._create_and_associate_elastic_ip(ec2_client, Mock(), instance)
+
+        self.assertEqual(ip, '1.2.3.4')
+        elastic_ip_pool.claim.assert_called_once_with(ec2_client, instance_id=instance.id)
+        self.elastic_ip_service.allocate_elastic_address.assert_not_called()
+
+    def test__create_and_associate_elastic_ip_allocates_when_pool_is_empty(self):
+        interface_id = 'interface id'
+        ec2_client = Mock()
+        ec2_session = Mock()
+        elastic_ip_pool = Mock()
+        elastic_ip_pool.is_enabled.return_value = True
+        elastic_ip_pool.claim.return_value = None
+        self.elastic_ip_service = ElasticIpService(elastic_ip_pool=elastic_ip_pool)
+        self.elastic_ip_service.allocate_elastic_address = Mock(return_value='5.6.7.8')
+        self.elastic_ip_service.associate_elastic_ip_to_network_interface = Mock()
+
+        ip = self.elastic_ip_service._create_and_associate_elastic_ip(ec2_client, ec2_session, interface_id)
+
+        self.assertEqual(ip, '5.6.7.8')
+        elastic_ip_pool.claim.assert_called_once_with(ec2_client, network_interface_id=interface_id)
+        self.elastic_ip_service.associate_elastic_ip_to_network_interface.assert_called_once_with(
+            ec2_session, interface_id, '5.6.7.8')
+
+    def test_set_elastic_ips_refills_pool(self):
+        ec2_client = Mock()
+        logger = Mock()
+        elastic_ip_pool = Mock()
+        elastic_ip_pool.is_enabled.return_value = True
+        self.elastic_ip_service = ElasticIpService(elastic_ip_pool=elastic_ip_pool)
+        self.elastic_ip_service._create_and_associate_elastic_ip = Mock(return_value='1.2.3.4')
+        ami_deployment_model = Mock(allocate_elastic_ip=True)
+        network_config_results = [DeployNetworkingResultModel('action1')]
+
+        self.elastic_ip_service.set_elastic_ips(Mock(), ec2_client, Mock(), ami_deployment_model, None,
+                                                network_config_results, logger)
+
+        self.assertEqual(network_config_results[0].public_ip, '1.2.3.4')
+        elastic_ip_pool.refill_in_background.assert_called_once_with(ec2_client, logger)
+
+    def test_release_elastic_address_returns_address_to_pool(self):
+        vpc_address = Mock()
+        elastic_ip_pool = Mock()
+        elastic_ip_pool.is_enabled.return_value = True
+        elastic_ip_pool.give_back.return_value = True
+        self.elastic_ip_service = ElasticIpService(elastic_ip_pool=elastic_ip_pool)
+
+        self.elastic_ip_service.release_elastic_address(vpc_address)
+
+        elastic_ip_pool.give_back.assert_called_once_with(vpc_address.meta.client, vpc_address.allocation_id,
+                                                          vpc_address.association_id)
+        vpc_address.release.assert_not_called()
+
+    def test_release_elastic_address_when_pool_is_full(self):
+        vpc_address = Mock()
+        elastic_ip_pool = Mock()
+        elastic_ip_pool.is_enabled.return_value = True
+        elastic_ip_pool.give_back.return_value = False
+        self.elastic_ip_service = ElasticIpService(elastic_ip_pool=elastic_ip_pool)
+
+        self.elastic_ip_service.release_elastic_address(vpc_address)
+
+        vpc_address.release.assert_called_once()
+
+    def test_release_elastic_address_disassociates_first(self):
+        vpc_address = Mock(association_id='eipassoc-1')
+
+        self.elastic_ip_service.release_elastic_address(vpc_address)
+
+        vpc_address.meta.client.disassociate_address.assert_called_once_with(AssociationId='eipassoc-1')
+        vpc_address.release.assert_called_once()
+
+    def test_release_elastic_address_already_disassociated(self):
+        vpc_address = Mock(association_id='eipassoc-1')
+        vpc_address.meta.client.disassociate_address.side_effect = \
+            ClientError({'Error': {'Code': 'InvalidAssociationID.NotFound'}}, 'DisassociateAddress')
+
+        self.elastic_ip_service.release_elastic_address(vpc_address)
+
+        vpc_address.release.assert_called_once()
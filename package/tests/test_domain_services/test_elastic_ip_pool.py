@@ -0,0 +1,182 @@
+from unittest import TestCase
+
+from botocore.exceptions import ClientError
+from mock import Mock, call, patch
+
+from cloudshell.cp.aws.domain.services.ec2.elastic_ip_pool import ElasticIpPool
+from cloudshell.cp.aws.models.aws_api import AwsApiClients
+
+
+class TestElasticIpPool(TestCase):
+    def setUp(self):
+        self.pool = ElasticIpPool()
+        self.ec2_client = self._create_ec2_client('us-east-1', 'key id')
+        self.pool.configure(self.ec2_client, min_size=2, max_size=3)
+        self.logger = Mock()
+
+    @staticmethod
+    def _create_ec2_client(region, access_key_id):
+        ec2_client = Mock()
+        ec2_client.meta.region_name = region
+        AwsApiClients.register_client(ec2_client, access_key_id)
+        return ec2_client
+
+    def _set_addresses(self, *addresses):
+        self.ec2_client.describe_addresses.return_value = {'Addresses': list(addresses)}
+
+    @staticmethod
+    def _address(allocation_id, association_id=None):
+        address = {'AllocationId': allocation_id, 'PublicIp': 'ip-' + allocation_id}
+        if association_id:
+            address['AssociationId'] = association_id
+        return address
+
+    def test_is_enabled(self):
+        other_region_client = self._create_ec2_client('eu-west-1', 'key id')
+        other_account_client = self._create_ec2_client('us-east-1', 'other key id')
+
+        self.assertTrue(self.pool.is_enabled(self.ec2_client))
+        self.assertTrue(self.pool.is_enabled(self._create_ec2_client('us-east-1', 'key id')))
+        self.assertFalse(self.pool.is_enabled(other_region_client))
+        self.assertFalse(self.pool.is_enabled(other_account_client))
+
+    def test_pool_of_unregistered_client(self):
+        ec2_client = Mock()
+        ec2_client.meta.region_name = 'us-east-1'
+
+        self.pool.configure(ec2_client, min_size=1, max_size=1)
+
+        self.assertTrue(self.pool.is_enabled(ec2_client))
+        self.assertEqual(self.pool._get_pool_key(ec2_client), ('us-east-1', None))
+
+    def test_configure_zero_size_disables_the_pool(self):
+        self.pool.configure(self.ec2_client, min_size=0, max_size=5)
+
+        self.assertFalse(self.pool.is_enabled(self.ec2_client))
+
+    def test_get_free_addresses_skips_associated_addresses(self):
+        self._set_addresses(self._address('eipalloc-1', 'eipassoc-1'), self._address('eipalloc-2'))
+
+        free_addresses = self.pool.get_free_addresses(self.ec2_client)
+
+        self.assertEqual([a['AllocationId'] for a in free_addresses], ['eipalloc-2'])
+        filters = self.ec2_client.describe_addresses.call_args[1]['Filters']
+        self.assertIn({'Name': 'tag:Type', 'Values': ['ElasticIpPool']}, filters)
+
+    def test_claim_associates_by_allocation_id(self):
+        self._set_addresses(self._address('eipalloc-1'))
+
+        public_ip = self.pool.claim(self.ec2_client, instance_id='i-1')
+
+        self.assertEqual(public_ip, 'ip-eipalloc-1')
+        self.ec2_client.associate_address.assert_called_once_with(AllocationId='eipalloc-1',
+                                                                  AllowReassociation=False,
+                                                                  InstanceId='i-1')
+
+    def test_claim_to_network_interface(self):
+        self._set_addresses(self._address('eipalloc-1'))
+
+        self.pool.claim(self.ec2_client, network_interface_id='eni-1')
+
+        self.ec2_client.associate_address.assert_called_once_with(AllocationId='eipalloc-1',
+                                                                  AllowReassociation=False,
+                                                                  NetworkInterfaceId='eni-1')
+
+    def test_claim_skips_address_claimed_by_another_process(self):
+        self._set_addresses(self._address('eipalloc-1'), self._address('eipalloc-2'))
+        already_associated = ClientError({'Error': {'Code': 'Resource.AlreadyAssociated'}}, 'AssociateAddress')
+        self.ec2_client.associate_address.side_effect = [already_associated, None]
+
+        public_ip = self.pool.claim(self.ec2_client, instance_id='i-1')
+
+        self.assertEqual(public_ip, 'ip-eipalloc-2')
+
+    def test_claim_raises_other_errors(self):
+        self._set_addresses(self._address('eipalloc-1'))
+        self.ec2_client.associate_address.side_effect = \
+            ClientError({'Error': {'Code': 'InvalidInstanceID'}}, 'AssociateAddress')
+
+        self.assertRaises(ClientError, self.pool.claim, self.ec2_client, instance_id='i-1')
+
+    def test_claim_empty_pool(self):
+        self._set_addresses()
+
+        self.assertIsNone(self.pool.claim(self.ec2_client, instance_id='i-1'))
+        self.ec2_client.associate_address.assert_not_called()
+
+    def test_give_back_tags_the_address(self):
+        self._set_addresses(self._address('eipalloc-1'))
+
+        result = self.pool.give_back(self.ec2_client, 'eipalloc-2', 'eipassoc-2')
+
+        self.assertTrue(result)
+        self.ec2_client.disassociate_address.assert_called_once_with(AssociationId='eipassoc-2')
+        self.assertEqual(self.ec2_client.create_tags.call_args[1]['Resources'], ['eipalloc-2'])
+
+    def test_give_back_full_pool(self):
+        self._set_addresses(self._address('eipalloc-1'), self._address('eipalloc-2'), self._address('eipalloc-3'))
+
+        result = self.pool.give_back(self.ec2_client, 'eipalloc-4')
+
+        self.assertFalse(result)
+        self.ec2_client.create_tags.assert_not_called()
+
+    def test_give_back_disabled_pool(self):
+        self.pool.configure(self.ec2_client, min_size=0, max_size=0)
+
+        self.assertFalse(self.pool.give_back(self.ec2_client, 'eipalloc-1'))
+        self.ec2_client.describe_addresses.assert_not_called()
+
+    def test_refill_allocates_up_to_min_size(self):
+        self._set_addresses()
+        self.ec2_client.allocate_address.side_effect = [{'AllocationId': 'eipalloc-1', 'PublicIp': '1.1.1.1'},
+                                                        {'AllocationId': 'eipalloc-2', 'PublicIp': '2.2.2.2'}]
+
+        self.pool.refill(self.ec2_client, self.logger)
+
+        self.assertEqual(self.ec2_client.allocate_address.call_count, 2)
+        self.assertEqual([c[1]['Resources'] for c in self.ec2_client.create_tags.call_args_list],
+                         [['eipalloc-1'], ['eipalloc-2']])
+
+    def test_refill_releases_address_when_tagging_fails(self):
+        self._set_addresses(self._address('eipalloc-1'))
+        self.ec2_client.allocate_address.return_value = {'AllocationId': 'eipalloc-2', 'PublicIp': '2.2.2.2'}
+        self.ec2_client.create_tags.side_effect = ValueError('tags')
+
+        self.assertRaises(ValueError, self.pool.refill, self.ec2_client, self.logger)
+        self.ec2_client.release_address.assert_called_once_with(AllocationId='eipalloc-2')
+
+    def test_refill_trims_above_max_size(self):
+        self._set_addresses(*[self._address('eipalloc-{0}'.format(i)) for i in range(5)])
+
+        self.pool.refill(self.ec2_client, self.logger)
+
+        self.ec2_client.allocate_address.assert_not_called()
+        self.ec2_client.release_address.assert_has_calls([call(AllocationId='eipalloc-3'),
+                                                          call(AllocationId='eipalloc-4')])
+
+    @patch('cloudshell.cp.aws.domain.services.ec2.elastic_ip_pool.threading')
+    def test_refill_in_background(self, threading):
+        self.pool.refill_in_background(self.ec2_client, self.logger)
+
+        threading.Thread.assert_called_once_with(target=self.pool._run_refill, args=(self.ec2_client, self.logger),
+                                                 name='ElasticIpPool-us-east-1')
+        self.assertTrue(threading.Thread.return_value.daemon)
+        threading.Thread.return_value.start.assert_called_once()
+
+    def test_run_refill_marks_region_as_refilled(self):
+        self.pool._refilling.add(('us-east-1', 'key id'))
+        self.pool.refill = Mock(side_effect=ValueError('refill'))
+
+        self.pool._run_refill(self.ec2_client, self.logger)
+
+        self.assertNotIn(('us-east-1', 'key id'), self.pool._refilling)
+        self.logger.exception.assert_called_once()
+
+    def test_refill_in_background_skips_region_being_refilled(self):
+        self.pool._refilling.add(('us-east-1', 'key id'))
+        self.pool._run_refill = Mock()
+
+        self.pool.refill_in_background(self.ec2_client, self.logger)
+
+        self.pool._run_refill.assert_not_called()
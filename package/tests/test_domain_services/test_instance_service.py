@@ -1,9 +1,12 @@
 from unittest import TestCase
 
+from botocore.exceptions import ClientError
 from mock import Mock
 from mock import MagicMock
+from mock import call
 
 from cloudshell.cp.aws.domain.services.ec2.instance import InstanceService
+from cloudshell.cp.aws.common.phase_timer import PhaseTimer
 
 
 class TestInstanceService(TestCase):
@@ -24,16 +27,74 @@ class TestInstanceService(TestCase):
         self.instance_service = InstanceService(self.tag_service, self.instance_waiter)
 
     # @Mock.Patch('cloudshell.cp.aws.domain.services.ec2.instance.create_instances')
+    def test_create_instance_measures_phases(self):
+        ami_dep = Mock()
+        ami_dep.custom_tags = ""
+        new_instance = Mock()
+        new_instance.instance_id = 'id'
+        new_instance.block_device_mappings = []
+        new_instance.tags = []
+        new_instance.meta.data = {}
+        self.tag_service.get_name_tag.return_value = {'Key': 'Name', 'Value': 'name id'}
+        self.ec2_session.create_instances = Mock(return_value=[new_instance])
+        phase_timer = PhaseTimer()
+
+        self.instance_service.create_instance(ec2_session=self.ec2_session,
+                                              name=self.name,
+                                              reservation=self.reservation_id,
+                                              ami_deployment_info=ami_dep,
+                                              ec2_client=self.ec2_client,
+                                              wait_for_status_check=True,
+                                              cancellation_context=Mock(),
+                                              logger=Mock(),
+                                              phase_timer=phase_timer)
+
+        self.assertEqual(list(phase_timer.get_durations().keys()),
+                         ['total', 'run_instances', 'wait_running', 'wait_status_check', 'set_name'])
+
+    def test_start_pooled_instance(self):
+        ami_dep = Mock()
+        ami_dep.custom_tags = ""
+        instance = Mock()
+        instance.instance_id = 'id'
+        instance.block_device_mappings = [{'DeviceName': '/dev/sda1', 'Ebs': {'VolumeId': 'vol-1'}}]
+        instance.tags = []
+        instance.meta.data = {}
+        self.tag_service.get_default_tags.return_value = [{'Key': 'Name', 'Value': self.name},
+                                                          {'Key': 'CreatedBy', 'Value': 'Cloudshell'}]
+        self.tag_service.get_name_tag.return_value = {'Key': 'Name', 'Value': 'name id'}
+        cancellation_context = Mock()
+
+        self.instance_service.start_pooled_instance(ec2_client=self.ec2_client,
+                                                    instance=instance,
+                                                    name=self.name,
+                                                    reservation=self.reservation_id,
+                                                    ami_deployment_info=ami_dep,
+                                                    wait_for_status_check=False,
+                                                    cancellation_context=cancellation_context,
+                                                    logger=Mock())
+
+        self.tag_service.set_ec2_resources_tags.assert_any_call(self.ec2_client, ['id', 'vol-1'],
+                                                                [{'Key': 'CreatedBy', 'Value': 'Cloudshell'}])
+        instance.start.assert_called_once()
+        self.instance_waiter.wait.assert_called_once_with(instance=instance,
+                                                          state=self.instance_waiter.RUNNING,
+                                                          cancellation_context=cancellation_context)
+
     def test_create_instance(self):
         ami_dep = Mock()
         ami_dep.custom_tags = ""
         cancellation_context = Mock()
         new_instance = Mock()
         new_instance.instance_id = 'id'
-        volume_1 = Mock()
-        volume_2 = Mock()
-
-        new_instance.volumes.all = Mock(return_value=[volume_2, volume_1])
+        new_instance.block_device_mappings = [{'DeviceName': '/dev/sda1', 'Ebs': {'VolumeId': 'vol-1'}},
+                                              {'DeviceName': '/dev/sdb', 'Ebs': {'VolumeId': 'vol-2'}}]
+        new_instance.meta.data = {'Tags': self.default_tags}
+        new_instance.tags = [{'Key': 'Name', 'Value': self.name}, {'Key': 'CreatedBy', 'Value': 'Cloudshell'}]
+        tag_specifications = Mock()
+        self.tag_service.get_tag_specifications.return_value = tag_specifications
+        name_tag = {'Key': 'Name', 'Value': 'name id'}
+        self.tag_service.get_name_tag.return_value = name_tag
 
         self.ec2_session.create_instances = Mock(return_value=[new_instance])
 
@@ -46,6 +107,8 @@ class TestInstanceService(TestCase):
                                                     cancellation_context=cancellation_context,
                                                     logger=Mock())
 
+        self.tag_service.get_default_tags.assert_called_once_with(self.name, self.reservation_id)
+        self.tag_service.get_tag_specifications.assert_called_once_with(['instance', 'volume'], self.default_tags)
         self.ec2_session.create_instances.assert_called_once_with(ImageId=ami_dep.aws_ami_id,
                                                                   MinCount=ami_dep.min_count,
                                                                   MaxCount=ami_dep.max_count,
@@ -54,20 +117,54 @@ class TestInstanceService(TestCase):
                                                                   KeyName=ami_dep.aws_key,
                                                                   BlockDeviceMappings=ami_dep.block_device_mappings,
                                                                   NetworkInterfaces=ami_dep.network_interfaces,
-                                                                  UserData=ami_dep.user_data)
+                                                                  UserData=ami_dep.user_data,
+                                                                  TagSpecifications=tag_specifications)
 
         self.instance_waiter.wait.assert_called_once_with(instance=new_instance,
                                                           state=self.instance_waiter.RUNNING,
                                                           cancellation_context=cancellation_context)
 
-        self.tag_service.get_default_tags.assert_called_with(self.name + ' ' + new_instance.instance_id,self.reservation_id)
-
-        self.tag_service.set_ec2_resource_tags.assert_any_call(new_instance, self.default_tags)
-        self.tag_service.set_ec2_resource_tags.assert_any_call(volume_2, self.default_tags)
-        self.tag_service.set_ec2_resource_tags.assert_any_call(volume_1, self.default_tags)
-        self.assertTrue(new_instance.load.called)
+        # only the name with the instance id is tagged after the launch, with a single call
+        self.tag_service.get_name_tag.assert_called_once_with(self.name + ' ' + new_instance.instance_id)
+        self.tag_service.set_ec2_resources_tags.assert_called_once_with(self.ec2_client, ['id', 'vol-1', 'vol-2'],
+                                                                        [name_tag])
+        self.tag_service.set_ec2_resource_tags.assert_not_called()
+        self.assertFalse(new_instance.load.called)
+        self.assertEqual(new_instance.meta.data['Tags'], [{'Key': 'CreatedBy', 'Value': 'Cloudshell'}, name_tag])
         self.assertEqual(new_instance, res)
 
+    def test_create_instances_launches_all_instances_in_one_call(self):
+        ami_dep = Mock()
+        instances = [Mock(id='i-1'), Mock(id='i-2')]
+        self.ec2_session.create_instances = Mock(return_value=instances)
+        self.tag_service.get_default_tags = Mock(return_value=[{'Key': 'Name', 'Value': 'app1'},
+                                                               {'Key': 'CreatedBy', 'Value': 'Cloudshell'}])
+
+        res = self.instance_service.create_instances(ec2_session=self.ec2_session,
+                                                     names=['app1', 'app2'],
+                                                     reservation=self.reservation_id,
+                                                     ami_deployment_info=ami_dep,
+                                                     logger=Mock())
+
+        self.assertEqual(res, instances)
+        self.assertEqual(self.ec2_session.create_instances.call_count, 1)
+        self.assertEqual(self.ec2_session.create_instances.call_args[1]['MinCount'], 2)
+        self.assertEqual(self.ec2_session.create_instances.call_args[1]['MaxCount'], 2)
+        # the names are set once the instances run
+        self.tag_service.get_tag_specifications.assert_called_once_with(
+            ['instance', 'volume'], [{'Key': 'CreatedBy', 'Value': 'Cloudshell'}])
+        self.instance_waiter.multi_wait.assert_not_called()
+
+    def test_set_instances_names(self):
+        self.instance_service._set_name_tag = Mock()
+        instance1 = Mock()
+        instance2 = Mock()
+
+        self.instance_service.set_instances_names(self.ec2_client, [instance1, instance2], ['app1', 'app2'])
+
+        self.assertEqual(self.instance_service._set_name_tag.call_args_list,
+                         [call(self.ec2_client, instance1, 'app1'), call(self.ec2_client, instance2, 'app2')])
+
     def test_get_instance_by_id(self):
         res = self.instance_service.get_instance_by_id(self.ec2_session, 'id')
         self.ec2_session.Instance.assert_called_once_with(id='id')
@@ -86,23 +183,109 @@ class TestInstanceService(TestCase):
         with self.assertRaises(Exception):
             self.instance_service.get_active_instance_by_id(self.ec2_session, 'id')
 
+    @staticmethod
+    def _terminating_instances(*states):
+        return {'TerminatingInstances': [{'InstanceId': instance_id, 'CurrentState': {'Name': state}}
+                                         for instance_id, state in states]}
+
+    def _create_instances(self, *instance_ids):
+        instances = []
+        for instance_id in instance_ids:
+            instance = Mock()
+            instance.id = instance_id
+            instance.meta.client = self.ec2_client
+            instances.append(instance)
+        return instances
+
     def test_terminate_instance(self):
-        self.instance_waiter.multi_wait = Mock(return_value=[self.instance])
+        self.instance.id = 'id'
+        self.instance.meta.client = self.ec2_client
+        self.ec2_client.terminate_instances.return_value = self._terminating_instances(('id', 'shutting-down'))
         self.instance_waiter.TERMINATED = 'terminated'
         res = self.instance_service.terminate_instance(self.instance)
 
-        self.assertTrue(self.instance.terminate.called)
+        self.ec2_client.terminate_instances.assert_called_once_with(InstanceIds=['id'])
         self.instance_waiter.multi_wait.assert_called_once_with([self.instance], self.instance_waiter.TERMINATED)
-        self.assertIsNotNone(res)
+        self.assertEqual(res, self.instance)
 
     def test_terminate_instances(self):
-        instances = [Mock(), Mock()]
+        instances = self._create_instances('i-1', 'i-2')
+        self.ec2_client.terminate_instances.return_value = self._terminating_instances(('i-1', 'shutting-down'),
+                                                                                       ('i-2', 'shutting-down'))
+        self.instance_waiter.TERMINATED = 'terminated'
         res = self.instance_service.terminate_instances(instances)
 
-        self.assertTrue(instances[0].terminate.called)
-        self.assertTrue(instances[1].terminate.called)
+        self.ec2_client.terminate_instances.assert_called_once_with(InstanceIds=['i-1', 'i-2'])
+        self.assertFalse(instances[0].terminate.called)
         self.instance_waiter.multi_wait.assert_called_once_with(instances, self.instance_waiter.TERMINATED)
-        self.assertIsNotNone(res)
+        self.assertEqual(res, instances)
+
+    def test_terminate_instances_without_wait(self):
+        instances = self._create_instances('i-1')
+        self.ec2_client.terminate_instances.return_value = self._terminating_instances(('i-1', 'shutting-down'))
+
+        self.instance_service.terminate_instances(instances, wait=False)
+
+        self.ec2_client.terminate_instances.assert_called_once_with(InstanceIds=['i-1'])
+        self.instance_waiter.multi_wait.assert_not_called()
+
+    def test_terminate_instances_in_chunks(self):
+        self.instance_service.MAX_INSTANCE_IDS_PER_TERMINATE = 2
+        instances = self._create_instances('i-1', 'i-2', 'i-3')
+        self.ec2_client.terminate_instances.side_effect = [
+            self._terminating_instances(('i-1', 'shutting-down'), ('i-2', 'shutting-down')),
+            self._terminating_instances(('i-3', 'shutting-down'))]
+        self.instance_waiter.TERMINATED = 'terminated'
+
+        self.instance_service.terminate_instances(instances)
+
+        self.assertEqual(self.ec2_client.terminate_instances.call_args_list,
+                         [call(InstanceIds=['i-1', 'i-2']), call(InstanceIds=['i-3'])])
+        self.instance_waiter.multi_wait.assert_called_once_with(instances, self.instance_waiter.TERMINATED)
+
+    def test_terminate_instances_does_not_wait_for_terminated_instances(self):
+        instances = self._create_instances('i-1', 'i-2')
+        self.ec2_client.terminate_instances.return_value = self._terminating_instances(('i-1', 'terminated'),
+                                                                                       ('i-2', 'shutting-down'))
+        self.instance_waiter.TERMINATED = 'terminated'
+
+        self.instance_service.terminate_instances(instances)
+
+        self.instance_waiter.multi_wait.assert_called_once_with([instances[1]], self.instance_waiter.TERMINATED)
+
+    def test_terminate_instances_skips_instances_not_found(self):
+        instances = self._create_instances('i-1', 'i-2')
+        not_found = ClientError({'Error': {'Code': 'InvalidInstanceID.NotFound'}}, 'TerminateInstances')
+        self.ec2_client.terminate_instances.side_effect = [
+            not_found, self._terminating_instances(('i-2', 'shutting-down'))]
+        self.ec2_client.describe_instances.return_value = {'Reservations': [{'Instances': [{'InstanceId': 'i-2'}]}]}
+        self.instance_waiter.TERMINATED = 'terminated'
+
+        self.instance_service.terminate_instances(instances)
+
+        self.ec2_client.describe_instances.assert_called_once_with(
+            Filters=[{'Name': 'instance-id', 'Values': ['i-1', 'i-2']}])
+        self.assertEqual(self.ec2_client.terminate_instances.call_args_list[1], call(InstanceIds=['i-2']))
+        self.instance_waiter.multi_wait.assert_called_once_with([instances[1]], self.instance_waiter.TERMINATED)
+
+    def test_terminate_instances_all_not_found(self):
+        instances = self._create_instances('i-1')
+        self.ec2_client.terminate_instances.side_effect = \
+            ClientError({'Error': {'Code': 'InvalidInstanceID.NotFound'}}, 'TerminateInstances')
+        self.ec2_client.describe_instances.return_value = {'Reservations': []}
+
+        res = self.instance_service.terminate_instances(instances)
+
+        self.assertEqual(res, instances)
+        self.ec2_client.terminate_instances.assert_called_once()
+        self.instance_waiter.multi_wait.assert_not_called()
+
+    def test_terminate_instances_raises_other_errors(self):
+        instances = self._create_instances('i-1')
+        self.ec2_client.terminate_instances.side_effect = \
+            ClientError({'Error': {'Code': 'UnauthorizedOperation'}}, 'TerminateInstances')
+
+        self.assertRaises(ClientError, self.instance_service.terminate_instances, instances)
 
     def test_wait_for_instance_to_run_in_aws_with_status_check(self):
         # arrange
@@ -128,3 +311,44 @@ class TestInstanceService(TestCase):
                 instance=instance,
                 logger=logger,
                 cancellation_context=cancellation_context)
+
+    def test_wait_for_instances_to_run_in_aws_with_status_check(self):
+        # arrange
+        ec2_client = Mock()
+        instances = [Mock(), Mock()]
+        cancellation_context = Mock()
+        logger = Mock()
+        instance_statuses = Mock()
+        self.instance_waiter.multi_wait_status_ok.return_value = instance_statuses
+        self.instance_waiter.get_impaired_instance_ids.return_value = ['i-2']
+
+        # act
+        res = self.instance_service.wait_for_instances_to_run_in_aws(ec2_client=ec2_client,
+                                                                     instances=instances,
+                                                                     wait_for_status_check=True,
+                                                                     cancellation_context=cancellation_context,
+                                                                     logger=logger)
+
+        # assert
+        self.instance_waiter.multi_wait.assert_called_once_with(instances=instances,
+                                                                state=self.instance_waiter.RUNNING,
+                                                                cancellation_context=cancellation_context)
+        self.instance_waiter.multi_wait_status_ok.assert_called_once_with(ec2_client=ec2_client,
+                                                                          instances=instances,
+                                                                          logger=logger,
+                                                                          cancellation_context=cancellation_context)
+        self.instance_waiter.get_impaired_instance_ids.assert_called_once_with(instance_statuses)
+        self.assertEqual(res, ['i-2'])
+
+    def test_wait_for_instances_to_run_in_aws_without_status_check(self):
+        instances = [Mock(), Mock()]
+
+        res = self.instance_service.wait_for_instances_to_run_in_aws(ec2_client=Mock(),
+                                                                     instances=instances,
+                                                                     wait_for_status_check=False,
+                                                                     cancellation_context=None,
+                                                                     logger=Mock())
+
+        self.assertEqual(res, [])
+        self.instance_waiter.multi_wait.assert_called_once()
+        self.instance_waiter.multi_wait_status_ok.assert_not_called()
@@ -0,0 +1,181 @@
+import threading
+from multiprocessing import TimeoutError
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from cloudshell.cp.aws.domain.services.waiters.instance import InstanceWaiter
+from cloudshell.cp.aws.domain.services.waiters.instance_state_poller import InstanceStatePoller
+from tests.test_domain_services.test_instance_waiter import FakeEc2Client, FakeInstance
+
+
+class TestInstanceStatePoller(TestCase):
+    def setUp(self):
+        self.poller = InstanceStatePoller(interval=0.01)
+        self.ec2_client = FakeEc2Client()
+
+    def test_watch_of_instances_already_in_state_is_done(self):
+        instance = FakeInstance('i-1', InstanceWaiter.RUNNING, self.ec2_client)
+
+        instances_watch = self.poller.watch([instance], InstanceWaiter.RUNNING)
+
+        self.assertTrue(instances_watch.wait(0))
+        self.assertEqual(self.ec2_client.describe_calls, [])
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.threading')
+    def test_poll_describes_the_instances_of_all_watches_once_per_client(self, threading):
+        instance1 = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+        instance2 = FakeInstance('i-2', InstanceWaiter.PENDING, self.ec2_client)
+        other_client = FakeEc2Client()
+        instance3 = FakeInstance('i-3', InstanceWaiter.PENDING, other_client)
+        watch1 = self.poller.watch([instance1], InstanceWaiter.RUNNING)
+        watch2 = self.poller.watch([instance2], InstanceWaiter.RUNNING)
+        watch3 = self.poller.watch([instance3], InstanceWaiter.RUNNING)
+        self.ec2_client.states['i-1'] = InstanceWaiter.RUNNING
+
+        self.poller.poll()
+
+        self.assertEqual(self.ec2_client.describe_calls, [['i-1', 'i-2']])
+        self.assertEqual(other_client.describe_calls, [['i-3']])
+        self.assertEqual(instance1.state['Name'], InstanceWaiter.RUNNING)
+        self.assertEqual(watch2.pending_instances, [instance2])
+        self.assertEqual(watch3.pending_instances, [instance3])
+
+        # the done watch is not polled anymore
+        self.poller.poll()
+        self.assertEqual(self.ec2_client.describe_calls, [['i-1', 'i-2'], ['i-2']])
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.threading')
+    def test_poll_chunks_describe_calls(self, threading):
+        self.poller.max_instance_ids_per_describe = 2
+        instances = [FakeInstance('i-{0}'.format(i), InstanceWaiter.PENDING, self.ec2_client) for i in range(3)]
+        self.poller.watch(instances, InstanceWaiter.RUNNING)
+
+        self.poller.poll()
+
+        self.assertEqual(self.ec2_client.describe_calls, [['i-0', 'i-1'], ['i-2']])
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller._describe_instances_once')
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.threading')
+    def test_poll_fails_watches_when_describe_fails_on_consecutive_ticks(self, threading, describe_instances):
+        self.poller.max_consecutive_errors = 2
+        error = ValueError('describe failed')
+        describe_instances.side_effect = error
+        instance = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+        instances_watch = self.poller.watch([instance], InstanceWaiter.RUNNING)
+        instances_watch._done = Mock()
+
+        self.poller.poll()
+
+        instances_watch._done.set.assert_not_called()
+        self.assertEqual(self.poller._watches, [instances_watch])
+
+        self.poller.poll()
+
+        self.assertEqual(instances_watch.error, error)
+        instances_watch._done.set.assert_called_once()
+        self.assertEqual(self.poller._watches, [])
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller._describe_instances_once')
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.threading')
+    def test_poll_resets_the_errors_of_a_watch_described_again(self, threading, describe_instances):
+        self.poller.max_consecutive_errors = 2
+        describe_instances.side_effect = [ValueError('describe failed'), {'Reservations': []},
+                                          ValueError('describe failed')]
+        instance = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+        instances_watch = self.poller.watch([instance], InstanceWaiter.RUNNING)
+
+        for _ in range(3):
+            self.poller.poll()
+
+        self.assertIsNone(instances_watch.error)
+        self.assertEqual(instances_watch.consecutive_errors, 1)
+        self.assertEqual(self.poller._watches, [instances_watch])
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller._describe_instances_once')
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.threading')
+    def test_poll_fails_only_the_watch_whose_describe_fails(self, threading, describe_instances):
+        self.poller.max_consecutive_errors = 1
+        error = ValueError('InvalidInstanceID.NotFound')
+
+        def describe(ec2_client, instance_ids):
+            if 'i-2' in instance_ids:
+                raise error
+            return ec2_client.describe_instances(InstanceIds=instance_ids)
+
+        describe_instances.side_effect = describe
+        instance1 = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+        instance2 = FakeInstance('i-2', InstanceWaiter.PENDING, self.ec2_client)
+        watch1 = self.poller.watch([instance1], InstanceWaiter.RUNNING)
+        watch2 = self.poller.watch([instance2], InstanceWaiter.RUNNING)
+        self.ec2_client.states['i-1'] = InstanceWaiter.RUNNING
+
+        self.poller.poll()
+
+        # the batched describe fails, each watch is then described on its own
+        self.assertEqual(describe_instances.call_count, 3)
+        self.assertIsNone(watch1.error)
+        self.assertTrue(watch1.wait(0))
+        self.assertEqual(watch2.error, error)
+        self.assertEqual(self.poller._watches, [])
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.time')
+    def test_run_survives_a_failed_poll(self, time):
+        self.poller._watches = [Mock()]
+        self.poller._thread = threading.current_thread()
+        poll_calls = []
+
+        def poll():
+            poll_calls.append(1)
+            if len(poll_calls) == 1:
+                raise ValueError('poll')
+            self.poller._watches = []
+
+        self.poller.poll = poll
+
+        self.poller._run()
+
+        self.assertEqual(len(poll_calls), 2)
+        self.assertIsNone(self.poller._thread)
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.instance_state_poller.time')
+    def test_run_resets_the_thread_when_it_dies(self, time):
+        self.poller._watches = [Mock()]
+        self.poller._thread = threading.current_thread()
+        time.sleep.side_effect = KeyboardInterrupt()
+
+        self.assertRaises(KeyboardInterrupt, self.poller._run)
+
+        self.assertIsNone(self.poller._thread)
+
+    def test_waiter_is_woken_by_the_poller(self):
+        waiter = InstanceWaiter(Mock(), instance_state_poller=self.poller)
+        instance1 = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+        instance2 = FakeInstance('i-2', InstanceWaiter.PENDING, self.ec2_client)
+        self.ec2_client.states['i-1'] = InstanceWaiter.RUNNING
+        self.ec2_client.states['i-2'] = InstanceWaiter.RUNNING
+
+        res = waiter.multi_wait([instance1, instance2], InstanceWaiter.RUNNING)
+
+        self.assertEqual(res, [instance1, instance2])
+        self.assertEqual(self.ec2_client.describe_calls, [['i-1', 'i-2']])
+        self.assertEqual(self.poller._watches, [])
+
+    def test_waiter_times_out_and_unwatches(self):
+        waiter = InstanceWaiter(Mock(), timeout=0, instance_state_poller=self.poller)
+        instance = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+
+        self.assertRaises(TimeoutError, waiter.wait, instance, InstanceWaiter.RUNNING)
+        self.assertEqual(self.poller._watches, [])
+
+    def test_waiter_checks_cancellation(self):
+        cancellation_service = Mock()
+        cancellation_service.check_if_cancelled.side_effect = ValueError('cancelled')
+        cancellation_context = Mock()
+        waiter = InstanceWaiter(cancellation_service, instance_state_poller=self.poller)
+        instance = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+
+        self.assertRaises(ValueError, waiter.wait, instance, InstanceWaiter.RUNNING, cancellation_context)
+        cancellation_service.check_if_cancelled.assert_called_once_with(cancellation_context,
+                                                                        {'instance_ids': ['i-1']})
+        self.assertEqual(self.poller._watches, [])
@@ -3,30 +3,29 @@ from mock import Mock, patch
 
 from cloudshell.cp.aws.domain.services.waiters.instance import InstanceWaiter
 
-instance = Mock()
-instance.state = {'Name': ''}
 
+class FakeEc2Client(object):
+    def __init__(self):
+        self.states = {}
+        self.describe_calls = []
 
-class helper:
-    @staticmethod
-    def change_to_terminate(a):
-        instance.state['Name'] = InstanceWaiter.TERMINATED
+    def describe_instances(self, InstanceIds):
+        self.describe_calls.append(list(InstanceIds))
+        return {'Reservations': [{'Instances': [{'InstanceId': instance_id,
+                                                 'State': {'Name': self.states[instance_id]}}
+                                                for instance_id in InstanceIds
+                                                if instance_id in self.states]}]}
 
-    @staticmethod
-    def change_to_stopped(a):
-        instance.state['Name'] = InstanceWaiter.STOPPED
 
-    @staticmethod
-    def change_to_running(a):
-        instance.state['Name'] = InstanceWaiter.RUNNING
+class FakeInstance(object):
+    def __init__(self, instance_id, state, ec2_client):
+        self.id = instance_id
+        self.meta = Mock(client=ec2_client, data={'InstanceId': instance_id, 'State': {'Name': state}})
+        ec2_client.states[instance_id] = state
 
-    @staticmethod
-    def change_to_stopping(a):
-        instance.state['Name'] = InstanceWaiter.STOPPING
-
-    @staticmethod
-    def change_to_pending(a):
-        instance.state['Name'] = InstanceWaiter.PENDING
+    @property
+    def state(self):
+        return self.meta.data['State']
 
 
 class TestInstanceWaiter(TestCase):
@@ -35,71 +34,107 @@ class TestInstanceWaiter(TestCase):
         self.instance_waiter = InstanceWaiter(self.cancellation_service, 1, 0.02)
         self.instance = Mock()
         self.logger = Mock()
+        self.ec2_client = FakeEc2Client()
+
+    def _change_state_on_sleep(self, state, *instances):
+        def sleep(delay):
+            for instance in instances:
+                self.ec2_client.states[instance.id] = state
+        return sleep
 
-    @patch('time.sleep', helper.change_to_stopped)
     def test_waiter(self):
-        helper.change_to_running(Mock())
-        inst = self.instance_waiter.wait(instance, InstanceWaiter.STOPPED)
+        instance = FakeInstance('i-1', InstanceWaiter.RUNNING, self.ec2_client)
+
+        with patch('time.sleep', self._change_state_on_sleep(InstanceWaiter.STOPPED, instance)):
+            inst = self.instance_waiter.wait(instance, InstanceWaiter.STOPPED)
+
         self.assertEqual(inst, instance)
-        self.assertEqual(inst.reload.call_count, 1)
+        self.assertEqual(inst.state['Name'], InstanceWaiter.STOPPED)
+        self.assertEqual(self.ec2_client.describe_calls, [['i-1']])
 
+    @patch('time.sleep', Mock())
     def test_waiter_timeout(self):
-        helper.change_to_running(Mock())
+        instance = FakeInstance('i-1', InstanceWaiter.RUNNING, self.ec2_client)
+        self.instance_waiter.timeout = 0
         self.assertRaises(Exception, self.instance_waiter.wait, instance, InstanceWaiter.STOPPED)
 
-    @patch('time.sleep', helper.change_to_stopped)
     def test_waiter_multi(self):
-        helper.change_to_stopped(Mock())
-
-        instance.state['Name'] = InstanceWaiter.RUNNING
+        instance = FakeInstance('i-1', InstanceWaiter.RUNNING, self.ec2_client)
+        inst = FakeInstance('i-2', InstanceWaiter.STOPPED, self.ec2_client)
 
-        inst = Mock()
-        inst.state = dict()
-        inst.state['Name'] = InstanceWaiter.STOPPED
+        with patch('time.sleep', self._change_state_on_sleep(InstanceWaiter.STOPPED, instance)):
+            res = self.instance_waiter.multi_wait([instance, inst], InstanceWaiter.STOPPED)
 
-        res = self.instance_waiter.multi_wait([instance, inst], InstanceWaiter.STOPPED)
         self.assertEqual(res, [instance, inst])
-        self.assertTrue(instance.reload.call_count, 2)
+        self.assertEqual(instance.state['Name'], InstanceWaiter.STOPPED)
+        # instances already in the state are not described
+        self.assertEqual(self.ec2_client.describe_calls, [['i-1']])
 
-    @patch('time.sleep', helper.change_to_stopped)
-    def test_waiter_multi_with_cancellation(self):
-        cancellation_context = Mock()
-        helper.change_to_stopped(Mock())
+    def test_waiter_multi_describes_all_pending_instances_in_one_call(self):
+        instances = [FakeInstance('i-{0}'.format(i), InstanceWaiter.PENDING, self.ec2_client) for i in range(3)]
+
+        with patch('time.sleep', self._change_state_on_sleep(InstanceWaiter.RUNNING, *instances)):
+            res = self.instance_waiter.multi_wait(instances, InstanceWaiter.RUNNING)
+
+        self.assertEqual(res, instances)
+        self.assertTrue(all(instance.state['Name'] == InstanceWaiter.RUNNING for instance in instances))
+        self.assertEqual(self.ec2_client.describe_calls, [['i-0', 'i-1', 'i-2']])
 
-        instance.state['Name'] = InstanceWaiter.RUNNING
+    def test_waiter_multi_stops_describing_instances_that_reached_the_state(self):
+        instance1 = FakeInstance('i-1', InstanceWaiter.PENDING, self.ec2_client)
+        instance2 = FakeInstance('i-2', InstanceWaiter.PENDING, self.ec2_client)
+        sleeps = [self._change_state_on_sleep(InstanceWaiter.RUNNING, instance1),
+                  self._change_state_on_sleep(InstanceWaiter.RUNNING, instance2)]
 
-        inst = Mock()
-        inst.state = dict()
-        inst.state['Name'] = InstanceWaiter.STOPPED
+        with patch('time.sleep', lambda delay: sleeps.pop(0)(delay)):
+            self.instance_waiter.multi_wait([instance1, instance2], InstanceWaiter.RUNNING)
 
+        self.assertEqual(self.ec2_client.describe_calls, [['i-1', 'i-2'], ['i-2']])
+
+    @patch('time.sleep', Mock())
+    def test_waiter_multi_chunks_describe_calls(self):
+        self.instance_waiter.MAX_INSTANCE_IDS_PER_DESCRIBE = 2
+        instances = [FakeInstance('i-{0}'.format(i), InstanceWaiter.PENDING, self.ec2_client) for i in range(5)]
+        for instance in instances:
+            self.ec2_client.states[instance.id] = InstanceWaiter.RUNNING
+
+        self.instance_waiter.multi_wait(instances, InstanceWaiter.RUNNING)
+
+        self.assertEqual(self.ec2_client.describe_calls, [['i-0', 'i-1'], ['i-2', 'i-3'], ['i-4']])
+
+    def test_waiter_multi_with_cancellation(self):
+        cancellation_context = Mock()
+        instance = FakeInstance('i-1', InstanceWaiter.RUNNING, self.ec2_client)
+        inst = FakeInstance('i-2', InstanceWaiter.STOPPED, self.ec2_client)
         instances = [instance, inst]
 
-        res = self.instance_waiter.multi_wait(instances, InstanceWaiter.STOPPED, cancellation_context)
+        with patch('time.sleep', self._change_state_on_sleep(InstanceWaiter.STOPPED, instance)):
+            res = self.instance_waiter.multi_wait(instances, InstanceWaiter.STOPPED, cancellation_context)
 
         self.assertEqual(res, [instance, inst])
-        self.assertTrue(instance.reload.call_count, 2)
-        self.assertTrue(self.cancellation_service.check_if_cancelled.call_count, 2)
-        instance_ids = filter(lambda x: str(x.id), instances)
+        self.assertEqual(self.cancellation_service.check_if_cancelled.call_count, 1)
         self.cancellation_service.check_if_cancelled.assert_called_with(cancellation_context,
-                                                                        {'instance_ids': instance_ids})
+                                                                        {'instance_ids': ['i-1', 'i-2']})
 
     def test_waiter_multi_errors(self):
         self.assertRaises(ValueError, self.instance_waiter.multi_wait, [], InstanceWaiter.STOPPED)
         self.assertRaises(ValueError, self.instance_waiter.multi_wait, [Mock], 'blalala')
 
-    @patch('cloudshell.cp.aws.domain.services.waiters.instance.time')
+    @patch('cloudshell.cp.aws.domain.services.waiters.polling.time')
     def test_wait_status_ok(self, time):
         # arrange
         def describe_instance_status_handler(*args, **kwargs):
-            result = Mock()
+            result = {}
             instance_id_mock = kwargs['InstanceIds'][0]
             if hasattr(instance_id_mock, "called_already") and instance_id_mock.called_already is True:
-                result.InstanceStatuses = [{'SystemStatus': {'Status': self.instance_waiter.STATUS_OK},
-                                            'InstanceStatus': {'Status': self.instance_waiter.STATUS_OK}}]
+                result['InstanceStatuses'] = [{'InstanceId': instance_id_mock,
+                                               'SystemStatus': {'Status': self.instance_waiter.STATUS_OK},
+                                               'InstanceStatus': {'Status': self.instance_waiter.STATUS_OK}}]
             else:
                 instance_id_mock.called_already = True
-                result.InstanceStatuses = [
-                    {'SystemStatus': {'Status': 'initializing'}, 'InstanceStatus': {'Status': 'initializing'}}]
+                result['InstanceStatuses'] = [
+                    {'InstanceId': instance_id_mock,
+                     'SystemStatus': {'Status': 'initializing'}, 'InstanceStatus': {'Status': 'initializing'}}]
 
             return result
 
@@ -117,19 +152,21 @@ class TestInstanceWaiter(TestCase):
         self.assertEquals(instance_state['SystemStatus']['Status'], self.instance_waiter.STATUS_OK)
         self.assertEquals(instance_state['InstanceStatus']['Status'], self.instance_waiter.STATUS_OK)
 
-    @patch('cloudshell.cp.aws.domain.services.waiters.instance.time')
+    @patch('cloudshell.cp.aws.domain.services.waiters.polling.time')
     def test_wait_status_ok_raises_impaired_status(self, time):
         # arrange
         def describe_instance_status_handler(*args, **kwargs):
-            result = Mock()
+            result = {}
             instance_id_mock = kwargs['InstanceIds'][0]
             if hasattr(instance_id_mock, "called_already") and instance_id_mock.called_already is True:
-                result.InstanceStatuses = [{'SystemStatus': {'Status': self.instance_waiter.STATUS_IMPAIRED},
-                                            'InstanceStatus': {'Status': self.instance_waiter.STATUS_IMPAIRED}}]
+                result['InstanceStatuses'] = [{'InstanceId': instance_id_mock,
+                                               'SystemStatus': {'Status': self.instance_waiter.STATUS_IMPAIRED},
+                                               'InstanceStatus': {'Status': self.instance_waiter.STATUS_IMPAIRED}}]
             else:
                 instance_id_mock.called_already = True
-                result.InstanceStatuses = [
-                    {'SystemStatus': {'Status': 'initializing'}, 'InstanceStatus': {'Status': 'initializing'}}]
+                result['InstanceStatuses'] = [
+                    {'InstanceId': instance_id_mock,
+                     'SystemStatus': {'Status': 'initializing'}, 'InstanceStatus': {'Status': 'initializing'}}]
 
             return result
 
@@ -144,3 +181,67 @@ class TestInstanceWaiter(TestCase):
                                                                  instance=instance,
                                                                  logger=self.logger)
 
+    @patch('cloudshell.cp.aws.domain.services.waiters.polling.time')
+    def test_multi_wait_status_ok_describes_all_pending_instances_in_one_call(self, time):
+        # arrange
+        time.time.return_value = 0
+        statuses = {'i-1': ['initializing', 'ok'],
+                    'i-2': ['initializing', 'initializing', 'ok'],
+                    'i-3': ['impaired']}
+        calls = []
+
+        def describe_instance_status_handler(InstanceIds, IncludeAllInstances):
+            calls.append(InstanceIds)
+            return {'InstanceStatuses': [{'InstanceId': instance_id,
+                                          'SystemStatus': {'Status': 'ok'},
+                                          'InstanceStatus': {'Status': statuses[instance_id].pop(0)}}
+                                         for instance_id in InstanceIds]}
+
+        ec2_client = Mock()
+        ec2_client.describe_instance_status = Mock(side_effect=describe_instance_status_handler)
+        instances = [Mock(id='i-1'), Mock(id='i-2'), Mock(id='i-3')]
+        cancellation_context = Mock()
+
+        # act
+        instance_statuses = self.instance_waiter.multi_wait_status_ok(ec2_client=ec2_client,
+                                                                      instances=instances,
+                                                                      logger=self.logger,
+                                                                      cancellation_context=cancellation_context)
+
+        # assert
+        self.assertEqual(calls, [['i-1', 'i-2', 'i-3'], ['i-1', 'i-2'], ['i-2']])
+        self.assertEqual(instance_statuses['i-1']['InstanceStatus']['Status'], self.instance_waiter.STATUS_OK)
+        self.assertEqual(instance_statuses['i-2']['InstanceStatus']['Status'], self.instance_waiter.STATUS_OK)
+        self.assertEqual(self.instance_waiter.get_impaired_instance_ids(instance_statuses), ['i-3'])
+        self.logger.error.assert_called_once()
+        self.cancellation_service.check_if_cancelled.assert_called_with(cancellation_context,
+                                                                        {'instance_ids': ['i-1', 'i-2', 'i-3']})
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.polling.time')
+    def test_multi_wait_status_ok_chunks_describe_calls(self, time):
+        # arrange
+        self.instance_waiter.MAX_INSTANCE_IDS_PER_DESCRIBE_STATUS = 2
+        ec2_client = Mock()
+        ec2_client.describe_instance_status.side_effect = lambda InstanceIds, IncludeAllInstances: {
+            'InstanceStatuses': [{'InstanceId': instance_id,
+                                  'SystemStatus': {'Status': 'ok'},
+                                  'InstanceStatus': {'Status': 'ok'}} for instance_id in InstanceIds]}
+        instances = [Mock(id='i-{0}'.format(i)) for i in range(3)]
+
+        # act
+        self.instance_waiter.multi_wait_status_ok(ec2_client=ec2_client, instances=instances, logger=self.logger)
+
+        # assert
+        self.assertEqual([c[1]['InstanceIds'] for c in ec2_client.describe_instance_status.call_args_list],
+                         [['i-0', 'i-1'], ['i-2']])
+        time.sleep.assert_not_called()
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.polling.time')
+    def test_multi_wait_status_ok_timeout(self, time):
+        time.time.side_effect = [0, self.instance_waiter.timeout]
+        ec2_client = Mock()
+        ec2_client.describe_instance_status.return_value = {'InstanceStatuses': []}
+
+        with self.assertRaisesRegexp(Exception, 'i-1'):
+            self.instance_waiter.multi_wait_status_ok(ec2_client=ec2_client, instances=[Mock(id='i-1')],
+                                                      logger=self.logger)
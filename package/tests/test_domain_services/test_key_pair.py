@@ -69,3 +69,25 @@ class TestKeyPair(TestCase):
 
         self.assertIsNone(key)
 
+
+    def test_save_and_load_instance_key(self):
+        self.key_pair_serv.save_instance_key(self.s3_session, 'bucket', 'res-1', 'i-1', 'private key')
+        key = self.key_pair_serv.load_instance_key(self.s3_session, 'bucket', 'res-1', 'i-1')
+
+        self.s3_service.put_key.assert_called_once_with(self.s3_session, bucket_name='bucket',
+                                                        key='reservation-id-res-1/instance i-1.pem',
+                                                        value='private key')
+        self.s3_service.get_key.assert_called_once_with(self.s3_session, 'bucket',
+                                                        'reservation-id-res-1/instance i-1.pem')
+        self.assertEqual(key, self.s3_service.get_body_of_object.return_value)
+
+    def test_load_instance_key_not_found(self):
+        self.s3_service.get_key.return_value = None
+
+        self.assertIsNone(self.key_pair_serv.load_instance_key(self.s3_session, 'bucket', 'res-1', 'i-1'))
+
+    def test_remove_instance_keys_for_reservation_in_s3(self):
+        self.key_pair_serv.remove_instance_keys_for_reservation_in_s3(self.s3_session, 'bucket', 'res-1')
+
+        self.s3_service.delete_keys.assert_called_once_with(s3_session=self.s3_session, bucket='bucket',
+                                                            prefix='reservation-id-res-1/instance ')
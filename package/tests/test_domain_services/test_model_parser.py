@@ -402,4 +402,95 @@ class TestModelParser(TestCase):
         self.assertTrue(convert_to_bool("True"))
         self.assertTrue(convert_to_bool(True))
         self.assertFalse(convert_to_bool("False"))
-        self.assertFalse(convert_to_bool(False))
\ No newline at end of file
+        self.assertFalse(convert_to_bool(False))
+
+    def _get_cloud_provider_resource(self, **extra_attributes):
+        attributes = {'Region': 'us-east-1',
+                      'Max Storage IOPS': '0',
+                      'Max Storage Size': '0',
+                      'AWS Secret Access Key': 'secret',
+                      'AWS Access Key ID': 'key id',
+                      'Keypairs Location': 'bucket',
+                      'AWS Mgmt VPC ID': 'vpc-1',
+                      'AWS Mgmt SG ID': 'sg-1',
+                      'Instance Type': 't2.micro',
+                      'VPC Mode': 'Dynamic',
+                      'VPC CIDR': ''}
+        attributes.update(extra_attributes)
+        resource = Mock()
+        resource.attributes = attributes
+        return resource
+
+    def test_convert_to_aws_resource_model_transport_attributes(self):
+        resource = self._get_cloud_provider_resource(**{'Max Pool Connections': '50',
+                                                        'Max Retry Attempts': '8',
+                                                        'Connect Timeout': '5',
+                                                        'Read Timeout': '30'})
+
+        model = AWSModelsParser.convert_to_aws_resource_model(resource)
+
+        self.assertEqual(model.max_pool_connections, 50)
+        self.assertEqual(model.max_retry_attempts, 8)
+        self.assertEqual(model.connect_timeout, 5)
+        self.assertEqual(model.read_timeout, 30)
+
+    def test_convert_to_aws_resource_model_without_transport_attributes(self):
+        model = AWSModelsParser.convert_to_aws_resource_model(self._get_cloud_provider_resource())
+
+        self.assertEqual(model.max_pool_connections, 0)
+        self.assertEqual(model.max_retry_attempts, 0)
+        self.assertEqual(model.connect_timeout, 0)
+        self.assertEqual(model.read_timeout, 0)
+
+    def test_convert_to_aws_resource_model_invalid_transport_attribute(self):
+        resource = self._get_cloud_provider_resource(**{'Read Timeout': 'abc'})
+
+        self.assertRaises(ValueError, AWSModelsParser.convert_to_aws_resource_model, resource)
+
+    def test_convert_to_aws_resource_model_elastic_ip_pool_attributes(self):
+        resource = self._get_cloud_provider_resource(**{'Elastic IP Pool Size': '3',
+                                                        'Elastic IP Pool Max Size': '10'})
+
+        model = AWSModelsParser.convert_to_aws_resource_model(resource)
+
+        self.assertEqual(model.elastic_ip_pool_size, 3)
+        self.assertEqual(model.elastic_ip_pool_max_size, 10)
+
+    def test_convert_to_aws_resource_model_without_elastic_ip_pool_attributes(self):
+        model = AWSModelsParser.convert_to_aws_resource_model(self._get_cloud_provider_resource())
+
+        self.assertEqual(model.elastic_ip_pool_size, 0)
+        self.assertEqual(model.elastic_ip_pool_max_size, 0)
+
+    def test_convert_to_aws_resource_model_warm_pool_attributes(self):
+        resource = self._get_cloud_provider_resource(**{'Warm Pool Subnet ID': ' subnet-1 ',
+                                                        'Warm Pool Size': '2',
+                                                        'Warm Pool AMI IDs': 'ami-1, ami-2,'})
+
+        model = AWSModelsParser.convert_to_aws_resource_model(resource)
+
+        self.assertEqual(model.warm_pool_subnet_id, 'subnet-1')
+        self.assertEqual(model.warm_pool_size, 2)
+        self.assertEqual(model.warm_pool_ami_ids, ['ami-1', 'ami-2'])
+
+    def test_convert_to_aws_resource_model_without_warm_pool_attributes(self):
+        model = AWSModelsParser.convert_to_aws_resource_model(self._get_cloud_provider_resource())
+
+        self.assertEqual(model.warm_pool_subnet_id, '')
+        self.assertEqual(model.warm_pool_size, 0)
+        self.assertEqual(model.warm_pool_ami_ids, [])
+
+    def test_convert_to_aws_resource_model_async_cleanup(self):
+        resource = self._get_cloud_provider_resource(**{'Async Cleanup': 'True'})
+
+        self.assertTrue(AWSModelsParser.convert_to_aws_resource_model(resource).async_cleanup)
+        self.assertFalse(AWSModelsParser.convert_to_aws_resource_model(self._get_cloud_provider_resource())
+                         .async_cleanup)
+
+    def test_convert_to_aws_resource_model_async_cleanup_journal_directory(self):
+        resource = self._get_cloud_provider_resource(**{'Async Cleanup Journal Directory': ' /var/aws_shell '})
+
+        self.assertEqual(AWSModelsParser.convert_to_aws_resource_model(resource).async_cleanup_journal_directory,
+                         '/var/aws_shell')
+        self.assertEqual(AWSModelsParser.convert_to_aws_resource_model(self._get_cloud_provider_resource())
+                         .async_cleanup_journal_directory, '')
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from mock import Mock
+from mock import Mock, call
 
 from cloudshell.cp.aws.domain.services.waiters.password import PasswordWaiter
 
@@ -26,3 +26,29 @@ class TestPasswordWaiter(TestCase):
         instance.password_data.side_effect = [{'PasswordData': ''}, {'PasswordData': 'password'}]
         res = self.pass_waiter.wait(instance)
         self.assertEqual(res, 'password')
+
+    def test_multi_wait_none(self):
+        self.assertRaises(ValueError, self.pass_waiter.multi_wait, [])
+
+    def test_multi_wait_calls_back_as_each_password_is_set(self):
+        first_instance = Mock(id='i-1')
+        first_instance.password_data.side_effect = [{'PasswordData': 'first'}]
+        second_instance = Mock(id='i-2')
+        second_instance.password_data.side_effect = [{'PasswordData': ''}, {'PasswordData': 'second'}]
+        on_password = Mock()
+
+        res = self.pass_waiter.multi_wait([first_instance, second_instance], on_password=on_password)
+
+        self.assertEqual(res, {'i-1': 'first', 'i-2': 'second'})
+        self.assertEqual(on_password.call_args_list, [call(first_instance), call(second_instance)])
+
+    def test_multi_wait_timeout(self):
+        instance = Mock(id='i-1')
+        instance.password_data = Mock(return_value={'PasswordData': ''})
+
+        self.assertRaises(Exception, self.pass_waiter.multi_wait, [instance])
+
+    def test_default_max_delay(self):
+        pass_waiter = PasswordWaiter(self.cancellation_service)
+
+        self.assertEqual(pass_waiter.backoff_policy.max_delay, 5)
@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from cloudshell.cp.aws.domain.services.waiters.polling import BackoffPolicy, poll_until
+
+
+class TestBackoffPolicy(TestCase):
+    def test_get_delay_backs_off_up_to_max_delay(self):
+        policy = BackoffPolicy(initial_delay=1, max_delay=10, backoff_factor=2, jitter=0)
+
+        delays = [policy.get_delay(attempt) for attempt in range(6)]
+
+        self.assertEqual(delays, [1, 2, 4, 8, 10, 10])
+
+    def test_get_delay_does_not_overflow_on_long_waits(self):
+        policy = BackoffPolicy(initial_delay=1, max_delay=10, jitter=0)
+        self.assertEqual(policy.get_delay(100000), 10)
+
+    def test_initial_delay_is_capped_by_max_delay(self):
+        policy = BackoffPolicy(initial_delay=5, max_delay=1, jitter=0)
+        self.assertEqual(policy.get_delay(0), 1)
+
+    @patch('cloudshell.cp.aws.domain.services.waiters.polling.random')
+    def test_get_delay_cuts_jitter(self, random):
+        random.random.return_value = 0.5
+        policy = BackoffPolicy(initial_delay=4, max_delay=10, jitter=0.5)
+
+        self.assertEqual(policy.get_delay(0), 3)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, BackoffPolicy, initial_delay=-1, max_delay=1)
+        self.assertRaises(ValueError, BackoffPolicy, initial_delay=1, max_delay=1, backoff_factor=0.5)
+        self.assertRaises(ValueError, BackoffPolicy, initial_delay=1, max_delay=1, jitter=2)
+
+
+@patch('cloudshell.cp.aws.domain.services.waiters.polling.time')
+class TestPollUntil(TestCase):
+    def setUp(self):
+        self.policy = BackoffPolicy(initial_delay=1, max_delay=4, jitter=0)
+
+    def test_returns_without_sleeping_when_done(self, time):
+        refresh = Mock()
+
+        poll_until(is_done=lambda: True, refresh=refresh, backoff_policy=self.policy, timeout=10,
+                   on_timeout=Exception)
+
+        time.sleep.assert_not_called()
+        refresh.assert_not_called()
+
+    def test_sleeps_with_backoff_and_refreshes_until_done(self, time):
+        time.time.return_value = 0
+        results = [False, False, False, True]
+        refresh = Mock()
+        check_cancelled = Mock()
+
+        poll_until(is_done=lambda: results.pop(0), refresh=refresh, backoff_policy=self.policy, timeout=10,
+                   on_timeout=Exception, check_cancelled=check_cancelled)
+
+        self.assertEqual([c[0][0] for c in time.sleep.call_args_list], [1, 2, 4])
+        self.assertEqual(refresh.call_count, 3)
+        self.assertEqual(check_cancelled.call_count, 3)
+
+    def test_does_not_sleep_past_timeout(self, time):
+        time.time.side_effect = [0, 0, 9, 10]
+        results = [False, False, True]
+
+        poll_until(is_done=lambda: results.pop(0), refresh=Mock(), backoff_policy=self.policy, timeout=10,
+                   on_timeout=Exception)
+
+        self.assertEqual([c[0][0] for c in time.sleep.call_args_list], [1, 1])
+
+    def test_raises_on_timeout(self, time):
+        time.time.side_effect = [0, 0, 10]
+
+        with self.assertRaisesRegexp(ValueError, 'timed out'):
+            poll_until(is_done=lambda: False, refresh=Mock(), backoff_policy=self.policy, timeout=10,
+                       on_timeout=lambda: ValueError('timed out'))
+
+    def test_cancellation_stops_polling(self, time):
+        time.time.return_value = 0
+        refresh = Mock()
+
+        with self.assertRaises(ValueError):
+            poll_until(is_done=lambda: False, refresh=refresh, backoff_policy=self.policy, timeout=10,
+                       on_timeout=Exception, check_cancelled=Mock(side_effect=ValueError()))
+
+        time.sleep.assert_not_called()
+        refresh.assert_not_called()
@@ -165,4 +165,34 @@ class TestRouteTableService(TestCase):
         result = self.route_table_service.delete_table(table)
         # Assert
         table.delete.assert_called_once()
-        self.assertTrue(result)
\ No newline at end of file
+        self.assertTrue(result)
+    def test_delete_peering_routes(self):
+        ec2_client = Mock()
+        ec2_client.describe_route_tables.return_value = {'RouteTables': [
+            {'RouteTableId': 'rtb-1', 'Routes': [{'DestinationCidrBlock': '10.0.1.0/24',
+                                                  'VpcPeeringConnectionId': 'pcx-1', 'State': 'blackhole'},
+                                                 {'DestinationCidrBlock': '10.0.2.0/24', 'State': 'blackhole'}]},
+            {'RouteTableId': 'rtb-2', 'Routes': [{'DestinationCidrBlock': '10.0.1.0/24',
+                                                  'VpcPeeringConnectionId': 'pcx-2', 'State': 'active'}]}]}
+
+        result = self.route_table_service.delete_peering_routes(ec2_client, ['rtb-1', 'rtb-2'], '10.0.1.0/24', 'pcx-1')
+
+        self.assertTrue(result)
+        ec2_client.describe_route_tables.assert_called_once_with(
+            Filters=[{'Name': 'route-table-id', 'Values': ['rtb-1', 'rtb-2']}])
+        ec2_client.delete_route.assert_called_once_with(RouteTableId='rtb-1', DestinationCidrBlock='10.0.1.0/24')
+
+    def test_delete_peering_routes_ignores_deleted_routes(self):
+        ec2_client = Mock()
+        ec2_client.describe_route_tables.return_value = {'RouteTables': [
+            {'RouteTableId': 'rtb-1', 'Routes': [{'DestinationCidrBlock': '10.0.1.0/24', 'State': 'blackhole'}]}]}
+        ec2_client.delete_route.side_effect = Exception('InvalidRoute.NotFound')
+
+        self.assertTrue(self.route_table_service.delete_peering_routes(ec2_client, ['rtb-1'], '10.0.1.0/24', 'pcx-1'))
+
+    def test_delete_peering_routes_without_route_tables(self):
+        ec2_client = Mock()
+
+        self.route_table_service.delete_peering_routes(ec2_client, [], '10.0.1.0/24', 'pcx-1')
+
+        ec2_client.describe_route_tables.assert_not_called()
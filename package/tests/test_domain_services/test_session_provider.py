@@ -1,6 +1,7 @@
 from unittest import TestCase
-from mock import Mock
+from mock import Mock, patch
 from cloudshell.cp.aws.domain.services.session_providers.aws_session_provider import AWSSessionProvider
+from cloudshell.cp.aws.models.aws_api import AwsApiClients
 
 DECRYPTED_PREFIX = "decrypted: "
 
@@ -23,6 +24,10 @@ class TestAWSSessionProvider(TestCase):
         self.aws_ec2_data_model.aws_access_key_id = "access key"
         self.aws_ec2_data_model.aws_secret_access_key = "secret key"
         self.aws_ec2_data_model.region = "region"
+        self.aws_ec2_data_model.max_pool_connections = 0
+        self.aws_ec2_data_model.max_retry_attempts = 0
+        self.aws_ec2_data_model.connect_timeout = 0
+        self.aws_ec2_data_model.read_timeout = 0
 
 
     def test_get_clients(self):
@@ -32,3 +37,180 @@ class TestAWSSessionProvider(TestCase):
         self.assertIsNotNone(aws_api.ec2_session)
         self.assertIsNotNone(aws_api.ec2_client)
         self.assertIsNotNone(aws_api.s3_session)
+
+    def test_get_clients_reuses_cached_clients(self):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+        self.assertIs(aws_api.ec2_client, aws_api_2.ec2_client)
+        self.assertIs(aws_api.ec2_session.meta.client, aws_api_2.ec2_session.meta.client)
+        self.assertIs(aws_api.s3_session.meta.client, aws_api_2.s3_session.meta.client)
+
+    def test_get_clients_builds_resources_per_command(self):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertIsNot(aws_api.ec2_session, aws_api_2.ec2_session)
+        self.assertIsNot(aws_api.s3_session, aws_api_2.s3_session)
+        self.assertIs(aws_api.ec2_session, aws_api.ec2_session)
+
+    def test_create_dedicated_clients(self):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        dedicated_aws_api = self.session_provider.create_dedicated_clients(
+            cloudshell_session=self.cloudshell_session, aws_ec2_data_model=self.aws_ec2_data_model)
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertIsNot(dedicated_aws_api.ec2_client, aws_api.ec2_client)
+        self.assertIs(aws_api.ec2_client, aws_api_2.ec2_client)
+
+    def test_get_clients_creates_new_clients_when_secret_changed(self):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        self.aws_ec2_data_model.aws_secret_access_key = "new secret key"
+
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertIsNot(aws_api.ec2_client, aws_api_2.ec2_client)
+        self.assertEqual(len(self.session_provider.clients_cache), 1)
+
+    def test_get_clients_per_region(self):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        self.aws_ec2_data_model.region = "other-region"
+
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertIsNot(aws_api.ec2_client, aws_api_2.ec2_client)
+        self.assertEqual(len(self.session_provider.clients_cache), 2)
+
+    def test_clients_cache_key_does_not_contain_secret(self):
+        credentials = Mock(access_key_id="key id", secret_access_key="secret")
+
+        key = self.session_provider._get_clients_cache_key(self.aws_ec2_data_model, credentials)
+
+        self.assertEqual(key[:2], ("region", "key id"))
+        self.assertNotIn("secret", key)
+
+    def test_invalidate_clients(self):
+        self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                          aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.session_provider.invalidate_clients(self.aws_ec2_data_model)
+
+        self.assertEqual(len(self.session_provider.clients_cache), 0)
+
+    def test_get_aws_credentials_decrypts_once(self):
+        credentials = self.session_provider._get_aws_credentials(self.cloudshell_session, self.aws_ec2_data_model)
+        credentials_2 = self.session_provider._get_aws_credentials(self.cloudshell_session, self.aws_ec2_data_model)
+
+        self.assertIs(credentials, credentials_2)
+        self.assertEqual(credentials.access_key_id, DECRYPTED_PREFIX + "access key")
+        self.assertEqual(credentials.secret_access_key, DECRYPTED_PREFIX + "secret key")
+        self.assertEqual(self.cloudshell_session.DecryptPassword.call_count, 2)
+
+    def test_get_aws_credentials_decrypts_again_when_encrypted_value_changed(self):
+        self.session_provider._get_aws_credentials(self.cloudshell_session, self.aws_ec2_data_model)
+        self.aws_ec2_data_model.aws_secret_access_key = "new secret key"
+
+        credentials = self.session_provider._get_aws_credentials(self.cloudshell_session, self.aws_ec2_data_model)
+
+        self.assertEqual(credentials.secret_access_key, DECRYPTED_PREFIX + "new secret key")
+        self.assertEqual(self.cloudshell_session.DecryptPassword.call_count, 4)
+
+    def test_get_aws_credentials_decrypts_again_when_expired(self):
+        session_provider = AWSSessionProvider(credentials_cache_ttl=0)
+
+        session_provider._get_aws_credentials(self.cloudshell_session, self.aws_ec2_data_model)
+        session_provider._get_aws_credentials(self.cloudshell_session, self.aws_ec2_data_model)
+
+        self.assertEqual(self.cloudshell_session.DecryptPassword.call_count, 4)
+
+    @patch('cloudshell.cp.aws.domain.services.session_providers.aws_session_provider.boto3')
+    def test_get_clients_creates_clients_on_first_access(self, boto3):
+        session = boto3.Session.return_value
+
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        boto3.Session.assert_not_called()
+
+        aws_api.ec2_client
+        aws_api.ec2_client
+
+        session.client.assert_called_once_with(AWSSessionProvider.EC2, config=None)
+        session.resource.assert_not_called()
+        self.assertEqual(aws_api.get_used_clients(), [AwsApiClients.EC2_CLIENT])
+        self.assertEqual(aws_api.usage_counters[AwsApiClients.EC2_CLIENT], 2)
+
+    @patch('cloudshell.cp.aws.domain.services.session_providers.aws_session_provider.boto3')
+    def test_get_clients_counts_usage_per_command(self, boto3):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        aws_api.s3_session
+
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertEqual(aws_api_2.get_used_clients(), [])
+        aws_api_2.s3_session
+        boto3.Session.return_value.resource.assert_called_once_with(AWSSessionProvider.S3, config=None)
+
+    def test_get_client_config_not_set(self):
+        self.assertIsNone(self.session_provider._get_client_config(self.aws_ec2_data_model))
+
+    def test_get_client_config(self):
+        self.aws_ec2_data_model.max_pool_connections = 50
+        self.aws_ec2_data_model.max_retry_attempts = 8
+        self.aws_ec2_data_model.connect_timeout = 5
+        self.aws_ec2_data_model.read_timeout = 30
+
+        config = self.session_provider._get_client_config(self.aws_ec2_data_model)
+
+        self.assertEqual(config.max_pool_connections, 50)
+        self.assertEqual(config.retries, {'max_attempts': 8})
+        self.assertEqual(config.connect_timeout, 5)
+        self.assertEqual(config.read_timeout, 30)
+
+    @patch('cloudshell.cp.aws.domain.services.session_providers.aws_session_provider.boto3')
+    def test_get_clients_passes_config_to_all_clients(self, boto3):
+        self.aws_ec2_data_model.max_pool_connections = 50
+        session = boto3.Session.return_value
+
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        aws_api.ec2_session
+        aws_api.s3_session
+        aws_api.ec2_client
+
+        for call in session.resource.call_args_list + session.client.call_args_list:
+            self.assertEqual(call[1]['config'].max_pool_connections, 50)
+
+    def test_get_clients_creates_new_clients_when_transport_settings_changed(self):
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+        self.aws_ec2_data_model.read_timeout = 120
+
+        aws_api_2 = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                      aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertIsNot(aws_api.ec2_client, aws_api_2.ec2_client)
+        # cloud providers of the same access key with different transport settings keep their own clients
+        self.assertEqual(len(self.session_provider.clients_cache), 2)
+
+    @patch('cloudshell.cp.aws.domain.services.session_providers.aws_session_provider.boto3')
+    def test_get_clients_registers_the_access_key_id_of_the_clients(self, boto3):
+        session = boto3.Session.return_value
+        session.get_credentials.return_value.access_key = 'key id'
+
+        aws_api = self.session_provider.get_clients(cloudshell_session=self.cloudshell_session,
+                                                    aws_ec2_data_model=self.aws_ec2_data_model)
+
+        self.assertEqual(AwsApiClients.get_access_key_id(aws_api.ec2_client), 'key id')
+        aws_api.ec2_session
+        self.assertEqual(AwsApiClients.get_access_key_id(session.resource.return_value.meta.client), 'key id')
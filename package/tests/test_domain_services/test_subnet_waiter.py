@@ -23,3 +23,30 @@ class TestSubnetWaiter(TestCase):
         vpc.reload = reload
         res = self.vpc_waiter.wait(vpc, SubnetWaiter.AVAILABLE)
         self.assertEqual(res.state, SubnetWaiter.AVAILABLE)
+
+    def test_multi_wait_describes_the_pending_subnets_together(self):
+        subnets = [Mock(id='subnet-1', state=SubnetWaiter.PENDING), Mock(id='subnet-2', state=SubnetWaiter.PENDING)]
+        subnets[1].meta = subnets[0].meta
+        client = subnets[0].meta.client
+        descriptions = [{'Subnets': [{'SubnetId': 'subnet-1', 'State': SubnetWaiter.AVAILABLE},
+                                     {'SubnetId': 'subnet-2', 'State': SubnetWaiter.PENDING}]},
+                        {'Subnets': [{'SubnetId': 'subnet-2', 'State': SubnetWaiter.AVAILABLE}]}]
+
+        def describe_subnets(SubnetIds):
+            description = descriptions.pop(0)
+            for subnet in subnets:
+                for subnet_description in description['Subnets']:
+                    if subnet_description['SubnetId'] == subnet.id:
+                        subnet.state = subnet_description['State']
+            return description
+
+        client.describe_subnets.side_effect = describe_subnets
+
+        res = self.vpc_waiter.multi_wait(subnets, SubnetWaiter.AVAILABLE)
+
+        self.assertEqual(res, subnets)
+        self.assertEqual([c[1]['SubnetIds'] for c in client.describe_subnets.call_args_list],
+                         [['subnet-1', 'subnet-2'], ['subnet-2']])
+
+    def test_multi_wait_empty(self):
+        self.assertRaises(ValueError, self.vpc_waiter.multi_wait, [], SubnetWaiter.AVAILABLE)
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from mock import Mock, MagicMock
+from mock import Mock, MagicMock, patch
 
 from cloudshell.cp.aws.domain.services.ec2.tags import TagService
 from cloudshell.cp.aws.models.reservation_model import ReservationModel
@@ -55,6 +55,22 @@ class TestTagService(TestCase):
 
         self.assertTrue(resource.create_tags.called_with(tags))
 
+    def test_set_ec2_resources_tags(self):
+        ec2_client = Mock()
+        tags = [Mock()]
+
+        self.tag_service.set_ec2_resources_tags(ec2_client=ec2_client, resource_ids=['i-1', 'vol-1'], tags=tags)
+
+        ec2_client.create_tags.assert_called_once_with(Resources=['i-1', 'vol-1'], Tags=tags)
+
+    def test_get_tag_specifications(self):
+        tags = [Mock()]
+
+        res = self.tag_service.get_tag_specifications(['instance', 'volume'], tags)
+
+        self.assertEqual(res, [{'ResourceType': 'instance', 'Tags': tags},
+                               {'ResourceType': 'volume', 'Tags': tags}])
+
     def test_find_isolation_tag_value(self):
         tag1 = MagicMock()
         tag2 = {'Key': 'Isolation', 'Value': 'Shared'}
@@ -73,3 +89,29 @@ class TestTagService(TestCase):
 
         # Assert
         self.assertEquals(public_tag, {'Key': 'IsPublic', 'Value': public_value})
+
+    @patch('cloudshell.cp.aws.domain.services.ec2.tags.time')
+    def test_get_cloud_provider_tags(self, time):
+        time.time.return_value = 1500000000.5
+
+        tags = self.tag_service.get_cloud_provider_tags('server/aws')
+
+        self.assertEqual(tags, [{'Key': 'CloudProvider', 'Value': 'server/aws'},
+                                {'Key': 'CreatedAt', 'Value': '1500000000'}])
+
+    def test_management_routes_tags(self):
+        tags = self.tag_service.get_management_routes_tags(['rtb-1', 'rtb-2'], '10.0.1.0/24')
+
+        self.assertEqual(tags, [{'Key': 'ManagementRouteTables', 'Value': 'rtb-1,rtb-2'},
+                                {'Key': 'ManagementRouteCidr', 'Value': '10.0.1.0/24'}])
+        self.assertEqual(TagService.find_management_routes(tags + [{'Key': 'Name', 'Value': 'name'}]),
+                         (['rtb-1', 'rtb-2'], '10.0.1.0/24'))
+
+    def test_management_routes_tags_too_long(self):
+        route_table_ids = ['rtb-0123456789abcdef{0}'.format(i) for i in range(20)]
+
+        self.assertIsNone(self.tag_service.get_management_routes_tags(route_table_ids, '10.0.1.0/24'))
+
+    def test_find_management_routes_without_index(self):
+        self.assertIsNone(TagService.find_management_routes([{'Key': 'Name', 'Value': 'name'}]))
+        self.assertIsNone(TagService.find_management_routes(None))
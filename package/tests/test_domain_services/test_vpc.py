@@ -80,6 +80,16 @@ class TestVPCService(TestCase):
         self.tag_service.get_default_tags.assert_called_once_with(vpc_name, self.reservation)
         self.tag_service.set_ec2_resource_tags.assert_called_once_with(self.vpc, self.tags)
 
+    def test_create_vpc_for_reservation_with_cloud_provider_owner(self):
+        tags = [{'Key': 'Name', 'Value': 'vpc'}]
+        self.tag_service.get_default_tags.return_value = tags
+        self.tag_service.get_cloud_provider_tags.return_value = [{'Key': 'CloudProvider', 'Value': 'server/aws'}]
+
+        self.vpc_service.create_vpc_for_reservation(self.ec2_session, self.reservation, self.cidr, 'server/aws')
+
+        self.tag_service.get_cloud_provider_tags.assert_called_once_with('server/aws')
+        self.tag_service.set_ec2_resource_tags.assert_called_once_with(
+            self.vpc, [{'Key': 'Name', 'Value': 'vpc'}, {'Key': 'CloudProvider', 'Value': 'server/aws'}])
 
     def test_find_vpc_for_reservation(self):
         self.ec2_session.vpcs = Mock()
@@ -182,6 +192,20 @@ class TestVPCService(TestCase):
         self.assertIsNotNone(res)
         self.instance_service.terminate_instances.assert_called_once_with([instance])
 
+    def test_get_reservation_instances(self):
+        instance = Mock(id='i-1')
+        claimed_instance = Mock(id='i-2')
+        self.vpc.instances.all = Mock(return_value=[instance])
+        ec2_session = Mock()
+        ec2_session.instances.filter.return_value = [instance, claimed_instance]
+
+        res = self.vpc_service.get_reservation_instances(ec2_session, self.vpc, 'res-1')
+
+        self.assertEqual(res, [instance, claimed_instance])
+        filters = ec2_session.instances.filter.call_args[1]['Filters']
+        self.assertEqual(filters[0], {'Name': 'tag:ReservationId', 'Values': ['res-1']})
+        self.assertNotIn('terminated', filters[1]['Values'])
+
     def test_delete_vpc(self):
         res = self.vpc_service.delete_vpc(self.vpc)
 
@@ -0,0 +1,345 @@
+from unittest import TestCase
+
+from botocore.exceptions import ClientError
+from mock import Mock, call, patch
+
+from cloudshell.cp.aws.domain.services.ec2.warm_instance_pool import WarmInstancePool
+
+
+class TestWarmInstancePool(TestCase):
+    def setUp(self):
+        self.tag_service = Mock()
+        self.key_pair_service = Mock()
+        self.instance_waiter = Mock()
+        self.password_waiter = Mock()
+        self.pool = WarmInstancePool(tag_service=self.tag_service,
+                                     key_pair_service=self.key_pair_service,
+                                     instance_waiter=self.instance_waiter,
+                                     password_waiter=self.password_waiter)
+        self.ec2_session = Mock()
+        self.ec2_client = Mock()
+        self.s3_session = Mock()
+        self.logger = Mock()
+        self.ec2_client.describe_subnets.return_value = {'Subnets': [{'AvailabilityZone': 'us-east-1a'}]}
+        self.ec2_client.create_network_interface.side_effect = \
+            [{'NetworkInterface': {'NetworkInterfaceId': 'eni-{0}'.format(i)}} for i in range(1, 4)]
+        self.ec2_client.attach_network_interface.return_value = {'AttachmentId': 'eni-attach-1'}
+        self.ec2_client.describe_security_groups.return_value = {'SecurityGroups': [{'GroupId': 'sg-isolation'}]}
+
+    @staticmethod
+    def _resource_model(subnet_id='subnet-hold', size=2, ami_ids=None):
+        model = Mock()
+        model.warm_pool_subnet_id = subnet_id
+        model.warm_pool_size = size
+        model.warm_pool_ami_ids = ['ami-1'] if ami_ids is None else ami_ids
+        return model
+
+    @staticmethod
+    def _deployment_info(network_interfaces=None, iam_role=None, private_ip_address=None):
+        info = Mock()
+        info.aws_ami_id = 'ami-1'
+        info.instance_type = 't2.large'
+        info.block_device_mappings = [{'DeviceName': '/dev/sda1', 'Ebs': {'VolumeSize': 30}}]
+        info.iam_role = iam_role
+        info.private_ip_address = private_ip_address
+        info.network_interfaces = network_interfaces or [{'SubnetId': 'subnet-1', 'DeviceIndex': 0, 'Groups': ['sg-1']}]
+        return info
+
+    @staticmethod
+    def _windows_image():
+        image = Mock()
+        image.platform = 'windows'
+        return image
+
+    @staticmethod
+    def _standby_instance(instance_id):
+        return Mock(id=instance_id, vpc_id='vpc-hold',
+                    network_interfaces_attribute=[{'NetworkInterfaceId': 'eni-hold-' + instance_id,
+                                                   'Attachment': {'DeviceIndex': 0}}],
+                    tags=[{'Key': 'WarmPool', 'Value': 'Standby'},
+                          {'Key': 'WarmPoolKeyPair', 'Value': 'warm-pool-' + instance_id}])
+
+    def _set_standby_instances(self, *instances):
+        self.ec2_session.instances.filter.return_value = list(instances)
+
+    def _device_index_taken_error(self):
+        return ClientError({'Error': {'Code': 'InvalidParameterValue',
+                                      'Message': "Instance 'i-1' already has an interface attached at device index "
+                                                 "'1'."}},
+                           'AttachNetworkInterface')
+
+    def test_is_enabled(self):
+        self.assertTrue(WarmInstancePool.is_enabled(self._resource_model(), 'ami-1'))
+        self.assertFalse(WarmInstancePool.is_enabled(self._resource_model(), 'ami-2'))
+        self.assertFalse(WarmInstancePool.is_enabled(self._resource_model(subnet_id=''), 'ami-1'))
+        self.assertFalse(WarmInstancePool.is_enabled(self._resource_model(size=0), 'ami-1'))
+
+    def test_is_claimed(self):
+        instance = Mock()
+        instance.tags = [{'Key': 'WarmPool', 'Value': 'Claimed'}]
+        standby_instance = Mock()
+        standby_instance.tags = [{'Key': 'WarmPool', 'Value': 'Standby'}]
+        untagged_instance = Mock()
+        untagged_instance.tags = None
+
+        self.assertTrue(WarmInstancePool.is_claimed(instance))
+        self.assertFalse(WarmInstancePool.is_claimed(standby_instance))
+        self.assertFalse(WarmInstancePool.is_claimed(untagged_instance))
+
+    def test_get_profile_is_the_same_for_the_same_deployment(self):
+        profile = self.pool.get_profile(self._deployment_info(), self._windows_image())
+
+        self.assertEqual(profile, self.pool.get_profile(self._deployment_info(), self._windows_image()))
+        other_info = self._deployment_info()
+        other_info.instance_type = 't2.micro'
+        self.assertNotEqual(profile, self.pool.get_profile(other_info, self._windows_image()))
+
+    def test_get_profile_of_deployments_a_pooled_instance_cannot_serve(self):
+        linux_image = Mock()
+        linux_image.platform = None
+        public_ip_interfaces = [{'SubnetId': 'subnet-1', 'DeviceIndex': 0, 'AssociatePublicIpAddress': True}]
+        private_ip_interfaces = [{'SubnetId': 'subnet-1', 'DeviceIndex': 0, 'PrivateIpAddress': '10.0.0.5'}]
+
+        self.assertIsNone(self.pool.get_profile(self._deployment_info(), linux_image))
+        self.assertIsNone(self.pool.get_profile(self._deployment_info(iam_role={'Arn': 'arn'}),
+                                                self._windows_image()))
+        self.assertIsNone(self.pool.get_profile(self._deployment_info(private_ip_address='10.0.0.5'),
+                                                self._windows_image()))
+        self.assertIsNone(self.pool.get_profile(self._deployment_info(public_ip_interfaces), self._windows_image()))
+        self.assertIsNone(self.pool.get_profile(self._deployment_info(private_ip_interfaces), self._windows_image()))
+
+    def test_claim_attaches_the_sandbox_interfaces_after_the_holding_interface(self):
+        instance = self._standby_instance('i-1')
+        self._set_standby_instances(instance)
+        network_interfaces = [{'SubnetId': 'subnet-2', 'DeviceIndex': 1, 'Groups': ['sg-1']},
+                              {'SubnetId': 'subnet-1', 'DeviceIndex': 0, 'Groups': ['sg-1']}]
+
+        result = self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                                 network_interfaces, self.logger)
+
+        self.assertEqual(result, instance)
+        self.ec2_client.create_network_interface.assert_has_calls([call(SubnetId='subnet-1', Groups=['sg-1']),
+                                                                  call(SubnetId='subnet-2', Groups=['sg-1'])])
+        self.ec2_client.attach_network_interface.assert_has_calls(
+            [call(DeviceIndex=1, InstanceId='i-1', NetworkInterfaceId='eni-1'),
+             call(DeviceIndex=2, InstanceId='i-1', NetworkInterfaceId='eni-2')])
+        self.tag_service.set_ec2_resources_tags.assert_called_once_with(
+            self.ec2_client, ['i-1'], [{'Key': 'WarmPool', 'Value': 'Claimed'}])
+        self.ec2_client.delete_network_interface.assert_not_called()
+        self.ec2_client.modify_network_interface_attribute.assert_called_with(NetworkInterfaceId='eni-hold-i-1',
+                                                                              Groups=['sg-isolation'])
+        self.ec2_client.create_security_group.assert_not_called()
+        filters = self.ec2_session.instances.filter.call_args[1]['Filters']
+        self.assertIn({'Name': 'availability-zone', 'Values': ['us-east-1a']}, filters)
+        self.assertIn({'Name': 'instance-state-name', 'Values': ['stopped']}, filters)
+
+    def test_claim_moves_the_key_of_the_instance_to_the_reservation(self):
+        self._set_standby_instances(self._standby_instance('i-1'))
+        self.key_pair_service.load_key_pair_by_name.return_value = 'private key'
+
+        self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                        self._deployment_info().network_interfaces, self.logger)
+
+        self.key_pair_service.load_key_pair_by_name.assert_called_once_with(self.s3_session, 'bucket', 'warm-pool-i-1')
+        self.key_pair_service.save_instance_key.assert_called_once_with(self.s3_session, 'bucket', 'res-1', 'i-1',
+                                                                        'private key')
+        self.key_pair_service.remove_key_pair_for_reservation_in_s3.assert_called_once_with(self.s3_session, 'bucket',
+                                                                                            'warm-pool-i-1')
+        self.key_pair_service.remove_key_pair_for_reservation_in_ec2.assert_called_once_with(self.ec2_session,
+                                                                                             'warm-pool-i-1')
+
+    def test_claim_terminates_the_instance_without_key(self):
+        instance = self._standby_instance('i-1')
+        self._set_standby_instances(instance)
+        self.key_pair_service.load_key_pair_by_name.return_value = None
+
+        self.assertRaises(ValueError, self.pool.claim, self.ec2_session, self.ec2_client, self.s3_session,
+                          'bucket', 'res-1', 'profile', self._deployment_info().network_interfaces, self.logger)
+
+        instance.terminate.assert_called_once()
+        self.key_pair_service.save_instance_key.assert_not_called()
+
+    def test_claim_skips_instance_claimed_by_another_deploy(self):
+        taken_instance = self._standby_instance('i-1')
+        instance = self._standby_instance('i-2')
+        self._set_standby_instances(taken_instance, instance)
+        device_index_taken = self._device_index_taken_error()
+        self.ec2_client.attach_network_interface.side_effect = [device_index_taken, {'AttachmentId': 'eni-attach-1'}]
+
+        result = self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                                 self._deployment_info().network_interfaces, self.logger)
+
+        self.assertEqual(result, instance)
+
+    def test_claim_raises_other_invalid_parameter_errors(self):
+        instance = self._standby_instance('i-1')
+        self._set_standby_instances(instance)
+        self.ec2_client.attach_network_interface.side_effect = ClientError(
+            {'Error': {'Code': 'InvalidParameterValue', 'Message': 'Invalid security group'}}, 'AttachNetworkInterface')
+
+        self.assertRaises(ClientError, self.pool.claim, self.ec2_session, self.ec2_client, self.s3_session, 'bucket',
+                          'res-1', 'profile', self._deployment_info().network_interfaces, self.logger)
+
+        self.ec2_client.delete_network_interface.assert_called_once_with(NetworkInterfaceId='eni-1')
+
+    def test_claim_deletes_the_interfaces_when_no_instance_was_claimed(self):
+        self._set_standby_instances(self._standby_instance('i-1'))
+        self.ec2_client.attach_network_interface.side_effect = self._device_index_taken_error()
+
+        result = self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                                 self._deployment_info().network_interfaces, self.logger)
+
+        self.assertIsNone(result)
+        self.ec2_client.delete_network_interface.assert_called_once_with(NetworkInterfaceId='eni-1')
+
+    def test_claim_terminates_the_claimed_instance_on_failure(self):
+        instance = self._standby_instance('i-1')
+        self._set_standby_instances(instance)
+        self.ec2_client.attach_network_interface.side_effect = [{'AttachmentId': 'eni-attach-1'}, ValueError('attach')]
+        network_interfaces = [{'SubnetId': 'subnet-1', 'DeviceIndex': 0, 'Groups': []},
+                              {'SubnetId': 'subnet-2', 'DeviceIndex': 1, 'Groups': []}]
+
+        self.assertRaises(ValueError, self.pool.claim, self.ec2_session, self.ec2_client, self.s3_session,
+                          'bucket', 'res-1', 'profile',
+                          network_interfaces, self.logger)
+
+        instance.terminate.assert_called_once()
+        self.ec2_client.delete_network_interface.assert_called_once_with(NetworkInterfaceId='eni-2')
+
+    def test_claim_creates_the_isolation_security_group(self):
+        self._set_standby_instances(self._standby_instance('i-1'))
+        self.ec2_client.describe_security_groups.return_value = {'SecurityGroups': []}
+        self.ec2_client.create_security_group.return_value = {'GroupId': 'sg-new'}
+
+        self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                        self._deployment_info().network_interfaces, self.logger)
+
+        self.assertEqual(self.ec2_client.create_security_group.call_args[1]['VpcId'], 'vpc-hold')
+        self.ec2_client.revoke_security_group_egress.assert_called_once_with(
+            GroupId='sg-new', IpPermissions=[{'IpProtocol': '-1', 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}])
+        self.ec2_client.modify_network_interface_attribute.assert_called_with(NetworkInterfaceId='eni-hold-i-1',
+                                                                              Groups=['sg-new'])
+
+    def test_claim_uses_the_isolation_security_group_created_by_another_deploy(self):
+        self._set_standby_instances(self._standby_instance('i-1'))
+        self.ec2_client.describe_security_groups.side_effect = [{'SecurityGroups': []},
+                                                                {'SecurityGroups': [{'GroupId': 'sg-other'}]}]
+        self.ec2_client.create_security_group.side_effect = \
+            ClientError({'Error': {'Code': 'InvalidGroup.Duplicate'}}, 'CreateSecurityGroup')
+
+        self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                        self._deployment_info().network_interfaces, self.logger)
+
+        self.ec2_client.modify_network_interface_attribute.assert_called_with(NetworkInterfaceId='eni-hold-i-1',
+                                                                              Groups=['sg-other'])
+
+    def test_claim_subnets_of_many_availability_zones(self):
+        self.ec2_client.describe_subnets.return_value = {'Subnets': [{'AvailabilityZone': 'us-east-1a'},
+                                                                     {'AvailabilityZone': 'us-east-1b'}]}
+
+        result = self.pool.claim(self.ec2_session, self.ec2_client, self.s3_session, 'bucket', 'res-1', 'profile',
+                                 self._deployment_info().network_interfaces, self.logger)
+
+        self.assertIsNone(result)
+        self.ec2_session.instances.filter.assert_not_called()
+
+    def test_replenish_launches_the_missing_instances(self):
+        self._set_standby_instances(Mock())
+        instances = [Mock(id='i-2')]
+        self.ec2_session.create_instances.return_value = instances
+        self.key_pair_service.get_reservation_key_name.return_value = 'warm-pool-key'
+        resource_model = self._resource_model()
+
+        self.pool.replenish(self.ec2_session, self.s3_session, resource_model, self._deployment_info(),
+                            'profile', self.logger)
+
+        kwargs = self.ec2_session.create_instances.call_args[1]
+        self.assertEqual(kwargs['MinCount'], 1)
+        self.assertEqual(kwargs['KeyName'], 'warm-pool-key')
+        self.assertEqual(kwargs['NetworkInterfaces'], [{'DeviceIndex': 0, 'SubnetId': 'subnet-hold'}])
+        key_pair_id = self.key_pair_service.create_key_pair.call_args[0][3]
+        self.assertTrue(key_pair_id.startswith('warm-pool-'))
+        self.key_pair_service.create_key_pair.assert_called_once_with(
+            self.ec2_session, self.s3_session, resource_model.key_pairs_location, key_pair_id)
+        self.key_pair_service.get_reservation_key_name.assert_called_once_with(key_pair_id)
+        self.password_waiter.multi_wait.assert_called_once()
+        self.assertEqual(self.password_waiter.multi_wait.call_args[0][0], instances)
+        self.password_waiter.multi_wait.call_args[1]['on_password'](instances[0])
+        instances[0].stop.assert_called_once()
+
+    def test_replenish_launches_each_instance_with_its_own_key_pair(self):
+        self._set_standby_instances()
+        self.ec2_session.create_instances.side_effect = lambda **kwargs: [Mock()]
+        self.tag_service.get_tag_specifications.side_effect = lambda resource_types, tags: tags
+
+        self.pool.replenish(self.ec2_session, self.s3_session, self._resource_model(), self._deployment_info(),
+                            'profile', self.logger)
+
+        key_pair_ids = [create_call[0][3] for create_call in self.key_pair_service.create_key_pair.call_args_list]
+        self.assertEqual(len(set(key_pair_ids)), 2)
+        self.assertEqual([create_call[1]['TagSpecifications'][-1]
+                          for create_call in self.ec2_session.create_instances.call_args_list],
+                         [{'Key': 'WarmPoolKeyPair', 'Value': key_pair_id} for key_pair_id in key_pair_ids])
+
+    def test_replenish_full_pool(self):
+        self._set_standby_instances(Mock(), Mock())
+
+        self.pool.replenish(self.ec2_session, self.s3_session, self._resource_model(), self._deployment_info(),
+                            'profile', self.logger)
+
+        self.ec2_session.create_instances.assert_not_called()
+
+    def test_replenish_terminates_the_instances_on_failure(self):
+        self._set_standby_instances()
+        instances = [Mock(id='i-1'), Mock(id='i-2')]
+        self.ec2_session.create_instances.side_effect = [[instance] for instance in instances]
+        self.password_waiter.multi_wait.side_effect = ValueError('password')
+
+        self.assertRaises(ValueError, self.pool.replenish, self.ec2_session, self.s3_session,
+                          self._resource_model(), self._deployment_info(), 'profile', self.logger)
+
+        for instance in instances:
+            instance.terminate.assert_called_once()
+        self.assertEqual(self.key_pair_service.remove_key_pair_for_reservation_in_s3.call_count, 2)
+        self.assertEqual(self.key_pair_service.remove_key_pair_for_reservation_in_ec2.call_count, 2)
+
+    @patch('cloudshell.cp.aws.domain.services.ec2.warm_instance_pool.threading')
+    def test_replenish_in_background_with_dedicated_clients(self, threading):
+        aws_api = Mock()
+        resource_model = Mock()
+        deployment_info = Mock()
+
+        self.pool.replenish_in_background(Mock(return_value=aws_api), resource_model, deployment_info, 'abcdef0123',
+                                          self.logger)
+
+        threading.Thread.assert_called_once_with(target=self.pool._run_replenish,
+                                                 args=(aws_api.ec2_session, aws_api.s3_session, resource_model,
+                                                       deployment_info, 'abcdef0123', self.logger),
+                                                 name='WarmInstancePool-abcdef01')
+        threading.Thread.return_value.start.assert_called_once()
+
+    def test_replenish_in_background_skips_profile_being_replenished(self):
+        self.pool._replenishing.add('profile')
+        self.pool._run_replenish = Mock()
+        create_aws_api = Mock()
+
+        self.pool.replenish_in_background(create_aws_api, Mock(), Mock(), 'profile', self.logger)
+
+        create_aws_api.assert_not_called()
+        self.pool._run_replenish.assert_not_called()
+
+    def test_replenish_in_background_fails_to_create_the_clients(self):
+        self.pool.replenish_in_background(Mock(side_effect=ValueError('clients')), Mock(), Mock(), 'profile',
+                                          self.logger)
+
+        self.assertNotIn('profile', self.pool._replenishing)
+        self.logger.exception.assert_called_once()
+
+    def test_run_replenish_marks_profile_as_replenished(self):
+        self.pool._replenishing.add('profile')
+        self.pool.replenish = Mock(side_effect=ValueError('replenish'))
+
+        self.pool._run_replenish(self.ec2_session, self.s3_session, Mock(), Mock(), 'profile', self.logger)
+
+        self.assertNotIn('profile', self.pool._replenishing)
+        self.logger.exception.assert_called_once()